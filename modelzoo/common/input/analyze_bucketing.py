@@ -29,7 +29,8 @@ outputs are generally underestimates.
 
 The data provided by the user is assumed to be a npy file containing a histogram
 of the frequencies of each sequence length. For example, `data[100]` should
-be the number of samples with length exactly 100.
+be the number of samples with length exactly 100. Such a histogram can be
+computed from HDF5, CSV or TFRecord files with `sequence_length_histogram.py`.
 """
 import argparse
 import os
@@ -68,7 +69,8 @@ def parse_args():
         required=True,
         help=(
             "The path to a npy file containing a histogram of sequence lengths "
-            "for a particular dataset"
+            "for a particular dataset, e.g. the output of "
+            "sequence_length_histogram.py"
         ),
     )
     args = parser.parse_args(sys.argv[1:])
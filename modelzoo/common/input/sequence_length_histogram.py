@@ -0,0 +1,307 @@
+# Copyright 2022 Cerebras Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Computes the histogram of the sequence lengths of a dataset, in the format
+expected by `analyze_bucketing.py`: a npy file where `data[100]` is the number
+of samples with length exactly 100.
+
+Supported files are
+1. HDF5 files written by `create_hdf5_dataset.py`, where the length of a
+    sample is the number of non padding entries of one of its features,
+    by default the attention mask.
+2. CSV files such as the ones written by `create_csv_mlm_only.py`, where the
+    length of a sample is the number of tokens of one of its columns, either
+    a list or a whitespace separated text.
+3. TFRecord files of `tf.train.Example`s, where the length of a sample is the
+    number of non padding entries of one of its features.
+
+The files are streamed by a pool of processes, HDF5 files in chunks of rows
+and other files one at a time, and the lengths are added to the histograms
+every `--chunk_size` rows, so the memory used does not depend on the size of
+the dataset or of its files. Every process returns the histogram of its
+chunk, which are added up as they complete.
+"""
+import argparse
+import ast
+import csv
+import glob
+import logging
+import os
+import struct
+import sys
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+HDF5_EXTENSIONS = (".h5", ".hdf5")
+CSV_EXTENSIONS = (".csv",)
+TFRECORD_EXTENSIONS = (".tfrecord", ".tfrecords")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--input",
+        required=True,
+        nargs="+",
+        help=(
+            "Files, directories or glob patterns of the data files. Files of "
+            "directories are selected by their extension."
+        ),
+    )
+    parser.add_argument(
+        "--output",
+        required=True,
+        help="Path of the npy file where the histogram is saved",
+    )
+    parser.add_argument(
+        "--hdf5_dataset",
+        default="data",
+        help="Name of the dataset of the samples in HDF5 files",
+    )
+    parser.add_argument(
+        "--hdf5_feature_index",
+        type=int,
+        default=1,
+        help=(
+            "Index of the feature whose length is counted along the second "
+            "dimension of the HDF5 dataset, e.g. 1 for the attention mask of "
+            "datasets of shape [num_samples, 3, max_sequence_length]. Use -1 "
+            "for datasets of shape [num_samples, max_sequence_length]."
+        ),
+    )
+    parser.add_argument(
+        "--csv_column",
+        default="tokens",
+        help="Name of the column whose length is counted in CSV files",
+    )
+    parser.add_argument(
+        "--tfrecord_feature",
+        default="input_mask",
+        help="Name of the feature whose length is counted in TFRecord files",
+    )
+    parser.add_argument(
+        "--pad_id",
+        type=int,
+        default=0,
+        help=(
+            "Numeric entries equal to this value are not counted, e.g. the 0s "
+            "of attention masks"
+        ),
+    )
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=1024,
+        help=(
+            "Number of rows of HDF5 files read at once by a process, and of "
+            "rows of other files counted before they are added to the "
+            "histogram"
+        ),
+    )
+    parser.add_argument(
+        "--num_processes",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of processes reading the files",
+    )
+    return parser.parse_args(sys.argv[1:])
+
+
+def list_files(inputs):
+    """
+    Expand files, directories and glob patterns into the sorted list of the
+    supported data files.
+    """
+    extensions = HDF5_EXTENSIONS + CSV_EXTENSIONS + TFRECORD_EXTENSIONS
+    files = set()
+    for pattern in inputs:
+        for path in glob.glob(pattern) or [pattern]:
+            if os.path.isdir(path):
+                for root, _, names in os.walk(path):
+                    files.update(
+                        os.path.join(root, name)
+                        for name in names
+                        if name.endswith(extensions)
+                    )
+            elif os.path.isfile(path):
+                files.add(path)
+            else:
+                raise ValueError(f"Got invalid data location {path}")
+    return sorted(files)
+
+
+def count_length(values, pad_id):
+    """Number of entries of a sample, without the numeric `pad_id` ones."""
+    values = np.asarray(values)
+    if values.dtype.kind in "biuf":
+        return int(np.count_nonzero(values != pad_id))
+    return len(values)
+
+
+def histogram_of_lengths(lengths):
+    return np.bincount(np.asarray(lengths, dtype=np.int64), minlength=1)
+
+
+def hdf5_histogram(path, start, stop, args):
+    import h5py
+
+    with h5py.File(path, mode="r") as h5_file:
+        dataset = h5_file[args.hdf5_dataset]
+        if args.hdf5_feature_index >= 0:
+            values = dataset[start:stop, args.hdf5_feature_index]
+        else:
+            values = dataset[start:stop]
+    lengths = np.count_nonzero(values != args.pad_id, axis=-1)
+    return histogram_of_lengths(lengths)
+
+
+def streamed_histogram(lengths, chunk_size):
+    """
+    Histogram of an iterable of lengths, accumulated every `chunk_size`
+    lengths so that they are not all held in memory.
+    """
+    histogram = np.zeros(1, dtype=np.int64)
+    chunk = []
+    for length in lengths:
+        chunk.append(length)
+        if len(chunk) == chunk_size:
+            histogram = add_histograms(histogram, histogram_of_lengths(chunk))
+            chunk = []
+    return add_histograms(histogram, histogram_of_lengths(chunk))
+
+
+def csv_lengths(path, args):
+    # Some fields hold whole documents
+    csv.field_size_limit(sys.maxsize)
+    with open(path, "r", newline="") as fin:
+        for row in csv.DictReader(fin):
+            value = row[args.csv_column].strip()
+            if value.startswith("["):
+                values = ast.literal_eval(value)
+                yield count_length(values, args.pad_id)
+            else:
+                yield len(value.split())
+
+
+def read_tfrecords(path):
+    """
+    Yields the serialized records of an uncompressed TFRecord file. Every
+    record is framed by its length, its data and their checksums, which are
+    not verified.
+    """
+    with open(path, "rb") as fin:
+        while True:
+            header = fin.read(12)
+            if not header:
+                return
+            (length,) = struct.unpack("<Q", header[:8])
+            record = fin.read(length)
+            fin.read(4)
+            yield record
+
+
+def tfrecord_lengths(path, args):
+    import tensorflow as tf
+
+    for record in read_tfrecords(path):
+        example = tf.train.Example.FromString(record)
+        feature = example.features.feature[args.tfrecord_feature]
+        kind = feature.WhichOneof("kind")
+        values = getattr(feature, kind).value if kind else []
+        yield count_length(values, args.pad_id)
+
+
+def split_work(files, args):
+    """
+    Split the files into the chunks read by every process, as tuples of the
+    path, the first row and the end row. Only HDF5 files are split in rows.
+    """
+    work = []
+    for path in files:
+        if path.endswith(HDF5_EXTENSIONS):
+            import h5py
+
+            with h5py.File(path, mode="r") as h5_file:
+                num_rows = len(h5_file[args.hdf5_dataset])
+            for start in range(0, num_rows, args.chunk_size):
+                stop = min(start + args.chunk_size, num_rows)
+                work.append((path, start, stop))
+        elif path.endswith(CSV_EXTENSIONS + TFRECORD_EXTENSIONS):
+            work.append((path, None, None))
+        else:
+            raise ValueError(
+                f"Unsupported file {path}. Expected an extension in "
+                f"{HDF5_EXTENSIONS + CSV_EXTENSIONS + TFRECORD_EXTENSIONS}."
+            )
+    return work
+
+
+def chunk_histogram(work_args):
+    (path, start, stop), args = work_args
+    if path.endswith(HDF5_EXTENSIONS):
+        return hdf5_histogram(path, start, stop, args)
+    if path.endswith(CSV_EXTENSIONS):
+        return streamed_histogram(csv_lengths(path, args), args.chunk_size)
+    return streamed_histogram(tfrecord_lengths(path, args), args.chunk_size)
+
+
+def add_histograms(total, histogram):
+    if len(histogram) > len(total):
+        total, histogram = histogram, total
+    total = total.copy()
+    total[: len(histogram)] += histogram
+    return total
+
+
+def main(args):
+    files = list_files(args.input)
+    if not files:
+        raise ValueError(f"No data files found in {args.input}")
+    work = split_work(files, args)
+    logging.info(f"Reading {len(files)} files in {len(work)} chunks")
+
+    start_time = time.time()
+    histogram = np.zeros(1, dtype=np.int64)
+    with Pool(args.num_processes) as pool:
+        for i, chunk in enumerate(
+            pool.imap_unordered(chunk_histogram, [(w, args) for w in work])
+        ):
+            histogram = add_histograms(histogram, chunk)
+            if (i + 1) % 100 == 0:
+                logging.info(
+                    f"Read {i + 1} of {len(work)} chunks, "
+                    f"{int(histogram.sum())} samples"
+                )
+
+    np.save(args.output, histogram)
+    total_samples = int(histogram.sum())
+    avg_seq_len = np.dot(np.arange(len(histogram)), histogram) / max(
+        total_samples, 1
+    )
+    print(
+        f"Wrote the histogram of {total_samples} samples to {args.output} in "
+        f"{time.time() - start_time:.1f}s. The longest sequence has length "
+        f"{len(histogram) - 1} and the average length is {avg_seq_len:.2f}"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main(parse_args())
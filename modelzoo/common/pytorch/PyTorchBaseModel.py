@@ -308,6 +308,7 @@ class PyTorchBaseModel(metaclass=Final):
                 momentum=oparams["momentum"],
                 weight_decay=oparams.get("weight_decay_rate", 0.0),
                 nesterov=oparams.get("use_nesterov", False),
+                foreach=oparams.get("foreach", None),
             )
         elif optimizer_type == "adam":
             return Adam(
@@ -316,6 +317,7 @@ class PyTorchBaseModel(metaclass=Final):
                 eps=oparams.get("eps", 1e-6),
                 weight_decay=oparams.get("weight_decay_rate", 0.0),
                 amsgrad=oparams.get("amsgrad", False),
+                foreach=oparams.get("foreach", None),
             )
         elif optimizer_type == "adamw":
             return AdamW(
@@ -325,6 +327,7 @@ class PyTorchBaseModel(metaclass=Final):
                 weight_decay=oparams.get("weight_decay_rate", 0.0),
                 correct_bias=oparams.get("correct_bias", False),
                 amsgrad=oparams.get("amsgrad", False),
+                foreach=oparams.get("foreach", None),
             )
         elif optimizer_type == "adamax":
             return Adamax(
@@ -364,6 +367,7 @@ class PyTorchBaseModel(metaclass=Final):
                 scale_parameter=scale_parameter,
                 relative_step=relative_step,
                 warmup_init=warmup_init,
+                foreach=oparams.get("foreach", None),
             )
         elif optimizer_type == "adagrad":
             return Adagrad(
@@ -399,6 +403,7 @@ class PyTorchBaseModel(metaclass=Final):
                 eps=eps,
                 weight_decay=weight_decay,
                 adam=adam,
+                foreach=oparams.get("foreach", None),
             )
         elif optimizer_type == "radam":
             eps = oparams.get("eps", 1e-6)
@@ -432,6 +437,7 @@ class PyTorchBaseModel(metaclass=Final):
                 centered=oparams.get("centered", False),
                 eps=oparams.get("eps", 1e-8),
                 weight_decay=oparams.get("weight_decay_rate", 0.0),
+                foreach=oparams.get("foreach", None),
             )
         elif optimizer_type == "rprop":
             etas = (oparams.get("eta1", 0.5), oparams.get("eta2", 1.2))
@@ -0,0 +1,170 @@
+# Copyright 2022 Cerebras Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Writer of checkpoints which saves them in a background thread"""
+
+import copy
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+
+import torch
+
+from modelzoo.common.pytorch.utils import get_checkpoints
+
+
+def snapshot_state(state: Any, pin_memory: bool = False) -> Any:
+    """Copies the tensors of a nested state dict to CPU memory.
+
+    The copies of GPU tensors are issued asynchronously, into pinned memory
+    if `pin_memory`, and are only complete once the current CUDA stream
+    reaches them. CPU tensors are cloned so that the training step can keep
+    updating them in place.
+    """
+    if isinstance(state, torch.Tensor):
+        if state.device.type == "cpu":
+            return state.detach().clone()
+        copy_ = torch.empty(
+            state.shape, dtype=state.dtype, pin_memory=pin_memory
+        )
+        return copy_.copy_(state.detach(), non_blocking=pin_memory)
+    if isinstance(state, dict):
+        return type(state)(
+            (key, snapshot_state(value, pin_memory))
+            for key, value in state.items()
+        )
+    if isinstance(state, (list, tuple)) and not hasattr(state, "_fields"):
+        return type(state)(snapshot_state(value, pin_memory) for value in state)
+    return copy.deepcopy(state)
+
+
+class CheckpointWriter:
+    """Saves checkpoints atomically, optionally in a background thread.
+
+    Every checkpoint is written to `<path>.tmp` and renamed to `<path>` once
+    complete, so a checkpoint which is found under its name is never partial.
+
+    With `asynchronous`, `save` takes a CPU snapshot of the state and returns
+    while a single background thread writes it. A save waits for the
+    previous one to complete first, so at most one snapshot is held in
+    memory. Saved checkpoints are reported by `collect`, on the thread which
+    calls it, and errors of the background thread are raised there.
+
+    Args:
+        asynchronous: Whether to write checkpoints in a background thread.
+        keep_checkpoint_max: Number of most recent checkpoints kept in the
+            directory of the saved checkpoints. All are kept if 0 or None.
+        save_fn: Saves a state dict to a file.
+    """
+
+    def __init__(
+        self,
+        asynchronous: bool = False,
+        keep_checkpoint_max: Optional[int] = None,
+        save_fn: Callable = torch.save,
+    ):
+        self.asynchronous = asynchronous
+        self.keep_checkpoint_max = keep_checkpoint_max
+        self.save_fn = save_fn
+        self._executor = None
+        # (path, step, future) of the checkpoint being written
+        self._in_flight = None
+        self._saved = []
+
+    def save(self, state: dict, path: str, step: int):
+        """Saves the state to `path`, once the previous save completed."""
+        self.wait()
+        if not self.asynchronous:
+            self._write(state, path, None)
+            self._saved.append((path, step))
+            return
+
+        pin_memory = torch.cuda.is_available()
+        state = snapshot_state(state, pin_memory)
+        copied = None
+        if pin_memory:
+            copied = torch.cuda.Event()
+            copied.record()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="checkpoint_writer"
+            )
+        future = self._executor.submit(self._write, state, path, copied)
+        self._in_flight = (path, step, future)
+
+    def _write(self, state: dict, path: str, copied):
+        if copied is not None:
+            copied.synchronize()
+        tmp_path = f"{path}.tmp"
+        try:
+            self.save_fn(state, tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._remove_old_checkpoints(os.path.dirname(path))
+
+    def _remove_old_checkpoints(self, model_dir: str):
+        if not self.keep_checkpoint_max:
+            return
+        checkpoints = get_checkpoints(model_dir or ".")
+        for path in checkpoints[: -self.keep_checkpoint_max]:
+            logging.info(f"Removing old checkpoint {path}")
+            os.remove(path)
+
+    @property
+    def in_flight(self) -> Optional[str]:
+        """Path of the checkpoint being written, if any."""
+        return self._in_flight[0] if self._in_flight else None
+
+    def wait(self):
+        """Blocks until the checkpoint being written is saved."""
+        if self._in_flight is None:
+            return
+        path, step, future = self._in_flight
+        if not future.done():
+            start = time.time()
+            logging.info(f"Waiting for checkpoint {path} to be written.")
+            future.exception()
+            logging.info(
+                f"Waited {time.time() - start:.2f}s for checkpoint {path}."
+            )
+        self._in_flight = None
+        # Raises the error of the background thread, if any
+        future.result()
+        self._saved.append((path, step))
+
+    def collect(self, wait: bool = False) -> List[Tuple[str, int]]:
+        """Returns the (path, step) of the checkpoints saved since the last
+        call.
+
+        Args:
+            wait: Whether to wait for the checkpoint being written.
+        """
+        if self._in_flight is not None and (wait or self._in_flight[2].done()):
+            self.wait()
+        saved, self._saved = self._saved, []
+        return saved
+
+    def close(self):
+        """Waits for the checkpoint being written and stops the thread."""
+        try:
+            self.wait()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
@@ -122,3 +122,187 @@ def bucketed_batch(
         raise ValueError(
             "buckets must be None or a list of boundaries. " f"Got {buckets}."
         )
+
+
+def pack_samples(data_iterator, max_lengths, element_lengths_fn, num_rows=8):
+    """
+    Pack the samples of an iterator into rows of several samples, such that
+    the lengths of the samples of every row add up to at most `max_lengths`.
+    Every sample goes into the first open row it fits in. When it fits in
+    none and `num_rows` rows are open, the oldest row is yielded to make room
+    for a new one. Rows which are full are yielded right away.
+
+    :param data_iterator: An iterater that yields data one sample at a time.
+    :param list max_lengths: The maximum total lengths of the samples of a
+        row, e.g. `[max_sequence_length]`, or the maximum lengths of the
+        encoder and decoder sequences.
+    :param callable element_lengths_fn: A function that takes a single
+        sample and returns its lengths, in the same order as `max_lengths`.
+        Samples longer than `max_lengths` must be truncated beforehand.
+    :param int num_rows: The number of rows that are kept open for samples
+        to be packed in. More rows pack the samples more tightly but
+        delay them more.
+
+    :yields: Lists of the samples of every row, in the order they were
+        added to the row.
+    """
+    if num_rows < 1:
+        raise ValueError(f"Number of rows must be at least 1. Got {num_rows}.")
+    max_lengths = tuple(max_lengths)
+
+    def fits(row_lengths, lengths):
+        return all(
+            row_length + length <= max_length
+            for row_length, length, max_length in zip(
+                row_lengths, lengths, max_lengths
+            )
+        )
+
+    rows = []
+    rows_lengths = []
+    for element in data_iterator:
+        lengths = tuple(element_lengths_fn(element))
+        if not fits((0,) * len(max_lengths), lengths):
+            raise ValueError(
+                f"Sample of lengths {lengths} does not fit in a row of "
+                f"lengths {max_lengths}."
+            )
+        for index, row_lengths in enumerate(rows_lengths):
+            if fits(row_lengths, lengths):
+                break
+        else:
+            if len(rows) == num_rows:
+                rows_lengths.pop(0)
+                yield rows.pop(0)
+            rows.append([])
+            rows_lengths.append((0,) * len(max_lengths))
+            index = len(rows) - 1
+
+        rows[index].append(element)
+        rows_lengths[index] = tuple(
+            row_length + length
+            for row_length, length in zip(rows_lengths[index], lengths)
+        )
+        if rows_lengths[index] == max_lengths:
+            rows_lengths.pop(index)
+            yield rows.pop(index)
+
+    for row in rows:
+        yield row
+
+
+class SampleCursor:
+    """
+    Checkpointable position in a deterministic order of the samples of a
+    dataset stored in chunks, such as files.
+
+    Samples are ordered by a permutation of the chunks, drawn from `seed`
+    and the epoch, and by their index within their chunk. Starting at the
+    cursor, this order is split into global batches of `batch_size`
+    samples, which are dealt round robin to the tasks and then to the
+    workers of each task. A data loader then yields the batches of its task
+    in order, and since every task consumes one batch per step, the samples
+    consumed so far are exactly the ones before the cursor, whatever the
+    number of tasks and workers. Restoring the cursor skips them without
+    reading them.
+
+    :param list chunk_sizes: Number of samples in every chunk.
+    :param int batch_size: The number of samples in a batch.
+    :param int seed: Seed of the permutations of the chunks. Must be the
+        same for all tasks.
+    :param bool shuffle: Whether to permute the chunks in every epoch.
+    """
+
+    def __init__(self, chunk_sizes, batch_size, seed=None, shuffle=True):
+        self.chunk_sizes = np.asarray(chunk_sizes, dtype=np.int64)
+        self.num_samples = int(self.chunk_sizes.sum())
+        self.batch_size = batch_size
+        self.seed = seed if seed is not None else 0
+        self.shuffle = shuffle
+
+        # Epoch and index of the next sample in the order of the epoch.
+        self.epoch = 0
+        self.samples_seen = 0
+
+    def _num_batches_per_task(self, samples_seen, num_tasks):
+        """Number of batches every task gets from the rest of an epoch."""
+        return (self.num_samples - samples_seen) // self.batch_size // num_tasks
+
+    def state_dict(self, num_batches_consumed=0, num_tasks=1):
+        """
+        State of the cursor after every task consumed `num_batches_consumed`
+        batches from its current position.
+
+        :param int num_batches_consumed: Number of batches consumed by every
+            task, possibly over several epochs.
+        :param int num_tasks: Number of tasks consuming the batches.
+        :returns: dict with the `epoch`, `samples_seen` and `seed`.
+        """
+        assert self._num_batches_per_task(0, num_tasks) > 0, (
+            f"Dataset with {self.num_samples} samples does not have a batch "
+            f"of {self.batch_size} samples for each of {num_tasks} tasks."
+        )
+        epoch, samples_seen = self.epoch, self.samples_seen
+        num_batches_left = num_batches_consumed
+        while num_batches_left >= self._num_batches_per_task(
+            samples_seen, num_tasks
+        ):
+            num_batches_left -= self._num_batches_per_task(
+                samples_seen, num_tasks
+            )
+            epoch += 1
+            samples_seen = 0
+        samples_seen += num_batches_left * num_tasks * self.batch_size
+        return {"epoch": epoch, "samples_seen": samples_seen, "seed": self.seed}
+
+    def load_state_dict(self, state):
+        """
+        Move the cursor to a state returned by `state_dict`, which may have
+        been saved with a different number of tasks or workers.
+        """
+        self.epoch = int(state["epoch"])
+        self.samples_seen = int(state["samples_seen"])
+        self.seed = int(state["seed"])
+
+    def iter_spans(self, task_id=0, num_tasks=1, worker_id=0, num_workers=1):
+        """
+        Yields the samples of the batches of one worker until the end of the
+        current epoch. The cursor itself does not move.
+
+        :yields: Tuples `(chunk_index, start, stop)` of contiguous ranges of
+            samples within a chunk, in the order of the batches.
+        """
+        if self.shuffle:
+            order = np.random.default_rng([self.seed, self.epoch]).permutation(
+                len(self.chunk_sizes)
+            )
+        else:
+            order = np.arange(len(self.chunk_sizes))
+        chunk_ends = np.cumsum(self.chunk_sizes[order])
+        chunk_starts = chunk_ends - self.chunk_sizes[order]
+
+        num_batches = (
+            self._num_batches_per_task(self.samples_seen, num_tasks)
+            * num_tasks
+        )
+        for batch_index in range(
+            task_id + num_tasks * worker_id, num_batches, num_tasks * num_workers
+        ):
+            start = self.samples_seen + batch_index * self.batch_size
+            stop = start + self.batch_size
+            chunk = int(np.searchsorted(chunk_ends, start, side="right"))
+            while start < stop:
+                span_stop = min(stop, int(chunk_ends[chunk]))
+                yield (
+                    int(order[chunk]),
+                    start - int(chunk_starts[chunk]),
+                    span_stop - int(chunk_starts[chunk]),
+                )
+                start = span_stop
+                chunk += 1
+
+    def next_epoch(self, num_epochs=1):
+        """Moves the cursor to the start of the `num_epochs`-th next epoch,
+        skipping the rest of the current epoch."""
+        self.epoch += num_epochs
+        self.samples_seen = 0
@@ -13,9 +13,11 @@
 # limitations under the License.
 
 from .AttentionLayer import MultiheadAttention
+from .BlockwiseAttentionLayer import BlockwiseMultiheadAttention
 
 ATTENTION_TYPE_DICT = {
     "aiayn_attention": MultiheadAttention,
+    "blockwise_attention": BlockwiseMultiheadAttention,
 }
 
 
@@ -18,6 +18,7 @@ import torch
 import torch.nn as nn
 
 from modelzoo.common.pytorch import cbtorch
+from modelzoo.common.pytorch.layers.KVCache import KVCache
 from modelzoo.common.pytorch.model_utils.create_initializer import (
     create_initializer,
 )
@@ -196,6 +197,7 @@ class MultiheadAttention(nn.Module):
         past_kv_self_attn=True,
         position_bias=None,
         rotary_position_embedding_helper=None,
+        position_ids=None,
     ):
         """Applies the attention mechanism to queries ``q``, keys ``k`` and values ``v``.
 
@@ -215,9 +217,10 @@ class MultiheadAttention(nn.Module):
                 should be averaged across heads. Otherwise, attn_weights are provided
                 separately per head. Note that this flag only has an effect when
                 need_weights=True. Default: True (i.e. average weights across heads)
-            past_kv (tuple(tensor, tensor)): Past keys and values. Tensors have shape
+            past_kv (tuple(tensor, tensor) or KVCache): Past keys and values. Tensors have shape
                 ``[batch_size, num_heads, seq_length, embed_dim / num_heads]``.
                 The 0th and 1st tensor contain the past keys and values, respectively.
+                A ``KVCache`` is updated in place with the present keys and values.
                 Defaults to ``None``.
             cache_present_kv (bool): Specifies if the present keys and values
                 must be cached and returned. Needed to speed up the
@@ -229,6 +232,9 @@ class MultiheadAttention(nn.Module):
             position_bias (Tensor): Tensor containing position bias to apply in attention.
             rotary_position_embedding_helper (Optional[RotaryPositionEmbeddingHelper]): 
                 A helper class to apply rotary embedding on the input tensor.
+            position_ids (Tensor): Positions of the queries and keys, shape
+                ``[batch_size, seq_length]``, used for rotary embeddings. If not
+                specified, positions follow the past keys and values.
 
         Returns:
             If ``cache_present_kv`` is ``False``, no entry for present keys and values
@@ -243,10 +249,6 @@ class MultiheadAttention(nn.Module):
             rotary_position_embedding_helper and position_bias
         ), "Cannot specify both rotary and relative position embeddings, pick one!"
 
-        assert (
-            past_kv is None and not cache_present_kv
-        ), "Cannot provide past_kv because inference is not supported yet."
-
         # Input is (batch_size, seq_length, dim)
         # Mask is (batch_size, key_length) (non-causal) or (batch_size, key_length, key_length)
         # past_key_value[0] is (batch_size, n_heads, q_len - 1, dim_per_head)
@@ -254,8 +256,8 @@ class MultiheadAttention(nn.Module):
         real_seq_length = seq_length
 
         assert (
-            real_seq_length > 1
-        ), "Sequence length 1 is currently unsupported."
+            real_seq_length > 1 or past_kv is not None
+        ), "Sequence length 1 is only supported for incremental decoding."
 
         # construct query, key and value vector with a linear projection and split into heads
         q = self.construct_query_vector(
@@ -274,10 +276,18 @@ class MultiheadAttention(nn.Module):
 
         # rotary embedding helper
         k = self.apply_rotary_position_embedding(
-            k, rotary_position_embedding_helper, real_seq_length, offset_length
+            k,
+            rotary_position_embedding_helper,
+            real_seq_length,
+            offset_length,
+            position_ids=position_ids,
         )
         q = self.apply_rotary_position_embedding(
-            q, rotary_position_embedding_helper, real_seq_length, offset_length
+            q,
+            rotary_position_embedding_helper,
+            real_seq_length,
+            offset_length,
+            position_ids=position_ids,
         )
         # q, k now have shape [batch_size, num_heads, seq_length, head_dim]
 
@@ -289,23 +299,10 @@ class MultiheadAttention(nn.Module):
 
         present_kv = self.construct_present_kv(cache_present_kv, k, v)
 
-        logits = self.calculate_attention_logits(q, k)
-
-        attn_mask_processed = self.process_attention_mask(attn_mask, past_kv, q)
-        key_padding_mask_processed = self.process_key_padding_mask(
-            key_padding_mask, attn_mask, past_kv, q
+        attention_output, attention_scores = self.attend(
+            q, k, v, attn_mask, key_padding_mask, past_kv, position_bias
         )
 
-        attention_bias = self.combine_masks(
-            attn_mask_processed, key_padding_mask_processed
-        )
-
-        logits = self.apply_attention_bias(logits, attention_bias)
-        logits = self.apply_position_bias(logits, position_bias)
-
-        attention_scores = self.calculate_attention_scores(logits)
-        attention_output = self.calculate_attention_output(attention_scores, v)
-
         if self._scope:
             attention_output = self._scope.exit(attention_output)
 
@@ -384,7 +381,10 @@ class MultiheadAttention(nn.Module):
 
     def get_sequence_length(self, past_kv, real_seq_length):
         offset_length = 0
-        if past_kv is not None:
+        if isinstance(past_kv, KVCache):
+            offset_length = past_kv.length
+            real_seq_length += offset_length
+        elif past_kv is not None:
             offset_length = past_kv[0].shape[-2]
             real_seq_length += offset_length
         return offset_length, real_seq_length
@@ -395,10 +395,14 @@ class MultiheadAttention(nn.Module):
         rotary_position_embedding_helper,
         real_seq_length,
         offset_length,
+        position_ids=None,
     ):
         if rotary_position_embedding_helper:
             vector = rotary_position_embedding_helper.rotate_tensor(
-                vector, real_seq_length, offset=offset_length
+                vector,
+                real_seq_length,
+                offset=offset_length,
+                position_ids=position_ids,
             )
         vector = vector.transpose(1, 2)
         return vector
@@ -416,7 +420,10 @@ class MultiheadAttention(nn.Module):
         return v
 
     def process_past_kv(self, past_kv, past_kv_self_attn, k, v):
-        if past_kv is not None:
+        if isinstance(past_kv, KVCache):
+            assert past_kv_self_attn, "KVCache only supports self-attention."
+            k, v = past_kv.update(k, v)
+        elif past_kv is not None:
             k_past, v_past = past_kv[0], past_kv[1]
             if past_kv_self_attn:
                 k = torch.cat([k_past, k], dim=-2)
@@ -431,6 +438,36 @@ class MultiheadAttention(nn.Module):
             present_kv = (k, v)
         return present_kv
 
+    def attend(
+        self, q, k, v, attn_mask, key_padding_mask, past_kv, position_bias
+    ):
+        """Attend to the keys ``k`` and values ``v`` with the queries ``q``,
+        of shape ``[batch_size, num_heads, seq_length, head_dim]``.
+
+        Returns:
+            The attention output of shape ``[batch_size, seq_length, embed_dim]``
+            and the attention scores.
+        """
+        logits = self.calculate_attention_logits(q, k)
+
+        attn_mask_processed = self.process_attention_mask(
+            attn_mask, past_kv, q, key_length=k.shape[-2]
+        )
+        key_padding_mask_processed = self.process_key_padding_mask(
+            key_padding_mask, attn_mask, past_kv, q, key_length=k.shape[-2]
+        )
+
+        attention_bias = self.combine_masks(
+            attn_mask_processed, key_padding_mask_processed
+        )
+
+        logits = self.apply_attention_bias(logits, attention_bias)
+        logits = self.apply_position_bias(logits, position_bias)
+
+        attention_scores = self.calculate_attention_scores(logits)
+        attention_output = self.calculate_attention_output(attention_scores, v)
+        return attention_output, attention_scores
+
     def calculate_attention_logits(self, q, k):
         if self.scale_dot_product:
             depth = self.inner_dim // self.num_heads
@@ -442,7 +479,19 @@ class MultiheadAttention(nn.Module):
         )  # (B, H, Lq, E) * (B, H, E, Lk) -> (B, H, Lq, Lk)
         return logits
 
-    def process_attention_mask(self, attn_mask, past_kv, q):
+    def _pad_mask_for_past_kv(self, mask, key_length):
+        """Left-pad the key dimension of a mask that only covers the present
+        keys, so that the past keys are attended to."""
+        if key_length is None or mask.shape[-1] >= key_length:
+            return mask
+        past_mask = torch.zeros(
+            mask.shape[:-1] + (key_length - mask.shape[-1],),
+            dtype=mask.dtype,
+            device=mask.device,
+        )
+        return torch.cat([past_mask, mask], axis=-1)
+
+    def process_attention_mask(self, attn_mask, past_kv, q, key_length=None):
         attn_mask_reshaped = None
 
         # apply attention mask
@@ -464,31 +513,16 @@ class MultiheadAttention(nn.Module):
 
             # for broadcasting over all heads
             num_heads = 1
+            if past_kv is not None:
+                attn_mask = self._pad_mask_for_past_kv(attn_mask, key_length)
             if len(attn_mask.shape) == 2:
-                if past_kv is not None:
-                    past_mask = torch.zeros(
-                        (q.shape[0], past_kv.shape[-2]), dtype=attn_mask.dtype,
-                    )
-                    attn_mask = torch.cat([past_mask, attn_mask], axis=-1)
                 query_length, all_seq_length = attn_mask.shape
                 # for broadcasting over all batches
                 batch_size = 1
             elif len(attn_mask.shape) == 3:
-                if past_kv is not None:
-                    past_mask = torch.zeros(
-                        (q.shape[0], q.shape[-2], past_kv.shape[-2]),
-                        dtype=attn_mask.dtype,
-                    )
-                    attn_mask = torch.cat([past_mask, attn_mask], axis=-1)
                 batch_size, query_length, all_seq_length = attn_mask.shape
             else:
                 num_heads = attn_mask.shape[1]
-                if past_kv is not None:
-                    past_mask = torch.zeros(
-                        (q.shape[0], num_heads, q.shape[-2], past_kv.shape[-2]),
-                        dtype=attn_mask.dtype,
-                    )
-                    attn_mask = torch.cat([past_mask, attn_mask], axis=-1)
                 (
                     batch_size,
                     num_heads,
@@ -503,7 +537,9 @@ class MultiheadAttention(nn.Module):
 
         return attn_mask_reshaped
 
-    def process_key_padding_mask(self, key_padding_mask, attn_mask, past_kv, q):
+    def process_key_padding_mask(
+        self, key_padding_mask, attn_mask, past_kv, q, key_length=None
+    ):
         key_padding_mask_reshaped = None
 
         # apply key padding mask
@@ -520,11 +556,8 @@ class MultiheadAttention(nn.Module):
 
             # for broadcasting over all heads and queries
             if past_kv is not None:
-                past_mask = torch.zeros(
-                    (q.shape[0], past_kv.shape[-2]), dtype=attn_mask.dtype,
-                )
-                key_padding_mask = torch.cat(
-                    [past_mask, key_padding_mask], axis=-1
+                key_padding_mask = self._pad_mask_for_past_kv(
+                    key_padding_mask, key_length
                 )
             batch_size, all_seq_length = key_padding_mask.shape
 
@@ -0,0 +1,281 @@
+# Copyright 2022 Cerebras Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import abc
+
+import torch
+
+from modelzoo.common.pytorch.layers.AttentionLayer import MultiheadAttention
+
+
+class BlockSparseMask(abc.ABC):
+    """Attention mask described by blocks, which ``BlockwiseMultiheadAttention``
+    accepts as ``attn_mask`` instead of a dense mask.
+
+    Subclasses describe which blocks of ``block_size`` queries and keys are
+    attended to, so that the other blocks are skipped, and compute the mask
+    of the partially masked blocks on demand.
+    """
+
+    block_size = None
+
+    @abc.abstractmethod
+    def block_map(self):
+        """Find the attended blocks.
+
+        Returns:
+            Tuple of two boolean CPU tensors of shape ``[num_heads,
+            num_query_blocks, num_key_blocks]``, with ``num_heads`` 1 for a
+            mask shared by all heads: whether any position of a block is
+            attended to, and whether every position of a block is.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def block_mask(self, q_start, q_end, k_start, k_end, device=None):
+        """Compute the mask of the given queries and keys.
+
+        Returns:
+            Boolean tensor of shape ``[num_heads, q_end - q_start,
+            k_end - k_start]`` with True for masked positions.
+        """
+        raise NotImplementedError
+
+
+class BlockwiseMultiheadAttention(MultiheadAttention):
+    """Multi-head attention computed block by block with an online softmax.
+
+    Instead of materializing the ``[batch_size, num_heads, query_length,
+    key_length]`` logits, queries and keys are split in blocks of
+    ``block_size`` positions. For every block of queries, the blocks of keys
+    are visited in turn while keeping the running maximum of the logits, the
+    running softmax denominator and the running weighted sum of the values,
+    so memory grows linearly with the sequence length. The result matches
+    ``MultiheadAttention`` up to floating point rounding.
+
+    Blocks of keys which are masked for every query of a block are skipped:
+    with ``causal=True``, the causal mask is applied implicitly and the
+    blocks above the diagonal are never computed; with a boolean
+    ``attn_mask``, such as the GPT-3 fixed sparse layout, the fully masked
+    blocks are found once per call and skipped. ``attn_mask`` can also be
+    a ``BlockSparseMask``, which only materializes the mask of the partially
+    masked blocks.
+
+    Accepts the arguments of ``MultiheadAttention``, and:
+
+    Args:
+        block_size (int): Number of queries and keys per block. Defaults to
+            128.
+        causal (bool): Apply a causal mask aligned on the last query and
+            key, without materializing it. Defaults to False.
+    """
+
+    def __init__(
+        self, *args, block_size: int = 128, causal: bool = False, **kwargs
+    ):
+        super(BlockwiseMultiheadAttention, self).__init__(*args, **kwargs)
+        assert block_size > 0, "block_size must be positive."
+        self.block_size = block_size
+        self.causal = causal
+
+    def forward(self, q, k, v, need_weights=False, **kwargs):
+        assert (
+            not need_weights
+        ), "Blockwise attention does not compute the attention weights."
+        return super(BlockwiseMultiheadAttention, self).forward(
+            q, k, v, need_weights=need_weights, **kwargs
+        )
+
+    def _masked_blocks(self, attn_mask, query_length, key_length):
+        """Find the blocks masked for every batch entry, head and query of
+        the block of a boolean mask.
+
+        Returns:
+            Boolean tensor of shape ``[num_query_blocks, num_key_blocks]``
+            on the CPU, or None if ``attn_mask`` is not boolean.
+        """
+        if attn_mask is None or attn_mask.dtype != torch.bool:
+            return None
+        block = self.block_size
+        num_query_blocks = -(-query_length // block)
+        num_key_blocks = -(-key_length // block)
+        # Positions past the end are padded as masked.
+        mask = torch.nn.functional.pad(
+            attn_mask.expand(-1, -1, query_length, key_length),
+            (
+                0,
+                num_key_blocks * block - key_length,
+                0,
+                num_query_blocks * block - query_length,
+            ),
+            value=True,
+        )
+        mask = mask.reshape(
+            mask.shape[0] * mask.shape[1],
+            num_query_blocks,
+            block,
+            num_key_blocks,
+            block,
+        )
+        return mask.all(dim=4).all(dim=2).all(dim=0).cpu()
+
+    def attend(
+        self, q, k, v, attn_mask, key_padding_mask, past_kv, position_bias
+    ):
+        query_length, key_length = q.shape[-2], k.shape[-2]
+        block_sparse_mask = None
+        full_blocks = None
+        if isinstance(attn_mask, BlockSparseMask):
+            assert attn_mask.block_size == self.block_size, (
+                f"Block sparse mask with blocks of {attn_mask.block_size} "
+                f"positions cannot be used with blocks of {self.block_size}."
+            )
+            assert (
+                query_length == key_length
+            ), "Block sparse masks are only supported for self-attention."
+            block_sparse_mask, attn_mask = attn_mask, None
+            attended_blocks, full_blocks = block_sparse_mask.block_map()
+            masked_blocks = ~attended_blocks.any(dim=0)
+            full_blocks = full_blocks.all(dim=0)
+        attn_mask = self.process_attention_mask(
+            attn_mask, past_kv, q, key_length=key_length
+        )
+        key_padding_mask = self.process_key_padding_mask(
+            key_padding_mask, None, past_kv, q, key_length=key_length
+        )
+        if block_sparse_mask is None:
+            masked_blocks = self._masked_blocks(
+                attn_mask, query_length, key_length
+            )
+
+        dtype = q.dtype
+        if self.softmax_dtype_fp32 and dtype != torch.float32:
+            dtype = torch.float32
+        neg_inf = (
+            self.neg_inf if self.neg_inf is not None else torch.finfo(dtype).min
+        )
+
+        def _slice(mask, q_start, q_end, k_start, k_end):
+            if mask is None:
+                return None
+            if mask.shape[-2] == 1:
+                # Broadcast over the queries, e.g. a key padding mask.
+                return mask[..., k_start:k_end]
+            return mask[..., q_start:q_end, k_start:k_end]
+
+        def _apply_mask(logits, mask):
+            if mask is None:
+                return logits
+            if mask.dtype == torch.bool:
+                return logits.masked_fill(mask, neg_inf)
+            # Adding a float mask can overflow to -inf, which would make
+            # the softmax of a fully masked row NaN.
+            return (logits + mask.to(dtype)).clamp_min(neg_inf)
+
+        # Queries are aligned on the last keys, like past keys and values.
+        offset = key_length - query_length
+        outputs = []
+        for q_block, q_start in enumerate(
+            range(0, query_length, self.block_size)
+        ):
+            q_end = min(q_start + self.block_size, query_length)
+            q_i = q[:, :, q_start:q_end]
+            row_max = None
+            denominator = None
+            accumulator = None
+            for k_block, k_start in enumerate(
+                range(0, key_length, self.block_size)
+            ):
+                if self.causal and k_start > q_end - 1 + offset:
+                    break
+                if masked_blocks is not None and masked_blocks[q_block, k_block]:
+                    continue
+                k_end = min(k_start + self.block_size, key_length)
+
+                logits = self.calculate_attention_logits(
+                    q_i, k[:, :, k_start:k_end]
+                ).to(dtype)
+                if self.causal and k_end - 1 > q_start + offset:
+                    causal_mask = torch.ones(
+                        q_end - q_start,
+                        k_end - k_start,
+                        dtype=torch.bool,
+                        device=logits.device,
+                    ).triu(q_start + offset - k_start + 1)
+                    logits = logits.masked_fill(causal_mask, neg_inf)
+                if block_sparse_mask is not None and not full_blocks[
+                    q_block, k_block
+                ]:
+                    logits = _apply_mask(
+                        logits,
+                        block_sparse_mask.block_mask(
+                            q_start, q_end, k_start, k_end, logits.device
+                        ),
+                    )
+                logits = _apply_mask(
+                    logits, _slice(attn_mask, q_start, q_end, k_start, k_end)
+                )
+                logits = _apply_mask(
+                    logits,
+                    _slice(key_padding_mask, q_start, q_end, k_start, k_end),
+                )
+                if position_bias is not None:
+                    logits = logits + position_bias[
+                        ..., q_start:q_end, k_start:k_end
+                    ].to(dtype)
+
+                block_max = logits.amax(dim=-1, keepdim=True)
+                if row_max is None:
+                    new_max = block_max
+                else:
+                    new_max = torch.maximum(row_max, block_max)
+                probs = torch.exp(logits - new_max)
+                block_sum = probs.sum(dim=-1, keepdim=True)
+                # Dropout only applies to the weights of the values, the
+                # denominator normalizes the weights before dropout.
+                probs = self.dropout_layer(probs)
+                block_output = torch.matmul(
+                    probs.to(v.dtype), v[:, :, k_start:k_end]
+                ).to(dtype)
+
+                if row_max is None:
+                    denominator = block_sum
+                    accumulator = block_output
+                else:
+                    correction = torch.exp(row_max - new_max)
+                    denominator = denominator * correction + block_sum
+                    accumulator = accumulator * correction + block_output
+                row_max = new_max
+
+            if accumulator is None:
+                # Every key is masked for this block of queries.
+                outputs.append(q_i.new_zeros(q_i.shape[:-1] + v.shape[-1:]))
+            else:
+                outputs.append((accumulator / denominator).to(v.dtype))
+
+        attention_output = torch.cat(outputs, dim=-2)
+
+        # Recombine heads --> [batch_size, seq_length, embed_dim].
+        attention_output = self._combine_heads(attention_output)
+
+        # Run the combined outputs through another linear projection layer.
+        attention_output = self.proj_output_dense_layer(attention_output)
+
+        return attention_output, None
+
+    def check_extra_params(params):
+        assert all(
+            k in {"attention_kernel", "block_size", "causal"}
+            for k in params.keys()
+        ), "Overflow extra params for attention module `BlockwiseMultiheadAttention`"
@@ -242,12 +242,12 @@ class EmbeddingLayer(nn.Module):
         self.word_embeddings = new_embeddings
 
     def forward(
-        self, input_ids, segment_ids=None, past_length=0,
+        self, input_ids, segment_ids=None, past_length=0, position_ids=None,
     ):
         embeddings = self.compute_token_embeddings(input_ids)
         if self.position_embeddings is not None:
             embeddings += self.compute_positional_embeddings(
-                input_ids, past_length, embeddings.dtype
+                input_ids, past_length, embeddings.dtype, position_ids
             )
         if segment_ids is not None and self.segment_embeddings is not None:
             embeddings += self.compute_segment_embeddings(segment_ids)
@@ -260,7 +260,7 @@ class EmbeddingLayer(nn.Module):
         return embeddings
 
     def compute_positional_embeddings(
-        self, input_ids, past_length=0, dtype=None
+        self, input_ids, past_length=0, dtype=None, position_ids=None
     ):
         input_shape = input_ids.size()
         batch_size = input_ids.shape[0]
@@ -271,12 +271,15 @@ class EmbeddingLayer(nn.Module):
 
         position_embeddings = None
         if self.position_embedding_type == "learned":
-            position_ids = torch.arange(
-                past_length, input_shape[-1] + past_length, device=device,
-            ).expand((batch_size, -1))
+            if position_ids is None:
+                position_ids = torch.arange(
+                    past_length, input_shape[-1] + past_length, device=device,
+                ).expand((batch_size, -1))
             position_embeddings = self.position_embeddings(position_ids)
         elif self.position_embedding_type == "fixed":
             position_embeddings = self.position_embeddings.to(dtype=embed_dtype)
+            if position_ids is not None:
+                return position_embeddings[position_ids]
             length = input_shape[-1]
             if length != position_embeddings.size(dim=0):
                 position_embeddings = position_embeddings[:length]
@@ -20,6 +20,7 @@ from modelzoo.common.pytorch.layers.TransformerDecoderLayer import (
     SelfAndCrossAttnKV,
     SelfAttnKV,
     TransformerDecoderLayer,
+    split_past_kv,
 )
 from modelzoo.common.pytorch.model_utils.RotaryPositionEmbeddingHelper import (
     RotaryPositionEmbeddingHelper,
@@ -54,6 +55,7 @@ class GPTJDecoderLayer(TransformerDecoderLayer):
         cache_present_kv: bool = False,
         self_attn_position_bias: Optional[Tensor] = None,
         cross_attn_position_bias: Optional[Tensor] = None,
+        position_ids: Optional[Tensor] = None,
     ) -> Tensor:
         """GPTJ layer with rotary position embeddings and parallel decoder architecture
         """
@@ -66,9 +68,10 @@ class GPTJDecoderLayer(TransformerDecoderLayer):
             tgt_mask,
             tgt_key_padding_mask,
             rotary_position_embedding_helper,
-            past_kv=past_kv[:2] if past_kv is not None else None,
+            past_kv=split_past_kv(past_kv)[0],
             cache_present_kv=cache_present_kv,
             self_attn_position_bias=self_attn_position_bias,
+            position_ids=position_ids,
         )
 
         # Apply untied layernorm in neox
@@ -77,4 +80,6 @@ class GPTJDecoderLayer(TransformerDecoderLayer):
 
         ffn_output = self.ffn(hidden_normed)
         outputs = residual + ffn_output + attn_output[0]
+        if cache_present_kv:
+            return outputs, attn_output[1]
         return outputs
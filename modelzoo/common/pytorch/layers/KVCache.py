@@ -0,0 +1,68 @@
+# Copyright 2022 Cerebras Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import torch
+
+
+class KVCache:
+    """Preallocated keys and values of a self-attention layer, used for
+    incremental decoding.
+
+    Passed as ``past_kv`` to an attention layer, the cache stores the keys
+    and values of the new positions in place after the ones of the previous
+    calls, instead of concatenating them into new tensors on every step.
+
+    Args:
+        batch_size (int): Batch size.
+        num_heads (int): Number of attention heads.
+        max_length (int): Maximum number of positions to store.
+        head_dim (int): Size of the keys and values of every head.
+        dtype (torch.dtype): Dtype of the keys and values.
+        device (torch.device): Device of the keys and values.
+    """
+
+    def __init__(
+        self, batch_size, num_heads, max_length, head_dim, dtype, device=None
+    ):
+        shape = (batch_size, num_heads, max_length, head_dim)
+        self.keys = torch.zeros(shape, dtype=dtype, device=device)
+        self.values = torch.zeros(shape, dtype=dtype, device=device)
+        self.max_length = max_length
+        self.length = 0
+
+    def update(self, k, v):
+        """Store the keys and values of new positions.
+
+        Args:
+            k (Tensor): Keys, shape
+                ``[batch_size, num_heads, seq_length, head_dim]``.
+            v (Tensor): Values, of the same shape as ``k``.
+
+        Returns:
+            Views of the keys and values of all positions stored so far.
+        """
+        new_length = self.length + k.shape[-2]
+        assert new_length <= self.max_length, (
+            f"Cannot store {new_length} positions in a cache of "
+            f"{self.max_length} positions."
+        )
+        self.keys[:, :, self.length : new_length] = k
+        self.values[:, :, self.length : new_length] = v
+        self.length = new_length
+        return self.keys[:, :, :new_length], self.values[:, :, :new_length]
+
+    def reorder(self, indices):
+        """Select the batch entries at ``indices``, e.g. for beam search."""
+        self.keys = self.keys.index_select(0, indices)
+        self.values = self.values.index_select(0, indices)
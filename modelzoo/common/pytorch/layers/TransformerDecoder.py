@@ -18,9 +18,11 @@ Adapted from https://github.com/pytorch/pytorch/blob/master/torch/nn/modules/tra
 
 from typing import List, Optional, Tuple, Union
 
+import torch
 import torch.nn as nn
 from torch import Tensor
 
+from modelzoo.common.pytorch.layers.KVCache import KVCache
 from modelzoo.common.pytorch.layers.utils import _get_clones
 from modelzoo.common.pytorch.model_utils.RotaryPositionEmbeddingHelper import (
     RotaryPositionEmbeddingHelper,
@@ -65,6 +67,31 @@ class TransformerDecoder(nn.Module):
                 self.norm.bias.data.zero_()
             self.norm.weight.data.fill_(1.0)
 
+    def init_kv_cache(
+        self,
+        batch_size: int,
+        max_length: int,
+        dtype: torch.dtype,
+        device: Optional[torch.device] = None,
+    ) -> List[KVCache]:
+        """Preallocate the self-attention keys and values of every layer for
+        incremental decoding of up to ``max_length`` positions.
+        """
+        caches = []
+        for layer in self.layers:
+            attn = layer.self_attn
+            caches.append(
+                KVCache(
+                    batch_size,
+                    attn.num_heads,
+                    max_length,
+                    attn.inner_dim // attn.num_heads,
+                    dtype,
+                    device=device,
+                )
+            )
+        return caches
+
     def forward(
         self,
         tgt: Tensor,
@@ -94,17 +121,14 @@ class TransformerDecoder(nn.Module):
             memory_mask: the mask for the memory sequence (optional).
             tgt_key_padding_mask: the mask for the tgt keys per batch (optional).
             memory_key_padding_mask: the mask for the memory keys per batch (optional).
-            past_kv: Past keys and values for each of the decoder layers (optional).
+            past_kv: Past keys and values for each of the decoder layers,
+                e.g. from ``init_kv_cache`` (optional).
             cache_present_kv: Specifies if the present keys and values
                 must be cached and returned. (optional).
 
         Shape:
             see the docs in Transformer class.
         """
-        assert (
-            past_kv is None and not cache_present_kv
-        ), "Cannot provide past_kv because inference is not supported yet."
-
         output = tgt
         present_kv = []
 
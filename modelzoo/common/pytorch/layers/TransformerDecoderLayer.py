@@ -24,6 +24,7 @@ from torch.nn import Dropout, LayerNorm
 
 from modelzoo.common.pytorch.layers.AttentionHelper import get_attention_module
 from modelzoo.common.pytorch.layers.FeedForwardNetwork import FeedForwardNetwork
+from modelzoo.common.pytorch.layers.KVCache import KVCache
 from modelzoo.common.pytorch.model_utils.RotaryPositionEmbeddingHelper import (
     RotaryPositionEmbeddingHelper,
 )
@@ -33,6 +34,16 @@ CrossAttnKV = Tuple[Tensor, Tensor]
 SelfAndCrossAttnKV = Tuple[Tensor, Tensor, Tensor, Tensor]
 
 
+def split_past_kv(past_kv):
+    """Split past keys and values into the ones of the self-attention and
+    of the cross-attention. A ``KVCache`` only holds self-attention."""
+    if past_kv is None:
+        return None, None
+    if isinstance(past_kv, KVCache):
+        return past_kv, None
+    return past_kv[:2], past_kv[2:]
+
+
 class TransformerDecoderLayer(nn.Module):
     r"""
     TransformerDecoderLayer is made up of self-attn, multihead-attn and feedforward network.
@@ -221,6 +232,7 @@ class TransformerDecoderLayer(nn.Module):
         cache_present_kv: bool = False,
         self_attn_position_bias: Optional[Tensor] = None,
         cross_attn_position_bias: Optional[Tensor] = None,
+        position_ids: Optional[Tensor] = None,
         **extra_args,
     ) -> Union[Tensor, Tuple[Tensor, Union[SelfAttnKV, SelfAndCrossAttnKV]]]:
         r"""Pass the inputs (and mask) through the decoder layer.
@@ -234,20 +246,21 @@ class TransformerDecoderLayer(nn.Module):
             memory_key_padding_mask: the mask for the memory keys per batch (optional).
             past_kv: Past keys and values for self attention and (if applicable) cross
                 attention modules. Key/value tensors have shape
-                ``[batch_size, num_heads, seq_length, embed_dim / num_heads]``. (optional).
+                ``[batch_size, num_heads, seq_length, embed_dim / num_heads]``,
+                or a ``KVCache`` of the self attention. (optional).
             cache_present_kv: Specifies if the present keys and values
                 must be cached and returned. Needed to speed up the
                 computations when the decoder is called within an
                 autoregressive loop. (optional).
+            position_ids: the positions of the tgt tokens, used by rotary
+                position embeddings (optional).
 
         Shape:
             see the docs in Transformer class.
         """
         # see Fig. 1 of https://arxiv.org/pdf/2002.04745v1.pdf
 
-        assert (
-            past_kv is None and not cache_present_kv
-        ), "Cannot provide past_kv because inference is not supported yet."
+        self_attn_past_kv, cross_attn_past_kv = split_past_kv(past_kv)
 
         x = tgt
         if self.norm_first:
@@ -256,9 +269,10 @@ class TransformerDecoderLayer(nn.Module):
                 tgt_mask,
                 tgt_key_padding_mask,
                 rotary_position_embedding_helper=rotary_position_embedding_helper,
-                past_kv=past_kv[:2] if past_kv is not None else None,
+                past_kv=self_attn_past_kv,
                 cache_present_kv=cache_present_kv,
                 self_attn_position_bias=self_attn_position_bias,
+                position_ids=position_ids,
                 **extra_args,
             )
 
@@ -270,7 +284,7 @@ class TransformerDecoderLayer(nn.Module):
                     memory,
                     memory_mask,
                     memory_key_padding_mask,
-                    past_kv=past_kv[2:] if past_kv is not None else None,
+                    past_kv=cross_attn_past_kv,
                     cache_present_kv=cache_present_kv,
                     cross_attn_position_bias=cross_attn_position_bias,
                     **extra_args,
@@ -288,9 +302,10 @@ class TransformerDecoderLayer(nn.Module):
                 tgt_mask,
                 tgt_key_padding_mask,
                 rotary_position_embedding_helper=rotary_position_embedding_helper,
-                past_kv=past_kv[:2] if past_kv is not None else None,
+                past_kv=self_attn_past_kv,
                 cache_present_kv=cache_present_kv,
                 self_attn_position_bias=self_attn_position_bias,
+                position_ids=position_ids,
                 **extra_args,
             )
 
@@ -301,7 +316,7 @@ class TransformerDecoderLayer(nn.Module):
                     memory,
                     memory_mask,
                     memory_key_padding_mask,
-                    past_kv=past_kv[2:] if past_kv is not None else None,
+                    past_kv=cross_attn_past_kv,
                     cache_present_kv=cache_present_kv,
                     cross_attn_position_bias=cross_attn_position_bias,
                     **extra_args,
@@ -335,8 +350,11 @@ class TransformerDecoderLayer(nn.Module):
         past_kv: Optional[SelfAttnKV] = None,
         cache_present_kv: bool = False,
         self_attn_position_bias: Optional[Tensor] = None,
+        position_ids: Optional[Tensor] = None,
         **extra_args,
     ) -> Tensor:
+        if position_ids is not None:
+            extra_args["position_ids"] = position_ids
         attn_out = self.self_attn(
             x,
             x,
@@ -16,6 +16,10 @@ from modelzoo.common.pytorch.layers.AttentionLayer import MultiheadAttention
 from modelzoo.common.pytorch.layers.BCELoss import BCELoss
 from modelzoo.common.pytorch.layers.BCEWithLogitsLoss import BCEWithLogitsLoss
 from modelzoo.common.pytorch.layers.BiaslessLayerNorm import BiaslessLayerNorm
+from modelzoo.common.pytorch.layers.BlockwiseAttentionLayer import (
+    BlockSparseMask,
+    BlockwiseMultiheadAttention,
+)
 from modelzoo.common.pytorch.layers.CosineEmbeddingLoss import (
     CosineEmbeddingLoss,
 )
@@ -28,6 +32,7 @@ from modelzoo.common.pytorch.layers.GPTJDecoderLayer import GPTJDecoderLayer
 from modelzoo.common.pytorch.layers.HingeEmbeddingLoss import HingeEmbeddingLoss
 from modelzoo.common.pytorch.layers.HuberLoss import HuberLoss
 from modelzoo.common.pytorch.layers.KLDivLoss import KLDivLoss
+from modelzoo.common.pytorch.layers.KVCache import KVCache
 from modelzoo.common.pytorch.layers.L1Loss import L1Loss
 from modelzoo.common.pytorch.layers.MarginRankingLoss import MarginRankingLoss
 from modelzoo.common.pytorch.layers.MSELoss import MSELoss
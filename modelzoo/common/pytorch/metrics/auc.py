@@ -33,9 +33,13 @@ class _PipelineAUCMetric(CBMetric):
     by value. The AUC is then computed by interpolating pre-bucket averages.
     These buckets define the evaluated operational points.
 
-    Internally, we keep track of four local variables, `true_positives`,
-    `true_negatives`, `false_positives` and `false_negatives` that are used to
-    compute the AUC.
+    Internally, we keep track of the weighted counts of the predictions of
+    positive and negative labels in every bucket between consecutive
+    thresholds. The `true_positive`, `true_negative`, `false_positive` and
+    `false_negative` of every threshold, which are used to compute the AUC,
+    are the cumulative sums of these counts. Memory and compute per update are
+    therefore linear in the number of predictions, and do not grow with the
+    number of thresholds.
 
     To discretize the AUC curve, a linearly spaced set of thresholds is used to
     compute pairs of recall and precision values. The area under the ROC-curve
@@ -176,37 +180,54 @@ class _PipelineAUCMetric(CBMetric):
                 f"Values in `predictions` tensor must be in [0, 1]"
             )
 
-        # Tile predictions to have shape (self.num_thresholds, num_predictions)
-        preds_tiled = torch.tile(predictions, (self.num_thresholds, 1))
-
-        # Tile thresholds to have shape (self.num_thresholds, num_predictions)
-        thresh_tiled = self.thresholds.expand(-1, predictions.shape[0])
-
-        # Compare predictions and threshold
-        pred_is_pos = torch.gt(preds_tiled, thresh_tiled)
-        pred_is_neg = torch.logical_not(pred_is_pos)
-        label_is_pos = labels > 0
-        label_is_neg = torch.logical_not(label_is_pos)
-
-        def weighted_assign_add(label, pred, var, weights=None):
-            label_and_pred = torch.logical_and(label, pred)
-            if weights is not None:
-                label_and_pred = label_and_pred.mul(weights)
-            var.add_(torch.sum(label_and_pred, axis=-1))
-
-        # Update values for TP, FP, FN, TN
-        weighted_assign_add(
-            label_is_pos, pred_is_pos, self.true_positive, weights
+        # Predictions are compared to the thresholds in at least float32
+        dtype = torch.promote_types(predictions.dtype, torch.float32)
+        thresholds = self.thresholds.flatten().to(predictions.device, dtype)
+        # Bucket `b` holds the predictions above exactly the first `b`
+        # thresholds, so a prediction is positive at threshold `i` iff its
+        # bucket is above `i`.
+        buckets = torch.searchsorted(
+            thresholds, predictions.to(dtype).contiguous()
         )
-        weighted_assign_add(
-            label_is_neg, pred_is_pos, self.false_positive, weights
-        )
-        weighted_assign_add(
-            label_is_pos, pred_is_neg, self.false_negative, weights
+        label_is_pos = (labels > 0).long()
+        if weights is not None:
+            weights = weights.to(torch.float64)
+        counts = torch.bincount(
+            buckets * 2 + label_is_pos,
+            weights=weights,
+            minlength=2 * (self.num_thresholds + 1),
         )
-        weighted_assign_add(
-            label_is_neg, pred_is_neg, self.true_negative, weights
+        counts = counts.view(self.num_thresholds + 1, 2).to(
+            self.negative_counts.device, torch.float64
         )
+        self.negative_counts.add_(counts[:, 0])
+        self.positive_counts.add_(counts[:, 1])
+
+    def _confusion_counts(self):
+        """Derives the TP, FP, FN and TN of every threshold from the weighted
+        counts of positive and negative labels of every bucket."""
+        # Weights of the buckets above every threshold
+        tp = self.positive_counts.flip(0).cumsum(0).flip(0)[1:]
+        fp = self.negative_counts.flip(0).cumsum(0).flip(0)[1:]
+        fn = self.positive_counts.sum() - tp
+        tn = self.negative_counts.sum() - fp
+        return tuple(count.to(torch.float32) for count in (tp, fp, fn, tn))
+
+    @property
+    def true_positive(self):
+        return self._confusion_counts()[0]
+
+    @property
+    def false_positive(self):
+        return self._confusion_counts()[1]
+
+    @property
+    def false_negative(self):
+        return self._confusion_counts()[2]
+
+    @property
+    def true_negative(self):
+        return self._confusion_counts()[3]
 
     def interpolate_pr_auc(self):
         """
@@ -310,17 +331,13 @@ class _PipelineAUCMetric(CBMetric):
         )
 
     def reset_state(self):
-        self.true_positive = torch.zeros(
-            self.num_thresholds, dtype=torch.float32
-        )
-        self.true_negative = torch.zeros(
-            self.num_thresholds, dtype=torch.float32
-        )
-        self.false_positive = torch.zeros(
-            self.num_thresholds, dtype=torch.float32
+        # Weighted counts of the predictions of positive and negative labels
+        # in every bucket between consecutive thresholds
+        self.positive_counts = torch.zeros(
+            self.num_thresholds + 1, dtype=torch.float64
         )
-        self.false_negative = torch.zeros(
-            self.num_thresholds, dtype=torch.float32
+        self.negative_counts = torch.zeros(
+            self.num_thresholds + 1, dtype=torch.float64
         )
 
 
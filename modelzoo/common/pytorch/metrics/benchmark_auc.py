@@ -0,0 +1,168 @@
+# Copyright 2022 Cerebras Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures the time of the updates of the AUC metric, which buckets every
+prediction between the thresholds and accumulates per-bucket counts, against
+the previous updates, which compared every prediction to every threshold.
+Predictions are token-level, of shape [batch_size, seq_length], and both
+implementations are checked to compute the same AUC for every curve and
+summation method.
+"""
+import argparse
+import os
+import sys
+import time
+
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../../.."))
+from modelzoo.common.pytorch.metrics.auc import _PipelineAUCMetric
+
+
+class TiledAUCMetric(_PipelineAUCMetric):
+    """AUC metric with the previous updates, which tile the predictions to
+    shape [num_thresholds, num_predictions]."""
+
+    # Stored counts instead of the counts derived from the buckets
+    true_positive = None
+    false_positive = None
+    false_negative = None
+    true_negative = None
+
+    def update_on_host(self, labels, predictions, weights=None):
+        labels = torch.flatten(labels)
+        predictions = torch.flatten(predictions)
+        if weights is not None:
+            weights = torch.flatten(weights)
+
+        preds_tiled = torch.tile(predictions, (self.num_thresholds, 1))
+        thresh_tiled = self.thresholds.expand(-1, predictions.shape[0])
+        pred_is_pos = torch.gt(preds_tiled, thresh_tiled)
+        pred_is_neg = torch.logical_not(pred_is_pos)
+        label_is_pos = labels > 0
+        label_is_neg = torch.logical_not(label_is_pos)
+
+        def weighted_assign_add(label, pred, var, weights=None):
+            label_and_pred = torch.logical_and(label, pred)
+            if weights is not None:
+                label_and_pred = label_and_pred.mul(weights)
+            var.add_(torch.sum(label_and_pred, axis=-1))
+
+        weighted_assign_add(
+            label_is_pos, pred_is_pos, self.true_positive, weights
+        )
+        weighted_assign_add(
+            label_is_neg, pred_is_pos, self.false_positive, weights
+        )
+        weighted_assign_add(
+            label_is_pos, pred_is_neg, self.false_negative, weights
+        )
+        weighted_assign_add(
+            label_is_neg, pred_is_neg, self.true_negative, weights
+        )
+
+    def reset_state(self):
+        self.true_positive = torch.zeros(self.num_thresholds)
+        self.true_negative = torch.zeros(self.num_thresholds)
+        self.false_positive = torch.zeros(self.num_thresholds)
+        self.false_negative = torch.zeros(self.num_thresholds)
+
+
+def make_batches(num_batches, batch_size, seq_length):
+    torch.manual_seed(0)
+    batches = []
+    for _ in range(num_batches):
+        labels = torch.randint(0, 2, (batch_size, seq_length))
+        # Scores correlated with the labels, so that the AUC is not trivial
+        logits = torch.randn(batch_size, seq_length) + labels
+        weights = (torch.rand(batch_size, seq_length) > 0.1).float()
+        batches.append((labels, torch.sigmoid(logits), weights))
+    return batches
+
+
+def time_updates(metric, batches):
+    start = time.perf_counter()
+    for labels, predictions, weights in batches:
+        metric.update_on_host(labels, predictions, weights)
+    return (time.perf_counter() - start) / len(batches)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--batch_sizes",
+        nargs="+",
+        type=int,
+        default=[8, 32],
+        help="batch sizes to benchmark",
+    )
+    parser.add_argument(
+        "--seq_length", type=int, default=2048, help="sequence length",
+    )
+    parser.add_argument(
+        "--num_thresholds",
+        type=int,
+        default=200,
+        help="number of thresholds of the metrics",
+    )
+    parser.add_argument(
+        "--num_batches",
+        type=int,
+        default=5,
+        help="number of updates timed for every batch size",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    print(
+        f"{'batch':>6}{'predictions':>13}{'tiled ms':>10}"
+        f"{'bucketed ms':>13}{'speedup':>9}{'max AUC diff':>14}"
+    )
+    for batch_size in args.batch_sizes:
+        batches = make_batches(args.num_batches, batch_size, args.seq_length)
+        max_diff = 0.0
+        for curve in ("ROC", "PR"):
+            for summation_method in ("interpolation", "minoring", "majoring"):
+                tiled = TiledAUCMetric(
+                    num_thresholds=args.num_thresholds,
+                    curve=curve,
+                    summation_method=summation_method,
+                )
+                bucketed = _PipelineAUCMetric(
+                    num_thresholds=args.num_thresholds,
+                    curve=curve,
+                    summation_method=summation_method,
+                )
+                tiled_time = time_updates(tiled, batches)
+                bucketed_time = time_updates(bucketed, batches)
+                max_diff = max(
+                    max_diff, abs(tiled.compute() - bucketed.compute())
+                )
+        assert max_diff < 1e-5, f"AUC differs by {max_diff}"
+        print(
+            f"{batch_size:>6}{batch_size * args.seq_length:>13}"
+            f"{tiled_time * 1e3:>10.2f}{bucketed_time * 1e3:>13.2f}"
+            f"{tiled_time / bucketed_time:>8.1f}x{max_diff:>14.2e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -23,6 +23,16 @@ from modelzoo.common.pytorch import cb_model as cm
 from modelzoo.common.pytorch.metrics.cb_metric import CBMetric, DeviceOutputs
 
 
+def _total_loss(labels, loss, weights=None):
+    """Sum the weighted losses of every token, if given per token."""
+    if not isinstance(loss, torch.Tensor) or loss.shape != labels.shape:
+        return loss
+    loss = loss.detach().float()
+    if weights is not None:
+        loss = loss * weights.detach().float()
+    return loss.sum()
+
+
 class _PipelinePerplexityMetric(CBMetric):
     def init_state(self):
         self.reset()
@@ -35,13 +45,15 @@ class _PipelinePerplexityMetric(CBMetric):
 
         Args:
             labels: Tensor of shape (batch, sequence) and type int32.
-            loss: Tensor of shape (1) and type float.
+            loss: Tensor of shape (1) and type float, or of shape
+                (batch, sequence) with the loss of every token.
             weights: Optional float Tensor of shape (batch, sequence).
         """
         if weights is None:
             num_tokens = float(labels.numel())
         else:
             num_tokens = float(weights.detach().sum())
+        loss = _total_loss(labels, loss, weights)
 
         self.total_loss += loss
         self.total_num_tokens += num_tokens
@@ -70,6 +82,7 @@ class _WSPerplexityMetric(CBMetric):
             )
         else:
             num_tokens = (weights > 0).float().sum()
+        loss = _total_loss(labels, loss, weights)
 
         self.total_loss.add_(loss)
         self.total_num_tokens.add_(num_tokens)
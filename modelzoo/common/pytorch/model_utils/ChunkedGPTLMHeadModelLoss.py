@@ -0,0 +1,198 @@
+# Copyright 2022 Cerebras Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import NamedTuple
+
+import torch
+import torch.nn as nn
+
+from modelzoo.common.pytorch.model_utils.GPTLMHeadModelLoss import (
+    GPTLMHeadModelLoss,
+)
+
+
+class _ChunkedLMHeadCrossEntropy(torch.autograd.Function):
+    """LM head projection followed by cross entropy, computed on chunks of
+    tokens so that the logits of all tokens are never held at once.
+
+    The forward pass keeps the log-sum-exp of the logits of every token, and
+    the backward pass recomputes the logits of every chunk from it.
+    """
+
+    @staticmethod
+    def forward(ctx, hidden_states, weight, bias, labels, chunk_size):
+        # The softmax is computed in at least float32
+        dtype = torch.promote_types(hidden_states.dtype, torch.float32)
+        num_tokens = hidden_states.shape[0]
+        losses = torch.empty(
+            num_tokens, dtype=dtype, device=hidden_states.device
+        )
+        predictions = torch.empty(
+            num_tokens, dtype=torch.long, device=hidden_states.device
+        )
+        logsumexp = torch.empty_like(losses)
+        for start in range(0, num_tokens, chunk_size):
+            end = min(start + chunk_size, num_tokens)
+            logits = nn.functional.linear(
+                hidden_states[start:end], weight, bias
+            ).to(dtype)
+            logsumexp[start:end] = torch.logsumexp(logits, dim=-1)
+            predictions[start:end] = logits.argmax(dim=-1)
+            losses[start:end] = logsumexp[start:end] - logits.gather(
+                -1, labels[start:end, None]
+            ).squeeze(-1)
+
+        ctx.save_for_backward(hidden_states, weight, bias, labels, logsumexp)
+        ctx.chunk_size = chunk_size
+        ctx.mark_non_differentiable(predictions)
+        return losses, predictions
+
+    @staticmethod
+    def backward(ctx, grad_losses, grad_predictions):
+        hidden_states, weight, bias, labels, logsumexp = ctx.saved_tensors
+        chunk_size = ctx.chunk_size
+        dtype = logsumexp.dtype
+        grad_hidden_states = grad_weight = grad_bias = None
+        if ctx.needs_input_grad[0]:
+            grad_hidden_states = torch.empty_like(hidden_states)
+        if ctx.needs_input_grad[1]:
+            grad_weight = torch.zeros_like(weight, dtype=dtype)
+        if bias is not None and ctx.needs_input_grad[2]:
+            grad_bias = torch.zeros_like(bias, dtype=dtype)
+
+        num_tokens = hidden_states.shape[0]
+        for start in range(0, num_tokens, chunk_size):
+            end = min(start + chunk_size, num_tokens)
+            chunk = hidden_states[start:end]
+            logits = nn.functional.linear(chunk, weight, bias).to(dtype)
+            # d(logsumexp - logit[label]) / d(logits) = softmax - one_hot
+            grad_logits = torch.exp(logits - logsumexp[start:end, None])
+            grad_logits.scatter_add_(
+                -1,
+                labels[start:end, None],
+                -torch.ones_like(grad_logits[:, :1]),
+            )
+            grad_logits *= grad_losses[start:end, None]
+
+            if grad_hidden_states is not None:
+                grad_hidden_states[start:end] = grad_logits.to(
+                    weight.dtype
+                ).matmul(weight)
+            if grad_weight is not None:
+                grad_weight += grad_logits.t().matmul(chunk.to(dtype))
+            if grad_bias is not None:
+                grad_bias += grad_logits.sum(dim=0)
+
+        if grad_weight is not None:
+            grad_weight = grad_weight.to(weight.dtype)
+        if grad_bias is not None:
+            grad_bias = grad_bias.to(bias.dtype)
+        return grad_hidden_states, grad_weight, grad_bias, None, None
+
+
+def chunked_lm_head_cross_entropy(
+    hidden_states, weight, bias, labels, chunk_size=1024, ignore_index=-100
+):
+    """Compute the cross entropy of the LM head logits of every token
+    without materializing the logits of all tokens.
+
+    Args:
+        hidden_states (Tensor): Final hidden states, shape ``[..., hidden]``.
+        weight (Tensor): LM head weight, shape ``[vocab_size, hidden]``.
+        bias (Tensor): Optional LM head bias, shape ``[vocab_size]``.
+        labels (Tensor): Target token ids, shape ``[...]``.
+        chunk_size (int): Number of tokens whose logits are computed at once.
+        ignore_index (int): Labels with this value get a loss of 0.
+
+    Returns:
+        Tuple of the cross entropy of every token, in at least float32, and
+        of the argmax of the logits of every token, both of the shape of
+        ``labels``.
+    """
+    shape = labels.shape
+    labels = labels.reshape(-1).long()
+    ignored = labels == ignore_index
+    losses, predictions = _ChunkedLMHeadCrossEntropy.apply(
+        hidden_states.reshape(-1, hidden_states.shape[-1]),
+        weight,
+        bias,
+        labels.masked_fill(ignored, 0),
+        chunk_size,
+    )
+    losses = losses.masked_fill(ignored, 0.0)
+    return losses.view(shape), predictions.view(shape)
+
+
+class ChunkedLMHeadOutput(NamedTuple):
+    """Outputs of ``ChunkedGPTLMHeadModelLoss``.
+
+    ``predictions`` and ``token_log_probs`` can be passed as is to
+    ``AccuracyMetric`` and, negated, as the ``loss`` of ``PerplexityMetric``.
+    """
+
+    loss: torch.Tensor
+    predictions: torch.Tensor
+    token_log_probs: torch.Tensor
+
+
+class ChunkedGPTLMHeadModelLoss(GPTLMHeadModelLoss):
+    """``GPTLMHeadModelLoss`` fused with the LM head, which computes the
+    logits in chunks of ``chunk_size`` tokens instead of taking the logits
+    of all tokens. The backward pass recomputes the logits of every chunk.
+    """
+
+    def __init__(
+        self, vocab_size, loss_scaling, loss_weight, chunk_size=1024,
+    ):
+        super(ChunkedGPTLMHeadModelLoss, self).__init__(
+            vocab_size, loss_scaling, loss_weight
+        )
+        assert chunk_size > 0, "chunk_size must be positive."
+        self.chunk_size = chunk_size
+
+    def forward(
+        self, hidden_states, lm_head, labels, attention_mask,
+    ):
+        """
+        Args:
+            hidden_states (Tensor): Final hidden states of shape
+                ``[batch_size, seq_length, hidden_size]``.
+            lm_head (nn.Linear): LM head projecting the hidden states to
+                the vocabulary.
+            labels (Tensor): Target token ids of shape
+                ``[batch_size, seq_length]``.
+            attention_mask (Tensor): Weights of the tokens in the loss.
+
+        Returns:
+            ``ChunkedLMHeadOutput`` with the scaled loss, the predicted token
+            ids and the log-probability of the label of every token.
+        """
+        lm_loss, predictions = chunked_lm_head_cross_entropy(
+            hidden_states,
+            lm_head.weight,
+            lm_head.bias,
+            labels,
+            chunk_size=self.chunk_size,
+        )
+        token_log_probs = -lm_loss
+
+        weights = attention_mask.to(dtype=torch.float32)
+        lm_loss = lm_loss * weights
+        if self.loss_scaling == "num_tokens":
+            lm_loss = torch.sum(lm_loss) / torch.sum(weights)
+        else:
+            lm_loss = (torch.sum(lm_loss) / labels.shape[0]) * self.loss_weight
+
+        loss = lm_loss.to(hidden_states.dtype)
+        return ChunkedLMHeadOutput(loss, predictions, token_log_probs)
@@ -67,7 +67,9 @@ class RotaryPositionEmbeddingHelper:
         self.cos_cached = cm.make_constant(cos)
         return self.sin_cached, self.cos_cached
 
-    def _apply_rotary_pos_emb(self, x, real_seq_length, offset=0):
+    def _apply_rotary_pos_emb(
+        self, x, real_seq_length, offset=0, position_ids=None
+    ):
         def rotate_every_two(x):
             x1 = x[:, :, :, ::2]
             x2 = x[:, :, :, 1::2]
@@ -78,20 +80,32 @@ class RotaryPositionEmbeddingHelper:
         def slice_at_offset(t):
             return t[None, offset : x.shape[1] + offset, None, :]
 
+        def gather_at_positions(t):
+            # [batch_size, seq_length, 1, rotary_dim]
+            return t[position_ids][:, :, None, :]
+
         sin, cos = self.create_fixed_pos_emb(x.device, x.dtype)
-        sin, cos = map(slice_at_offset, (sin, cos))
+        if position_ids is not None:
+            sin, cos = map(gather_at_positions, (sin, cos))
+        else:
+            sin, cos = map(slice_at_offset, (sin, cos))
 
         # einsum notation for lambda t: repeat(t[offset:x.shape[1]+offset,:], "n d -> () n () (d j)", j=2)
         return (x * cos) + (rotate_every_two(x) * sin)
 
-    def rotate_tensor(self, x, real_seq_length, offset=0):
+    def rotate_tensor(self, x, real_seq_length, offset=0, position_ids=None):
+        """Rotate `x` by the angles of its positions. The positions start at
+        `offset`, unless `position_ids` of shape [batch_size, seq_length]
+        gives the positions of every sequence, e.g. for left padded
+        sequences during incremental decoding.
+        """
         assert (
             len(x.shape) == 4
         ), "Tensor should be of shape [batch_size, seq_length, num_heads, head_dim] !"
         x_rotary = x[:, :, :, : self.rotary_dim]
         x_pass = x[:, :, :, self.rotary_dim :]
         x_rotated = self._apply_rotary_pos_emb(
-            x_rotary, real_seq_length, offset=offset
+            x_rotary, real_seq_length, offset=offset, position_ids=position_ids
         )
         x = torch.cat([x_rotated, x_pass], dim=-1)
         return x
@@ -0,0 +1,262 @@
+# Copyright 2022 Cerebras Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures how many checkpoint keys per second the checkpoint converters match
+to their conversion rules, with the compiled and indexed rules and with the
+previous sequential matching, which compiled the regex of every rule tried.
+Keys follow the HF state dicts of GPT-2, GPT-J, GPT-NeoX and T5, and are
+converted to CS 1.8 and back. Only the keys are converted, no rule action is
+applied.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../../.."))
+from modelzoo.common.pytorch.model_utils.checkpoint_converters.base_converter import (
+    ConversionRule,
+    EquivalentSubkey,
+)
+from modelzoo.common.pytorch.model_utils.checkpoint_converters.gpt2_hf_cs import (
+    Converter_GPT2LMHeadModel_HF_CS18,
+)
+from modelzoo.common.pytorch.model_utils.checkpoint_converters.gpt_neox_hf_cs import (
+    Converter_GPT_Neox_LMHeadModel_HF_CS18,
+)
+from modelzoo.common.pytorch.model_utils.checkpoint_converters.gptj_hf_cs import (
+    Converter_GPTJ_LMHeadModel_HF_CS18,
+)
+from modelzoo.common.pytorch.model_utils.checkpoint_converters.t5 import (
+    Converter_T5_HF_CS18,
+)
+
+
+def gpt2_keys(num_layers):
+    keys = ["transformer.wte.weight", "transformer.wpe.weight"]
+    for i in range(num_layers):
+        for name in [
+            "ln_1",
+            "attn.c_attn",
+            "attn.c_proj",
+            "ln_2",
+            "mlp.c_fc",
+            "mlp.c_proj",
+        ]:
+            keys += [
+                f"transformer.h.{i}.{name}.{p}" for p in ("weight", "bias")
+            ]
+    keys += ["transformer.ln_f.weight", "transformer.ln_f.bias"]
+    return keys + ["lm_head.weight"]
+
+
+def gptj_keys(num_layers):
+    keys = ["transformer.wte.weight"]
+    for i in range(num_layers):
+        layer = f"transformer.h.{i}"
+        keys += [f"{layer}.ln_1.weight", f"{layer}.ln_1.bias"]
+        keys += [
+            f"{layer}.attn.{name}.weight"
+            for name in ("q_proj", "k_proj", "v_proj", "out_proj")
+        ]
+        keys += [
+            f"{layer}.mlp.{name}.{p}"
+            for name in ("fc_in", "fc_out")
+            for p in ("weight", "bias")
+        ]
+    keys += ["transformer.ln_f.weight", "transformer.ln_f.bias"]
+    return keys + ["lm_head.weight", "lm_head.bias"]
+
+
+def gpt_neox_keys(num_layers):
+    keys = ["gpt_neox.embed_in.weight"]
+    for i in range(num_layers):
+        keys += [
+            f"gpt_neox.layers.{i}.{name}.{p}"
+            for name in (
+                "input_layernorm",
+                "post_attention_layernorm",
+                "attention.query_key_value",
+                "attention.dense",
+                "mlp.dense_h_to_4h",
+                "mlp.dense_4h_to_h",
+            )
+            for p in ("weight", "bias")
+        ]
+    keys += ["gpt_neox.final_layer_norm.weight"]
+    keys += ["gpt_neox.final_layer_norm.bias"]
+    return keys + ["embed_out.weight"]
+
+
+def t5_keys(num_layers):
+    keys = ["shared.weight", "encoder.embed_tokens.weight"]
+    keys += ["decoder.embed_tokens.weight"]
+    for stack, attention_layers in (
+        ("encoder", ["SelfAttention"]),
+        ("decoder", ["SelfAttention", "EncDecAttention"]),
+    ):
+        for i in range(num_layers):
+            block = f"{stack}.block.{i}.layer"
+            for j, name in enumerate(attention_layers):
+                keys += [
+                    f"{block}.{j}.{name}.{w}.weight"
+                    for w in ("q", "k", "v", "o")
+                ]
+                keys += [f"{block}.{j}.layer_norm.weight"]
+            if i == 0:
+                keys += [
+                    f"{block}.0.SelfAttention.relative_attention_bias.weight"
+                ]
+            ffn = len(attention_layers)
+            keys += [
+                f"{block}.{ffn}.DenseReluDense.{w}.weight"
+                for w in ("wi", "wo")
+            ]
+            keys += [f"{block}.{ffn}.layer_norm.weight"]
+        keys += [f"{stack}.final_layer_norm.weight"]
+    return keys + ["lm_head.weight"]
+
+
+MODELS = {
+    "gpt2": (Converter_GPT2LMHeadModel_HF_CS18, gpt2_keys),
+    "gptj": (Converter_GPTJ_LMHeadModel_HF_CS18, gptj_keys),
+    "gpt-neox": (Converter_GPT_Neox_LMHeadModel_HF_CS18, gpt_neox_keys),
+    "t5": (Converter_T5_HF_CS18, t5_keys),
+}
+
+
+def sequential_match_key(
+    converter, old_key, from_index, match_start=0, prefix=""
+):
+    """Matches keys like the converters did before the rules were indexed:
+    every rule is tried in turn and its regex is rebuilt and compiled."""
+    for rule in converter.rules:
+        chained = ConversionRule.segment_is_converter(rule.segments[-1])
+        segments = rule.segments[:-1] if chained else rule.segments
+        regex_str = ""
+        for elm in segments:
+            if isinstance(elm, EquivalentSubkey):
+                elm = re.escape(elm[from_index])
+            regex_str += "({})".format(elm)
+        pattern = re.compile(regex_str)
+        match_result = (
+            pattern.match(old_key, match_start)
+            if chained
+            else pattern.fullmatch(old_key, match_start)
+        )
+        if match_result is None:
+            continue
+        converted = prefix
+        for i, elm in enumerate(segments):
+            if isinstance(elm, EquivalentSubkey):
+                converted += elm[1 - from_index]
+            else:
+                converted += match_result.group(i + 1)
+        if not chained:
+            return rule, converted
+        match = sequential_match_key(
+            rule.segments[-1],
+            old_key,
+            from_index,
+            match_start=match_result.span()[1],
+            prefix=converted,
+        )
+        if match is not None:
+            return match
+    return None
+
+
+def time_matching(match_fn, converter, keys, from_index, repeats):
+    matches = None
+    start = time.perf_counter()
+    for _ in range(repeats):
+        matches = [match_fn(converter, key, from_index) for key in keys]
+    elapsed = time.perf_counter() - start
+    return matches, len(keys) * repeats / elapsed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--models",
+        nargs="+",
+        choices=list(MODELS.keys()),
+        default=list(MODELS.keys()),
+        help="converters to benchmark",
+    )
+    parser.add_argument(
+        "--num_layers",
+        type=int,
+        default=44,
+        help="number of layers of the synthetic state dicts",
+    )
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=3,
+        help="number of times every key is converted",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    indexed_match_key = lambda converter, key, from_index: converter.match_key(
+        key, from_index
+    )
+
+    print(
+        f"{'model':<10}{'direction':<11}{'keys':>7}{'unmatched':>11}"
+        f"{'sequential keys/s':>19}{'indexed keys/s':>16}{'speedup':>9}"
+    )
+    for model in args.models:
+        converter_class, make_keys = MODELS[model]
+        converter = converter_class()
+        keys = make_keys(args.num_layers)
+        for from_index in (0, 1):
+            matches, sequential_rate = time_matching(
+                sequential_match_key,
+                converter,
+                keys,
+                from_index,
+                args.repeats,
+            )
+            indexed_matches, indexed_rate = time_matching(
+                indexed_match_key, converter, keys, from_index, args.repeats,
+            )
+            assert [
+                match and (id(match[0]), match[1]) for match in matches
+            ] == [
+                match and (id(match[0]), match[1]) for match in indexed_matches
+            ], f"Indexed matching differs for {model}"
+
+            formats = converter_class.formats()
+            direction = f"{formats[from_index]}->{formats[1 - from_index]}"
+            print(
+                f"{model:<10}{direction:<11}{len(keys):>7}"
+                f"{sum(match is None for match in matches):>11}"
+                f"{sequential_rate:>19.0f}{indexed_rate:>16.0f}"
+                f"{indexed_rate / sequential_rate:>8.1f}x"
+            )
+            # The converted keys are converted back
+            keys = [match[1] for match in matches if match is not None]
+
+
+if __name__ == "__main__":
+    main()
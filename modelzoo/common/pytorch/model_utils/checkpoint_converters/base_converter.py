@@ -46,6 +46,88 @@ class EquivalentSubkey:
         return self.keys[idx]
 
 
+def _has_top_level_alternation(regex: str) -> bool:
+    depth = 0
+    in_class = False
+    i = 0
+    while i < len(regex):
+        char = regex[i]
+        if char == "\\":
+            i += 2
+            continue
+        if in_class:
+            in_class = char != "]"
+        elif char == "[":
+            in_class = True
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            return True
+        i += 1
+    return False
+
+
+def _regex_literal_prefix(regex: str) -> Tuple[str, bool]:
+    r"""
+    Returns the literal string that every match of `regex` starts with, and
+    whether the regex is entirely that literal. Conservative: stops at the
+    first construct other than plain or escaped punctuation characters.
+    """
+    if _has_top_level_alternation(regex):
+        return "", False
+    literal = ""
+    i = 0
+    while i < len(regex):
+        char = regex[i]
+        length = 1
+        if char == "\\":
+            if i + 1 >= len(regex) or regex[i + 1].isalnum():
+                # Character classes (\d, \w, ...) and back references
+                return literal, False
+            char = regex[i + 1]
+            length = 2
+        elif char in ".^$*+?{}[]()":
+            return literal, False
+        if regex[i + length : i + length + 1] in ("*", "?", "{"):
+            # The character is optional
+            return literal, False
+        literal += char
+        if regex[i + length : i + length + 1] == "+":
+            return literal, False
+        i += length
+    return literal, True
+
+
+class _RulePrefixTrie:
+    r"""
+    Character trie of the literal prefixes of a converter's rules. Looking up
+    a key returns the indices, in order, of the rules whose literal prefix
+    the key starts with, which are the only rules that can match it.
+    """
+
+    def __init__(self, prefixes: List[str]) -> None:
+        # Every node is a pair of its children and of the rules ending there
+        self.root = ({}, [])
+        for rule_index, prefix in enumerate(prefixes):
+            node = self.root
+            for char in prefix:
+                node = node[0].setdefault(char, ({}, []))
+            node[1].append(rule_index)
+
+    def candidates(self, key: str, start: int = 0) -> List[int]:
+        node = self.root
+        rule_indices = list(node[1])
+        for i in range(start, len(key)):
+            node = node[0].get(key[i])
+            if node is None:
+                break
+            rule_indices.extend(node[1])
+        rule_indices.sort()
+        return rule_indices
+
+
 class ConversionRule:
     r"""ConversionRule defines a "rule" which:
         1. a key can be matched against
@@ -139,6 +221,7 @@ class ConversionRule:
         self.exists = exists
         self.action = action
         self.validate_segments()
+        self._compiled = {}
 
     @staticmethod
     def segment_is_converter(
@@ -158,40 +241,71 @@ class ConversionRule:
                     seg
                 )
 
-    def convert_key(
+    def compile(self, from_index: int):
+        r"""
+        Returns the compiled regex of the rule's segments when converting from
+        `from_index`, along with the number of segments it covers and whether
+        the rule ends with a chained converter. Compiled once per index.
+        """
+        if from_index not in self._compiled:
+            chained_converter = ConversionRule.segment_is_converter(
+                self.segments[-1]
+            )
+            candidate_segments = len(self.segments)
+            if chained_converter:
+                candidate_segments -= 1
+
+            regex_str = ""
+            for i in range(candidate_segments):
+                elm = self.segments[i]
+                assert not ConversionRule.segment_is_converter(
+                    elm
+                ), "Checkpoint convert objects can only be placed at the end of rules"
+                if isinstance(elm, EquivalentSubkey):
+                    elm = re.escape(elm[from_index])
+                regex_str += "({})".format(elm)
+
+            self._compiled[from_index] = (
+                re.compile(regex_str),
+                candidate_segments,
+                chained_converter,
+            )
+        return self._compiled[from_index]
+
+    def literal_prefix(self, from_index: int) -> str:
+        r"""
+        Returns a string that every key matched by this rule starts with
+        (after `match_start`) when converting from `from_index`. It is used to
+        skip the rules which cannot match a key without running their regex.
+        """
+        prefix = ""
+        for elm in self.segments:
+            if ConversionRule.segment_is_converter(elm):
+                break
+            if isinstance(elm, EquivalentSubkey):
+                prefix += elm[from_index]
+                continue
+            literal, is_literal = _regex_literal_prefix(elm)
+            prefix += literal
+            if not is_literal:
+                break
+        return prefix
+
+    def match_key(
         self,
         old_key: str,
-        old_state_dict: OrderedDict,
-        new_state_dict: OrderedDict,
         from_index: int,
         match_start: int = 0,
         prefix: str = "",
-        action_fn_args: Optional[dict] = None,
-        debug: bool = False,
-    ) -> bool:
-        regex_str = ""
-        maybe_escape = (
-            lambda elm, idx: re.escape(elm[idx])
-            if isinstance(elm, EquivalentSubkey)
-            else elm
-        )
-
-        regex_str = ""
-        chained_converter = ConversionRule.segment_is_converter(
-            self.segments[-1]
+    ) -> Optional[Tuple[ConversionRule, str]]:
+        r"""
+        Matches the old key against this rule (and its chained converter, if
+        any) without applying any action. Returns the rule which matched the
+        full key and the new key, or None if the key didn't match.
+        """
+        pattern, candidate_segments, chained_converter = self.compile(
+            from_index
         )
-        candidate_segments = len(self.segments)
-        if chained_converter:
-            candidate_segments -= 1
-
-        for i in range(candidate_segments):
-            elm = self.segments[i]
-            assert not ConversionRule.segment_is_converter(
-                elm
-            ), "Checkpoint convert objects can only be placed at the end of rules"
-            regex_str += "({})".format(maybe_escape(elm, from_index))
-
-        pattern = re.compile(regex_str)
         match_result = (
             pattern.fullmatch(old_key, match_start)
             if not chained_converter
@@ -199,7 +313,7 @@ class ConversionRule:
         )
 
         if match_result is None:
-            return False
+            return None
 
         converted = prefix
         to_index = 1 - from_index
@@ -213,35 +327,83 @@ class ConversionRule:
 
         if chained_converter:
             converter = self.segments[-1]
-            return converter.convert_key(
+            return converter.match_key(
                 old_key,
-                old_state_dict,
-                new_state_dict,
                 from_index,
                 match_start=match_result.span()[1],
                 prefix=converted,
-                action_fn_args=action_fn_args,
-                debug=debug,
             )
-        else:
-            if debug:
-                print(
-                    "Matched {} -> {} action: {}".format(
-                        old_key,
-                        converted,
-                        self.action.__name__ if self.action else "None",
-                    )
-                )
-            if self.action:
-                self.action(
+        return self, converted
+
+    def apply_action(
+        self,
+        old_key: str,
+        new_key: str,
+        old_state_dict: OrderedDict,
+        new_state_dict: OrderedDict,
+        from_index: int,
+        action_fn_args: Optional[dict] = None,
+        debug: bool = False,
+    ) -> None:
+        if debug:
+            print(
+                "Matched {} -> {} action: {}".format(
                     old_key,
-                    converted,
-                    old_state_dict,
-                    new_state_dict,
-                    from_index,
-                    action_fn_args,
+                    new_key,
+                    self.action.__name__ if self.action else "None",
                 )
-            return True
+            )
+        if self.action:
+            self.action(
+                old_key,
+                new_key,
+                old_state_dict,
+                new_state_dict,
+                from_index,
+                action_fn_args,
+            )
+
+    def convert_key(
+        self,
+        old_key: str,
+        old_state_dict: OrderedDict,
+        new_state_dict: OrderedDict,
+        from_index: int,
+        match_start: int = 0,
+        prefix: str = "",
+        action_fn_args: Optional[dict] = None,
+        debug: bool = False,
+    ) -> bool:
+        match = self.match_key(old_key, from_index, match_start, prefix)
+        if match is None:
+            return False
+        rule, new_key = match
+        rule.apply_action(
+            old_key,
+            new_key,
+            old_state_dict,
+            new_state_dict,
+            from_index,
+            action_fn_args,
+            debug=debug,
+        )
+        return True
+
+    def get_action_inputs(
+        self, old_key: str, new_key: str, from_index: int
+    ) -> List[str]:
+        r"""
+        Returns the other old keys which the action reads, as declared with
+        the `action_inputs` decorator.
+        """
+        inputs_fn = getattr(self.action, "inputs", None)
+        if inputs_fn is None:
+            return []
+        return [
+            key
+            for key in inputs_fn(old_key, new_key, from_index)
+            if key != old_key
+        ]
 
     def exists_in_index(self, to_index: int) -> bool:
         return (
@@ -306,6 +468,51 @@ class BaseDictionaryConverter(ABC):
         """
         new_state_dict[new_key] = old_state_dict[old_key]
 
+    def _rule_index(self, from_index: int) -> _RulePrefixTrie:
+        r"""
+        Returns the prefix trie of the rules for `from_index`, built once and
+        rebuilt only if `self.rules` is replaced or resized.
+        """
+        assert hasattr(
+            self, "rules"
+        ), "Converter must have a list of conversion rules"
+        cache = getattr(self, "_rule_index_cache", None)
+        if (
+            cache is None
+            or cache[0] is not self.rules
+            or cache[1] != len(self.rules)
+        ):
+            cache = (self.rules, len(self.rules), {})
+            self._rule_index_cache = cache
+        indices = cache[2]
+        if from_index not in indices:
+            indices[from_index] = _RulePrefixTrie(
+                [rule.literal_prefix(from_index) for rule in self.rules]
+            )
+        return indices[from_index]
+
+    def match_key(
+        self,
+        old_key: str,
+        from_index: int,
+        match_start: int = 0,
+        prefix: str = "",
+    ) -> Optional[Tuple[ConversionRule, str]]:
+        r"""
+        Finds the first rule which matches the old key, without applying its
+        action. Only the rules whose literal prefix the key starts with are
+        tried, in order. Returns the matching rule (possibly from a chained
+        converter) and the new key, or None if no rule matched.
+        """
+        rule_index = self._rule_index(from_index)
+        for i in rule_index.candidates(old_key, match_start):
+            match = self.rules[i].match_key(
+                old_key, from_index, match_start, prefix
+            )
+            if match is not None:
+                return match
+        return None
+
     def convert_key(
         self,
         old_key: str,
@@ -323,23 +530,20 @@ class BaseDictionaryConverter(ABC):
         even if multiple rules *would* match, the latter ones are never used).
         Returns True if a conversion occured.
         """
-        assert hasattr(
-            self, "rules"
-        ), "Converter must have a list of conversion rules"
-        for rule in self.rules:
-            did_convert = rule.convert_key(
-                old_key,
-                old_state_dict,
-                new_state_dict,
-                from_index,
-                match_start,
-                prefix,
-                action_fn_args,
-                debug=debug,
-            )
-            if did_convert:
-                return True
-        return False
+        match = self.match_key(old_key, from_index, match_start, prefix)
+        if match is None:
+            return False
+        rule, new_key = match
+        rule.apply_action(
+            old_key,
+            new_key,
+            old_state_dict,
+            new_state_dict,
+            from_index,
+            action_fn_args,
+            debug=debug,
+        )
+        return True
 
     def convert_all_keys(
         self,
@@ -479,6 +683,157 @@ class BaseCheckpointConverter(BaseDictionaryConverter, ABC):
         del old_state_dict
         return checkpoint
 
+    @classmethod
+    def convert_streaming(
+        cls,
+        old_state_dict,
+        new_state_dict,
+        configs,
+        checkpoint_from_index,
+        **kwargs,
+    ):
+        instance = cls()
+        instance.convert_streaming_helper(
+            old_state_dict,
+            new_state_dict,
+            configs,
+            checkpoint_from_index,
+            **kwargs,
+        )
+
+    def convert_streaming_helper(
+        self,
+        old_state_dict,
+        new_state_dict,
+        configs: Tuple[dict, dict],
+        from_index: int,
+        drop_unmatched_keys: bool = False,
+        no_progress_bar: bool = True,
+        debug: bool = False,
+    ):
+        r"""
+        Converts the model state dict like `convert_helper`, reading the old
+        state dict from a `LazyStateDict` and writing the new one to a
+        `ShardedStateDictWriter`, so that neither is held in memory. Only the
+        model is converted, the checkpoint hooks aren't executed.
+        """
+        old_state_dict.transform = lambda value: self.pre_tensor_convert(
+            value, configs, from_index
+        )
+
+        self.pre_model_convert(
+            old_state_dict,
+            new_state_dict,
+            configs,
+            from_index,
+            drop_unmatched_keys,
+        )
+
+        matched_all_keys = self.convert_all_keys_streaming(
+            old_state_dict,
+            new_state_dict,
+            from_index,
+            action_fn_args={"configs": configs},
+            no_progress_bar=no_progress_bar,
+            debug=debug,
+        )
+
+        self.post_model_convert(
+            old_state_dict,
+            new_state_dict,
+            configs,
+            from_index,
+            drop_unmatched_keys,
+        )
+
+        if not matched_all_keys and not drop_unmatched_keys:
+            assert (
+                matched_all_keys
+            ), "Unable to match all keys. If you want to proceed by dropping keys that couldn't matched, rerun with --drop-unmatched-keys"
+        elif not matched_all_keys:
+            logging.warning(
+                "proceeding even though some keys weren't matched because of --drop-unmatched-keys"
+            )
+
+    def convert_all_keys_streaming(
+        self,
+        old_state_dict,
+        new_state_dict,
+        from_index: int,
+        action_fn_args: Optional[dict] = None,
+        no_progress_bar: bool = True,
+        debug: bool = False,
+    ):
+        r"""
+        Converts the keys in the order the old state dict visits them. The
+        action of a key is deferred until the other keys it reads (see
+        `action_inputs`) have been visited, and the values of the keys of
+        deferred actions are retained until then. Actions which become ready
+        together run in the order their keys were visited, as they would in
+        `convert_all_keys`.
+        """
+        if not no_progress_bar:
+            pbar = tqdm(total=len(old_state_dict), desc=self.pbar_desc)
+
+        matched_all_keys = True
+        visited = set()
+        # (old key, new key, rule, inputs, inputs not visited yet)
+        pending = []
+        for key in old_state_dict:
+            visited.add(key)
+            match = self.match_key(key, from_index)
+            if match is None:
+                logging.warning("Key not matched: {}".format(key))
+                matched_all_keys = False
+            else:
+                rule, new_key = match
+                inputs = rule.get_action_inputs(key, new_key, from_index)
+                missing = {
+                    k
+                    for k in inputs
+                    if k in old_state_dict and k not in visited
+                }
+                pending.append((key, new_key, rule, inputs, missing))
+
+            ready = []
+            waiting = []
+            for entry in pending:
+                entry[4].discard(key)
+                (waiting if entry[4] else ready).append(entry)
+            # Values are retained until the actions reading them ran
+            for old_key, _, _, inputs, _ in waiting:
+                for k in [old_key] + inputs:
+                    if k in visited:
+                        old_state_dict.retain(k)
+            pending = waiting
+
+            for old_key, new_key, rule, _, _ in ready:
+                rule.apply_action(
+                    old_key,
+                    new_key,
+                    old_state_dict,
+                    new_state_dict,
+                    from_index,
+                    action_fn_args,
+                    debug=debug,
+                )
+            if ready:
+                still_read = set()
+                for old_key, _, _, inputs, _ in pending:
+                    still_read.add(old_key)
+                    still_read.update(inputs)
+                for old_key, _, _, inputs, _ in ready:
+                    for k in [old_key] + inputs:
+                        if k not in still_read:
+                            old_state_dict.release(k)
+            if not no_progress_bar:
+                pbar.update(1)
+
+        assert not pending, "Keys never visited: {}".format(
+            set().union(*(entry[4] for entry in pending))
+        )
+        return matched_all_keys
+
     def pre_model_convert(
         self,
         old_state_dict: OrderedDict,
@@ -511,6 +866,16 @@ class BaseCheckpointConverter(BaseDictionaryConverter, ABC):
         """
         return checkpoint
 
+    def pre_tensor_convert(
+        self, value, configs: Tuple[dict, dict], from_index: int,
+    ):
+        r"""
+        Hook executes on every value of the old state dict when it is read
+        during streaming conversion, which doesn't execute the checkpoint
+        hooks.
+        """
+        return value
+
     def post_checkpoint_convert(
         self, checkpoint, from_index: int,
     ):
@@ -578,6 +943,16 @@ class BaseCheckpointConverter_HF_CS(BaseCheckpointConverter_PT_PT):
                     weight[weight.isnan()] = 0
         return checkpoint
 
+    def pre_tensor_convert(
+        self, value, configs: Tuple[dict, dict], from_index: int,
+    ):
+        if from_index == 1 and configs[from_index].get("sparsity", {}):
+            # Finalize the CS sparsity of every tensor as it is read. Values
+            # may be memory-mapped, so they are not modified in place.
+            if isinstance(value, torch.Tensor) and value.is_floating_point():
+                value = value.masked_fill(value.isnan(), 0)
+        return value
+
     def post_checkpoint_convert(
         self, checkpoint, from_index: int,
     ):
@@ -811,3 +1186,30 @@ def converter_notes(notes):
         return func
 
     return attach_notes
+
+
+# Decorator declaring the other old keys which a conversion rule action reads,
+# e.g. the keys of the tensors it fuses. `inputs_fn(old_key, new_key,
+# from_index)` returns them, so that streaming conversion defers the action
+# until they have been read.
+def action_inputs(inputs_fn):
+    def attach_inputs(func):
+        setattr(func, "inputs", inputs_fn)
+        return func
+
+    return attach_inputs
+
+
+def qkv_sibling_keys(old_key, new_key, from_index):
+    r"""
+    Keys of the Q, K and V projections of the attention layer of a CS key,
+    which are packed into a single HF tensor.
+    """
+    if from_index == 0:
+        return []
+    return [
+        re.sub(
+            r"\.proj_[qkv]_dense_layer\.", f".proj_{name}_dense_layer.", old_key
+        )
+        for name in "qkv"
+    ]
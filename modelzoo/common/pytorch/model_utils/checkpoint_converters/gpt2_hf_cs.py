@@ -25,7 +25,9 @@ from modelzoo.common.pytorch.model_utils.checkpoint_converters.base_converter im
     ConfigConversionError,
     ConversionRule,
     EquivalentSubkey,
+    action_inputs,
     converter_notes,
+    qkv_sibling_keys,
 )
 
 
@@ -78,6 +80,7 @@ class Converter_GPT2_Attention_HF_CS17(BaseCheckpointConverter_HF_CS):
     def get_config_converter_class() -> BaseConfigConverter:
         return None
 
+    @action_inputs(qkv_sibling_keys)
     def c_attn_converter(
         self,
         old_key,
@@ -183,6 +186,7 @@ class Converter_GPT2_Attention_HF_CS17(BaseCheckpointConverter_HF_CS):
             masked_bias_key = re.sub("\.c_attn\.", ".masked_", new_key)
             new_state_dict[masked_bias_key] = torch.tensor(-1e4)
 
+    @action_inputs(qkv_sibling_keys)
     def assert_already_converted(
         self,
         old_key,
@@ -24,7 +24,9 @@ from modelzoo.common.pytorch.model_utils.checkpoint_converters.base_converter im
     BaseConfigConverter_HF_CS,
     ConversionRule,
     EquivalentSubkey,
+    action_inputs,
     converter_notes,
+    qkv_sibling_keys,
 )
 
 
@@ -125,6 +127,7 @@ class Converter_GPT_Neox_Attention_HF_CS17(BaseCheckpointConverter_HF_CS):
             ), "shape of query, key, value projection tensor has to have shape of length 1 (biases) or 2 (weights) when converting from CS to HF"
         return reversed
 
+    @action_inputs(qkv_sibling_keys)
     def qkv_converter(
         self,
         old_key,
@@ -277,6 +280,7 @@ class Converter_GPT_Neox_Attention_HF_CS17(BaseCheckpointConverter_HF_CS):
         else:
             raise ValueError("Invalid key after conversion: {}".format(new_key))
 
+    @action_inputs(qkv_sibling_keys)
     def assert_already_converted(
         self,
         old_key,
@@ -25,7 +25,9 @@ from modelzoo.common.pytorch.model_utils.checkpoint_converters.base_converter im
     ConfigConversionError,
     ConversionRule,
     EquivalentSubkey,
+    action_inputs,
     converter_notes,
+    qkv_sibling_keys,
 )
 
 
@@ -75,6 +77,7 @@ class Converter_Codegen_Attention_HF_CS17(BaseCheckpointConverter_HF_CS):
     def get_config_converter_class() -> BaseConfigConverter:
         return None
 
+    @action_inputs(qkv_sibling_keys)
     def qkv_converter(
         self,
         old_key,
@@ -217,6 +220,7 @@ class Converter_Codegen_Attention_HF_CS17(BaseCheckpointConverter_HF_CS):
                 torch.ones((max_positions, max_positions), dtype=torch.uint8)
             ).view(1, 1, max_positions, max_positions)
 
+    @action_inputs(qkv_sibling_keys)
     def assert_already_converted(
         self,
         old_key,
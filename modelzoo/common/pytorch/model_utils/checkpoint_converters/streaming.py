@@ -0,0 +1,328 @@
+# Copyright 2022 Cerebras Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""State dicts backed by checkpoint files, used to convert checkpoints
+tensor by tensor instead of holding the old and new checkpoints in memory."""
+
+import inspect
+import json
+import logging
+import os
+import zipfile
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Callable, Dict, List, Optional
+
+import torch
+
+from modelzoo.common.pytorch import cbtorch
+
+INDEX_SUFFIX = ".index.json"
+DEFAULT_MAX_SHARD_SIZE = 10 * 2 ** 30
+
+_SUPPORTS_MMAP = "mmap" in inspect.signature(torch.load).parameters
+
+
+def load_checkpoint_file(file: str):
+    r"""
+    Loads a checkpoint file, memory-mapped if torch supports it so that only
+    the tensors which are accessed are read.
+    """
+    if _SUPPORTS_MMAP and zipfile.is_zipfile(file):
+        return torch.load(file, map_location="cpu", mmap=True)
+    return cbtorch.load(file)
+
+
+def _model_state_dict(checkpoint):
+    # CS checkpoints package the model with the optimizer state
+    return checkpoint["model"] if "model" in checkpoint else checkpoint
+
+
+def _nbytes(value) -> int:
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    return 0
+
+
+def is_sharded_checkpoint(file: str) -> bool:
+    return file.endswith(INDEX_SUFFIX)
+
+
+class LazyStateDict(MutableMapping):
+    r"""
+    State dict of one or more checkpoint files, whose values are loaded on
+    access instead of upfront.
+
+    Files are loaded with `load_fn`, memory-mapped by default, and at most
+    `max_loaded_files` of them are kept loaded. Iterating visits the keys
+    file by file, in the order of the file names, then in the order they are
+    stored in each file. Values which are assigned (e.g. tied weights
+    restored by `pre_model_convert`) shadow the files, and values which are
+    retained stay in memory once their file is released.
+
+    Args:
+        weight_map: Maps every key to the file which contains it.
+        load_fn: Loads a checkpoint file.
+        max_loaded_files: Number of files kept loaded.
+    """
+
+    def __init__(
+        self,
+        weight_map: Dict[str, str],
+        load_fn: Callable = load_checkpoint_file,
+        max_loaded_files: int = 1,
+    ) -> None:
+        self.weight_map = OrderedDict(weight_map)
+        self.load_fn = load_fn
+        self.max_loaded_files = max_loaded_files
+        # Applied to every value read from the files
+        self.transform = None
+        self._loaded = OrderedDict()
+        self._assigned = OrderedDict()
+        self._retained = {}
+
+    @classmethod
+    def from_file(cls, file: str, **kwargs) -> "LazyStateDict":
+        r"""
+        Opens either a single checkpoint file or the index of a sharded
+        checkpoint, which maps every key to its shard under "weight_map".
+        """
+        if is_sharded_checkpoint(file):
+            with open(file, "r") as f:
+                index = json.load(f)
+            folder = os.path.dirname(file)
+            weight_map = OrderedDict(
+                (key, os.path.join(folder, shard))
+                for key, shard in index["weight_map"].items()
+            )
+            return cls(weight_map, **kwargs)
+
+        state_dict = cls({}, **kwargs)
+        checkpoint = state_dict.load_fn(file)
+        if "model" in checkpoint and len(checkpoint) > 1:
+            dropped = [key for key in checkpoint if key != "model"]
+            logging.warning(
+                "Only the model is converted when streaming, dropping: "
+                "{}".format(", ".join(dropped))
+            )
+        model = _model_state_dict(checkpoint)
+        state_dict._loaded[file] = model
+        state_dict.weight_map = OrderedDict((key, file) for key in model)
+        return state_dict
+
+    def files(self) -> List[str]:
+        # Shards are numbered, so that keys are visited in the order of the
+        # state dict which was sharded, as the index lists them sorted.
+        return sorted(set(self.weight_map.values()))
+
+    def _load_file(self, file: str):
+        if file in self._loaded:
+            self._loaded.move_to_end(file)
+        else:
+            while len(self._loaded) >= self.max_loaded_files:
+                self._loaded.popitem(last=False)
+            self._loaded[file] = _model_state_dict(self.load_fn(file))
+        return self._loaded[file]
+
+    def file_keys(self, file: str) -> List[str]:
+        r"""Returns the keys of a file in the order they are stored."""
+        return [
+            key
+            for key in self._load_file(file)
+            if self.weight_map.get(key) == file
+        ]
+
+    def retain(self, key: str) -> None:
+        r"""Keeps the value of the key in memory until it is released."""
+        if key in self and key not in self._retained:
+            self._retained[key] = self[key]
+
+    def release(self, key: str) -> None:
+        self._retained.pop(key, None)
+
+    def __getitem__(self, key: str):
+        if key in self._assigned:
+            return self._assigned[key]
+        if key in self._retained:
+            return self._retained[key]
+        value = self._load_file(self.weight_map[key])[key]
+        if self.transform is not None:
+            value = self.transform(value)
+        return value
+
+    def __setitem__(self, key: str, value) -> None:
+        self._assigned[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self._assigned.pop(key, None)
+        self._retained.pop(key, None)
+        self.weight_map.pop(key, None)
+
+    def __contains__(self, key) -> bool:
+        return key in self._assigned or key in self.weight_map
+
+    def __iter__(self):
+        for file in self.files():
+            yield from self.file_keys(file)
+        for key in self._assigned:
+            if key not in self.weight_map:
+                yield key
+
+    def __len__(self) -> int:
+        return len(self.weight_map) + sum(
+            key not in self.weight_map for key in self._assigned
+        )
+
+
+class ShardedStateDictWriter(MutableMapping):
+    r"""
+    State dict which is written to checkpoint shards as values are assigned.
+
+    Values are buffered until they reach `max_shard_size` bytes, then saved
+    as the next shard `<file_without_ext>-<i>-of-<n>.<ext>`. Closing the
+    writer saves the last shard and an index in the format of HF sharded
+    checkpoints, `<file_without_ext>.<ext>.index.json`, which maps every key
+    to its shard. If all values fit in one shard, it is saved as
+    `<file_without_ext>.<ext>` without an index instead. Values which were
+    already saved are loaded back on access.
+
+    Args:
+        file_without_ext: Path of the checkpoint without its extension.
+        ext: Extension of the checkpoint files.
+        max_shard_size: Size in bytes above which a shard is saved.
+        package_model: Save every shard as {"model": state_dict}, like CS
+            checkpoints.
+        save_fn: Saves a checkpoint file.
+    """
+
+    def __init__(
+        self,
+        file_without_ext: str,
+        ext: str,
+        max_shard_size: int = DEFAULT_MAX_SHARD_SIZE,
+        package_model: bool = False,
+        save_fn: Callable = torch.save,
+    ) -> None:
+        self.file_without_ext = file_without_ext
+        self.ext = ext
+        self.max_shard_size = max_shard_size
+        self.package_model = package_model
+        self.save_fn = save_fn
+        self._pending = OrderedDict()
+        self._pending_size = 0
+        self._shards = []
+        self._weight_map = OrderedDict()
+        self._sizes = {}
+        self._closed = False
+
+    def _shard_path(self, index: int, num_shards: Optional[int] = None) -> str:
+        suffix = f"-{index + 1:05d}"
+        if num_shards is not None:
+            suffix += f"-of-{num_shards:05d}"
+        return f"{self.file_without_ext}{suffix}.{self.ext}"
+
+    def _save(self, state_dict, path: str) -> None:
+        checkpoint = {"model": state_dict} if self.package_model else state_dict
+        # A partially written shard is never left under its final name
+        tmp_path = f"{path}.tmp"
+        self.save_fn(checkpoint, tmp_path)
+        os.replace(tmp_path, path)
+
+    def flush(self) -> None:
+        r"""Saves the buffered values as the next shard."""
+        if not self._pending:
+            return
+        path = self._shard_path(len(self._shards))
+        self._save(self._pending, path)
+        for key in self._pending:
+            self._weight_map[key] = len(self._shards)
+        self._shards.append(path)
+        self._pending = OrderedDict()
+        self._pending_size = 0
+
+    def close(self) -> str:
+        r"""
+        Saves the remaining values and the index. Returns the path of the
+        index, or of the checkpoint if it has a single shard.
+        """
+        assert not self._closed, "Writer is already closed"
+        self._closed = True
+        if not self._shards:
+            file = f"{self.file_without_ext}.{self.ext}"
+            self._save(self._pending, file)
+            self._pending = OrderedDict()
+            return file
+
+        self.flush()
+        num_shards = len(self._shards)
+        shard_names = []
+        for i, path in enumerate(self._shards):
+            final_path = self._shard_path(i, num_shards)
+            os.replace(path, final_path)
+            shard_names.append(os.path.basename(final_path))
+
+        index = {
+            "metadata": {"total_size": sum(self._sizes.values())},
+            "weight_map": {
+                key: shard_names[shard]
+                for key, shard in self._weight_map.items()
+            },
+        }
+        index_file = f"{self.file_without_ext}.{self.ext}{INDEX_SUFFIX}"
+        tmp_path = f"{index_file}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, index_file)
+        return index_file
+
+    def __setitem__(self, key: str, value) -> None:
+        assert not self._closed, "Writer is already closed"
+        if key in self._weight_map:
+            # The saved value is left in its shard, the index points to the
+            # new one.
+            logging.debug(f"Overwriting {key}, which was already saved")
+            del self._weight_map[key]
+        size = _nbytes(value)
+        self._pending_size += size - _nbytes(self._pending.get(key))
+        self._pending[key] = value
+        self._sizes[key] = size
+        if self._pending_size >= self.max_shard_size:
+            self.flush()
+
+    def __getitem__(self, key: str):
+        if key in self._pending:
+            return self._pending[key]
+        shard = self._shards[self._weight_map[key]]
+        return _model_state_dict(load_checkpoint_file(shard))[key]
+
+    def __delitem__(self, key: str) -> None:
+        if key in self._pending:
+            self._pending_size -= _nbytes(self._pending.pop(key))
+        elif key in self._weight_map:
+            del self._weight_map[key]
+        else:
+            raise KeyError(key)
+        del self._sizes[key]
+
+    def __contains__(self, key) -> bool:
+        return key in self._pending or key in self._weight_map
+
+    def __iter__(self):
+        yield from self._weight_map
+        yield from self._pending
+
+    def __len__(self) -> int:
+        return len(self._weight_map) + len(self._pending)
@@ -20,9 +20,11 @@ import logging
 import os
 import sys
 
+import torch
 from tabulate import tabulate
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "../../../.."))
+from modelzoo.common.pytorch import cbtorch
 from modelzoo.common.pytorch.model_utils.checkpoint_converters.bert import (  # To CS 1.7; To CS 1.8
     Converter_Bert_CS17_CS18,
     Converter_BertPretrainModel_CS16_CS17,
@@ -64,6 +66,13 @@ from modelzoo.common.pytorch.model_utils.checkpoint_converters.salesforce_codege
     Converter_Codegen_LMHeadModel_HF_CS17,
     Converter_Codegen_LMHeadModel_HF_CS18,
 )
+from modelzoo.common.pytorch.model_utils.checkpoint_converters.streaming import (
+    DEFAULT_MAX_SHARD_SIZE,
+    INDEX_SUFFIX,
+    LazyStateDict,
+    ShardedStateDictWriter,
+    is_sharded_checkpoint,
+)
 from modelzoo.common.pytorch.model_utils.checkpoint_converters.t5 import (  # To CS 1.7; To CS 1.8
     Converter_T5_CS16_CS17,
     Converter_T5_CS16_CS18,
@@ -239,14 +248,11 @@ def _select_model_and_config_converter(model, src_fmt, tgt_fmt):
     )
 
 
-def _convert_checkpoint_helper(
-    converter_class,
-    checkpoint,
+def _convert_config_helper(
     checkpoint_from_index,
     config_converter_class,
     config,
     config_from_index,
-    drop_unmatched_keys=False,
     no_progress_bar=True,
     debug=False,
 ):
@@ -258,12 +264,36 @@ def _convert_checkpoint_helper(
         drop_unmatched_keys=True,
     )
 
-    # Convert checkpoint:
+    # Configs in the order of the checkpoint formats:
     configs = (
         (config, new_config)
         if checkpoint_from_index == 0
         else (new_config, config)
     )
+    return new_config, configs
+
+
+def _convert_checkpoint_helper(
+    converter_class,
+    checkpoint,
+    checkpoint_from_index,
+    config_converter_class,
+    config,
+    config_from_index,
+    drop_unmatched_keys=False,
+    no_progress_bar=True,
+    debug=False,
+):
+    new_config, configs = _convert_config_helper(
+        checkpoint_from_index,
+        config_converter_class,
+        config,
+        config_from_index,
+        no_progress_bar,
+        debug,
+    )
+
+    # Convert checkpoint:
     new_checkpoint = converter_class.convert(
         checkpoint,
         configs,
@@ -287,8 +317,16 @@ def convert_checkpoint_from_file(
     drop_unmatched_keys=False,
     no_progress_bar=True,
     debug=False,
+    streaming=False,
+    max_shard_size=DEFAULT_MAX_SHARD_SIZE,
 ):
-
+    r"""
+    Converts a checkpoint file and its config file. With `streaming`, or if
+    the checkpoint is the index of a sharded HF checkpoint, the checkpoint
+    is converted tensor by tensor and saved in shards of at most
+    `max_shard_size` bytes with their own index, see
+    `_convert_checkpoint_file_streaming`.
+    """
     (
         converter_class,
         checkpoint_from_index,
@@ -298,26 +336,48 @@ def convert_checkpoint_from_file(
     if converter_class is None:
         return None, None
 
+    if is_sharded_checkpoint(checkpoint_file) and not streaming:
+        logging.info(
+            "Converting sharded checkpoint {} by streaming".format(
+                checkpoint_file
+            )
+        )
+        streaming = True
+
     logging.info("Loading config & checkpoint...")
     config = config_converter_class.load(config_file, config_from_index)
-    checkpoint = converter_class.load(checkpoint_file, checkpoint_from_index)
+    if streaming:
+        new_config, configs = _convert_config_helper(
+            checkpoint_from_index,
+            config_converter_class,
+            config,
+            config_from_index,
+            no_progress_bar,
+            debug,
+        )
+    else:
+        checkpoint = converter_class.load(
+            checkpoint_file, checkpoint_from_index
+        )
 
-    new_checkpoint, new_config = _convert_checkpoint_helper(
-        converter_class,
-        checkpoint,
-        checkpoint_from_index,
-        config_converter_class,
-        config,
-        config_from_index,
-        drop_unmatched_keys,
-        no_progress_bar,
-        debug,
-    )
+        new_checkpoint, new_config = _convert_checkpoint_helper(
+            converter_class,
+            checkpoint,
+            checkpoint_from_index,
+            config_converter_class,
+            config,
+            config_from_index,
+            drop_unmatched_keys,
+            no_progress_bar,
+            debug,
+        )
 
     if outputdir is not None and not os.path.exists(outputdir):
         os.makedirs(outputdir)
 
     checkpoint_folder, checkpoint_filename = os.path.split(checkpoint_file)
+    if is_sharded_checkpoint(checkpoint_filename):
+        checkpoint_filename = checkpoint_filename[: -len(INDEX_SUFFIX)]
     new_checkpoint_filename_without_ext = (
         os.path.splitext(checkpoint_filename)[0] + "_to_" + tgt_fmt
     )
@@ -329,13 +389,28 @@ def convert_checkpoint_from_file(
         )
     )
 
-    logging.info("Saving...")
-    final_checkpoint_file = converter_class.save(
-        new_checkpoint_file_without_ext,
-        new_checkpoint,
-        checkpoint_from_index,
-        export_h5_checkpoint=export_h5_checkpoint,
-    )
+    if streaming:
+        logging.info("Converting & saving...")
+        final_checkpoint_file = _convert_checkpoint_file_streaming(
+            converter_class,
+            checkpoint_file,
+            checkpoint_from_index,
+            configs,
+            new_checkpoint_file_without_ext,
+            max_shard_size,
+            export_h5_checkpoint,
+            drop_unmatched_keys,
+            no_progress_bar,
+            debug,
+        )
+    else:
+        logging.info("Saving...")
+        final_checkpoint_file = converter_class.save(
+            new_checkpoint_file_without_ext,
+            new_checkpoint,
+            checkpoint_from_index,
+            export_h5_checkpoint=export_h5_checkpoint,
+        )
 
     config_folder, config_filename = os.path.split(config_file)
     new_config_filename_without_ext = (
@@ -354,6 +429,49 @@ def convert_checkpoint_from_file(
     return final_checkpoint_file, final_config_file
 
 
+def _convert_checkpoint_file_streaming(
+    converter_class,
+    checkpoint_file,
+    checkpoint_from_index,
+    configs,
+    new_checkpoint_file_without_ext,
+    max_shard_size=DEFAULT_MAX_SHARD_SIZE,
+    export_h5_checkpoint=False,
+    drop_unmatched_keys=False,
+    no_progress_bar=True,
+    debug=False,
+):
+    r"""
+    Converts the model of a checkpoint file, or of the shards listed by the
+    index of a sharded HF checkpoint, without loading it: the old checkpoint
+    is read one memory-mapped file at a time and the new one is saved in
+    shards as it is converted. Only the model is converted. Returns the
+    index of the new shards, or the new checkpoint if it has a single shard.
+    """
+    to_index = 1 - checkpoint_from_index
+    output_file_format = converter_class.file_formats()[to_index]
+
+    old_state_dict = LazyStateDict.from_file(checkpoint_file)
+    new_state_dict = ShardedStateDictWriter(
+        new_checkpoint_file_without_ext,
+        output_file_format,
+        max_shard_size=max_shard_size,
+        # CS checkpoints package the model with the optimizer state
+        package_model=output_file_format == "mdl",
+        save_fn=cbtorch.save if export_h5_checkpoint else torch.save,
+    )
+    converter_class.convert_streaming(
+        old_state_dict,
+        new_state_dict,
+        configs,
+        checkpoint_from_index,
+        drop_unmatched_keys=drop_unmatched_keys,
+        no_progress_bar=no_progress_bar,
+        debug=debug,
+    )
+    return new_state_dict.close()
+
+
 def convert_checkpoint(
     model,
     src_fmt,
@@ -458,6 +576,15 @@ def convert_config(
     return new_config
 
 
+def _parse_size(size):
+    units = {"KB": 2 ** 10, "MB": 2 ** 20, "GB": 2 ** 30}
+    size = size.strip().upper()
+    for unit, multiplier in units.items():
+        if size.endswith(unit):
+            return int(float(size[: -len(unit)]) * multiplier)
+    return int(size)
+
+
 class CheckpointConverterCLI(object):
     def __init__(self):
         parser = argparse.ArgumentParser(
@@ -537,6 +664,22 @@ The following commands are supported:
             '--debug', action='store_true', help='Debug checkpoint key mapping',
         )
 
+        parser.add_argument(
+            '--streaming',
+            action='store_true',
+            help='Convert the checkpoint tensor by tensor instead of loading\
+            it, and save the output in shards with an index file. Sharded HF\
+            checkpoints (pytorch_model.bin.index.json) are always streamed.',
+        )
+
+        parser.add_argument(
+            '--max-shard-size',
+            type=_parse_size,
+            default=DEFAULT_MAX_SHARD_SIZE,
+            help='Max size of the output shards when streaming, in bytes or\
+            with a KB, MB or GB suffix (default: 10GB)',
+        )
+
         args = parser.parse_args(sys.argv[2:])
 
         (
@@ -553,6 +696,8 @@ The following commands are supported:
             args.drop_unmatched_keys,
             args.no_progress_bar,
             args.debug,
+            args.streaming,
+            args.max_shard_size,
         )
 
         if checkpoint_output_path is None or config_output_path is None:
@@ -38,6 +38,11 @@ import torch
 from torch.optim import Optimizer
 
 from modelzoo.common.pytorch import cb_model as cm
+from modelzoo.common.pytorch.optim.utils import (
+    group_by_device_and_dtype,
+    mul_per_tensor_,
+    use_foreach,
+)
 from modelzoo.common.pytorch.utils import to_tensor
 
 
@@ -45,6 +50,11 @@ class Adafactor(Optimizer):
     """
     Adafactor optimizer implemented to conform to execution within the
     constraints of the Cerebras WSE.
+
+    With `foreach`, the step applies the elementwise operations to all params
+    of a device and dtype at once with multi-tensor ops, with the same
+    results for float32 params. If None, it does so for float32 GPU params,
+    see `use_foreach`.
     """
 
     def __init__(
@@ -59,6 +69,7 @@ class Adafactor(Optimizer):
         scale_parameter=True,
         relative_step=True,
         warmup_init=False,
+        foreach=None,
     ):
         if lr is not None and relative_step:
             raise ValueError(
@@ -90,6 +101,7 @@ class Adafactor(Optimizer):
             warmup_init=warmup_init,
         )
         super().__init__(params, defaults)
+        self.foreach = foreach
 
         if not cm.use_cs():
             self.preinitialize()
@@ -179,6 +191,12 @@ class Adafactor(Optimizer):
             loss = closure()
 
         for group in self.param_groups:
+            params = [p for p in group["params"] if p.grad is not None]
+            if use_foreach(self.foreach, params):
+                for device_params in group_by_device_and_dtype(params):
+                    self._multi_tensor_step(group, device_params)
+                continue
+
             for p in group["params"]:
                 if p.grad is None:
                     continue
@@ -249,3 +267,117 @@ class Adafactor(Optimizer):
                 p.sub_(update)
 
         return loss
+
+    def _multi_tensor_step(self, group, params):
+        """
+        Same update as `step`, applied to params of a single device and dtype
+        with multi-tensor ops. Reductions and the factored second moment are
+        still computed per param, while the per-param factors (learning rate,
+        decay, clipping) of all params are computed at once.
+        """
+        grads = [p.grad for p in params]
+        if any(grad.is_sparse for grad in grads):
+            raise RuntimeError("Adafactor does not support sparse gradients.")
+        states = [self.state[p] for p in params]
+
+        if hasattr(self, "global_step"):
+            global_step_fp32 = self.global_step.add(1).float().expand(
+                len(params)
+            )
+        else:
+            steps = [state["step"] for state in states]
+            torch._foreach_add_(steps, 1)
+            global_step_fp32 = torch.stack(steps).float()
+
+        # Per-param factors, as tensors of shape [len(params)]
+        rms = torch.stack(
+            [sq.mean() for sq in torch._foreach_mul(params, params)]
+        ).sqrt()
+        lr = self._get_lr(group, rms)
+        beta2t = 1.0 - torch.pow(
+            global_step_fp32, to_tensor(group["decay_rate"]).item()
+        )
+        beta2t = beta2t.to(params[0].device)
+        one_minus_beta2t = 1.0 - beta2t
+
+        updates = list(torch._foreach_mul(grads, grads))
+        torch._foreach_add_(updates, group["eps"][0])
+
+        factored = [
+            i for i, state in enumerate(states) if "exp_avg_sq_row" in state
+        ]
+        unfactored = [
+            i for i, state in enumerate(states) if "exp_avg_sq_row" not in state
+        ]
+        if factored:
+            rows = [states[i]["exp_avg_sq_row"] for i in factored]
+            cols = [states[i]["exp_avg_sq_col"] for i in factored]
+            decays = [beta2t[i] for i in factored]
+            mul_per_tensor_(rows, decays)
+            torch._foreach_add_(
+                rows,
+                [
+                    updates[i].mean(dim=-1).mul(one_minus_beta2t[i])
+                    for i in factored
+                ],
+            )
+            mul_per_tensor_(cols, decays)
+            torch._foreach_add_(
+                cols,
+                [
+                    updates[i].mean(dim=-2).mul(one_minus_beta2t[i])
+                    for i in factored
+                ],
+            )
+            # Approximation of exponential moving average of square of gradient
+            for i, row, col in zip(factored, rows, cols):
+                updates[i] = self._approx_sq_grad(row, col)
+        if unfactored:
+            exp_avg_sqs = [states[i]["exp_avg_sq"] for i in unfactored]
+            mul_per_tensor_(exp_avg_sqs, [beta2t[i] for i in unfactored])
+            torch._foreach_add_(
+                exp_avg_sqs,
+                [updates[i].mul(one_minus_beta2t[i]) for i in unfactored],
+            )
+            for i, exp_avg_sq in zip(unfactored, exp_avg_sqs):
+                updates[i] = exp_avg_sq.rsqrt()
+        torch._foreach_mul_(updates, grads)
+
+        update_rms = torch.stack(
+            [sq.mean() for sq in torch._foreach_mul(updates, updates)]
+        ).sqrt()
+        clips = torch.maximum(
+            update_rms / group["clip_threshold"],
+            torch.tensor(1.0, dtype=torch.float32, device=rms.device),
+        )
+        for update, clip in zip(updates, clips.unbind()):
+            update.div_(clip)
+        if isinstance(lr, torch.Tensor):
+            mul_per_tensor_(updates, lr.unbind())
+        else:
+            torch._foreach_mul_(updates, lr)
+
+        use_first_moment = [
+            i for i, state in enumerate(states) if "exp_avg" in state
+        ]
+        if use_first_moment:
+            exp_avgs = [states[i]["exp_avg"] for i in use_first_moment]
+            torch._foreach_mul_(exp_avgs, group["beta1"])
+            torch._foreach_add_(
+                exp_avgs,
+                torch._foreach_mul(
+                    [updates[i] for i in use_first_moment], 1 - group["beta1"]
+                ),
+            )
+            for i, exp_avg in zip(use_first_moment, exp_avgs):
+                updates[i] = exp_avg
+
+        if group["weight_decay"] > 0.0:
+            decay = group["weight_decay"] * lr
+            if isinstance(decay, torch.Tensor):
+                decays = [p.mul(d) for p, d in zip(params, decay.unbind())]
+            else:
+                decays = torch._foreach_mul(params, decay)
+            torch._foreach_sub_(params, decays)
+
+        torch._foreach_sub_(params, updates)
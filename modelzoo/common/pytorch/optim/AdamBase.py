@@ -14,12 +14,18 @@
 
 import math
 import sys
-from typing import Iterable, Tuple
+from typing import Iterable, Optional, Tuple
 
 import torch
 from torch import nn
 
 from modelzoo.common.pytorch.optim.CSOptimizer import CSOptimizer
+from modelzoo.common.pytorch.optim.utils import (
+    group_by_device_and_dtype,
+    mul_per_tensor_,
+    to_scalar,
+    use_foreach,
+)
 
 
 class AdamBase(CSOptimizer):
@@ -29,6 +35,11 @@ class AdamBase(CSOptimizer):
     performing a gradual reduction of bias correction using exponential decay
     of `beta1_power` and `beta2_power` rather than recomputing `beta1^step` each
     step.
+
+    With `foreach`, the step applies every operation to all params of a
+    device and dtype at once with multi-tensor ops, with the same results for
+    float32 params. If None, it does so for float32 GPU params, see
+    `use_foreach`.
     """
 
     def __init__(
@@ -41,6 +52,7 @@ class AdamBase(CSOptimizer):
         l2_regularization_rate: float = 0.0,
         correct_bias: bool = True,
         amsgrad: bool = False,
+        foreach: Optional[bool] = None,
     ):
         if lr < 0.0:
             raise ValueError(f"Invalid learning rate: {lr} - should be >= 0.0")
@@ -64,6 +76,7 @@ class AdamBase(CSOptimizer):
             amsgrad=amsgrad,
         )
         super().__init__(params, defaults)
+        self.foreach = foreach
 
     def state_names_to_sparsify(self):
         # Only return state names which can be maskable by sparsity optimizer:
@@ -113,6 +126,12 @@ class AdamBase(CSOptimizer):
         if closure is not None:
             loss = closure()
         for group in self.param_groups:
+            params = [p for p in group["params"] if p.grad is not None]
+            if use_foreach(self.foreach, params):
+                for device_params in group_by_device_and_dtype(params):
+                    self._multi_tensor_step(group, device_params)
+                continue
+
             for p in group["params"]:
                 if p.grad is None:
                     continue
@@ -171,6 +190,63 @@ class AdamBase(CSOptimizer):
 
         return loss
 
+    def _multi_tensor_step(self, group, params):
+        """
+        Same update as `step`, applied to params of a single device and dtype
+        with multi-tensor ops.
+        """
+        grads = [p.grad for p in params]
+        states = [self.state[p] for p in params]
+        exp_avgs = [state["exp_avg"] for state in states]
+        exp_avg_sqs = [state["exp_avg_sq"] for state in states]
+        beta1, beta2 = group["betas"]
+
+        if group["l2_regularization_rate"] > 0.0:
+            grads = torch._foreach_add(
+                grads, params, alpha=to_scalar(group["l2_regularization_rate"])
+            )
+
+        torch._foreach_mul_(exp_avgs, to_scalar(beta1))
+        torch._foreach_add_(exp_avgs, grads, alpha=to_scalar(1.0 - beta1))
+        torch._foreach_mul_(exp_avg_sqs, to_scalar(beta2))
+        torch._foreach_addcmul_(
+            exp_avg_sqs, grads, grads, value=to_scalar(1.0 - beta2)
+        )
+
+        if group["amsgrad"]:
+            max_exp_avg_sqs = [state["max_exp_avg_sq"] for state in states]
+            for max_exp_avg_sq, exp_avg_sq in zip(max_exp_avg_sqs, exp_avg_sqs):
+                torch.maximum(max_exp_avg_sq, exp_avg_sq, out=max_exp_avg_sq)
+            denoms = torch._foreach_sqrt(max_exp_avg_sqs)
+        else:
+            denoms = torch._foreach_sqrt(exp_avg_sqs)
+        torch._foreach_add_(denoms, to_scalar(group["eps"]))
+
+        updates = torch._foreach_div(exp_avgs, denoms)
+
+        if group["correct_bias"]:
+            # The step sizes of all params are computed at once
+            beta1_powers = [state["beta1_power"] for state in states]
+            beta2_powers = [state["beta2_power"] for state in states]
+            one = torch.tensor(
+                1.0, dtype=torch.float32, device=params[0].device
+            )
+            bias_corrections1 = one - torch.stack(beta1_powers)
+            bias_corrections2 = one - torch.stack(beta2_powers)
+            step_sizes = torch.sqrt(bias_corrections2) / bias_corrections1
+            mul_per_tensor_(updates, step_sizes.unbind())
+            # Update `beta1^step` for the next step.
+            torch._foreach_mul_(beta1_powers, to_scalar(beta1))
+            torch._foreach_mul_(beta2_powers, to_scalar(beta2))
+
+        if group["weight_decay"] > 0.0:
+            torch._foreach_add_(
+                updates, params, alpha=to_scalar(group["weight_decay"])
+            )
+
+        torch._foreach_mul_(updates, to_scalar(group["lr"]))
+        torch._foreach_sub_(params, updates)
+
     def convert_state_dict_for_checkpoint(self, state_dict):
         """
         Converts the state_dict for compatibility with AdamW from
@@ -263,6 +339,7 @@ class AdamW(AdamBase):
         weight_decay: float = 0.0,
         correct_bias: bool = True,
         amsgrad: bool = False,
+        foreach: Optional[bool] = None,
     ):
         super(AdamW, self).__init__(
             params=params,
@@ -273,6 +350,7 @@ class AdamW(AdamBase):
             l2_regularization_rate=0.0,
             correct_bias=correct_bias,
             amsgrad=amsgrad,
+            foreach=foreach,
         )
 
     def load_state_dict(self, state_dict):
@@ -300,6 +378,7 @@ class Adam(AdamBase):
         eps: float = 1e-6,
         weight_decay: float = 0.0,
         amsgrad: bool = False,
+        foreach: Optional[bool] = None,
     ):
         # This init uses `weight_decay` to be in sync with PyTorch API
         super(Adam, self).__init__(
@@ -311,6 +390,7 @@ class Adam(AdamBase):
             l2_regularization_rate=weight_decay,
             correct_bias=True,
             amsgrad=amsgrad,
+            foreach=foreach,
         )
         for group in self.param_groups:
             group["l2_regularization_rate"] = group.pop("weight_decay", 0.0)
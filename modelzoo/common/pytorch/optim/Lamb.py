@@ -5,6 +5,12 @@
 import torch
 
 from modelzoo.common.pytorch.optim.CSOptimizer import CSOptimizer
+from modelzoo.common.pytorch.optim.utils import (
+    group_by_device_and_dtype,
+    mul_per_tensor_,
+    to_scalar,
+    use_foreach,
+)
 
 
 class Lamb(CSOptimizer):
@@ -22,6 +28,10 @@ class Lamb(CSOptimizer):
         weight_decay (float, optional): weight decay (L2 penalty) (default: 0)
         adam (bool, optional): always use trust ratio = 1, which turns this into
             Adam. Useful for comparison purposes.
+        foreach (bool, optional): apply every operation to all params of a
+            device and dtype at once with multi-tensor ops, with the same
+            results for float32 params. If None, only for float32 GPU params
+            (default: None)
     
     .. _Large Batch Optimization for Deep Learning\: Training BERT in 76 minutes:
         https://arxiv.org/abs/1904.00962
@@ -36,6 +46,7 @@ class Lamb(CSOptimizer):
         eps=1e-6,
         weight_decay=0,
         adam=False,
+        foreach=None,
     ):
         if not 0.0 <= lr:
             raise ValueError("Invalid learning rate: {}".format(lr))
@@ -54,6 +65,7 @@ class Lamb(CSOptimizer):
         )
 
         super(Lamb, self).__init__(params, defaults)
+        self.foreach = foreach
 
     def state_names_to_sparsify(self):
         return ["exp_avg", "exp_avg_sq"]
@@ -88,6 +100,12 @@ class Lamb(CSOptimizer):
             loss = closure()
 
         for group in self.param_groups:
+            params = [p for p in group['params'] if p.grad is not None]
+            if use_foreach(self.foreach, params):
+                for device_params in group_by_device_and_dtype(params):
+                    self._multi_tensor_step(group, device_params)
+                continue
+
             for p in group['params']:
                 if p.grad is None:
                     continue
@@ -151,3 +169,65 @@ class Lamb(CSOptimizer):
                 p.sub_(update_step * step_size)
 
         return loss
+
+    def _multi_tensor_step(self, group, params):
+        """
+        Same update as `step`, applied to params of a single device and dtype
+        with multi-tensor ops. The norms are reduced per param and the trust
+        ratios of all params are computed at once.
+        """
+        grads = [p.grad for p in params]
+        if any(grad.is_sparse for grad in grads):
+            raise RuntimeError(
+                'Lamb does not support sparse gradients, consider SparseAdam instad.'
+            )
+        states = [self.state[p] for p in params]
+        exp_avgs = [state['exp_avg'] for state in states]
+        exp_avg_sqs = [state['exp_avg_sq'] for state in states]
+        beta1, beta2 = group['betas']
+
+        # m_t
+        torch._foreach_mul_(exp_avgs, to_scalar(beta1))
+        torch._foreach_add_(exp_avgs, grads, alpha=to_scalar(1 - beta1))
+        # v_t
+        torch._foreach_mul_(exp_avg_sqs, to_scalar(beta2))
+        torch._foreach_addcmul_(
+            exp_avg_sqs, grads, grads, value=to_scalar(1 - beta2)
+        )
+
+        weight_norms = (
+            torch.stack([sq.sum() for sq in torch._foreach_mul(params, params)])
+            .sqrt()
+            .clamp(0, 10)
+            .to(torch.float)
+        )
+
+        denoms = torch._foreach_sqrt(exp_avg_sqs)
+        torch._foreach_add_(denoms, to_scalar(group['eps']))
+        adam_steps = torch._foreach_div(exp_avgs, denoms)
+        if group['weight_decay'] != 0:
+            torch._foreach_add_(
+                adam_steps, params, alpha=to_scalar(group['weight_decay'])
+            )
+
+        if not group['adam']:
+            adam_norms = (
+                torch.stack(
+                    [
+                        sq.sum()
+                        for sq in torch._foreach_mul(adam_steps, adam_steps)
+                    ]
+                )
+                .sqrt()
+                .to(torch.float)
+            )
+            one = torch.ones_like(weight_norms)
+            trust_ratios = torch.where(
+                weight_norms > 0,
+                torch.where(adam_norms > 0, weight_norms / adam_norms, one),
+                one,
+            )
+            mul_per_tensor_(adam_steps, trust_ratios.unbind())
+
+        torch._foreach_mul_(adam_steps, to_scalar(group['lr']))
+        torch._foreach_sub_(params, adam_steps)
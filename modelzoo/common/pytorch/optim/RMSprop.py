@@ -15,12 +15,22 @@
 import torch
 
 from modelzoo.common.pytorch.optim.CSOptimizer import CSOptimizer
+from modelzoo.common.pytorch.optim.utils import (
+    group_by_device_and_dtype,
+    to_scalar,
+    use_foreach,
+)
 
 
 class RMSprop(CSOptimizer):
     """
     RMSprop optimizer implemented to perform the required
     pre-initialization of the optimizer state.
+
+    With `foreach`, the step applies every operation to all params of a
+    device and dtype at once with multi-tensor ops, with the same results for
+    float32 params. If None, it does so for float32 GPU params, see
+    `use_foreach`.
     """
 
     def __init__(
@@ -32,6 +42,7 @@ class RMSprop(CSOptimizer):
         weight_decay=0,
         momentum=0,
         centered=False,
+        foreach=None,
     ):
         if not 0.0 <= lr:
             raise ValueError("Invalid learning rate: {}".format(lr))
@@ -56,6 +67,7 @@ class RMSprop(CSOptimizer):
         )
 
         super(RMSprop, self).__init__(params, defaults)
+        self.foreach = foreach
 
     def state_names_to_sparsify(self):
         return ["square_avg", "momentum_buffer", "grad_avg"]
@@ -99,6 +111,12 @@ class RMSprop(CSOptimizer):
             eps = group["eps"]
             centered = group["centered"]
 
+            params = [p for p in group["params"] if p.grad is not None]
+            if use_foreach(self.foreach, params):
+                for device_params in group_by_device_and_dtype(params):
+                    self._multi_tensor_step(group, device_params)
+                continue
+
             for p in group["params"]:
                 if p.grad is None:
                     continue
@@ -137,3 +155,54 @@ class RMSprop(CSOptimizer):
                     p.addcdiv_(-lr * grad, avg)
 
         return loss
+
+    def _multi_tensor_step(self, group, params):
+        """
+        Same update as `step`, applied to params of a single device and dtype
+        with multi-tensor ops.
+        """
+        lr = group["lr"]
+        alpha = group["alpha"]
+        weight_decay = group["weight_decay"]
+        momentum = group["momentum"]
+        eps = to_scalar(group["eps"])
+
+        grads = [p.grad for p in params]
+        if any(grad.is_sparse for grad in grads):
+            raise RuntimeError("RMSprop does not support sparse gradients.")
+        states = [self.state[p] for p in params]
+        square_avgs = [state["square_avg"] for state in states]
+
+        if weight_decay != 0:
+            grads = torch._foreach_add(
+                grads, params, alpha=to_scalar(weight_decay)
+            )
+
+        torch._foreach_mul_(square_avgs, to_scalar(alpha))
+        torch._foreach_addcmul_(
+            square_avgs, grads, grads, value=to_scalar(1.0 - alpha)
+        )
+
+        if group["centered"]:
+            grad_avgs = [state["grad_avg"] for state in states]
+            torch._foreach_mul_(grad_avgs, to_scalar(alpha))
+            torch._foreach_add_(grad_avgs, grads, alpha=to_scalar(1 - alpha))
+            avgs = torch._foreach_addcmul(
+                square_avgs, grad_avgs, grad_avgs, value=-1.0
+            )
+            torch._foreach_sqrt_(avgs)
+        else:
+            avgs = torch._foreach_sqrt(square_avgs)
+        torch._foreach_add_(avgs, eps)
+
+        if momentum > 0.0:
+            momentum_buffers = [state["momentum_buffer"] for state in states]
+            torch._foreach_mul_(momentum_buffers, to_scalar(momentum))
+            torch._foreach_addcdiv_(momentum_buffers, grads, avgs)
+            torch._foreach_add_(
+                params, torch._foreach_mul(momentum_buffers, to_scalar(-lr))
+            )
+        else:
+            torch._foreach_addcdiv_(
+                params, torch._foreach_mul(grads, to_scalar(-lr)), avgs
+            )
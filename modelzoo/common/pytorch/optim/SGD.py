@@ -15,12 +15,22 @@
 import torch
 
 from modelzoo.common.pytorch.optim.CSOptimizer import CSOptimizer
+from modelzoo.common.pytorch.optim.utils import (
+    group_by_device_and_dtype,
+    to_scalar,
+    use_foreach,
+)
 
 
 class SGD(CSOptimizer):
     """
     SGD optimizer implemented to conform to execution within the constraints
     of the Cerebras WSE, including pre-initializing optimizer state
+
+    With `foreach`, the step applies every operation to all params of a
+    device and dtype at once with multi-tensor ops, with the same results for
+    float32 params. If None, it does so for float32 GPU params, see
+    `use_foreach`.
     """
 
     def __init__(
@@ -32,6 +42,7 @@ class SGD(CSOptimizer):
         weight_decay=0,
         nesterov=False,
         maximize=False,
+        foreach=None,
     ):
         if lr < 0.0:
             raise ValueError("Invalid learning rate: {}".format(lr))
@@ -57,6 +68,7 @@ class SGD(CSOptimizer):
         )
 
         super(SGD, self).__init__(params, defaults)
+        self.foreach = foreach
 
     def state_names_to_sparsify(self):
         return ["momentum_buffer"]
@@ -93,6 +105,12 @@ class SGD(CSOptimizer):
             nesterov = group["nesterov"]
             maximize = group["maximize"]
 
+            params = [p for p in group["params"] if p.grad is not None]
+            if use_foreach(self.foreach, params):
+                for device_params in group_by_device_and_dtype(params):
+                    self._multi_tensor_step(group, device_params)
+                continue
+
             for p in group["params"]:
                 if p.grad is None:
                     continue
@@ -120,3 +138,39 @@ class SGD(CSOptimizer):
                 p.add_(-lr * grad)
 
         return loss
+
+    def _multi_tensor_step(self, group, params):
+        """
+        Same update as `step`, applied to params of a single device and dtype
+        with multi-tensor ops.
+        """
+        lr = group["lr"]
+        weight_decay = group["weight_decay"]
+        momentum = group["momentum"]
+
+        grads = [p.grad for p in params]
+        if any(grad.is_sparse for grad in grads):
+            raise RuntimeError("SGD does not support sparse gradients.")
+
+        if group["maximize"]:
+            grads = torch._foreach_neg(grads)
+
+        if weight_decay != 0:
+            grads = torch._foreach_add(
+                grads, params, alpha=to_scalar(weight_decay)
+            )
+
+        if momentum != 0:
+            bufs = [self.state[p]["momentum_buffer"] for p in params]
+
+            torch._foreach_mul_(bufs, to_scalar(momentum))
+            torch._foreach_add_(
+                bufs, grads, alpha=to_scalar(1.0 - group["dampening"])
+            )
+
+            if group["nesterov"]:
+                torch._foreach_add_(grads, bufs, alpha=to_scalar(momentum))
+            else:
+                grads = bufs
+
+        torch._foreach_add_(params, torch._foreach_mul(grads, to_scalar(-lr)))
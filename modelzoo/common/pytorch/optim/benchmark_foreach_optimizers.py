@@ -0,0 +1,200 @@
+# Copyright 2022 Cerebras Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures the time of an optimizer step with the per-param loop and with the
+multi-tensor (foreach) implementation, on the params of GPT-like models of
+several sizes, and checks that both give identical float32 params. Float16
+and bfloat16 params are checked to differ by at most 1 ulp per step, since
+the multi-tensor ops apply the hyperparameters in float32 precision. Every
+layer has the params of a GPT-2 block: 2 layer norms, the fused QKV and
+output projections and the 2 feed-forward layers, with their biases.
+"""
+import argparse
+import os
+import sys
+import time
+
+import torch
+
+# Maximum difference in ulp per step between the params of both paths
+MAX_ULP_PER_STEP = {torch.float32: 0, torch.float16: 1, torch.bfloat16: 1}
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../../.."))
+from modelzoo.common.pytorch.optim.Adafactor import Adafactor
+from modelzoo.common.pytorch.optim.AdamBase import Adam, AdamW
+from modelzoo.common.pytorch.optim.Lamb import Lamb
+from modelzoo.common.pytorch.optim.RMSprop import RMSprop
+from modelzoo.common.pytorch.optim.SGD import SGD
+
+# num_layers, hidden_size
+MODELS = {
+    "tiny": (4, 128),
+    "small": (12, 256),
+    "medium": (24, 512),
+}
+
+OPTIMIZERS = {
+    "sgd": lambda params, foreach: SGD(
+        params, lr=0.1, momentum=0.9, weight_decay=0.01, foreach=foreach
+    ),
+    "adam": lambda params, foreach: Adam(
+        params, lr=1e-3, weight_decay=0.01, foreach=foreach
+    ),
+    "adamw": lambda params, foreach: AdamW(
+        params, lr=1e-3, weight_decay=0.01, correct_bias=True, foreach=foreach
+    ),
+    "rmsprop": lambda params, foreach: RMSprop(
+        params, lr=1e-3, momentum=0.9, foreach=foreach
+    ),
+    "lamb": lambda params, foreach: Lamb(
+        params, lr=1e-3, weight_decay=0.01, foreach=foreach
+    ),
+    "adafactor": lambda params, foreach: Adafactor(
+        params, lr=1e-3, relative_step=False, foreach=foreach
+    ),
+}
+
+
+def gpt_param_shapes(num_layers, hidden_size, vocab_size, max_position):
+    shapes = [(vocab_size, hidden_size), (max_position, hidden_size)]
+    for _ in range(num_layers):
+        shapes += [(hidden_size,)] * 2
+        shapes += [(3 * hidden_size, hidden_size), (3 * hidden_size,)]
+        shapes += [(hidden_size, hidden_size), (hidden_size,)]
+        shapes += [(hidden_size,)] * 2
+        shapes += [(4 * hidden_size, hidden_size), (4 * hidden_size,)]
+        shapes += [(hidden_size, 4 * hidden_size), (hidden_size,)]
+    return shapes + [(hidden_size,)] * 2
+
+
+def time_steps(make_optimizer, shapes, foreach, steps, device, dtype):
+    torch.manual_seed(0)
+    params = [
+        torch.nn.Parameter(torch.randn(shape, device=device, dtype=dtype))
+        for shape in shapes
+    ]
+    optimizer = make_optimizer(params, foreach)
+    elapsed = 0.0
+    for step in range(steps + 1):
+        for p in params:
+            p.grad = torch.randn_like(p)
+        if device.type == "cuda":
+            torch.cuda.synchronize(device)
+        start = time.perf_counter()
+        optimizer.step()
+        if device.type == "cuda":
+            torch.cuda.synchronize(device)
+        # The first step allocates the optimizer state
+        if step > 0:
+            elapsed += time.perf_counter() - start
+    return params, elapsed / steps
+
+
+def max_ulp_difference(params, other_params):
+    """Maximum difference between two lists of params, in ulp of the
+    params, or of 1 for params smaller than 1, whose updates can cancel
+    them."""
+    max_ulp = 0.0
+    for a, b in zip(params, other_params):
+        ulp = torch.finfo(a.dtype).eps * a.detach().abs().float().clamp(min=1)
+        diff = (a.detach().float() - b.detach().float()).abs() / ulp
+        max_ulp = max(max_ulp, float(diff.max()))
+    return max_ulp
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--models",
+        nargs="+",
+        choices=list(MODELS.keys()),
+        default=list(MODELS.keys()),
+        help="model sizes to benchmark",
+    )
+    parser.add_argument(
+        "--optimizers",
+        nargs="+",
+        choices=list(OPTIMIZERS.keys()),
+        default=list(OPTIMIZERS.keys()),
+        help="optimizers to benchmark",
+    )
+    parser.add_argument(
+        "--vocab_size", type=int, default=8192, help="vocabulary size",
+    )
+    parser.add_argument(
+        "--max_position",
+        type=int,
+        default=1024,
+        help="number of position embeddings",
+    )
+    parser.add_argument(
+        "--steps", type=int, default=5, help="number of timed steps",
+    )
+    parser.add_argument(
+        "--dtypes",
+        nargs="+",
+        choices=["float32", "float16", "bfloat16"],
+        default=["float32", "float16"],
+        help="dtypes of the params",
+    )
+    parser.add_argument(
+        "--device",
+        default="cuda" if torch.cuda.is_available() else "cpu",
+        help="device of the params",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    device = torch.device(args.device)
+
+    print(
+        f"{'model':<8}{'optimizer':<11}{'dtype':<10}{'params':>8}"
+        f"{'loop ms':>10}{'foreach ms':>12}{'speedup':>9}{'max ulp':>9}"
+    )
+    for model in args.models:
+        num_layers, hidden_size = MODELS[model]
+        shapes = gpt_param_shapes(
+            num_layers, hidden_size, args.vocab_size, args.max_position
+        )
+        for name in args.optimizers:
+            make_optimizer = OPTIMIZERS[name]
+            for dtype_name in args.dtypes:
+                dtype = getattr(torch, dtype_name)
+                loop_params, loop_time = time_steps(
+                    make_optimizer, shapes, False, args.steps, device, dtype
+                )
+                foreach_params, foreach_time = time_steps(
+                    make_optimizer, shapes, True, args.steps, device, dtype
+                )
+                max_ulp = max_ulp_difference(loop_params, foreach_params)
+                # Including the untimed first step
+                num_steps = args.steps + 1
+                assert max_ulp <= MAX_ULP_PER_STEP[dtype] * num_steps, (
+                    f"The foreach step of {name} differs from the loop by "
+                    f"{max_ulp} ulp for {dtype_name} params"
+                )
+                print(
+                    f"{model:<8}{name:<11}{dtype_name:<10}{len(shapes):>8}"
+                    f"{loop_time * 1e3:>10.2f}{foreach_time * 1e3:>12.2f}"
+                    f"{loop_time / foreach_time:>8.1f}x{max_ulp:>9.1f}"
+                )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# Copyright 2022 Cerebras Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Checks that the multi-tensor (foreach) step of every optimizer gives the
+same params and state as the per-param loop, on CPU and on GPU if available,
+for the options which take a different code path in the multi-tensor step.
+Params and state must be identical for float32. For float16 and bfloat16,
+the params may differ by at most 1 ulp per step, and the state, whose small
+values accumulate the rounding differences, is not compared.
+"""
+import argparse
+import os
+import sys
+
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../../.."))
+from modelzoo.common.pytorch.optim.Adafactor import Adafactor
+from modelzoo.common.pytorch.optim.AdamBase import Adam, AdamW
+from modelzoo.common.pytorch.optim.benchmark_foreach_optimizers import (
+    MAX_ULP_PER_STEP,
+    max_ulp_difference,
+)
+from modelzoo.common.pytorch.optim.Lamb import Lamb
+from modelzoo.common.pytorch.optim.RMSprop import RMSprop
+from modelzoo.common.pytorch.optim.SGD import SGD
+
+# Matrices are factored by Adafactor, vectors are not
+SHAPES = [(32, 16), (16,), (8, 4, 4), (1,), (64, 8)]
+
+OPTIMIZERS = {
+    "sgd": lambda params, foreach: SGD(
+        params, lr=0.1, momentum=0.9, weight_decay=0.01, foreach=foreach
+    ),
+    "sgd_nesterov": lambda params, foreach: SGD(
+        params, lr=0.1, momentum=0.9, nesterov=True, foreach=foreach
+    ),
+    "adam": lambda params, foreach: Adam(
+        params, lr=1e-3, weight_decay=0.01, foreach=foreach
+    ),
+    "adam_amsgrad": lambda params, foreach: Adam(
+        params, lr=1e-3, amsgrad=True, foreach=foreach
+    ),
+    "adamw": lambda params, foreach: AdamW(
+        params, lr=1e-3, weight_decay=0.01, correct_bias=True, foreach=foreach
+    ),
+    "adamw_amsgrad": lambda params, foreach: AdamW(
+        params, lr=1e-3, correct_bias=True, amsgrad=True, foreach=foreach
+    ),
+    "rmsprop": lambda params, foreach: RMSprop(
+        params, lr=1e-3, momentum=0.9, foreach=foreach
+    ),
+    "rmsprop_centered": lambda params, foreach: RMSprop(
+        params, lr=1e-3, centered=True, weight_decay=0.01, foreach=foreach
+    ),
+    "lamb": lambda params, foreach: Lamb(
+        params, lr=1e-3, weight_decay=0.01, foreach=foreach
+    ),
+    "lamb_adam": lambda params, foreach: Lamb(
+        params, lr=1e-3, adam=True, foreach=foreach
+    ),
+    # Scaled by the RMS of the params, the learning rate is a tensor
+    "adafactor": lambda params, foreach: Adafactor(
+        params, lr=1e-3, relative_step=False, foreach=foreach
+    ),
+    "adafactor_weight_decay": lambda params, foreach: Adafactor(
+        params,
+        lr=1e-3,
+        relative_step=False,
+        weight_decay=0.01,
+        foreach=foreach,
+    ),
+    "adafactor_unscaled": lambda params, foreach: Adafactor(
+        params,
+        lr=1e-3,
+        relative_step=False,
+        scale_parameter=False,
+        weight_decay=0.01,
+        foreach=foreach,
+    ),
+}
+
+
+def run_steps(make_optimizer, foreach, steps, device, dtype):
+    """Returns the params and the state tensors after `steps` steps."""
+    torch.manual_seed(0)
+    params = [
+        torch.nn.Parameter(torch.randn(shape).to(device, dtype))
+        for shape in SHAPES
+    ]
+    grads = [
+        [torch.randn(shape).to(device, dtype) for shape in SHAPES]
+        for _ in range(steps)
+    ]
+    optimizer = make_optimizer(params, foreach)
+    for step_grads in grads:
+        for p, grad in zip(params, step_grads):
+            p.grad = grad
+        optimizer.step()
+    state = [
+        value
+        for p in params
+        for _, value in sorted(optimizer.state[p].items())
+        if isinstance(value, torch.Tensor) and value.is_floating_point()
+    ]
+    return params, state
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--optimizers",
+        nargs="+",
+        choices=list(OPTIMIZERS.keys()),
+        default=list(OPTIMIZERS.keys()),
+        help="optimizers to check",
+    )
+    parser.add_argument(
+        "--steps", type=int, default=3, help="number of checked steps",
+    )
+    parser.add_argument(
+        "--dtypes",
+        nargs="+",
+        choices=["float32", "float16", "bfloat16"],
+        default=["float32", "float16", "bfloat16"],
+        help="dtypes of the params",
+    )
+    parser.add_argument(
+        "--devices",
+        nargs="+",
+        default=["cpu", "cuda"] if torch.cuda.is_available() else ["cpu"],
+        help="devices of the params",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    failures = []
+    print(f"{'device':<8}{'optimizer':<24}{'dtype':<10}{'max ulp':>9}")
+    for device_name in args.devices:
+        device = torch.device(device_name)
+        for name in args.optimizers:
+            make_optimizer = OPTIMIZERS[name]
+            for dtype_name in args.dtypes:
+                dtype = getattr(torch, dtype_name)
+                loop_params, loop_state = run_steps(
+                    make_optimizer, False, args.steps, device, dtype
+                )
+                foreach_params, foreach_state = run_steps(
+                    make_optimizer, True, args.steps, device, dtype
+                )
+                max_ulp = max_ulp_difference(loop_params, foreach_params)
+                if dtype == torch.float32:
+                    max_ulp = max(
+                        max_ulp, max_ulp_difference(loop_state, foreach_state)
+                    )
+                if max_ulp > MAX_ULP_PER_STEP[dtype] * args.steps:
+                    failures.append((device_name, name, dtype_name))
+                print(
+                    f"{device_name:<8}{name:<24}{dtype_name:<10}"
+                    f"{max_ulp:>9.1f}"
+                )
+    if failures:
+        raise SystemExit(
+            f"The foreach steps differ from the loop for {failures}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -11,3 +11,69 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+
+"""
+Helpers for the multi-tensor (foreach) implementations of the optimizers.
+"""
+from collections import OrderedDict
+
+import torch
+
+from modelzoo.common.pytorch import cb_model as cm
+
+
+def use_foreach(foreach, params):
+    """
+    Whether an optimizer step takes the multi-tensor path, which applies
+    every operation to all params at once with `torch._foreach_*` ops.
+
+    Args:
+        foreach (bool): The `foreach` option of the optimizer. If None, the
+            multi-tensor path is used when not running on CS and all params
+            are float32 params on GPU, where it launches fewer kernels. On
+            CPU it saves no kernel launch and allocates more temporaries, so
+            it is opt-in. For float16 and bfloat16 params, the per-param
+            loop applies the float32 tensor hyperparameters in the dtype of
+            the params while multi-tensor ops take them as Python scalars,
+            so results may differ by about 1 ulp and it is opt-in too.
+        params (list): Params of the step.
+    """
+    if foreach is None:
+        return not cm.use_cs() and all(
+            p.device.type == "cuda" and p.dtype == torch.float32
+            for p in params
+        )
+    return bool(foreach)
+
+
+def group_by_device_and_dtype(params):
+    """
+    Splits params in lists of params of the same device and dtype, which
+    multi-tensor ops require.
+    """
+    groups = OrderedDict()
+    for p in params:
+        groups.setdefault((p.device, p.dtype), []).append(p)
+    return list(groups.values())
+
+
+def to_scalar(value):
+    """
+    Python number of a hyperparameter, which param groups may store as
+    0-dim tensors. Numbers are passed to multi-tensor ops as scalars, which
+    are applied in float32 precision to float16 and bfloat16 params, unlike
+    the float32 tensors, see `use_foreach`.
+    """
+    if isinstance(value, torch.Tensor):
+        return value.item()
+    return value
+
+
+def mul_per_tensor_(tensors, factors):
+    """
+    Multiplies every tensor in place by the 0-dim tensor of the same index.
+    Multi-tensor ops only take scalars or lists of tensors of the same sizes,
+    so the factors are applied per tensor, without copying them to the host.
+    """
+    for tensor, factor in zip(tensors, factors):
+        tensor.mul_(factor)
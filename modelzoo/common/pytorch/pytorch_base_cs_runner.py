@@ -160,6 +160,9 @@ class PyTorchBaseCSRunner(PyTorchBaseRunner, metaclass=abc.ABCMeta):
 
         state_dict = self._model.get_state()
         state_dict["global_step"] = state_dict.get("global_step", step)
+        dataloader_state = self._get_dataloader_state()
+        if dataloader_state is not None:
+            state_dict["dataloader"] = dataloader_state
 
         def post_transfer_callback(state_dict):
             if "optimizer" in state_dict:
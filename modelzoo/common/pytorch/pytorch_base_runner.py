@@ -48,6 +48,7 @@ from modelzoo.common.pytorch.summaries import (
 from modelzoo.common.pytorch.summary_collection import SummaryCollection
 from modelzoo.common.pytorch.utils import (
     RunConfigParamsValidator,
+    get_checkpoint_step,
     visit_structure,
 )
 from modelzoo.common.run_utils.utils import DeviceType, ExecutionStrategy
@@ -119,6 +120,9 @@ class PyTorchBaseRunner(metaclass=abc.ABCMeta):
         self._global_step = None
         self._initial_step = None
         self._total_steps = None
+        # Batches read from the training dataloader in the current epoch,
+        # including the ones of incomplete gradient accumulations
+        self._num_batches_read_in_epoch = 0
 
         if self._runconfig.get("enable_summaries", False):
             if cm.is_wse_device():
@@ -760,7 +764,9 @@ class PyTorchBaseRunner(metaclass=abc.ABCMeta):
         self._loss_saver.clear()
 
         self._model.train()  # Enable training mode
+        self._num_batches_read_in_epoch = 0
         for epoch_step, data in enumerate(dataloader):
+            self._num_batches_read_in_epoch = epoch_step + 1
             data = self.on_train_batch_start(data)
 
             # Only zero out the gradients if on first step or immediately
@@ -997,6 +1003,7 @@ class PyTorchBaseRunner(metaclass=abc.ABCMeta):
             The loaded state dict. If checkpoint path was None, returns None.
         """
         if checkpoint_path:
+            self._check_checkpoint_step(checkpoint_path, mode)
             logging.info(
                 f"Loading weights from checkpoint {self._checkpoint_path}"
             )
@@ -1011,6 +1018,8 @@ class PyTorchBaseRunner(metaclass=abc.ABCMeta):
 
         if state_dict and not self._is_pretrained_checkpoint:
             self._global_step = state_dict.get("global_step", 0)
+            if mode in (modes.TRAIN, modes.TRAIN_AND_EVAL):
+                self._maybe_load_dataloader_state(state_dict.get("dataloader"))
         else:
             self._global_step = 0
 
@@ -1018,10 +1027,64 @@ class PyTorchBaseRunner(metaclass=abc.ABCMeta):
 
         return state_dict
 
+    def _check_checkpoint_step(self, checkpoint_path: str, mode: str):
+        """Raises if training would resume past `max_steps`, before the
+        weights of the checkpoint are loaded.
+
+        The same check is done once the checkpoint is loaded, for checkpoints
+        whose step can't be read without loading them.
+        """
+        max_steps = self._runconfig.get("max_steps", None)
+        if (
+            mode not in (modes.TRAIN, modes.TRAIN_AND_EVAL)
+            or max_steps is None
+            or self._is_pretrained_checkpoint
+        ):
+            return
+        global_step = get_checkpoint_step(checkpoint_path)
+        if global_step is not None and global_step >= max_steps:
+            raise RuntimeError(
+                f"Global step {global_step} already exceeds "
+                f"max step {max_steps}."
+            )
+
+    def _get_resumable_dataset(self):
+        """Returns the training dataset if it can save its position."""
+        dataset = getattr(
+            getattr(self, "_train_dataloader", None), "dataset", None
+        )
+        if hasattr(dataset, "get_dataloader_state") and hasattr(
+            dataset, "load_dataloader_state"
+        ):
+            return dataset
+        return None
+
+    def _get_dataloader_state(self):
+        """Returns the position of the training dataloader to checkpoint.
+
+        Returns:
+            The state returned by the dataset, or None if the dataset does
+            not support resuming from it.
+        """
+        dataset = self._get_resumable_dataset()
+        if dataset is None or self._global_step is None:
+            return None
+        return dataset.get_dataloader_state(self._num_batches_read_in_epoch)
+
+    def _maybe_load_dataloader_state(self, state):
+        """Resumes the training dataloader from a checkpointed position."""
+        dataset = self._get_resumable_dataset()
+        if state is None or dataset is None:
+            return
+        logging.info(f"Resuming the training dataloader from {state}")
+        dataset.load_dataloader_state(state)
+
     # Returns path to last checkpoint or None if no checkpoints exist
     def _get_last_checkpoint(self):
         # Used when running on interuptable instances in order to reload from
         # the last checkpoint.
+        # Checkpoints are renamed to `checkpoint_<step>.mdl` once completely
+        # written, so partially written ones are never picked up.
         if not os.path.exists(self._model_dir):
             return None
         last_ckpt = (None, None)  # (step of last ckpt, path of last ckpt)
@@ -15,12 +15,14 @@
 import logging
 import os
 import warnings
+from contextlib import contextmanager
 from datetime import datetime
 from typing import Optional, Union
 
 import torch
 from torch.cuda.amp import GradScaler, autocast
 
+from modelzoo.common.pytorch.checkpoint_writer import CheckpointWriter
 from modelzoo.common.pytorch.pytorch_base_runner import PyTorchBaseRunner
 from modelzoo.common.pytorch.sparsity.finalizer import finalize_cs2_sparsity
 
@@ -52,8 +54,32 @@ class PyTorchRunner(PyTorchBaseRunner):
             )
         self.use_bfloat16 = params["model"].get("use_bfloat16", False)
 
+        # Checkpoints are written to a temporary file and renamed once
+        # complete, in a background thread if `async_checkpoint` is set.
+        self._checkpoint_writer = CheckpointWriter(
+            asynchronous=params["runconfig"].get("async_checkpoint", False),
+            keep_checkpoint_max=params["runconfig"].get("keep_checkpoint_max"),
+        )
+
         super().__init__(model=model, params=params)
 
+    @contextmanager
+    def _configure_run(self, mode, dataloader):
+        try:
+            with super()._configure_run(mode, dataloader):
+                yield
+        except BaseException:
+            # The checkpoint being written is still completed, but without
+            # replacing the error of the run or running the hooks
+            try:
+                self._checkpoint_writer.close()
+            except Exception:
+                logging.exception("Failed to write the last checkpoint.")
+            raise
+        # Checkpoints still being written are completed before returning
+        self._checkpoint_writer.close()
+        self._on_checkpoints_written()
+
     ##################################################################
     #                         Training Hooks                         #
     ##################################################################
@@ -80,6 +106,7 @@ class PyTorchRunner(PyTorchBaseRunner):
         logging.info("Training Completed Successfully!")
 
     def on_train_batch_start(self, data):
+        self._on_checkpoints_written()
         return self._to_device(data)
 
     def train_forward(self, data):
@@ -143,6 +170,13 @@ class PyTorchRunner(PyTorchBaseRunner):
                 self._scaler.load_state_dict(scaler_state)
         return state_dict
 
+    def _on_checkpoints_written(self):
+        """Runs `on_checkpoint_saved` for the checkpoints written since the
+        last call."""
+        for file_name, step in self._checkpoint_writer.collect():
+            logging.info(f"Saved checkpoint {file_name} at step : {step}.")
+            self.on_checkpoint_saved(file_name, step)
+
     def _save_checkpoint(self, step):
         logging.info(f"Saving checkpoint at step : {step}.")
         file_name = os.path.join(self._model_dir, f"checkpoint_{step}.mdl")
@@ -150,10 +184,13 @@ class PyTorchRunner(PyTorchBaseRunner):
         model_state["global_step"] = step
         if self._scaler:
             model_state["scaler"] = self._scaler.state_dict()
+        dataloader_state = self._get_dataloader_state()
+        if dataloader_state is not None:
+            model_state["dataloader"] = dataloader_state
 
-        torch.save(model_state, file_name)
-
-        self.on_checkpoint_saved(file_name, step)
+        # Waits for the previous checkpoint to be written first
+        self._checkpoint_writer.save(model_state, file_name, step)
+        self._on_checkpoints_written()
 
     def _to_device(self, data: Union[dict, list, tuple], non_blocking=False):
         device_data = None
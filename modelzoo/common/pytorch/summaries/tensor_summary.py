@@ -20,10 +20,12 @@ import json
 import logging
 import threading
 import time
+from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
-from typing import List, Union
+from typing import Dict, List, Optional, Tuple, Union
 
+import numpy as np
 import torch
 from tensorboard.backend.event_processing.io_wrapper import (
     IsSummaryEventsFile as is_summary_events_file,
@@ -38,7 +40,24 @@ from modelzoo.common.pytorch.summaries.cb_summary import (
 _LOCK = threading.Lock()
 _METADATA = "__metadata__"
 _VERSION_KEY = "__version__"
-_VERSION = "1.0"
+_VERSION = "1.1"
+# Versions which the reader supports. 1.0 only has one file per tensor.
+_SUPPORTED_VERSIONS = ("1.0", "1.1")
+
+# Name of the index of the tensors appended to the chunks of a summary
+_INDEX = "index.jsonl"
+# Size in bytes above which a new chunk is started
+_MAX_CHUNK_SIZE = 64 * 2 ** 20
+# Alignment in bytes of the offsets of the tensors in the chunks
+_ALIGNMENT = 64
+# Integer types of the same size as the stored dtypes, used to view tensors
+# as raw bytes
+_RAW_DTYPES = {
+    1: (torch.uint8, np.uint8),
+    2: (torch.int16, np.int16),
+    4: (torch.int32, np.int32),
+    8: (torch.int64, np.int64),
+}
 
 
 class TensorSummary(CBSummary):
@@ -74,6 +93,7 @@ class TensorSummary(CBSummary):
         super().__init__(name)
 
         self._log_provider = _LogProvider(name)
+        self._storage = None
 
     # pylint: disable=arguments-differ
     def run_on_device(self, tensor: torch.Tensor) -> DeviceOutputs:
@@ -114,19 +134,15 @@ class TensorSummary(CBSummary):
         """
         # pylint: disable=protected-access
         self._log_provider.update(writer.file_writer.event_writer._file_name)
-        curr_time = time.time_ns()
-        filename = f"{step}.{curr_time}"
-
-        filepath = self._log_provider.logdir.joinpath(filename)
-
-        # Write the tensor data to file
-        torch.save(
+        logdir = self._log_provider.logdir
+        if self._storage is None or self._storage.logdir != logdir:
+            self._storage = _TensorStorage(logdir)
+        self._storage.append(
             TensorDescriptor(
                 step=int(step),
-                ns_since_epoch=curr_time,
+                ns_since_epoch=time.time_ns(),
                 tensor=host_outputs.detach(),
-            ).to_dict(),
-            str(filepath),
+            )
         )
 
 
@@ -175,18 +191,99 @@ class TensorDescriptor:
         return TensorDescriptor(**values)
 
 
+class _TensorStorage:
+    """Append-only storage of the tensors of a summary.
+
+    Tensors are appended as raw bytes to chunk files `<i>.bin` of the summary
+    directory, and a line describing every tensor (step, time, chunk, offset,
+    dtype and shape) is appended to `index.jsonl`. A tensor is written before
+    its index line, so that readers only ever see complete tensors, and a new
+    chunk is started once a chunk exceeds `max_chunk_size` bytes. Tensors are
+    padded to offsets aligned to `_ALIGNMENT` bytes, so that they can be
+    memory-mapped as aligned arrays. Tensors of
+    dtypes which can't be viewed as raw bytes are saved in the one file per
+    tensor format of version 1.0. Summaries are never closed, so the files
+    are only open while a tensor is appended.
+    """
+
+    def __init__(self, logdir: Path, max_chunk_size: int = _MAX_CHUNK_SIZE):
+        self.logdir = logdir
+        self.max_chunk_size = max_chunk_size
+        # A new chunk is started instead of appending to a chunk which may
+        # have been left partially written.
+        self._chunk = len(list(logdir.glob("*.bin")))
+
+    @staticmethod
+    def raw_view(tensor: torch.Tensor) -> Optional[torch.Tensor]:
+        """Returns the tensor viewed as integers of the same size, or None if
+        it can't be stored as raw bytes."""
+        if tensor.dtype.is_complex or tensor.element_size() not in _RAW_DTYPES:
+            return None
+        return tensor.view(_RAW_DTYPES[tensor.element_size()][0])
+
+    def append(self, descriptor: TensorDescriptor) -> None:
+        """Appends the tensor of the descriptor to the storage."""
+        tensor = descriptor.tensor.cpu().contiguous()
+        raw = self.raw_view(tensor)
+        if raw is None:
+            torch.save(
+                descriptor.to_dict(),
+                str(
+                    self.logdir.joinpath(
+                        f"{descriptor.step}.{descriptor.ns_since_epoch}"
+                    )
+                ),
+            )
+            return
+
+        data = raw.numpy().tobytes()
+        chunk_file = self.logdir.joinpath(f"{self._chunk}.bin").open("ab")
+        try:
+            if (
+                chunk_file.tell() + len(data) > self.max_chunk_size
+                and chunk_file.tell() > 0
+            ):
+                chunk_file.close()
+                self._chunk += 1
+                chunk_file = self.logdir.joinpath(f"{self._chunk}.bin").open(
+                    "ab"
+                )
+            offset = chunk_file.tell()
+            padding = -offset % _ALIGNMENT
+            if padding:
+                chunk_file.write(bytes(padding))
+                offset += padding
+            chunk_file.write(data)
+        finally:
+            chunk_file.close()
+
+        entry = {
+            "step": descriptor.step,
+            "ns": descriptor.ns_since_epoch,
+            "chunk": self._chunk,
+            "offset": offset,
+            "dtype": str(tensor.dtype).split(".")[-1],
+            "shape": list(tensor.shape),
+        }
+        with self.logdir.joinpath(_INDEX).open("a") as index_file:
+            index_file.write(json.dumps(entry) + "\n")
+
+
 class TensorSummaryReader:
     """Class for reading summarized tensors.
 
     This class works in tandem with `TensorSummary` defined above. It provides
     general convenience APIs for inspecting tensor summaries produced by a run.
 
-    Currently this class does not do any caching. So it can be used to inspect
-    a live run. As more data becomes available, calling the APIs will reload the
-    latest values.
+    Tensors appended to the chunks of a summary are memory-mapped, and the
+    index of every summary is read incrementally, so the reader can be used
+    to inspect a live run. As more data becomes available, calling the APIs
+    will load the latest values. Tensors saved in the one file per tensor
+    format of version 1.0 are still found by listing the summary directories
+    on every call. Loaded tensors are kept in an LRU cache.
     """
 
-    def __init__(self, path: str):
+    def __init__(self, path: str, cache_size: int = 1024):
         """Constructs a `TensorSummaryReader` instance.
 
         Args:
@@ -195,9 +292,16 @@ class TensorSummaryReader:
                 inferred from these events files as there is a one-to-one
                 mapping from Tensorboard events files and tensor summary
                 directories.
+            cache_size: Number of loaded tensors kept in the cache.
         """
         self._path = path
         self._summary_dirs: List[Path] = []
+        self._cache_size = cache_size
+        self._cache = OrderedDict()
+        # Entries of the index of every summary directory, and the size of
+        # the index which was read
+        self._indices: Dict[Path, Tuple[int, List[dict]]] = {}
+        self._chunks: Dict[Path, np.memmap] = {}
 
         event_files = self._discover_event_files(self._path)
         cb_summaries = self._discover_cerebras_summary_dirs(event_files)
@@ -220,14 +324,12 @@ class TensorSummaryReader:
                 the same name and step. If True, only return the latest value.
         Returns:
             A single tensor, multiple tensors, or no tensors matching the given
-                name and step.
+                name and step. Tensors appended to chunks are copy-on-write
+                views of the memory-mapped chunks, which are shared with the
+                cache, so modifying them in place also modifies the tensors
+                returned by later calls. Clone them before modifying them.
         """
-        descriptors = []
-        for summary_dir in self._summary_dirs:
-            for path in summary_dir.joinpath(name).glob(f"{step}.*"):
-                if path.exists():
-                    content = torch.load(str(path))
-                    descriptors.append(TensorDescriptor.from_dict(content))
+        descriptors = self._load(name, step, step + 1)
 
         if not descriptors:
             logging.warning(
@@ -243,9 +345,128 @@ class TensorSummaryReader:
                     f"Multiple summarized tensors with name {name} found at "
                     f"step {step}. Returning the latest one."
                 )
-            descriptors.sort(key=lambda x: x.ns_since_epoch)
             return descriptors[-1]
 
+    def load_range(
+        self, name: str, start_step: int, end_step: int
+    ) -> List[TensorDescriptor]:
+        """Loads the tensors with given name summarized at steps in
+        `[start_step, end_step)`.
+
+        Tensors appended to chunks are returned as views of the memory-mapped
+        chunks, so loading a whole time series only reads the tensors which
+        are accessed. The views are copy-on-write and shared with the cache,
+        so modifying them in place also modifies the tensors returned by later
+        calls. Clone them before modifying them.
+
+        Args:
+            name: Name of the tensor.
+            start_step: First step of the range.
+            end_step: Step after the last step of the range.
+        Returns:
+            The tensors sorted by step, then by the time they were summarized.
+        """
+        return self._load(name, start_step, end_step)
+
+    def _load(
+        self, name: str, start_step: int, end_step: int
+    ) -> List[TensorDescriptor]:
+        descriptors = []
+        for summary_dir in self._summary_dirs:
+            logdir = summary_dir.joinpath(name)
+            for entry in self._read_index(logdir):
+                if start_step <= entry["step"] < end_step:
+                    descriptors.append(self._load_entry(logdir, entry))
+
+            # Tensors saved one file per tensor
+            if end_step - start_step == 1:
+                paths = logdir.glob(f"{start_step}.*")
+            else:
+                paths = logdir.glob("*.*")
+            for path in paths:
+                step = path.name.split(".")[0]
+                if (
+                    path.suffix != ".bin"
+                    and path.name != _INDEX
+                    and step.isdigit()
+                    and start_step <= int(step) < end_step
+                ):
+                    descriptors.append(self._load_file(path))
+
+        descriptors.sort(key=lambda x: (x.step, x.ns_since_epoch))
+        return descriptors
+
+    def _read_index(self, logdir: Path) -> List[dict]:
+        """Returns the entries of the index of a summary directory, reading
+        the entries which were appended since the last call."""
+        path = logdir.joinpath(_INDEX)
+        size, entries = self._indices.get(logdir, (0, []))
+        if not path.exists() or path.stat().st_size == size:
+            return entries
+        with path.open("rb") as f:
+            f.seek(size)
+            data = f.read()
+        # The last line may be partially written
+        complete = data[: data.rfind(b"\n") + 1]
+        entries = entries + [
+            json.loads(line) for line in complete.splitlines() if line
+        ]
+        self._indices[logdir] = (size + len(complete), entries)
+        return entries
+
+    def _cached(self, key, load_fn) -> TensorDescriptor:
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        descriptor = load_fn()
+        if self._cache_size > 0:
+            self._cache[key] = descriptor
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return descriptor
+
+    def _load_file(self, path: Path) -> TensorDescriptor:
+        return self._cached(
+            str(path),
+            lambda: TensorDescriptor.from_dict(torch.load(str(path))),
+        )
+
+    def _load_entry(self, logdir: Path, entry: dict) -> TensorDescriptor:
+        chunk = logdir.joinpath(f"{entry['chunk']}.bin")
+
+        def load_fn():
+            dtype = getattr(torch, entry["dtype"])
+            shape = entry["shape"]
+            numel = int(np.prod(shape))
+            if numel == 0:
+                tensor = torch.empty(shape, dtype=dtype)
+            else:
+                element_size = torch.empty((), dtype=dtype).element_size()
+                raw_dtype, np_raw_dtype = _RAW_DTYPES[element_size]
+                end = entry["offset"] + numel * element_size
+                data = self._chunks.get(chunk)
+                if data is None or len(data) < end:
+                    # Copy-on-write, so that tensors can be modified without
+                    # modifying the chunk
+                    data = np.memmap(str(chunk), dtype=np.uint8, mode="c")
+                    self._chunks[chunk] = data
+                raw = data[entry["offset"] : end]
+                if entry["offset"] % element_size:
+                    # Unaligned tensors of chunks written before tensors
+                    # were padded
+                    raw = raw.copy()
+                raw = raw.view(np_raw_dtype)
+                tensor = torch.from_numpy(raw.reshape(shape))
+                if raw_dtype != dtype:
+                    tensor = tensor.view(dtype)
+            return TensorDescriptor(
+                step=entry["step"], ns_since_epoch=entry["ns"], tensor=tensor,
+            )
+
+        # Empty tensors share their offset with the next tensor
+        key = (str(chunk), entry["offset"], entry["step"], entry["ns"])
+        return self._cached(key, load_fn)
+
     def names(self) -> List[str]:
         """Returns a list of available tensor names."""
         names = set()
@@ -291,7 +512,7 @@ class TensorSummaryReader:
                     f"Could not detect version of Cerebras summaries at "
                     f"directory {root}. This may lead to unexpected behavior."
                 )
-            if version != _VERSION:
+            if version not in _SUPPORTED_VERSIONS:
                 logging.warning(
                     f"Unknown version {version} for Cerebras summaries at "
                     f"directory {root}. Skipping this directory."
@@ -15,12 +15,26 @@
 """General purpose Pytorch Utilities"""
 import logging
 import os
+import pickle
 import random
 import re
 import sys
 import time
 import traceback
-from typing import Any, Callable, Generator, List, Optional, Tuple, Union
+import warnings
+import zipfile
+from collections import namedtuple
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
 import torch
 import yaml
@@ -395,9 +409,140 @@ def get_checkpoints(model_dir: str) -> List[str]:
     """Gather checkpoints in a model directory"""
     matches = []
     for filename in os.listdir(model_dir):
-        m = re.match(r"checkpoint_(\d+)\.mdl", filename)
+        m = re.fullmatch(r"checkpoint_(\d+)\.mdl", filename)
         if m:
             matches.append(m)
     matches.sort(key=lambda x: int(x.group(1)))  # Sort by index not lexically
     checkpoints = [os.path.join(model_dir, match.group()) for match in matches]
     return checkpoints
+
+
+# Tensor of a checkpoint whose storage was not read
+_TensorRef = namedtuple(
+    "_TensorRef", ["key", "dtype", "offset", "size", "stride"]
+)
+
+
+class _MetadataUnpickler(pickle.Unpickler):
+    """Unpickles the structure of a checkpoint saved in the zip format of
+    `torch.save`, with references to the storages instead of tensors.
+
+    Like `torch.load(weights_only=True)`, only containers and tensors are
+    unpickled, and any other global raises an `UnpicklingError`, so that
+    reading a checkpoint never calls arbitrary functions.
+    """
+
+    def find_class(self, module, name):
+        if module == "collections" and name == "OrderedDict":
+            return super().find_class(module, name)
+        if module == "torch._utils":
+            if name == "_rebuild_tensor_v2":
+                return self._rebuild_tensor
+            if name in ("_rebuild_parameter", "_rebuild_parameter_with_state"):
+                return lambda data, *args: data
+        if module == "torch._tensor" and name == "_rebuild_from_type_v2":
+            # Tensors and params are read as tensors
+            return lambda func, new_type, args, state: func(*args)
+        if module == "torch.nn.parameter" and name == "Parameter":
+            return torch.nn.Parameter
+        if module == "torch":
+            value = getattr(torch, name, None)
+            if (
+                isinstance(value, type)
+                and (
+                    name.endswith("Storage")
+                    or value in (torch.Size, torch.Tensor, torch.device)
+                )
+            ) or isinstance(value, torch.dtype):
+                return value
+        raise pickle.UnpicklingError(
+            f"Checkpoint holds the unsupported global {module}.{name}"
+        )
+
+    @staticmethod
+    def _rebuild_tensor(storage, offset, size, stride, *args):
+        key, dtype = storage
+        return _TensorRef(key, dtype, offset, tuple(size), tuple(stride))
+
+    def persistent_load(self, saved_id):
+        _, storage_type, key, _, _ = saved_id
+        if storage_type is getattr(torch, "UntypedStorage", None):
+            dtype = torch.uint8
+        else:
+            # Legacy typed storage classes warn about their deprecation
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                dtype = storage_type.dtype
+        return key, dtype
+
+
+def _load_tensor_ref(archive, prefix, value):
+    if isinstance(value, _TensorRef):
+        buffer = bytearray(archive.read(f"{prefix}data/{value.key}"))
+        storage = torch.frombuffer(buffer, dtype=value.dtype)
+        return torch.as_strided(
+            storage, value.size, value.stride, value.offset
+        )
+    if isinstance(value, dict):
+        return type(value)(
+            (k, _load_tensor_ref(archive, prefix, v)) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple)) and not hasattr(value, "_fields"):
+        return type(value)(_load_tensor_ref(archive, prefix, v) for v in value)
+    return value
+
+
+def read_checkpoint_values(
+    checkpoint_path: str, keys: Iterable[str] = ("global_step",)
+) -> Dict[str, Any]:
+    """Reads top level values of a checkpoint, e.g. its global step, without
+    loading all of its tensors.
+
+    For checkpoints in the zip format of `torch.save`, only the pickled
+    structure of the checkpoint and the storages of the tensors of the
+    requested values are read, and the structure may only hold containers
+    and tensors. Other checkpoints are loaded entirely.
+
+    Args:
+        checkpoint_path: Path to a checkpoint file.
+        keys: Top level keys of the checkpoint to read.
+    Returns:
+        The values of the keys which are in the checkpoint.
+    """
+    if not zipfile.is_zipfile(checkpoint_path):
+        from modelzoo.common.pytorch import cbtorch
+
+        state_dict = cbtorch.load(checkpoint_path)
+        return {key: state_dict[key] for key in keys if key in state_dict}
+
+    with zipfile.ZipFile(checkpoint_path) as archive:
+        pickle_name = next(
+            name
+            for name in archive.namelist()
+            if name == "data.pkl" or name.endswith("/data.pkl")
+        )
+        prefix = pickle_name[: -len("data.pkl")]
+        with archive.open(pickle_name) as f:
+            state_dict = _MetadataUnpickler(f).load()
+        return {
+            key: _load_tensor_ref(archive, prefix, state_dict[key])
+            for key in keys
+            if key in state_dict
+        }
+
+
+def get_checkpoint_step(checkpoint_path: str) -> Optional[int]:
+    """Returns the global step of a checkpoint, or 0 if it has none, without
+    loading its tensors.
+
+    Returns None if the step can't be read without loading the whole
+    checkpoint, i.e. if it is not in the zip format of `torch.save` or holds
+    objects other than containers and tensors.
+    """
+    if not zipfile.is_zipfile(checkpoint_path):
+        return None
+    try:
+        values = read_checkpoint_values(checkpoint_path, ("global_step",))
+    except pickle.UnpicklingError:
+        return None
+    return int(values.get("global_step", 0))
@@ -15,13 +15,21 @@
 """
 Processors for handling TF records data format for BERT
 """
+import functools
 import os
 from abc import ABC, abstractmethod
 
 import tensorflow as tf
 
-from modelzoo.common.tf.input.utils import transform_dataset
-from modelzoo.common.tf.model_utils.shard_dataset import shard_dataset
+from modelzoo.common.tf.input.utils import (
+    count_tfrecords,
+    seek_interleaved_records,
+    transform_dataset,
+)
+from modelzoo.common.tf.model_utils.shard_dataset import (
+    get_shard_spec,
+    shard_dataset,
+)
 
 
 class TfRecordsProcessor(ABC):
@@ -41,6 +49,9 @@ class TfRecordsProcessor(ABC):
     :param int n_parallel_reads: for call to tf.data.Dataset.interleave
     :param bool map_before_batch: if True, mapping will happen before batching.
     :param int skip_steps: Number of steps to skip the dataset after batching.
+        If the data isn't shuffled and is batched by `batch_fn` of this class,
+        the files are opened directly at the records following the skipped
+        steps, instead of reading and mapping every skipped batch.
     """
 
     def __init__(
@@ -113,6 +124,21 @@ class TfRecordsProcessor(ABC):
             deterministic=not (self.shuffle and self.shuffle_seed is None),
         )
 
+        if self.skip_steps and self._is_seekable():
+            resumed_dataset = self._create_resumed_tf_dataset(
+                file_pattern, is_training, input_context
+            )
+            if resumed_dataset is not None:
+                if not (is_training and self.repeat):
+                    return resumed_dataset
+                # Later epochs start from the first record again
+                return resumed_dataset.concatenate(
+                    self._transform_dataset(dataset, is_training, 0)
+                )
+
+        return self._transform_dataset(dataset, is_training, self.skip_steps)
+
+    def _transform_dataset(self, dataset, is_training, skip_steps, repeat=None):
         return transform_dataset(
             dataset,
             self.map_fn,
@@ -120,10 +146,94 @@ class TfRecordsProcessor(ABC):
             is_training,
             shuffle=self.shuffle,
             shuffle_buffer=self.shuffle_buffer,
-            repeat=self.repeat,
+            repeat=self.repeat if repeat is None else repeat,
             seed=self.shuffle_seed,
             map_before_batch=self.map_before_batch,
             batch_fn=self.batch_fn,
             post_batch_map_fn=getattr(self, "post_batch_map_fn", None),
-            skip_steps=self.skip_steps,
+            skip_steps=skip_steps,
         )
+
+    def _is_seekable(self):
+        """
+        Whether the records which follow the skipped steps can be found from
+        the number of records of the files: the order of the records must not
+        depend on shuffling, and every batch must have `batch_size` records.
+        """
+        return (
+            not self.shuffle
+            and type(self).batch_fn is TfRecordsProcessor.batch_fn
+        )
+
+    def _create_resumed_tf_dataset(
+        self, file_pattern, is_training, input_context
+    ):
+        """
+        Creates the dataset of the batches which follow the first
+        `skip_steps` batches of the epoch, by opening every file at the record
+        the interleave reached. Only the record headers of the files are read
+        to find it.
+
+        :returns: tf dataset, or None if the steps can't be skipped this way
+        """
+        # Files are listed like `list_files` does without shuffling
+        files = sorted(
+            path
+            for pattern in file_pattern
+            for path in tf.io.gfile.glob(pattern)
+        )
+        shard_spec = get_shard_spec(self.use_multiple_workers, input_context)
+        if shard_spec is not None:
+            num_workers, worker_id = shard_spec
+            files = files[worker_id::num_workers]
+        if not files:
+            return None
+        count_fn = functools.lru_cache(maxsize=None)(
+            lambda index: count_tfrecords(files[index])
+        )
+
+        skip_steps = self.skip_steps
+        inputs = seek_interleaved_records(
+            len(files),
+            count_fn,
+            self.n_parallel_reads,
+            skip_steps * self.batch_size,
+        )
+        if inputs is None:
+            if not (is_training and self.repeat):
+                return None
+            # The skipped steps span several epochs, which drop their last
+            # incomplete batch.
+            steps_per_epoch = (
+                sum(count_fn(index) for index in range(len(files)))
+                // self.batch_size
+            )
+            if steps_per_epoch == 0:
+                return None
+            skip_steps %= steps_per_epoch
+            inputs = seek_interleaved_records(
+                len(files),
+                count_fn,
+                self.n_parallel_reads,
+                skip_steps * self.batch_size,
+            )
+
+        tf.compat.v1.logging.info(
+            f"Resuming the input pipeline after {skip_steps} steps of the "
+            f"current epoch by opening the files at the next records."
+        )
+        resumed = tf.data.Dataset.from_tensor_slices(
+            (
+                [files[index] for index, _ in inputs],
+                tf.constant([skip for _, skip in inputs], dtype=tf.int64),
+            )
+        )
+        resumed = resumed.interleave(
+            map_func=lambda path, skip: tf.data.TFRecordDataset(path).skip(
+                skip
+            ),
+            cycle_length=self.n_parallel_reads,
+            num_parallel_calls=tf.data.experimental.AUTOTUNE,
+            deterministic=True,
+        )
+        return self._transform_dataset(resumed, is_training, 0, repeat=False)
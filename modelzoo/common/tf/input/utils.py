@@ -16,7 +16,8 @@
 Function for performing standard transformations on datasets.
 """
 
-from typing import Any, Callable, Dict, List, Tuple, Union
+import struct
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import tensorflow as tf
@@ -100,6 +101,116 @@ def transform_dataset(
     return dataset.prefetch(buffer_size=tf.data.experimental.AUTOTUNE)
 
 
+def count_tfrecords(path):
+    """
+    Counts the records of an uncompressed TF records file by reading the
+    length of every record, without reading the records themselves.
+
+    :param str path: Path to the TF records file
+    :returns: number of records in the file
+    """
+    count = 0
+    offset = 0
+    with tf.io.gfile.GFile(path, "rb") as f:
+        size = f.size()
+        while offset < size:
+            f.seek(offset)
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            # Each record is: length (uint64), crc of length (uint32),
+            # data, crc of data (uint32)
+            (length,) = struct.unpack("<Q", header)
+            offset += 8 + 4 + length + 4
+            count += 1
+    return count
+
+
+def seek_interleaved_records(
+    num_files: int,
+    count_fn: Callable[[int], int],
+    cycle_length: int,
+    num_records: int,
+) -> Optional[List[Tuple[int, int]]]:
+    """
+    Finds the state of a deterministic `Dataset.interleave` of files, with
+    `block_length=1`, after it produced `num_records` records.
+
+    The interleave visits its `cycle_length` slots in turn. A slot produces
+    the next record of its file, or is emptied when its file is exhausted,
+    and an empty slot opens the next file before producing from it. Only the
+    files which are opened are counted, and rounds in which no file is
+    exhausted are skipped at once, so the cost doesn't grow with
+    `num_records`.
+
+    :param int num_files: Number of files, in the order they are interleaved
+    :param callable count_fn: Returns the number of records of a file index
+    :param int cycle_length: Number of files interleaved at once
+    :param int num_records: Number of records produced
+    :returns: List of (file index, number of records to skip) which, when
+        interleaved in order with the same `cycle_length` after skipping
+        the records of every file, produces the records which follow the
+        first `num_records`. None if the files have fewer records.
+    """
+    counts = {}
+
+    def count(index):
+        if index not in counts:
+            counts[index] = count_fn(index)
+        return counts[index]
+
+    # [file index, number of records produced] of every slot
+    slots = [None] * cycle_length
+    cycle_index = 0
+    next_file = 0
+    produced = 0
+    while produced < num_records:
+        open_slots = [slot for slot in slots if slot is not None]
+        if (
+            cycle_index == 0
+            and open_slots
+            and (len(open_slots) == cycle_length or next_file == num_files)
+        ):
+            rounds = min(
+                min(count(index) - skip for index, skip in open_slots),
+                (num_records - produced) // len(open_slots),
+            )
+            if rounds > 0:
+                for slot in open_slots:
+                    slot[1] += rounds
+                produced += rounds * len(open_slots)
+                continue
+
+        slot = slots[cycle_index]
+        if slot is not None:
+            if slot[1] < count(slot[0]):
+                slot[1] += 1
+                produced += 1
+            else:
+                slots[cycle_index] = None
+            cycle_index = (cycle_index + 1) % cycle_length
+        elif next_file < num_files:
+            slots[cycle_index] = [next_file, 0]
+            next_file += 1
+        elif open_slots:
+            cycle_index = (cycle_index + 1) % cycle_length
+        else:
+            return None
+
+    # The slots are listed from the next one to produce, and empty slots
+    # take the files they would open next.
+    inputs = []
+    for i in range(cycle_length):
+        slot = slots[(cycle_index + i) % cycle_length]
+        if slot is not None:
+            inputs.append(tuple(slot))
+        elif next_file < num_files:
+            inputs.append((next_file, 0))
+            next_file += 1
+    inputs.extend((index, 0) for index in range(next_file, num_files))
+    return inputs
+
+
 def create_bytes_feature(value):
     """Returns a bytes_list from a string / byte."""
     if isinstance(value, type(tf.constant(0))):
@@ -16,6 +16,29 @@ import json
 import os
 
 
+def get_shard_spec(use_multiple_workers, input_context=None):
+    """
+    Returns the number of shards and the index of the shard of this worker
+    which `shard_dataset` uses, or None if the dataset is not sharded.
+
+    :param bool use_multiple_workers: Specifies whether using multiple_workers
+        with the Cerebras System or not
+    :param dict input_context: Given by distributed strategy for training
+    """
+    # Add multi-gpu input context.
+    if not use_multiple_workers and input_context:
+        return (
+            input_context.num_input_pipelines,
+            input_context.input_pipeline_id,
+        )
+    # Add a multi-worker context for the Cerebras System data loading.
+    # In this case, no input context should be generated.
+    elif use_multiple_workers and "TF_CONFIG" in os.environ:
+        config = json.loads(os.environ["TF_CONFIG"])
+        return len(config["cluster"]["worker"]), config["task"]["index"]
+    return None
+
+
 def shard_dataset(dataset, use_multiple_workers, input_context=None):
     """
     Shard a dataset based on whether we are using a multi-gpu setting
@@ -30,18 +53,9 @@ def shard_dataset(dataset, use_multiple_workers, input_context=None):
     :returns dataset: Sharded if either input_context or use_multiple_workers
     is passed, else just returns the dataset
     """
-
-    # Add multi-gpu input context.
-    if not use_multiple_workers and input_context:
-        num_workers = input_context.num_input_pipelines
-        worker_id = input_context.input_pipeline_id
-        dataset = dataset.shard(num_workers, worker_id)
-    # Add a multi-worker context for the Cerebras System data loading.
-    # In this case, no input context should be generated.
-    elif use_multiple_workers and "TF_CONFIG" in os.environ:
-        config = json.loads(os.environ["TF_CONFIG"])
-        num_workers = len(config["cluster"]["worker"])
-        worker_id = config["task"]["index"]
+    shard_spec = get_shard_spec(use_multiple_workers, input_context)
+    if shard_spec is not None:
+        num_workers, worker_id = shard_spec
         dataset = dataset.shard(num_workers, worker_id)
 
     return dataset
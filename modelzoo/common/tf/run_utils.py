@@ -63,6 +63,28 @@ class GetWeights:
         return self._var_names
 
 
+def read_checkpoint_values(ckpt_path, var_names):
+    """Reads variables of a TensorFlow checkpoint by name, e.g. its global
+    step. Only the index of the checkpoint and the data of these variables
+    are read, so the time does not depend on the size of the model.
+    Args:
+        ckpt_path: (str)
+            Path to TensorFlow checkpoint (prefix).
+        var_names: (list)
+            Names of the variables to read.
+    Returns:
+        : (dict)
+            Dictionary of the names of the variables which are in the
+            checkpoint to numpy arrays.
+    """
+    reader = tf.compat.v1.train.NewCheckpointReader(ckpt_path)
+    return {
+        var_name: reader.get_tensor(var_name)
+        for var_name in var_names
+        if reader.has_tensor(var_name)
+    }
+
+
 def get_weight_dict(ckpt_path):
     """Reads TensorFlow checkpoint from specified path and returns
     the corresponding model's parameters as a dictionary of variable
@@ -441,11 +463,10 @@ def get_input_checkpoint_steps(model_dir):
     skip = 0
     ckpt_path = tf.train.latest_checkpoint(model_dir)
     if ckpt_path is not None:
-        for var, value in GetWeights(ckpt_path):
-            if var == "global_step":
-                # explicit cast from np.int64 to int
-                skip = int(value)
-                break
+        values = read_checkpoint_values(ckpt_path, ["global_step"])
+        if "global_step" in values:
+            # explicit cast from np.int64 to int
+            skip = int(values["global_step"])
     return skip
 
 
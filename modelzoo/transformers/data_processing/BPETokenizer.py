@@ -17,7 +17,9 @@
 Modified from the GPT-2 codebase: https://github.com/openai/gpt-2
 """
 
+import heapq
 import json
+from collections import OrderedDict
 from functools import lru_cache
 
 import regex as re
@@ -64,8 +66,25 @@ def get_pairs(word):
 
 
 class BPETokenizer:
+    """Byte-level BPE tokenizer.
+
+    Args:
+        vocab_file (str): File with the BPE merges, one pair per line.
+        encoder_file (str): JSON file mapping word-pieces to token ids.
+        errors (str): How to handle errors in decoding. Defaults to `replace`.
+        special_tokens (list): Tokens to add to the encoder. Defaults to `None`.
+        cache_size (int): Maximum number of words whose BPE result is kept in
+            the LRU cache. `None` makes the cache unbounded. Defaults to
+            `100000`.
+    """
+
     def __init__(
-        self, vocab_file, encoder_file, errors='replace', special_tokens=None
+        self,
+        vocab_file,
+        encoder_file,
+        errors='replace',
+        special_tokens=None,
+        cache_size=100000,
     ):
         with open(vocab_file, 'r', encoding="utf-8") as f:
             bpe_data = f.read()
@@ -90,7 +109,10 @@ class BPETokenizer:
         self.byte_encoder = bytes_to_unicode()
         self.byte_decoder = {v: k for k, v in self.byte_encoder.items()}
         self.bpe_ranks = dict(zip(bpe_merges, range(len(bpe_merges))))
-        self.cache = {}
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
 
         # Should haved added re.IGNORECASE so BPE merges can happen for
         # capitalized versions of contractions
@@ -98,63 +120,118 @@ class BPETokenizer:
             r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+"""
         )
 
+    def cache_info(self):
+        """Returns the hits, misses, size and hit rate of the word cache."""
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "size": len(self.cache),
+            "max_size": self.cache_size,
+            "hit_rate": self.cache_hits / lookups if lookups else 0.0,
+        }
+
     def bpe(self, token):
         if token in self.cache:
+            self.cache_hits += 1
+            self.cache.move_to_end(token)
             return self.cache[token]
-        word = tuple(token)
-        pairs = get_pairs(word)
+        self.cache_misses += 1
 
-        if not pairs:
+        if len(token) < 2:
             return token
 
-        while True:
-            bigram = min(
-                pairs, key=lambda pair: self.bpe_ranks.get(pair, float('inf'))
-            )
-            if bigram not in self.bpe_ranks:
-                break
-            first, second = bigram
-            new_word = []
-            i = 0
-            while i < len(word):
-                try:
-                    j = word.index(first, i)
-                    new_word.extend(word[i:j])
-                    i = j
-                except:
-                    new_word.extend(word[i:])
-                    break
-
-                if (
-                    word[i] == first
-                    and i < len(word) - 1
-                    and word[i + 1] == second
-                ):
-                    new_word.append(first + second)
-                    i += 2
-                else:
-                    new_word.append(word[i])
-                    i += 1
-            new_word = tuple(new_word)
-            word = new_word
-            if len(word) == 1:
-                break
-            else:
-                pairs = get_pairs(word)
-        word = ' '.join(word)
+        # The symbols of the word form a linked list over `word`, merged
+        # symbols are stored at the position of their left part and the
+        # right part is set to `None`. Candidate merges are kept in a heap
+        # ordered by (rank, position), so each merge costs O(log n) instead
+        # of a scan over all pairs. Since a merge in the BPE table can only
+        # involve symbols created by lower ranked merges, popping from the
+        # heap applies the merges in the same order as the reference
+        # implementation, which merges all occurrences of the lowest ranked
+        # pair before moving on.
+        bpe_ranks = self.bpe_ranks
+        word = list(token)
+        next_pos = list(range(1, len(word))) + [-1]
+        prev_pos = list(range(-1, len(word) - 1))
+
+        heap = []
+        for i in range(len(word) - 1):
+            rank = bpe_ranks.get((word[i], word[i + 1]))
+            if rank is not None:
+                heap.append((rank, i))
+        heapq.heapify(heap)
+
+        while heap:
+            rank, i = heapq.heappop(heap)
+            j = next_pos[i]
+            # skip stale entries whose pair was changed by an earlier merge
+            if (
+                word[i] is None
+                or j == -1
+                or bpe_ranks.get((word[i], word[j])) != rank
+            ):
+                continue
+
+            word[i] += word[j]
+            word[j] = None
+            next_pos[i] = next_pos[j]
+            if next_pos[j] != -1:
+                prev_pos[next_pos[j]] = i
+
+            if prev_pos[i] != -1:
+                rank = bpe_ranks.get((word[prev_pos[i]], word[i]))
+                if rank is not None:
+                    heapq.heappush(heap, (rank, prev_pos[i]))
+            if next_pos[i] != -1:
+                rank = bpe_ranks.get((word[i], word[next_pos[i]]))
+                if rank is not None:
+                    heapq.heappush(heap, (rank, i))
+
+        word = ' '.join(symbol for symbol in word if symbol is not None)
         self.cache[token] = word
+        if self.cache_size is not None and len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
         return word
 
+    def _encode_word(self, token):
+        token = ''.join(self.byte_encoder[b] for b in token.encode('utf-8'))
+        return [
+            self.encoder[bpe_token] for bpe_token in self.bpe(token).split(' ')
+        ]
+
     def encode(self, text):
         bpe_tokens = []
         for token in re.findall(self.pat, text):
-            token = ''.join(self.byte_encoder[b] for b in token.encode('utf-8'))
-            bpe_tokens.extend(
-                self.encoder[bpe_token]
-                for bpe_token in self.bpe(token).split(' ')
-            )
+            bpe_tokens.extend(self._encode_word(token))
         return bpe_tokens
 
+    def encode_batch(self, texts):
+        """Encode a list of documents.
+
+        Words are encoded once per batch, so words repeated across the
+        documents of a batch skip the byte mapping, the cache lookup and
+        the encoder lookups even if they have been evicted from the cache.
+
+        Args:
+            texts (list): List of documents to encode.
+
+        Returns:
+            List containing the list of token ids of every document.
+        """
+        word_ids = {}
+        batch_tokens = []
+        for text in texts:
+            bpe_tokens = []
+            for token in re.findall(self.pat, text):
+                ids = word_ids.get(token)
+                if ids is None:
+                    ids = self._encode_word(token)
+                    word_ids[token] = ids
+                bpe_tokens.extend(ids)
+            batch_tokens.append(bpe_tokens)
+        return batch_tokens
+
     def decode(self, tokens):
         text = ''.join([self.decoder[token] for token in tokens])
         text = bytearray([self.byte_decoder[c] for c in text]).decode(
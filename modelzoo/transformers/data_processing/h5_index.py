@@ -0,0 +1,144 @@
+# Copyright 2022 Cerebras Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Sidecar index of the HDF5 files in a dataset directory.
+
+The index is a single JSON file next to the HDF5 files, recording for every
+file its name, size, modification time and number of examples. Data
+processors read it once instead of opening every HDF5 file for its
+`n_examples` attribute, which is slow for many files on shared filesystems.
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import h5py
+
+INDEX_FILENAME = "h5_index.json"
+INDEX_VERSION = 1
+
+
+def read_n_examples(file_path):
+    """Read the number of examples of a HDF5 file from its attributes."""
+    with h5py.File(file_path, mode="r") as h5_file:
+        return int(h5_file.attrs["n_examples"])
+
+
+def read_n_examples_parallel(file_paths, num_threads=None):
+    """Read the number of examples of many HDF5 files with a thread pool.
+
+    Opening a file mostly waits on the filesystem, so threads overlap the
+    latency of the opens.
+
+    Args:
+        file_paths (list): Paths of the HDF5 files.
+        num_threads (int): Number of threads. Defaults to the default of
+            `ThreadPoolExecutor`.
+
+    Returns:
+        List with the number of examples of every file, in order.
+    """
+    if len(file_paths) <= 1:
+        return [read_n_examples(file_path) for file_path in file_paths]
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        return list(executor.map(read_n_examples, file_paths))
+
+
+def _file_entry(file_path, n_examples):
+    stat = os.stat(file_path)
+    return {
+        "path": os.path.basename(file_path),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "n_examples": int(n_examples),
+    }
+
+
+def write_h5_index(data_dir, n_examples=None, num_threads=None):
+    """Write the index of the HDF5 files in `data_dir`.
+
+    Args:
+        data_dir (str): Directory with the HDF5 files.
+        n_examples (dict): Number of examples of the files, by file name,
+            if already known to the caller. Files not listed in it are
+            opened to read their `n_examples` attribute.
+        num_threads (int): Number of threads used to open the files.
+
+    Returns:
+        dict with the written index.
+    """
+    if n_examples is None:
+        n_examples = {}
+    file_paths = sorted(str(path) for path in Path(data_dir).glob("*.h5"))
+    unknown = [
+        file_path
+        for file_path in file_paths
+        if os.path.basename(file_path) not in n_examples
+    ]
+    n_examples = dict(n_examples)
+    for file_path, count in zip(
+        unknown, read_n_examples_parallel(unknown, num_threads)
+    ):
+        n_examples[os.path.basename(file_path)] = count
+
+    files = [
+        _file_entry(file_path, n_examples[os.path.basename(file_path)])
+        for file_path in file_paths
+    ]
+    index = {
+        "version": INDEX_VERSION,
+        "n_examples": sum(entry["n_examples"] for entry in files),
+        "files": files,
+    }
+
+    # Readers never see a partially written index.
+    index_path = os.path.join(data_dir, INDEX_FILENAME)
+    with open(index_path + ".tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(index_path + ".tmp", index_path)
+    return index
+
+
+def load_h5_index(data_dir):
+    """Load the index of the HDF5 files in `data_dir`.
+
+    Args:
+        data_dir (str): Directory with the HDF5 files.
+
+    Returns:
+        dict mapping the absolute path of every indexed file to its entry,
+        or `None` if the directory has no readable index.
+    """
+    index_path = os.path.join(data_dir, INDEX_FILENAME)
+    try:
+        with open(index_path, "r") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get("version") != INDEX_VERSION:
+        return None
+
+    data_dir = os.path.abspath(data_dir)
+    return {
+        os.path.join(data_dir, entry["path"]): entry for entry in index["files"]
+    }
+
+
+def is_entry_stale(file_path, entry):
+    """Whether a HDF5 file changed since its index entry was written."""
+    stat = os.stat(file_path)
+    return stat.st_size != entry["size"] or stat.st_mtime != entry["mtime"]
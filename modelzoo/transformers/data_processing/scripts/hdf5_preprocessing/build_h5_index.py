@@ -0,0 +1,64 @@
+# Copyright 2022 Cerebras Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Script that (re)builds the index of the HDF5 files of datasets, used by the
+HDF5 data processors to size the dataset without opening every file.
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../../../.."))
+from modelzoo.transformers.data_processing.h5_index import (
+    INDEX_FILENAME,
+    write_h5_index,
+)
+
+logging.basicConfig()
+logger = logging.getLogger(__file__)
+logger.setLevel(logging.INFO)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "data_dirs",
+        nargs="+",
+        help="Directories with the HDF5 files to index.",
+    )
+    parser.add_argument(
+        "--num_threads",
+        type=int,
+        default=32,
+        help="Number of threads opening the HDF5 files. Defaults to `32`.",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    for data_dir in args.data_dirs:
+        index = write_h5_index(data_dir, num_threads=args.num_threads)
+        logger.info(
+            f"Indexed {len(index['files'])} files with "
+            f"{index['n_examples']} examples in "
+            f"{os.path.join(data_dir, INDEX_FILENAME)}."
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -23,6 +23,7 @@ from pathlib import Path
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "../../../../../.."))
 from modelzoo.common.input.utils import check_and_create_output_dirs
+from modelzoo.transformers.data_processing.h5_index import write_h5_index
 from modelzoo.transformers.data_processing.scripts.hdf5_preprocessing.utils import (
     create_dataset,
     create_dataset_mp,
@@ -32,7 +33,9 @@ from modelzoo.transformers.data_processing.scripts.hdf5_preprocessing.utils impo
     set_defaults,
     verify_saved_hdf5_files,
     verify_saved_hdf5_files_mp,
+    verify_saved_memmap_files,
     write_hdf5_files,
+    write_memmap_files,
 )
 from modelzoo.transformers.data_processing.scripts.utils import get_files
 
@@ -47,8 +50,9 @@ def main():
     args = parser.parse_args()
 
     output_dir = args.output_dir
+    filetype = "bin" if args.mode == "memmap_text" else "h5"
     if not args.resume_from_checkpoint:
-        check_and_create_output_dirs(output_dir, filetype="h5")
+        check_and_create_output_dirs(output_dir, filetype=filetype)
 
     if args.metadata_files:
         metadata_files = args.metadata_files.split(",")
@@ -65,11 +69,16 @@ def main():
     json_params_file = os.path.join(output_dir, "data_params.json")
     dump_args(args, json_params_file)
 
+    if args.mode == "memmap_text":
+        write_files_fn = write_memmap_files
+    else:
+        write_files_fn = write_hdf5_files
+
     if args.processes > 1:
-        results = create_dataset_mp(input_files, args, write_hdf5_files)
+        results = create_dataset_mp(input_files, args, write_files_fn)
     else:
         # Run only single process run, with process number set as 0.
-        results = create_dataset((input_files, args, write_hdf5_files, 0))
+        results = create_dataset((input_files, args, write_files_fn, 0))
 
     if args.mode == "raw_text":
         dump_result(results, json_params_file)
@@ -82,14 +91,24 @@ def main():
     )
 
     logger.info(f"Verifying the converted dataset at: {output_dir}")
-    output_files = list(Path(output_dir).glob("*.h5"))
-    if args.processes > 1:
+    output_files = list(Path(output_dir).glob(f"*.{filetype}"))
+    if args.mode == "memmap_text":
+        # Only the small offsets index is read, so a single process is enough.
+        verify_saved_memmap_files((output_files, args))
+    elif args.processes > 1:
         verify_saved_hdf5_files_mp(output_files, args)
     else:
         # Run only single process run, with process number set as 0.
         verify_saved_hdf5_files((output_files, args))
     logger.info("Done verifying the converted dataset.")
 
+    if filetype == "h5":
+        index = write_h5_index(output_dir, num_threads=args.processes)
+        logger.info(
+            f"Indexed {len(index['files'])} files with "
+            f"{index['n_examples']} examples."
+        )
+
 
 if __name__ == "__main__":
     main()
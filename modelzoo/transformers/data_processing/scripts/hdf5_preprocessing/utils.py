@@ -15,6 +15,7 @@
 import argparse
 import json
 import logging
+import os
 import random
 from itertools import repeat
 from math import ceil
@@ -119,34 +120,12 @@ def add_common_args(parser):
     )
 
 
-def get_parser(desc):
-
-    """Argparser definition for command line arguments from user.
-
-    Returns:
-        Argparse namespace object with command line arguments.
+def add_tokenization_args(parser):
     """
-    parser = argparse.ArgumentParser(description=desc)
-    subparser = parser.add_subparsers(
-        description="Sub command for HDF5 conversion.",
-        dest="mode",
-        required=True,
-        help="Sub command to choose saving the raw text into HDF5 files or "
-        "pre-processed text converted into token ids at desired maximum "
-        "sequence length.",
-    )
-    raw_text_parser = subparser.add_parser(
-        "raw_text", help="Convert input files into hdf5 files with raw text."
-    )
-    add_common_args(raw_text_parser)
-    token_id_parser = subparser.add_parser(
-        "preprocessed_text",
-        help="Convert input files into hdf5 files with the input text "
-        "that is tokenized and converted into token ids. Along with it "
-        "also save the labels and input attention mask for each sample.",
-    )
-    add_common_args(token_id_parser)
-    token_id_parser.add_argument(
+    Add command line arguments shared by the subcommands which tokenize the
+    input documents.
+    """
+    parser.add_argument(
         "--tokenizer_type",
         type=str,
         required=True,
@@ -156,25 +135,25 @@ def get_parser(desc):
             "Can be one of `GPT2Tokenizer` or `NeoXTokenizer`."
         ),
     )
-    token_id_parser.add_argument(
+    parser.add_argument(
         "--vocab_file",
         type=str,
         default=None,
         help="path to the vocabulary file. Defaults to None.",
     )
-    token_id_parser.add_argument(
+    parser.add_argument(
         "--encoder_file",
         type=str,
         default=None,
         help="Path to the encoder file. Defaults to None.",
     )
-    token_id_parser.add_argument(
+    parser.add_argument(
         "--max_seq_length",
         type=int,
         default=2048,
         help="Maximum sequence length. Defaults to `2048`.",
     )
-    token_id_parser.add_argument(
+    parser.add_argument(
         "--short_seq_prob",
         type=float,
         default=0.0,
@@ -183,10 +162,8 @@ def get_parser(desc):
             + " maximum sequence length. Defaults to `0.0`."
         ),
     )
-    token_id_parser.add_argument(
-        "--ftfy", action="store_true", help="Fix text with ftfy."
-    )
-    token_id_parser.add_argument(
+    parser.add_argument("--ftfy", action="store_true", help="Fix text with ftfy.")
+    parser.add_argument(
         "--ftfy_normalizer",
         type=str,
         default="NFC",
@@ -198,12 +175,12 @@ def get_parser(desc):
             + " applies no normalization while fixing text."
         ),
     )
-    token_id_parser.add_argument(
+    parser.add_argument(
         "--wikitext-detokenize",
         action="store_true",
         help="Use wikitext detokenizer to fix text.",
     )
-    token_id_parser.add_argument(
+    parser.add_argument(
         "--eos_id",
         type=int,
         default=50256,
@@ -212,7 +189,7 @@ def get_parser(desc):
             + " is `<|endoftext|>` in tokens."
         ),
     )
-    token_id_parser.add_argument(
+    parser.add_argument(
         "--pad_id",
         type=int,
         default=50256,
@@ -221,11 +198,49 @@ def get_parser(desc):
             + " is `<|endoftext|>` in tokens."
         ),
     )
+
+
+def get_parser(desc):
+
+    """Argparser definition for command line arguments from user.
+
+    Returns:
+        Argparse namespace object with command line arguments.
+    """
+    parser = argparse.ArgumentParser(description=desc)
+    subparser = parser.add_subparsers(
+        description="Sub command for HDF5 conversion.",
+        dest="mode",
+        required=True,
+        help="Sub command to choose saving the raw text into HDF5 files or "
+        "pre-processed text converted into token ids at desired maximum "
+        "sequence length.",
+    )
+    raw_text_parser = subparser.add_parser(
+        "raw_text", help="Convert input files into hdf5 files with raw text."
+    )
+    add_common_args(raw_text_parser)
+    token_id_parser = subparser.add_parser(
+        "preprocessed_text",
+        help="Convert input files into hdf5 files with the input text "
+        "that is tokenized and converted into token ids. Along with it "
+        "also save the labels and input attention mask for each sample.",
+    )
+    add_common_args(token_id_parser)
+    add_tokenization_args(token_id_parser)
+    memmap_parser = subparser.add_parser(
+        "memmap_text",
+        help="Convert input files into a flat token stream with an offsets "
+        "index per output file. Labels and attention masks are not stored "
+        "and are derived by the `GptMemmapDataProcessor` at load time.",
+    )
+    add_common_args(memmap_parser)
+    add_tokenization_args(memmap_parser)
     return parser
 
 
 def set_defaults(args):
-    if args.mode == "preprocessed_text":
+    if args.mode != "raw_text":
         # fix args for ftfy normalization
         if args.ftfy_normalizer == "None":
             args.ftfy_normalizer = None
@@ -341,7 +356,7 @@ def create_dataset(params):
     doc_object_array = []
 
     tokenizer = None
-    if args.mode == "preprocessed_text":
+    if args.mode != "raw_text":
         tokenizer, eos_id, pad_id = get_tokenizer(args)
 
         # re-assign eos_id, pos_id to the args value since it is used for generation
@@ -358,7 +373,7 @@ def create_dataset(params):
             if files_processed < resume_files_processed:
                 continue  # enable resuming from checkpoint
 
-            if args.mode == "preprocessed_text":
+            if args.mode != "raw_text":
                 # if the last chunk < chunk size, but > minimum_size, take it
                 # and append it to the beginning of the next file
                 if data_to_prepend:
@@ -372,7 +387,7 @@ def create_dataset(params):
                         discarded_files += 1
 
             # add tokenized files > chunk size to main array
-            if args.mode == "preprocessed_text":
+            if args.mode != "raw_text":
                 doc_object_array.extend(doc_object)
             else:
                 doc_object_array.append(doc_object)
@@ -645,6 +660,96 @@ def write_hdf5_files(
     return start_number, remainder
 
 
+def write_memmap_file(file_path, files, args, rng):
+    """Write tokenized sequences as a flat token stream with an offsets index.
+
+    The token ids of all sequences are concatenated into ``<file_path>.bin``
+    as ``uint16`` (or ``uint32`` if the vocabulary does not fit) and the
+    sequence boundaries are saved to ``<file_path>.idx.npz``. Sequence ``i``
+    occupies ``tokens[offsets[i] : offsets[i + 1]]`` and holds up to
+    ``max_seq_length + 1`` tokens, from which input ids, labels and the
+    attention mask are derived at load time.
+
+    Args:
+        file_path (string): Output path, without extension.
+        files (sequence): List of lists containing tokenized data to write.
+        args (argparse namespace): Arguments for writing out the dataset.
+        rng (random.Random obj): Instance of random object, with states set.
+    """
+    sequences = []
+    for tokens in files:
+        # same truncation as `create_features_labels` so that the memmap
+        # and HDF5 outputs contain identical samples for a given seed
+        if rng.random() < args.short_seq_prob:
+            tokens = tokens[0 : rng.randint(2, args.max_seq_length - 1)]
+        sequences.append(np.asarray(tokens, dtype=np.int64))
+
+    offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+    np.cumsum([len(seq) for seq in sequences], out=offsets[1:])
+    tokens = np.concatenate(sequences)
+    dtype = np.uint16 if tokens.max(initial=0) < 2 ** 16 else np.uint32
+
+    tokens.astype(dtype).tofile(file_path + ".bin")
+    # the index is written last, so its presence marks a complete file
+    np.savez(
+        file_path + ".idx",
+        offsets=offsets,
+        dtype=np.dtype(dtype).str,
+        pad_id=args.pad_id,
+        max_seq_length=args.max_seq_length,
+    )
+
+
+def write_memmap_files(
+    files,
+    args,
+    start_number,
+    write_remainder=False,
+    process_number=None,
+    rng=random.Random(),
+):
+    """Writes a list of tokenized sequences to flat token stream files.
+
+    Args:
+        files (sequence): List of lists containing tokenized data to write.
+        args (argparse namespace): Arguments for writing out the dataset.
+        start_number (int): Continual count of files written out.
+        write_remainder (bool): Write out remaining data from files, if
+            files per record is not met. Defaults to `False`.
+        process_number (int): Process number for execution. Defaults to `None`.
+        rng (random.Random obj): Instance of random object, with states set.
+            Defaults to new instance created for write.
+
+    Returns:
+        start_number (int): Continual count of files written out.
+        remainder (list): Remaining sequences not written out, if length of
+            files to write is greater than the file per record.
+    """
+    if not files:
+        return
+
+    files_per_record = args.files_per_record
+    file_chunks = split_list(files, files_per_record)
+    if not file_chunks:
+        return
+
+    if len(file_chunks[-1]) != files_per_record and not write_remainder:
+        remainder = file_chunks.pop(-1)
+    else:
+        remainder = None
+
+    for files in file_chunks:
+        fp = f"{args.output_dir}/{args.output_name}_{start_number}"
+        if process_number is not None:
+            fp += f"_{process_number}"
+
+        write_memmap_file(file_path=fp, files=files, args=args, rng=rng)
+
+        start_number += 1
+
+    return start_number, remainder
+
+
 def verify_saved_hdf5_files(params):
     """
     This function is used to do sanity checks at the end of the creation 
@@ -699,6 +804,43 @@ def verify_saved_hdf5_files(params):
                 )
 
 
+def verify_saved_memmap_files(params):
+    """
+    This function is used to do sanity checks at the end of the creation
+    of flat token stream files. It loads the index of every `.bin` file
+    generated and checks:
+        1. The offsets are monotonic and match the size of the token file
+        2. Every sequence can produce at least one input token and label
+           and fits into the maximum sequence length
+    """
+    bin_files_path, args = params
+    for bin_file_path in bin_files_path:
+        bin_file_path = str(bin_file_path)
+        index = np.load(bin_file_path[: -len(".bin")] + ".idx.npz")
+        offsets = index["offsets"]
+        itemsize = np.dtype(str(index["dtype"])).itemsize
+        n_tokens = os.path.getsize(bin_file_path) // itemsize
+        assert offsets[-1] == n_tokens, (
+            f"Error in {bin_file_path}, conversion is corrupted as the "
+            f"number of tokens is unexpected. Expected: {offsets[-1]}, "
+            f"received {n_tokens}."
+        )
+        n_examples = len(offsets) - 1
+        assert n_examples <= args.files_per_record, (
+            f"Error in {bin_file_path}, conversion is corrupted as the "
+            f"number of examples in file is unexpected. Expected:"
+            f" {args.files_per_record}, received {n_examples}."
+        )
+        lengths = np.diff(offsets)
+        assert np.all(lengths >= 2) and np.all(
+            lengths <= args.max_seq_length + 1
+        ), (
+            f"Error in {bin_file_path}, conversion is corrupted as the "
+            f"sequence lengths are outside of the expected range "
+            f"[2, {args.max_seq_length + 1}]."
+        )
+
+
 def verify_saved_hdf5_files_mp(files, args):
     """Create HDF5 dataset using multiple processes.
 
@@ -1,137 +1,333 @@
+# Copyright 2022 Cerebras Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Script that shuffles the samples of a HDF5 dataset across a new set of
+HDF5 files with a two-pass external shuffle.
+
+In the first pass, every input file is read in contiguous slices and each
+sample is scattered to a random output chunk. Scattered samples are buffered
+up to a fixed budget and then flushed to small uncompressed sub-chunk files.
+In the second pass, the sub-chunks of every output chunk are written into
+the final file at the positions given by a random permutation, one sub-chunk
+at a time. Both passes are deterministic for a given `--seed` and can be
+resumed after a crash by re-running the same command.
+"""
 
 import argparse
 import glob
-import h5py
-import numpy as np
+import json
+import logging
+import multiprocessing
+import multiprocessing.connection
 import os
+import sys
 import time
 
-parser = argparse.ArgumentParser()
-parser.add_argument('inputdir', help='Path to the H5 files directory to shuffle.')
-parser.add_argument('outdir', help='Directory path in which to place shuffled data files')
-parser.add_argument('num_output_chunks', help='Number of output data chunks to create', type=int)
-parser.add_argument('--num_parallel', default=1, type=int)
-parser.add_argument('--worker_id', default=0, type=int)
-args = parser.parse_args()
-
-np.random.seed(seed=115 + args.worker_id)
-
-# Recursively find all H5 files in inputdir
-h5filenames = glob.glob(os.path.join(args.inputdir, '**/*.h5'), recursive=True)
-
-inputdir = args.inputdir
-if inputdir[-1] != '/':
-    inputdir += '/'
-if not os.path.exists(args.outdir):
-    os.makedirs(args.outdir, exist_ok=True)
-workers_dir = os.path.join(args.outdir, 'workers')
-if not os.path.exists(workers_dir):
-    os.makedirs(workers_dir, exist_ok=True)
-worker_file = os.path.join(workers_dir, f'worker-{args.worker_id}.txt')
-if os.path.exists(worker_file):
-    os.remove(worker_file)
-shuf_split_dir = os.path.join(args.outdir, 'shuf_split')
-if not os.path.exists(shuf_split_dir):
-    os.makedirs(shuf_split_dir, exist_ok=True)
-
-sorted(h5filenames)
-print(h5filenames)
-
-chunk_outdirs = []
-for i in range(args.num_output_chunks):
-    chunk_outdir = os.path.join(args.outdir, f'{str(i)}')
-    chunk_outdirs.append(chunk_outdir)
-    if not os.path.exists(chunk_outdir):
-        os.makedirs(chunk_outdir, exist_ok=True)
+import h5py
+import numpy as np
 
-spread_start_time = time.time()
-for idx, h5filename in enumerate(h5filenames):
-    if idx % args.num_parallel != args.worker_id:
-        continue
-    done_filename = h5filename.replace(inputdir, "").replace('.h5', '.shuf')
-    done_filename = os.path.join(shuf_split_dir, done_filename)
-    done_filedir = os.path.dirname(done_filename)
-    if not os.path.exists(done_filedir):
-        os.makedirs(done_filedir, exist_ok=True)
-    if os.path.exists(done_filename):
-        print(f'H5 file is done: {h5filename}')
-        continue
-    chunk_samples = []
-    for i in range(args.num_output_chunks):
-        chunk_samples.append([])
-    h5file = h5py.File(h5filename, 'r')
-    num_samples = h5file['data'].shape[0]
-    out_chunk_ids = np.random.choice(np.arange(args.num_output_chunks), size=num_samples)
-    print(out_chunk_ids)
-    for seq_id, out_id in enumerate(out_chunk_ids):
-        chunk_samples[out_id].append(h5file['data'][seq_id:seq_id+1])
-    for chunk_id, chunk in enumerate(chunk_samples):
-        if len(chunk) == 0:
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../../../.."))
+from modelzoo.transformers.data_processing.h5_index import (
+    INDEX_FILENAME,
+    write_h5_index,
+)
+
+logging.basicConfig()
+logger = logging.getLogger(__file__)
+logger.setLevel(logging.INFO)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "inputdir", help="Path to the H5 files directory to shuffle."
+    )
+    parser.add_argument(
+        "outdir", help="Directory path in which to place shuffled data files."
+    )
+    parser.add_argument(
+        "num_output_chunks",
+        type=int,
+        help="Number of output data chunks to create.",
+    )
+    parser.add_argument(
+        "--num_parallel",
+        type=int,
+        default=1,
+        help="Number of local worker processes. Defaults to `1`.",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=115, help="Random seed. Defaults to `115`.",
+    )
+    parser.add_argument(
+        "--read_block_size",
+        type=int,
+        default=4096,
+        help="Number of samples read from an input file at once. "
+        "Defaults to `4096`.",
+    )
+    parser.add_argument(
+        "--buffer_size",
+        type=int,
+        default=16384,
+        help="Maximum number of scattered samples a worker buffers in memory "
+        "before flushing them to sub-chunk files. Defaults to `16384`.",
+    )
+    return parser.parse_args()
+
+
+def _subchunk_prefix(file_idx):
+    return f"sdata-{file_idx:06d}-"
+
+
+def _flush_buffers(buffers, chunk_outdirs, file_idx, part):
+    """Write the buffered samples of every output chunk to sub-chunk files.
+
+    Sub-chunk files are named after the input file and flush number, so the
+    second pass can consume them in a deterministic order.
+    """
+    for chunk_id, chunk in enumerate(buffers):
+        if not chunk:
             continue
-        chunk = np.concatenate(chunk, axis=0)
-        out_hash = f'{np.random.randint(2**48):012x}'
-        out_filename = os.path.join(args.outdir, f'{chunk_id}', f'sdata-{out_hash}.h5')
-        # TODO: Make this a while loop
-        assert not os.path.exists(out_filename)
-        outfile = h5py.File(out_filename, 'w')
-        outfile.create_dataset(
-            'data',
-            data=chunk,
-            shape=chunk.shape,
-            chunks=(1, chunk.shape[1], chunk.shape[2]), # hdf5 chunk size
-            compression='gzip',
+        data = np.concatenate(chunk, axis=0)
+        out_filename = os.path.join(
+            chunk_outdirs[chunk_id],
+            f"{_subchunk_prefix(file_idx)}{part:04d}.h5",
         )
-        outfile.close()
-    h5file.close()
-    with open(done_filename, 'w') as done_file:
-        done_file.write('Done :D\n')
-
-with open(worker_file, 'w') as worker_file:
-    worker_file.write('Done :D\n')
-
-spread_end_time = time.time()
-print(f'Spreading samples took {spread_end_time-spread_start_time} seconds', flush=True)
-
-done = False
-while not done:
-    done_workers = 0
-    for i in range(args.num_parallel):
-        if os.path.exists(os.path.join(args.outdir, 'workers', f'worker-{i}.txt')):
-            done_workers += 1
-    if done_workers == args.num_parallel:
-        done = True
-    time.sleep(2)
-
-sync_end_time = time.time()
-print(f'Syncing with other workers took {sync_end_time-spread_end_time} seconds', flush=True)
-
-for chunk_id, chunk_outdir in enumerate(chunk_outdirs):
-    if chunk_id % args.num_parallel != args.worker_id:
-        continue
-    subchunk_filenames = glob.glob(os.path.join(chunk_outdir, 'sdata-*.h5'))
-    sorted(subchunk_filenames) # For determinism
-    chunk_data = []
-    for subchunk_filename in subchunk_filenames:
-        h5file = h5py.File(subchunk_filename, 'r')
-        chunk_data.append(np.array(h5file['data']))
-        h5file.close()
-    chunk = np.concatenate(chunk_data, axis=0)
-    np.random.shuffle(chunk)
-    chunk_filename = os.path.join(args.outdir, f'data-{chunk_id:05d}.h5')
-    chunk_file = h5py.File(chunk_filename, 'w')
-    chunk_file.attrs["n_examples"] = chunk.shape[0]
-    chunk_file.create_dataset(
-        'data',
-        data=chunk,
-        shape=chunk.shape,
-        chunks=(1, chunk.shape[1], chunk.shape[2]), # hdf5 chunk size
-        compression='gzip',
+        with h5py.File(out_filename, "w") as outfile:
+            outfile.create_dataset("data", data=data)
+        chunk.clear()
+
+
+def scatter_file(h5filename, file_idx, chunk_outdirs, args):
+    """Scatter the samples of one input file to the output chunks.
+
+    Args:
+        h5filename (str): Path of the input HDF5 file.
+        file_idx (int): Index of the file in the sorted list of input files.
+        chunk_outdirs (list): Directories collecting the output chunks.
+        args (argparse namespace): Arguments for the shuffle.
+    """
+    # Remove leftovers from an interrupted run over this file
+    for chunk_outdir in chunk_outdirs:
+        for partial in glob.glob(
+            os.path.join(chunk_outdir, f"{_subchunk_prefix(file_idx)}*.h5")
+        ):
+            os.remove(partial)
+
+    rng = np.random.default_rng([args.seed, 0, file_idx])
+    buffers = [[] for _ in chunk_outdirs]
+    num_buffered = 0
+    part = 0
+    with h5py.File(h5filename, "r") as h5file:
+        dataset = h5file["data"]
+        num_samples = dataset.shape[0]
+        for start in range(0, num_samples, args.read_block_size):
+            block = dataset[start : start + args.read_block_size]
+            out_chunk_ids = rng.integers(
+                len(chunk_outdirs), size=block.shape[0]
+            )
+            # Group the block by output chunk with a single stable sort
+            order = np.argsort(out_chunk_ids, kind="stable")
+            bounds = np.searchsorted(
+                out_chunk_ids[order], np.arange(len(chunk_outdirs) + 1)
+            )
+            block = block[order]
+            for chunk_id in range(len(chunk_outdirs)):
+                if bounds[chunk_id] < bounds[chunk_id + 1]:
+                    buffers[chunk_id].append(
+                        block[bounds[chunk_id] : bounds[chunk_id + 1]]
+                    )
+            num_buffered += block.shape[0]
+            if num_buffered >= args.buffer_size:
+                _flush_buffers(buffers, chunk_outdirs, file_idx, part)
+                num_buffered = 0
+                part += 1
+    _flush_buffers(buffers, chunk_outdirs, file_idx, part)
+
+
+def consolidate_chunk(chunk_id, chunk_outdir, chunk_filename, args):
+    """Shuffle the sub-chunks of one output chunk into its final file.
+
+    Only one sub-chunk is held in memory at a time: each one is written to
+    the positions of the output dataset given by a seeded permutation.
+
+    Returns:
+        Number of examples in the output chunk.
+    """
+    subchunk_filenames = sorted(
+        glob.glob(os.path.join(chunk_outdir, "sdata-*.h5"))
     )
-    chunk_file.close()
+
+    if os.path.exists(chunk_filename):
+        # Chunk was consolidated before a restart
+        with h5py.File(chunk_filename, "r") as chunk_file:
+            n_examples = int(chunk_file.attrs["n_examples"])
+    else:
+        sizes = []
+        for subchunk_filename in subchunk_filenames:
+            with h5py.File(subchunk_filename, "r") as h5file:
+                sizes.append(h5file["data"].shape[0])
+                sample_shape = h5file["data"].shape[1:]
+                dtype = h5file["data"].dtype
+        n_examples = sum(sizes)
+        if n_examples == 0:
+            return 0
+
+        permutation = np.random.default_rng(
+            [args.seed, 1, chunk_id]
+        ).permutation(n_examples)
+        tmp_filename = chunk_filename + ".tmp"
+        with h5py.File(tmp_filename, "w") as chunk_file:
+            chunk_file.attrs["n_examples"] = n_examples
+            dset = chunk_file.create_dataset(
+                "data",
+                shape=(n_examples,) + sample_shape,
+                dtype=dtype,
+                chunks=(1,) + sample_shape,  # hdf5 chunk size
+                compression="gzip",
+            )
+            offset = 0
+            for subchunk_filename, size in zip(subchunk_filenames, sizes):
+                with h5py.File(subchunk_filename, "r") as h5file:
+                    data = h5file["data"][()]
+                targets = permutation[offset : offset + size]
+                # h5py requires increasing indices for point selections
+                order = np.argsort(targets)
+                dset[targets[order]] = data[order]
+                offset += size
+        os.replace(tmp_filename, chunk_filename)
 
     # Remove all subchunk files, since they have been consolidated
     for subchunk_filename in subchunk_filenames:
         os.remove(subchunk_filename)
+    return n_examples
+
+
+def shuffle_worker(worker_id, h5filenames, chunk_outdirs, barrier, args):
+    shuf_split_dir = os.path.join(args.outdir, "shuf_split")
+    workers_dir = os.path.join(args.outdir, "workers")
+
+    spread_start_time = time.time()
+    for file_idx, h5filename in enumerate(h5filenames):
+        if file_idx % args.num_parallel != worker_id:
+            continue
+        done_filename = os.path.join(shuf_split_dir, f"{file_idx:06d}.shuf")
+        if os.path.exists(done_filename):
+            logger.info(f"H5 file is done: {h5filename}")
+            continue
+        scatter_file(h5filename, file_idx, chunk_outdirs, args)
+        with open(done_filename, "w") as done_file:
+            done_file.write(f"{h5filename}\n")
+
+    spread_end_time = time.time()
+    logger.info(
+        f"Worker {worker_id}: spreading samples took "
+        f"{spread_end_time - spread_start_time} seconds"
+    )
+
+    # Every sub-chunk needs to be written before any chunk is consolidated
+    barrier.wait()
+
+    sync_end_time = time.time()
+    logger.info(
+        f"Worker {worker_id}: syncing with other workers took "
+        f"{sync_end_time - spread_end_time} seconds"
+    )
+
+    n_examples = {}
+    for chunk_id, chunk_outdir in enumerate(chunk_outdirs):
+        if chunk_id % args.num_parallel != worker_id:
+            continue
+        chunk_filename = os.path.join(args.outdir, f"data-{chunk_id:05d}.h5")
+        n_examples[os.path.basename(chunk_filename)] = consolidate_chunk(
+            chunk_id, chunk_outdir, chunk_filename, args
+        )
+    with open(os.path.join(workers_dir, f"worker-{worker_id}.json"), "w") as f:
+        json.dump(n_examples, f)
+
+    logger.info(
+        f"Worker {worker_id}: consolidating shuffled samples took "
+        f"{time.time() - sync_end_time} seconds"
+    )
+
+
+def write_index(outdir, num_parallel):
+    """Merge the per-worker example counts into the index of the output
+    files, so loaders don't need to open every output file to size the
+    dataset.
+    """
+    n_examples = {}
+    for worker_id in range(num_parallel):
+        with open(
+            os.path.join(outdir, "workers", f"worker-{worker_id}.json"), "r"
+        ) as f:
+            n_examples.update(json.load(f))
+    return write_h5_index(outdir, n_examples=n_examples)
+
+
+def main():
+    args = parse_args()
+
+    # Recursively find all H5 files in inputdir, sorted for determinism
+    h5filenames = sorted(
+        glob.glob(os.path.join(args.inputdir, "**/*.h5"), recursive=True)
+    )
+    if not h5filenames:
+        raise RuntimeError(f"No .h5 files found in {args.inputdir}.")
+
+    os.makedirs(os.path.join(args.outdir, "workers"), exist_ok=True)
+    os.makedirs(os.path.join(args.outdir, "shuf_split"), exist_ok=True)
+    chunk_outdirs = []
+    for i in range(args.num_output_chunks):
+        chunk_outdir = os.path.join(args.outdir, f"{i}")
+        chunk_outdirs.append(chunk_outdir)
+        os.makedirs(chunk_outdir, exist_ok=True)
+
+    barrier = multiprocessing.Barrier(args.num_parallel)
+    processes = []
+    for worker_id in range(args.num_parallel):
+        p = multiprocessing.Process(
+            target=shuffle_worker,
+            args=(worker_id, h5filenames, chunk_outdirs, barrier, args),
+        )
+        processes.append(p)
+        p.start()
+
+    failed = False
+    pending = {p.sentinel: p for p in processes}
+    while pending:
+        for sentinel in multiprocessing.connection.wait(list(pending)):
+            p = pending.pop(sentinel)
+            p.join()
+            if p.exitcode != 0 and not failed:
+                failed = True
+                # Release the workers waiting at the barrier for this one
+                barrier.abort()
+    if failed:
+        raise RuntimeError(
+            "A shuffle worker failed. Re-run the same command to resume."
+        )
+
+    index = write_index(args.outdir, args.num_parallel)
+    logger.info(
+        f"Done! Wrote {index['n_examples']} examples to "
+        f"{len(index['files'])} files in {args.outdir}, indexed in "
+        f"{INDEX_FILENAME}."
+    )
+
 
-consolidate_end_time = time.time()
-print(f'Consolidating shuffled samples took {consolidate_end_time-sync_end_time} seconds', flush=True)
+if __name__ == "__main__":
+    main()
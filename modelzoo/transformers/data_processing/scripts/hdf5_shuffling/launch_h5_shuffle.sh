@@ -6,6 +6,7 @@
 indir=$1
 # Output directory in which to create the shuffled *.h5 files
 # The output directory will be a flat directory with all resulting *.h5 files
+# and a h5_index.json listing the number of examples in each of them
 outdir=$2
 # Number of output *.h5 file chunks
 numchunks=$3
@@ -14,14 +15,11 @@ workers=$4
 mkdir -p $outdir/logs
 
 # Recommend running with up to 40 worker processes
-# Recommend estimating shuffle time as: (dataset chunks total size) / (2 MB/s)
-# For instance, 1 GB is likely to take roughly 8 minutes of total worker time
-# This process parallelizes quite well as long as the input chunks are all roughly
-# the same size, so we can estimate that the time will be roughly divided by
-# the number of workers. Would recommend doubling this value for --time, just in
-# case there is heavy disk access that causes slowdowns.
+# The shuffle runs in two passes. The first reads the input files in large
+# contiguous slices and scatters the samples to uncompressed sub-chunks, the
+# second writes each output chunk from its sub-chunks. Workers synchronize
+# between the passes with a barrier, and memory per worker is bounded by
+# --buffer_size samples. If the run gets interrupted, re-run the same command
+# to resume: finished input files and output chunks are skipped.
 
-for ((i=0; i<workers; i++))
-do
-	python h5_dataset_shuffle.py $indir $outdir $numchunks --num_parallel $workers --worker_id $i > $outdir/logs/shuf-$i.txt 2>&1 &
-done
+python h5_dataset_shuffle.py $indir $outdir $numchunks --num_parallel $workers > $outdir/logs/shuf.txt 2>&1
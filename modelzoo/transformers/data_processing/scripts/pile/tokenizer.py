@@ -64,6 +64,9 @@ class HFTokenizer:
     def encode(self, text):
         return self.tokenizer.encode(text).ids
 
+    def encode_batch(self, texts):
+        return [encoding.ids for encoding in self.tokenizer.encode_batch(texts)]
+
     def decode(self, token_ids):
         return self.tokenizer.decode(token_ids)
 
@@ -1,14 +1,23 @@
 import argparse
+import math
+import os
 import pickle
 import queue
+import shutil
+import sys
+import tempfile
 import time
 from collections import defaultdict
 from glob import glob
-from multiprocessing import Process, Queue
+from itertools import repeat
+from multiprocessing import Pool, Process, Queue
 
-from datasketch.lean_minhash import LeanMinHash
+import numpy as np
 from more_itertools import divide
 
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from dedup.minhash import load_signatures
+
 
 def _H(hs):
     return bytes(hs.byteswap().data)
@@ -26,22 +35,47 @@ def split_files(input_dir, n_proc):
         "common_crawl",
     ]:
         if dataset == "common_crawl":
-            files.extend(glob(f"{input_dir}/{dataset}/*/minhash_nfc/*"))
+            minhash_dir = f"{input_dir}/{dataset}/*/minhash_nfc"
         else:
-            files.extend(glob(f"{input_dir}/{dataset}/minhash_nfc/*"))
+            minhash_dir = f"{input_dir}/{dataset}/minhash_nfc"
+        files.extend(glob(f"{minhash_dir}/*.npy"))
+        # MinHash objects pickled by earlier versions of `to_hash.py`.
+        files.extend(glob(f"{minhash_dir}/*.pickle"))
     files = sorted(files)
+    if any(fp.endswith(".npy") for fp in files) and any(
+        fp.endswith(".pickle") for fp in files
+    ):
+        # Bands of both formats are hashed to different bytes, so
+        # duplicates across them would never be found.
+        raise ValueError(
+            f"Found both .npy signatures and pickled MinHash files in "
+            f"{input_dir}. Regenerate the pickled MinHash files with "
+            f"`to_hash.py`."
+        )
     parts = divide(n_proc, files)
     return [list(p) for p in parts]
 
 
 def get_hashes(files, doc_queues, r):
     for fp in files:
+        if fp.endswith(".npy"):
+            keys, signatures = load_signatures(fp)
+            # Read every band as one contiguous slice of the signatures.
+            bands = [
+                np.ascontiguousarray(signatures[:, i * r : (i + 1) * r])
+                for i in range(len(doc_queues))
+            ]
+            for j, key in enumerate(keys):
+                for band, doc_queue in zip(bands, doc_queues):
+                    doc_queue.put((key, band[j].tobytes()))
+            continue
+
         with open(fp, "rb") as fin:
             for item in pickle.load(fin):
                 key = f"{item['file_name']}@{item['doc_id']}"
-                minhash = LeanMinHash(item["hash"])
+                hashvalues = item["hash"].hashvalues
                 for i, doc_queue in enumerate(doc_queues):
-                    H = _H(minhash.hashvalues[i * r : (i + 1) * r])
+                    H = _H(hashvalues[i * r : (i + 1) * r])
                     doc_queue.put((key, H))
 
 
@@ -61,7 +95,7 @@ def lsh(out_file, doc_queue, idx):
 
             if i % 100000 == 0:
                 print(
-                    f"{idx}: Processed {i / 931361530 * 100}%.",
+                    f"{idx}: Processed {i} documents.",
                     time.time() - start_time,
                 )
             i += 1
@@ -72,7 +106,290 @@ def lsh(out_file, doc_queue, idx):
     f.close()
 
 
+# Record of the external sort: 128-bit hash of a band and document index.
+_RECORD_DTYPE = np.dtype([("h1", "<u8"), ("h2", "<u8"), ("index", "<i8")])
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+
+
+def _mix64(x):
+    x ^= x >> np.uint64(30)
+    x *= _MIX_1
+    x ^= x >> np.uint64(27)
+    x *= _MIX_2
+    x ^= x >> np.uint64(31)
+    return x
+
+
+def _band_hashes(band):
+    """Two independent 64-bit hashes of every row of a `[n, r]` band."""
+    hashes = []
+    with np.errstate(over="ignore"):
+        for seed in (1, 2):
+            h = np.full(len(band), seed, dtype=np.uint64)
+            for column in band.T:
+                h = _mix64(h * np.uint64(0x100000001B3) + column)
+            hashes.append(h)
+    return hashes
+
+
+def build_key_table(files, tmp_dir):
+    """Concatenate the keys of all signature files into an indexed table.
+
+    Documents are numbered in the order of `files`. The table is a blob of
+    UTF-8 keys and an array of their `int64` offsets in the blob, written
+    to `tmp_dir` so that keys of pairs can be looked up without holding
+    them in memory.
+
+    Returns:
+        List with the number of documents of every file.
+    """
+    num_docs = []
+    offset = 0
+    with open(os.path.join(tmp_dir, "keys.bin"), "wb") as blob, open(
+        os.path.join(tmp_dir, "key_offsets.bin"), "wb"
+    ) as offsets:
+        np.zeros(1, np.int64).tofile(offsets)
+        for fp in files:
+            keys, _ = load_signatures(fp)
+            encoded = [key.encode("utf8") for key in keys]
+            lengths = np.fromiter(map(len, encoded), np.int64, len(encoded))
+            (offset + np.cumsum(lengths)).tofile(offsets)
+            offset += int(lengths.sum())
+            blob.write(b"".join(encoded))
+            num_docs.append(len(keys))
+    return num_docs
+
+
+def _load_key_table(tmp_dir):
+    blob = np.memmap(os.path.join(tmp_dir, "keys.bin"), dtype=np.uint8)
+    offsets = np.memmap(
+        os.path.join(tmp_dir, "key_offsets.bin"), dtype=np.int64
+    )
+
+    def get_key(index):
+        return bytes(blob[offsets[index] : offsets[index + 1]]).decode("utf8")
+
+    return get_key
+
+
+# Buckets written or read at once by the sort mode, to bound open files.
+_MAX_OPEN_BUCKETS = 256
+
+
+def _band_records(band, files, num_docs, r, chunk_size):
+    """Yields the records of a band of all documents in chunks."""
+    doc_offset = 0
+    for fp, n in zip(files, num_docs):
+        signatures = np.load(fp, mmap_mode="r")
+        for start in range(0, n, chunk_size):
+            stop = min(n, start + chunk_size)
+            records = np.empty(stop - start, dtype=_RECORD_DTYPE)
+            records["h1"], records["h2"] = _band_hashes(
+                np.ascontiguousarray(
+                    signatures[start:stop, band * r : (band + 1) * r]
+                ).astype(np.uint64)
+            )
+            records["index"] = np.arange(doc_offset + start, doc_offset + stop)
+            yield records
+        doc_offset += n
+
+
+def _bucket_records(path, chunk_size):
+    """Yields the records of a bucket file in chunks."""
+    with open(path, "rb") as fin:
+        while True:
+            records = np.fromfile(fin, dtype=_RECORD_DTYPE, count=chunk_size)
+            if not len(records):
+                return
+            yield records
+
+
+def _split_records(chunks, bucket_paths, get_bucket_ids):
+    """Appends the records of every chunk to the bucket files chosen by
+    `get_bucket_ids`, keeping their order, and returns the number of records
+    of every bucket."""
+    sizes = np.zeros(len(bucket_paths), dtype=np.int64)
+    buckets = [open(path, "wb") for path in bucket_paths]
+    try:
+        for records in chunks:
+            bucket_ids = get_bucket_ids(records).astype(np.int64)
+            records = records[np.argsort(bucket_ids, kind="stable")]
+            counts = np.bincount(bucket_ids, minlength=len(bucket_paths))
+            ends = np.cumsum(counts)
+            for bucket in np.flatnonzero(counts):
+                records[ends[bucket] - counts[bucket] : ends[bucket]].tofile(
+                    buckets[bucket]
+                )
+            sizes += counts
+    finally:
+        for bucket in buckets:
+            bucket.close()
+    return sizes
+
+
+def _pair_bucket(path, size, records_per_bucket, write_pair, level=1):
+    """Writes the pairs of the runs of equal hashes of a bucket file, and
+    removes it.
+
+    A bucket which fits in `records_per_bucket` is sorted in memory. A larger
+    bucket holding a single hash, like the bands of all empty documents, is
+    paired as a stream. Any other larger bucket is split by a hash of its
+    records, which differs at every `level`, into smaller buckets.
+
+    Returns:
+        Number of written pairs.
+    """
+    if size <= records_per_bucket:
+        records = np.fromfile(path, dtype=_RECORD_DTYPE)
+        os.remove(path)
+        records = records[
+            np.lexsort((records["index"], records["h2"], records["h1"]))
+        ]
+        is_run_start = np.ones(len(records), dtype=bool)
+        is_run_start[1:] = (records["h1"][1:] != records["h1"][:-1]) | (
+            records["h2"][1:] != records["h2"][:-1]
+        )
+        run_starts = records["index"][is_run_start]
+        firsts = run_starts[np.cumsum(is_run_start) - 1]
+        for index, first in zip(
+            records["index"][~is_run_start], firsts[~is_run_start]
+        ):
+            write_pair(index, first)
+        return int((~is_run_start).sum())
+
+    h1 = h2 = first = None
+    for records in _bucket_records(path, records_per_bucket):
+        if h1 is None:
+            h1, h2 = records["h1"][0], records["h2"][0]
+        if not np.all((records["h1"] == h1) & (records["h2"] == h2)):
+            break
+        index = records["index"].min()
+        first = index if first is None else min(first, index)
+    else:
+        n_pairs = 0
+        for records in _bucket_records(path, records_per_bucket):
+            for index in records["index"][records["index"] != first]:
+                write_pair(index, first)
+                n_pairs += 1
+        os.remove(path)
+        return n_pairs
+
+    n_buckets = min(
+        _MAX_OPEN_BUCKETS, max(2, math.ceil(size / records_per_bucket))
+    )
+    root, ext = os.path.splitext(path)
+    bucket_paths = [f"{root}-{bucket}{ext}" for bucket in range(n_buckets)]
+
+    def get_bucket_ids(records):
+        with np.errstate(over="ignore"):
+            h = _mix64(records["h1"] + np.uint64(level)) ^ records["h2"]
+        return h % np.uint64(n_buckets)
+
+    sizes = _split_records(
+        _bucket_records(path, records_per_bucket), bucket_paths, get_bucket_ids
+    )
+    os.remove(path)
+    return sum(
+        _pair_bucket(
+            bucket_path, bucket_size, records_per_bucket, write_pair, level + 1
+        )
+        for bucket_path, bucket_size in zip(bucket_paths, sizes)
+    )
+
+
+def sort_band(band_args):
+    """Find the duplicate pairs of one band with an external sort.
+
+    The band of every document is hashed to 128 bits and the records
+    `(hash, document index)` are distributed by hash into at most
+    `_MAX_OPEN_BUCKETS` buckets on disk. Every bucket is then paired by
+    `_pair_bucket` in memory of `records_per_bucket` records, and every
+    document is paired with the first document of its run of equal hashes,
+    like the first document stored in a `lsh` dictionary.
+    """
+    band, files, num_docs, r, tmp_dir, records_per_bucket, out_file = (
+        band_args
+    )
+    start_time = time.time()
+    n_buckets = min(
+        _MAX_OPEN_BUCKETS,
+        max(1, math.ceil(sum(num_docs) / records_per_bucket)),
+    )
+    band_dir = os.path.join(tmp_dir, f"band-{band}")
+    os.makedirs(band_dir, exist_ok=True)
+    bucket_paths = [
+        os.path.join(band_dir, f"bucket-{bucket}.bin")
+        for bucket in range(n_buckets)
+    ]
+
+    # Distribute the records of the band into the buckets.
+    sizes = _split_records(
+        _band_records(band, files, num_docs, r, records_per_bucket),
+        bucket_paths,
+        lambda records: records["h1"] % np.uint64(n_buckets),
+    )
+
+    # Write the pairs of the runs of equal hashes of every bucket.
+    get_key = _load_key_table(tmp_dir)
+    n_pairs = 0
+    with open(out_file.replace(".txt", f"-{band}.txt"), "w") as f:
+
+        def write_pair(index, first):
+            f.write(f"{get_key(index)} :: {get_key(first)}\n")
+
+        for path, size in zip(bucket_paths, sizes):
+            n_pairs += _pair_bucket(path, size, records_per_bucket, write_pair)
+    os.rmdir(band_dir)
+    print(
+        f"{band}: Found {n_pairs} pairs in {sum(num_docs)} documents.",
+        time.time() - start_time,
+    )
+    return n_pairs
+
+
+def generate_pairs_sorted(args):
+    """Generate duplicate pairs with one external sort per band."""
+    files = split_files(args.input_dir, 1)[0]
+    if any(not fp.endswith(".npy") for fp in files):
+        raise ValueError(
+            "The sort mode needs signatures in .npy files. Regenerate the "
+            "pickled MinHash files with `to_hash.py` or use the queue mode."
+        )
+
+    tmp_dir = tempfile.mkdtemp(dir=args.tmp_dir)
+    try:
+        num_docs = build_key_table(files, tmp_dir)
+        # A bucket is held in memory with a few copies while it is sorted.
+        processes = min(args.processes, args.bands)
+        records_per_bucket = max(
+            1,
+            args.memory_budget
+            * 1024 ** 2
+            // (4 * _RECORD_DTYPE.itemsize * processes),
+        )
+        with Pool(processes=processes) as pool:
+            pool.map(
+                sort_band,
+                zip(
+                    range(args.bands),
+                    repeat(files),
+                    repeat(num_docs),
+                    repeat(args.range),
+                    repeat(tmp_dir),
+                    repeat(records_per_bucket),
+                    repeat(args.out_file),
+                ),
+                chunksize=1,
+            )
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
 def generate_pairs(args):
+    if getattr(args, "mode", "queue") == "sort":
+        return generate_pairs_sorted(args)
+
     # size of the queue was tuned for optimal perf and memory constraints.
     doc_queues = [Queue(1000000) for _ in range(args.bands)]
     files = split_files(args.input_dir, args.processes)
@@ -111,6 +428,27 @@ if __name__ == "__main__":
     parser.add_argument(
         "--processes", type=int,
     )
+    parser.add_argument(
+        "--mode",
+        choices=["queue", "sort"],
+        default="queue",
+        help="`queue` streams the bands of all documents to one process "
+        "per band, holding an in-memory LSH dictionary. `sort` processes "
+        "bands in a pool of `--processes` processes with bounded memory, "
+        "with an external sort of every band on disk.",
+    )
+    parser.add_argument(
+        "--memory_budget",
+        type=int,
+        default=16384,
+        help="Memory in MB used by all processes of the sort mode together.",
+    )
+    parser.add_argument(
+        "--tmp_dir",
+        default=None,
+        help="Directory for the temporary files of the sort mode. Defaults "
+        "to the system temporary directory.",
+    )
     args = parser.parse_args()
 
     generate_pairs(args)
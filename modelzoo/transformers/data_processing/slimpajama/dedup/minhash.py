@@ -0,0 +1,184 @@
+"""
+Vectorized MinHash signatures of the character n-grams of documents.
+
+All n-grams of a batch of documents are hashed at once with NumPy: the
+codepoints of the documents are concatenated, every n-gram is hashed with a
+polynomial rolling hash followed by a 64-bit mixer, and the permutations
+`(a * h + b) % (2 ** 61 - 1)` of datasketch are applied to blocks of n-grams,
+reducing them to the minimum of every document with `np.minimum.reduceat`.
+
+The permutations are drawn like those of `datasketch.MinHash`, so signatures
+estimate Jaccard similarities the same way, but the n-gram hash differs from
+the SHA-1 hash of datasketch. Signatures of one deduplication run must all
+be computed with this module.
+
+Signatures are stored as `uint32` arrays of shape `[n_docs, num_perm]` in
+`.npy` files, next to a `.keys.txt` table with the key of every row.
+"""
+
+import os
+import re
+import string
+
+import numpy as np
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+SIGNATURE_DTYPE = np.uint32
+KEYS_SUFFIX = ".keys.txt"
+
+# Multiplier of the rolling hash and constants of the splitmix64 finalizer.
+_ROLLING_PRIME = np.uint64(0x100000001B3)
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+
+_PUNCTUATION_TABLE = str.maketrans("", "", string.punctuation)
+
+
+def normalize(text):
+    """Lowercase, remove punctuation and collapse whitespaces of a text."""
+    text = text.lower().translate(_PUNCTUATION_TABLE)
+    return re.sub(r"\s+", " ", text.strip())
+
+
+def get_permutations(num_perm=128, seed=1):
+    """Draw the `(a, b)` coefficients of the permutations like datasketch.
+
+    Returns:
+        Tuple of two `uint64` arrays of shape `[num_perm]`.
+    """
+    gen = np.random.RandomState(seed)
+    permutations = np.array(
+        [
+            (
+                gen.randint(1, MERSENNE_PRIME, dtype=np.uint64),
+                gen.randint(0, MERSENNE_PRIME, dtype=np.uint64),
+            )
+            for _ in range(num_perm)
+        ],
+        dtype=np.uint64,
+    ).T
+    return permutations[0], permutations[1]
+
+
+def shingle_hashes(texts, width):
+    """Hash the character n-grams of a batch of normalized texts.
+
+    Args:
+        texts (list): Normalized texts.
+        width (int): Number of characters of the n-grams.
+
+    Returns:
+        Tuple of the 32-bit hashes of the n-grams of all texts, as an
+        `uint64` array, and of the index of the text of every n-gram.
+    """
+    codepoints = np.frombuffer(
+        "".join(texts).encode("utf-32-le"), dtype=np.uint32
+    ).astype(np.uint64)
+    lengths = np.fromiter((len(text) for text in texts), np.int64, len(texts))
+    num_shingles = np.maximum(lengths - width + 1, 0)
+    text_ids = np.repeat(np.arange(len(texts)), num_shingles)
+    if not len(text_ids):
+        return np.zeros(0, np.uint64), text_ids
+
+    # Position of every n-gram in the concatenated codepoints.
+    text_starts = np.cumsum(lengths) - lengths
+    shingle_starts = np.cumsum(num_shingles) - num_shingles
+    positions = (
+        np.arange(len(text_ids))
+        - np.repeat(shingle_starts, num_shingles)
+        + np.repeat(text_starts, num_shingles)
+    )
+
+    with np.errstate(over="ignore"):
+        hashes = np.zeros(len(positions), np.uint64)
+        for offset in range(width):
+            hashes = hashes * _ROLLING_PRIME + codepoints[positions + offset]
+        hashes ^= hashes >> np.uint64(30)
+        hashes *= _MIX_1
+        hashes ^= hashes >> np.uint64(27)
+        hashes *= _MIX_2
+        hashes ^= hashes >> np.uint64(31)
+    return hashes >> np.uint64(32), text_ids
+
+
+def _permute(hashes, a, b):
+    """Apply `((a * h + b) % MERSENNE_PRIME) & MAX_HASH` to all hashes.
+
+    `a * h + b` wraps around like in datasketch, and the modulo by the
+    Mersenne prime is computed with shifts instead of a slow division.
+    """
+    values = hashes[:, None] * a
+    values += b
+    remainders = values & MERSENNE_PRIME
+    values >>= np.uint64(61)
+    remainders += values
+    remainders[remainders >= MERSENNE_PRIME] -= MERSENNE_PRIME
+    remainders &= MAX_HASH
+    return remainders.astype(SIGNATURE_DTYPE)
+
+
+def minhash_signatures(texts, width, permutations, block_size=4096):
+    """Compute the MinHash signatures of a batch of normalized texts.
+
+    Args:
+        texts (list): Normalized texts.
+        width (int): Number of characters of the n-grams.
+        permutations (tuple): Coefficients from `get_permutations`.
+        block_size (int): Number of n-grams permuted at once, which bounds
+            the memory to `block_size * num_perm` 64-bit integers.
+
+    Returns:
+        `uint32` array of shape `[len(texts), num_perm]`. Texts shorter
+        than `width` get the maximum hash value, like an empty datasketch
+        MinHash.
+    """
+    a, b = permutations
+    signatures = np.full(
+        (len(texts), len(a)), MAX_HASH, dtype=SIGNATURE_DTYPE
+    )
+    hashes, text_ids = shingle_hashes(texts, width)
+
+    with np.errstate(over="ignore"):
+        for start in range(0, len(hashes), block_size):
+            block_ids = text_ids[start : start + block_size]
+            values = _permute(hashes[start : start + block_size], a, b)
+            # `text_ids` is sorted, so every text is one segment of a block.
+            segment_starts = np.flatnonzero(
+                np.diff(block_ids, prepend=block_ids[0] - 1)
+            )
+            ids = block_ids[segment_starts]
+            signatures[ids] = np.minimum(
+                signatures[ids],
+                np.minimum.reduceat(values, segment_starts, axis=0),
+            )
+    return signatures
+
+
+def save_signatures(path, keys, signatures):
+    """Save signatures to `path` and their keys to the sidecar key table."""
+    assert len(keys) == len(signatures)
+    with open(keys_path(path), "w") as fout:
+        fout.writelines(f"{key}\n" for key in keys)
+    # The signatures are written last, readers only list `.npy` files.
+    with open(path + ".tmp", "wb") as fout:
+        np.save(fout, signatures)
+    os.replace(path + ".tmp", path)
+
+
+def keys_path(path):
+    """Path of the key table of the signatures saved at `path`."""
+    return os.path.splitext(path)[0] + KEYS_SUFFIX
+
+
+def load_signatures(path):
+    """Load keys and memory-mapped signatures saved with `save_signatures`.
+
+    Returns:
+        Tuple of the list of keys and of the `[n_docs, num_perm]` signatures.
+    """
+    with open(keys_path(path), "r") as fin:
+        keys = fin.read().splitlines()
+    signatures = np.load(path, mmap_mode="r")
+    assert len(keys) == len(signatures), f"{path} does not match its keys."
+    return keys, signatures
@@ -1,33 +1,25 @@
 import argparse
 import gc
 import os
-import pickle
-import re
-import string
 import sys
 from itertools import repeat
 from multiprocessing import Pool, cpu_count
 
 import jsonlines
-from datasketch import MinHash
+import numpy as np
 from more_itertools import chunked
-from nltk import ngrams
 from tqdm import tqdm
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from dedup.minhash import (
+    get_permutations,
+    minhash_signatures,
+    normalize,
+    save_signatures,
+)
 from lm_dataformat.lm_dataformat import Reader
 
 
-def get_features(s, width):
-    # lower cased
-    s = s.lower()
-    # remove punctuation
-    s = s.translate(str.maketrans("", "", string.punctuation))
-    # remove consecutive spaces, newlines, tabs in the middle and in the beginning / end
-    s = re.sub(r"\s+", " ", s.strip())
-    return map(lambda x: "".join(x), ngrams(s, width))
-
-
 def get_documents(input_dir, index_start, index_end, output_dir, dataset_name):
     gc.collect()
     files = sorted(os.listdir(input_dir))
@@ -54,30 +46,34 @@ def get_documents(input_dir, index_start, index_end, output_dir, dataset_name):
 
 def to_minhash(chunks):
     gc.collect()
-    buckets = []
-    documents, output_dir, width, dataset_name, n_docs = chunks
-    for doc in tqdm(documents, total=n_docs):
-        text, file_path, doc_id = doc[0], doc[1], doc[2]
-        file_name = file_path.split("/")[-1]
-        if dataset_name == "common_crawl":
-            dir_2 = file_path.split("/")[-2]
-            output_name = f"{dataset_name}/{dir_2}/{file_name}"
-        else:
-            output_name = f"{dataset_name}/{file_name}"
-
-        m = MinHash(num_perm=128)
-        m.update_batch(map(lambda x: x.encode('utf8'), get_features(text, width)))
-        buckets.append(
-            {"file_name": output_name, "doc_id": doc_id, "hash": m,}
-        )
-    return buckets
-
-
-def output_results(output_dir, results, chunk_id, iter):
-    with open(
-        f"{output_dir}/minhash_nfc/{iter}-{chunk_id}.pickle", "wb"
-    ) as fout:
-        pickle.dump(results, fout)
+    keys = []
+    signatures = []
+    documents, output_dir, width, dataset_name, n_docs, num_perm = chunks
+    permutations = get_permutations(num_perm)
+    # Documents are hashed in batches to bound the memory of the n-grams.
+    for batch in chunked(tqdm(documents, total=n_docs), 256):
+        texts = []
+        for text, file_path, doc_id in batch:
+            file_name = file_path.split("/")[-1]
+            if dataset_name == "common_crawl":
+                dir_2 = file_path.split("/")[-2]
+                output_name = f"{dataset_name}/{dir_2}/{file_name}"
+            else:
+                output_name = f"{dataset_name}/{file_name}"
+            keys.append(f"{output_name}@{doc_id}")
+            texts.append(normalize(text))
+        signatures.append(minhash_signatures(texts, width, permutations))
+    if not signatures:
+        return keys, np.zeros((0, num_perm), np.uint32)
+    return keys, np.concatenate(signatures)
+
+
+def output_results(output_dir, keys, signatures, chunk_id, iter):
+    save_signatures(
+        f"{output_dir}/minhash_nfc/{iter}-{chunk_id}.npy",
+        keys,
+        np.concatenate(signatures),
+    )
 
 
 def generate_hashes(args):
@@ -91,7 +87,8 @@ def generate_hashes(args):
         args.output_dir,
         args.dataset_name,
     )
-    results = []
+    keys, signatures = [], []
+    n_results = 0
     chunk_id = 0
     gc.collect()
     with Pool(processes=cpu_count()) as pool:
@@ -105,25 +102,32 @@ def generate_hashes(args):
                         repeat(args.w),
                         repeat(args.dataset_name),
                         repeat(args.n_docs // cpu_count()),
+                        repeat(getattr(args, "num_perm", 128)),
                     ),
                 ),
                 total=cpu_count(),
             )
         ):
 
-            for chunk in chunks:
-                if len(results) == args.k:
+            chunk_keys, chunk_signatures = chunks
+            start = 0
+            while start < len(chunk_keys):
+                if n_results == args.k:
                     output_results(
-                        args.output_dir, results, chunk_id, args.iter
+                        args.output_dir, keys, signatures, chunk_id, args.iter
                     )
-                    del results
+                    keys, signatures = [], []
+                    n_results = 0
                     gc.collect()
-                    results = []
                     chunk_id += 1
-                results.append(chunk)
+                stop = min(len(chunk_keys), start + args.k - n_results)
+                keys.extend(chunk_keys[start:stop])
+                signatures.append(chunk_signatures[start:stop])
+                n_results += stop - start
+                start = stop
 
-    if results:
-        output_results(args.output_dir, results, chunk_id, args.iter)
+    if keys:
+        output_results(args.output_dir, keys, signatures, chunk_id, args.iter)
 
 
 if __name__ == "__main__":
@@ -157,5 +161,12 @@ if __name__ == "__main__":
         help="Number of batches to output with.",
         required=False,
     )
+    parser.add_argument(
+        "--num_perm",
+        type=int,
+        default=128,
+        help="Number of permutations of the MinHash signatures.",
+        required=False,
+    )
     args = parser.parse_args()
     generate_hashes(args)
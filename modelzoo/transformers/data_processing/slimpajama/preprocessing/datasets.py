@@ -4,16 +4,32 @@ import pickle
 import random
 import sys
 from glob import glob
-from multiprocessing import Manager, Process
+from multiprocessing import Process
 
 from tqdm import tqdm
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "../utils"))
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from document_sets import DocumentSets, write_document_sets
 from lm_dataformat.lm_dataformat import Reader
 from utils import cycle_documents, utf8len
 
 
+def load_document_sets(path):
+    """Load a pickled dict of sets of documents as `DocumentSets`.
+
+    The dict is converted to `<path>.ids` once, and again only if the
+    pickle is newer.
+    """
+    ids_path = f"{path}.ids"
+    if not os.path.exists(ids_path) or (
+        os.path.getmtime(ids_path) < os.path.getmtime(path)
+    ):
+        with open(path, "rb") as fin:
+            write_document_sets(ids_path, pickle.load(fin))
+    return DocumentSets(ids_path)
+
+
 class Dataset(abc.ABC):
     def dir_path(self):
         """ Path to the directory """
@@ -359,15 +375,9 @@ class RedPajamaReplication(Dataset):
             relative_weight = weight * dataset.num_docs() / total_weight
             weights.append(relative_weight)
 
-        with open(self.duplicates, "rb") as fin:
-            dup = pickle.load(fin)
-
-        with open(self.short_docs, "rb") as fin:
-            short = pickle.load(fin)
-
-        manager = Manager()
-        dup_sh = manager.dict(dup)
-        short_sh = manager.dict(short)
+        # every process looks documents up in the shared memory-mapped files
+        dup_sh = load_document_sets(self.duplicates)
+        short_sh = load_document_sets(self.short_docs)
         # create processes here to speed up read and write in shuffle_holdout.py
         # queues are given by shuffle_holdout to populate with documents
         n_process = 2 * len(queues)
@@ -387,7 +397,7 @@ class RedPajamaReplication(Dataset):
                 ),
             )
             procs.append(p)
-        return procs, manager
+        return procs
 
 
 def redpj_datasets(input_dir):
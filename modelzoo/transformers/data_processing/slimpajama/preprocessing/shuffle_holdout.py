@@ -55,7 +55,7 @@ def pass_1_shuffle(
     # queue to collect documents from reading processes
     docs_queue = [Queue(64 * 10000) for _ in range(n_process)]
     # returning a list of reading processes
-    r_procs, manager = redpajama_dataset.documents(docs_queue)
+    r_procs = redpajama_dataset.documents(docs_queue)
     w_procs = []
     for process_id in range(n_process):
         p = Process(
@@ -0,0 +1,152 @@
+"""
+Measures the per-document latency of the lookups of `Dataset.documents`,
+which skips the duplicate and short documents of every data file, with the
+sets of documents in a `multiprocessing.Manager` dict and in a memory-mapped
+`DocumentSets`. Every worker process reads its share of the documents of
+all files, like the reading processes of `RedPajamaReplication`, and both
+representations are checked to filter the same documents.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from multiprocessing import Manager, Process, Queue
+
+from document_sets import DocumentSets, write_document_sets
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--num_files", type=int, default=64, help="number of data files"
+    )
+    parser.add_argument(
+        "--docs_per_file",
+        type=int,
+        default=100000,
+        help="number of documents of every data file",
+    )
+    parser.add_argument(
+        "--duplicate_fraction",
+        type=float,
+        default=0.3,
+        help="fraction of the documents which are duplicates",
+    )
+    parser.add_argument(
+        "--num_workers",
+        nargs="+",
+        type=int,
+        default=[1, 8],
+        help="numbers of concurrent worker processes to benchmark",
+    )
+    return parser.parse_args()
+
+
+def make_documents(num_files, docs_per_file, fraction, seed):
+    rnd = random.Random(seed)
+    return {
+        f"common_crawl/2023/file{i}.jsonl.zst": set(
+            rnd.sample(range(docs_per_file), int(fraction * docs_per_file))
+        )
+        for i in range(num_files)
+    }
+
+
+def read_documents(
+    file_names, docs_per_file, process_id, n_process, dup_sh, results
+):
+    """Filter the documents of `process_id` like `Dataset.documents`."""
+    kept = 0
+    num_docs = 0
+    get_time = 0.0
+    start = time.perf_counter()
+    for file_name in file_names:
+        get_start = time.perf_counter()
+        duplicates_set = dup_sh.get(file_name, set())
+        get_time += time.perf_counter() - get_start
+        for doc_id in range(process_id, docs_per_file, n_process):
+            if doc_id not in duplicates_set:
+                kept += 1
+            num_docs += 1
+    elapsed = time.perf_counter() - start
+    results.put((elapsed, get_time, num_docs, kept))
+
+
+def time_lookups(dup_sh, file_names, docs_per_file, num_workers):
+    """Returns the mean time of the set of a file, the mean latency per
+    document including it, and the number of kept documents."""
+    results = Queue()
+    procs = [
+        Process(
+            target=read_documents,
+            args=(
+                file_names,
+                docs_per_file,
+                process_id,
+                num_workers,
+                dup_sh,
+                results,
+            ),
+        )
+        for process_id in range(num_workers)
+    ]
+    for p in procs:
+        p.start()
+    elapsed, get_time, num_docs, kept = zip(*(results.get() for _ in procs))
+    for p in procs:
+        p.join()
+    return (
+        sum(get_time) / (num_workers * len(file_names)),
+        sum(elapsed) / sum(num_docs),
+        sum(kept),
+    )
+
+
+def main():
+    args = parse_args()
+    documents = make_documents(
+        args.num_files, args.docs_per_file, args.duplicate_fraction, seed=0
+    )
+    file_names = sorted(documents)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "duplicates.ids")
+        start = time.perf_counter()
+        write_document_sets(path, documents)
+        print(
+            f"Wrote the sets of {args.num_files * args.docs_per_file} "
+            f"documents in {time.perf_counter() - start:.2f}s, "
+            f"{os.path.getsize(path) / 2 ** 20:.1f} MiB"
+        )
+        document_sets = DocumentSets(path)
+
+        manager = Manager()
+        dup_sh = manager.dict(documents)
+
+        print(
+            f"{'workers':>8}{'manager ms/file':>17}{'mmap ms/file':>14}"
+            f"{'manager ns/doc':>16}{'mmap ns/doc':>13}{'speedup':>9}"
+        )
+        for num_workers in args.num_workers:
+            manager_get, manager_latency, manager_kept = time_lookups(
+                dup_sh, file_names, args.docs_per_file, num_workers
+            )
+            mmap_get, mmap_latency, mmap_kept = time_lookups(
+                document_sets, file_names, args.docs_per_file, num_workers
+            )
+            assert manager_kept == mmap_kept, (manager_kept, mmap_kept)
+            print(
+                f"{num_workers:>8}{manager_get * 1e3:>17.2f}"
+                f"{mmap_get * 1e3:>14.2f}{manager_latency * 1e9:>16.1f}"
+                f"{mmap_latency * 1e9:>13.1f}"
+                f"{manager_latency / mmap_latency:>8.1f}x"
+            )
+        manager.shutdown()
+
+
+if __name__ == "__main__":
+    main()
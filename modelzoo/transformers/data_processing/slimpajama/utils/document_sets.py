@@ -0,0 +1,95 @@
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+# Size of the JSON index at the start of a file of document sets.
+_HEADER = struct.Struct("<Q")
+_ID_DTYPE = np.dtype("<u4")
+
+
+def write_document_sets(path, documents):
+    """Write sets of document indices to a file of sorted indices.
+
+    The file starts with the size of a JSON index, which maps every data file
+    name to the offset and the number of its indices, followed by the index
+    and the sorted `uint32` indices of every data file. The file is written
+    to `<path>.tmp` and renamed, so a complete file is never partially
+    overwritten.
+
+    Args:
+        path: Path of the written file.
+        documents: Dict from data file names to sets of document indices,
+            like the pickles of `filter.py` and `generate_duplicates_dict.py`.
+    """
+    index = {}
+    offset = 0
+    for file_name, doc_ids in documents.items():
+        if doc_ids:
+            if max(doc_ids) > np.iinfo(_ID_DTYPE).max:
+                raise ValueError(
+                    f"Document indices of {file_name} do not fit in "
+                    f"{_ID_DTYPE}."
+                )
+            index[file_name] = (offset, len(doc_ids))
+            offset += len(doc_ids) * _ID_DTYPE.itemsize
+    encoded = json.dumps(index).encode("utf8")
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as fout:
+        fout.write(_HEADER.pack(len(encoded)))
+        fout.write(encoded)
+        for file_name, (_, count) in index.items():
+            doc_ids = np.fromiter(documents[file_name], _ID_DTYPE, count)
+            fout.write(np.sort(doc_ids).tobytes())
+    os.replace(tmp_path, path)
+
+
+class DocumentSets:
+    """Read-only sets of documents of the data files of a dataset, in a
+    memory-mapped file written by `write_document_sets`.
+
+    It replaces the dict of sets of document indices of every data file:
+    `get(file_name, default)` returns the set of a data file, built from the
+    mapped pages of its sorted indices. The pages are shared by all
+    processes through the page cache, so workers read the sets without IPC
+    or copies of the whole dict, and only hold the set of the file they
+    read. Instances are pickled by path and mapped again when unpickled.
+
+    Args:
+        path: Path of the file of document sets.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fin:
+            (index_size,) = _HEADER.unpack(fin.read(_HEADER.size))
+            index = json.loads(fin.read(index_size))
+            self._mmap = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+        start = _HEADER.size + index_size
+        self._files = {
+            file_name: (start + offset, count)
+            for file_name, (offset, count) in index.items()
+        }
+
+    def get(self, file_name, default=None):
+        """Returns the frozenset of documents of a data file, or `default`
+        if the file has no documents."""
+        if file_name not in self._files:
+            return default
+        offset, count = self._files[file_name]
+        doc_ids = np.frombuffer(
+            self._mmap, dtype=_ID_DTYPE, count=count, offset=offset
+        )
+        return frozenset(doc_ids.tolist())
+
+    def __contains__(self, file_name):
+        return file_name in self._files
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
@@ -21,6 +21,7 @@ from modelzoo.common.pytorch.layers import (
     TransformerEncoderLayer,
 )
 from modelzoo.transformers.pytorch.transformer_utils import (
+    build_segment_attention_mask,
     make_key_padding_mask_broadcastable,
 )
 
@@ -248,7 +249,14 @@ class BertModel(nn.Module):
         self.embed_ln_f.bias.data.zero_()
         self.embed_ln_f.weight.data.fill_(1.0)
 
-    def forward(self, input_ids=None, segment_ids=None, attention_mask=None):
+    def forward(
+        self,
+        input_ids=None,
+        segment_ids=None,
+        attention_mask=None,
+        position_ids=None,
+        packed_segment_ids=None,
+    ):
         """
         Args:
             input_ids (Tensor): The id of input tokens
@@ -259,15 +267,28 @@ class BertModel(nn.Module):
                 Can be 2D of shape ``[batch_size, seq_length]``,
                 or 3D of shape ``[batch, query_length, seq_length]``,
                 or 4D of shape ``[batch, num_heads, query_length, seq_length]``.
+            position_ids (Tensor): The position of input tokens, restarting
+                at 0 for every packed example. Can be of shape ``[batch_size, seq_length]``
+            packed_segment_ids (Tensor): The example of input tokens when several examples
+                are packed in a row, numbered from 1, with 0 for padding. Tokens only attend
+                to the tokens of their example, instead of using the `attention_mask`.
+                Can be of shape ``[batch_size, seq_length]``
         """
         src_key_padding_mask = None
 
-        hidden_states = self.embedding_layer(input_ids, segment_ids=segment_ids)
+        hidden_states = self.embedding_layer(
+            input_ids, segment_ids=segment_ids, position_ids=position_ids
+        )
         hidden_states = self.embed_ln_f(hidden_states)
         hidden_states = self.dropout_embd(hidden_states)
-        attention_mask = make_key_padding_mask_broadcastable(
-            attention_mask, dtype=hidden_states.dtype
-        )
+        if packed_segment_ids is not None:
+            attention_mask = build_segment_attention_mask(
+                packed_segment_ids, dtype=hidden_states.dtype
+            )
+        else:
+            attention_mask = make_key_padding_mask_broadcastable(
+                attention_mask, dtype=hidden_states.dtype
+            )
         if len(attention_mask.size()) == 2:
             src_key_padding_mask = attention_mask
             attention_mask = None
@@ -304,6 +304,8 @@ class BertPretrainModel(nn.Module):
         masked_lm_positions=None,
         mlm_loss_scale=None,
         should_calc_loss=True,
+        position_ids=None,
+        packed_segment_ids=None,
     ):
         """
         Args:
@@ -324,11 +326,18 @@ class BertPretrainModel(nn.Module):
                 Weights for mlm logits. Shape ``[batch_size, max_predictions_per_seq]``
             masked_lm_positions (Tensor):
                 Position ids of mlm tokens. Shape ``[batch_size, max_predictions_per_seq]``
+            position_ids (Tensor):
+                Position of input tokens within their packed example. Shape ``[batch_size, seq_length]``
+            packed_segment_ids (Tensor):
+                Example of input tokens when several examples are packed in a row,
+                numbered from 1, with 0 for padding. Shape ``[batch_size, seq_length]``
         """
         mlm_hidden_states, pooled_hidden_states = self.bert_encoder(
             input_ids,
             segment_ids=token_type_ids,
             attention_mask=attention_mask,
+            position_ids=position_ids,
+            packed_segment_ids=packed_segment_ids,
         )
         batch_size, seq_len, hidden_size = list(mlm_hidden_states.size())
         _, len_labels = list(labels.size())
@@ -15,14 +15,16 @@
 """
 Processor for PyTorch BERT training.
 """
-import csv
 import random
 
 import numpy as np
 import torch
 
 from modelzoo.common.pytorch.input_utils import bucketed_batch
-from modelzoo.transformers.pytorch.bert.input.utils import get_meta_data
+from modelzoo.transformers.pytorch.bert.input.utils import (
+    get_meta_data,
+    read_rows,
+)
 from modelzoo.transformers.pytorch.input_utils import (
     get_data_for_task,
     num_tasks,
@@ -34,6 +36,8 @@ from modelzoo.transformers.pytorch.input_utils import (
 class BertCSVDataProcessor(torch.utils.data.IterableDataset):
     """
     Reads csv files containing the input text tokens, and MLM features.
+    Also reads the binary shards created from these csv files by
+    `convert_csv_to_binary.py`, if they are listed in the meta file instead.
     :param <dict> params: dict containing input parameters for creating dataset.
     Expects the following fields:
 
@@ -126,24 +130,18 @@ class BertCSVDataProcessor(torch.utils.data.IterableDataset):
                 start_id,
             ) = self.csv_files_per_task_per_worker[self.processed_buffers]
 
-            with open(current_file_path, "r", newline="") as fin:
-                data_reader = csv.DictReader(fin)
-
-                for row_id, row in enumerate(data_reader):
-                    if start_id <= row_id < start_id + num_examples:
-                        self.data_buffer.append(row)
-                    else:
-                        continue
+            for row in read_rows(current_file_path, num_examples, start_id):
+                self.data_buffer.append(row)
 
-                    if len(self.data_buffer) == self.shuffle_buffer:
-                        if self.shuffle:
-                            self.rng.shuffle(self.data_buffer)
+                if len(self.data_buffer) == self.shuffle_buffer:
+                    if self.shuffle:
+                        self.rng.shuffle(self.data_buffer)
 
-                        for ind in range(len(self.data_buffer)):
-                            yield self.data_buffer[ind]
-                        self.data_buffer = []
+                    for ind in range(len(self.data_buffer)):
+                        yield self.data_buffer[ind]
+                    self.data_buffer = []
 
-                self.processed_buffers += 1
+            self.processed_buffers += 1
 
         if self.shuffle:
             self.rng.shuffle(self.data_buffer)
@@ -189,31 +187,32 @@ class BertCSVDataProcessor(torch.utils.data.IterableDataset):
 
         # Iterate over the data rows to create input features.
         for data_row in self.load_buffer():
-            # `data_row` is a dict with keys:
+            if isinstance(data_row["input_ids"], str):
+                # csv rows store every feature as a python literal, rows of
+                # binary shards are already parsed.
+                data_row = {key: eval(value) for key, value in data_row.items()}
             features = {
-                "input_ids": np.array(
-                    eval(data_row["input_ids"]), dtype=np.int32
-                ),
+                "input_ids": np.array(data_row["input_ids"], dtype=np.int32),
                 "masked_lm_mask": np.array(
                     # Stored as masked_lm_weights, but really masked_lm_mask
-                    eval(data_row["masked_lm_weights"]),
+                    data_row["masked_lm_weights"],
                     dtype=np.int32,
                 ),
                 "masked_lm_positions": np.array(
-                    eval(data_row["masked_lm_positions"]), dtype=np.int32
+                    data_row["masked_lm_positions"], dtype=np.int32
                 ),
                 "attention_mask": np.array(
-                    eval(data_row["attention_mask"]), dtype=np.int32
+                    data_row["attention_mask"], dtype=np.int32
                 ),
-                "labels": np.array(eval(data_row["labels"]), dtype=np.int32),
+                "labels": np.array(data_row["labels"], dtype=np.int32),
             }
 
             if not self.disable_nsp:
                 features["next_sentence_label"] = np.array(
-                    eval(data_row["next_sentence_label"]), dtype=np.int32
+                    data_row["next_sentence_label"], dtype=np.int32
                 )
                 features["token_type_ids"] = np.array(
-                    eval(data_row["token_type_ids"]), dtype=np.int32
+                    data_row["token_type_ids"], dtype=np.int32
                 )
             yield features
 
@@ -15,18 +15,19 @@
 """
 Processor for PyTorch BERT training.
 """
-import csv
 import random
 
 import numpy as np
 import torch
 
-from modelzoo.common.pytorch.input_utils import bucketed_batch
+from modelzoo.common.pytorch.input_utils import bucketed_batch, pack_samples
 from modelzoo.transformers.pytorch.bert.input.utils import (
     build_vocab,
     create_masked_lm_predictions,
+    create_masked_lm_predictions_batch,
     get_meta_data,
     parse_text,
+    read_rows,
 )
 from modelzoo.transformers.pytorch.input_utils import (
     get_data_for_task,
@@ -36,10 +37,16 @@ from modelzoo.transformers.pytorch.input_utils import (
 )
 
 
+def _identity(token_ids):
+    return token_ids
+
+
 class BertCSVDynamicMaskDataProcessor(torch.utils.data.IterableDataset):
     """
     Reads csv files containing the input text tokens, adds MLM features
-    on the fly.
+    on the fly. Also reads the binary shards with already resolved token ids
+    created from these csv files by `convert_csv_to_binary.py`, if they are
+    listed in the meta file instead.
     :param <dict> params: dict containing input parameters for creating dataset.
     Expects the following fields:
 
@@ -50,6 +57,9 @@ class BertCSVDynamicMaskDataProcessor(torch.utils.data.IterableDataset):
     - "shuffle_buffer" (int): Shuffle buffer size.
     - "repeat" (bool): Flag to enable data repeat.
     - "mask_whole_word" (bool): Flag to whether mask the entire word.
+    - "mask_after_batching" (bool): Flag to apply the MLM masking to whole
+      batches with numpy instead of to every sample. Whole words are found
+      with the vocab ids, so out of vocabulary tokens never continue a word.
     - "do_lower" (bool): Flag to lower case the texts.
     - "dynamic_mlm_scale" (bool): Flag to dynamically scale the loss.
     - "num_workers" (int):  How many subprocesses to use for data loading.
@@ -68,6 +78,13 @@ class BertCSVDynamicMaskDataProcessor(torch.utils.data.IterableDataset):
     - "gather_mlm_labels" (bool): Flag to gather mlm labels.
     - "mixed_precision" (bool): Casts input mask to fp16 if set to True.
       Otherwise, the generated mask is float32.
+    - "pack_samples" (bool): Flag to pack several examples in every sequence
+      instead of padding every example to `max_sequence_length`. Adds the
+      `position_ids` of the tokens within their example and the
+      `packed_segment_ids` of the examples, from which the model builds a
+      block diagonal attention mask. Requires `disable_nsp`.
+    - "num_packing_rows" (int): Number of sequences which are kept open for
+      examples to be packed in.
     """
 
     def __init__(self, params):
@@ -112,9 +129,15 @@ class BertCSVDynamicMaskDataProcessor(torch.utils.data.IterableDataset):
         self.shuffle_buffer = params.get("shuffle_buffer", 10 * self.batch_size)
         self.repeat = params.get("repeat", False)
         self.mask_whole_word = params.get("mask_whole_word", False)
+        self.mask_after_batching = params.get("mask_after_batching", False)
         self.do_lower = params.get("do_lower", False)
         self.dynamic_mlm_scale = params.get("dynamic_mlm_scale", False)
         self.buckets = params.get("buckets", None)
+        self.pack_samples = params.get("pack_samples", False)
+        self.num_packing_rows = params.get("num_packing_rows", 8)
+        assert (
+            not self.pack_samples or self.disable_nsp
+        ), "Packing examples is only supported with `disable_nsp`."
 
         # Multi-processing params.
         self.num_workers = params.get("num_workers", 0)
@@ -162,11 +185,28 @@ class BertCSVDynamicMaskDataProcessor(torch.utils.data.IterableDataset):
             self.tokenize([token])[0] for token in self.exclude_from_masking
         ]
 
+        # Lookup of the ids of tokens that continue a word, used for whole
+        # word masking of binary shards, which store ids instead of tokens,
+        # and of whole batches.
+        self.is_continuation_id = np.zeros((self.vocab_size,), dtype=bool)
+        for token, token_id in self.vocab.items():
+            if token.startswith("##"):
+                self.is_continuation_id[token_id] = True
+
+        # Lookup of the ids excluded from masking, used to mask whole batches.
+        self.is_excluded_id = np.zeros((self.vocab_size,), dtype=bool)
+        for token in self.exclude_from_masking:
+            if token in self.vocab:
+                self.is_excluded_id[self.vocab[token]] = True
+
         # We create a pool with tokens that can be used to randomly replace input tokens
         # for BERT MLM task.
         self.replacement_pool = list(
             set(range(self.vocab_size)) - set(self.exclude_from_masking_ids)
         )
+        self.replacement_pool_ids = np.array(
+            sorted(self.replacement_pool), dtype=np.int32
+        )
 
         # Padding indices.
         # See https://huggingface.co/transformers/glossary.html#labels.
@@ -204,24 +244,18 @@ class BertCSVDynamicMaskDataProcessor(torch.utils.data.IterableDataset):
                 start_id,
             ) = self.csv_files_per_task_per_worker[self.processed_buffers]
 
-            with open(current_file_path, "r", newline="") as fin:
-                data_reader = csv.DictReader(fin)
-
-                for row_id, row in enumerate(data_reader):
-                    if start_id <= row_id < start_id + num_examples:
-                        self.data_buffer.append(row)
-                    else:
-                        continue
+            for row in read_rows(current_file_path, num_examples, start_id):
+                self.data_buffer.append(row)
 
-                    if len(self.data_buffer) == self.shuffle_buffer:
-                        if self.shuffle:
-                            self.rng.shuffle(self.data_buffer)
+                if len(self.data_buffer) == self.shuffle_buffer:
+                    if self.shuffle:
+                        self.rng.shuffle(self.data_buffer)
 
-                        for ind in range(len(self.data_buffer)):
-                            yield self.data_buffer[ind]
-                        self.data_buffer = []
+                    for ind in range(len(self.data_buffer)):
+                        yield self.data_buffer[ind]
+                    self.data_buffer = []
 
-                self.processed_buffers += 1
+            self.processed_buffers += 1
 
         if self.shuffle:
             self.rng.shuffle(self.data_buffer)
@@ -232,6 +266,9 @@ class BertCSVDynamicMaskDataProcessor(torch.utils.data.IterableDataset):
 
     def __len__(self):
         # Returns the len of dataset on the task process
+        if self.pack_samples:
+            # The number of sequences depends on how the examples are packed
+            raise TypeError("Packed dataset has no known length.")
         if not self.drop_last:
             return (
                 self.num_examples_per_task + self.batch_size - 1
@@ -264,11 +301,25 @@ class BertCSVDynamicMaskDataProcessor(torch.utils.data.IterableDataset):
                Shape: (`max_predictions`)
                `0` indicates the non masked token, and `1` indicates the masked token.
         """
+        data_rows = self.load_buffer()
+        if self.pack_samples:
+            data_rows = self.pack_data_rows(data_rows)
+
         # Iterate over the data rows to create input features.
-        for data_row in self.load_buffer():
+        for data_row in data_rows:
             # `data_row` is a dict with keys:
-            # ["tokens", "segment_ids", "is_random_next"].
-            tokens = parse_text(data_row["tokens"], do_lower=self.do_lower)
+            # ["tokens", "segment_ids", "is_random_next"] for csv files and
+            # ["token_ids", "segment_ids", "is_random_next"] for binary shards.
+            if "token_ids" in data_row:
+                tokens = data_row["token_ids"].tolist()
+                tokenize = _identity
+                exclude_from_masking = self.exclude_from_masking_ids
+                is_continuation = self.is_continuation_id.__getitem__
+            else:
+                tokens = parse_text(data_row["tokens"], do_lower=self.do_lower)
+                tokenize = self.tokenize
+                exclude_from_masking = self.exclude_from_masking
+                is_continuation = None
 
             if self.disable_nsp:
                 # truncate tokens to MSL
@@ -278,6 +329,16 @@ class BertCSVDynamicMaskDataProcessor(torch.utils.data.IterableDataset):
                     len(tokens) <= self.max_sequence_length
                 ), "When using NSP head, make sure that len(tokens) <= MSL."
 
+            if self.mask_after_batching:
+                # Masking is applied to the whole batch in `__iter__`.
+                features = self.get_unmasked_features(tokenize(tokens))
+                if not self.disable_nsp:
+                    features.update(self.get_nsp_features(data_row))
+                if self.pack_samples:
+                    features.update(self.get_packing_features(data_row))
+                yield features
+                continue
+
             (
                 input_ids,
                 labels,
@@ -291,13 +352,14 @@ class BertCSVDynamicMaskDataProcessor(torch.utils.data.IterableDataset):
                 self.input_pad_id,
                 self.attn_mask_pad_id,
                 self.labels_pad_id,
-                self.tokenize,
+                tokenize,
                 self.vocab_size,
                 self.masked_lm_prob,
                 self.rng,
-                self.exclude_from_masking,
+                exclude_from_masking,
                 self.mask_whole_word,
                 self.replacement_pool,
+                is_continuation,
             )
             features = {
                 "input_ids": input_ids,
@@ -327,20 +389,132 @@ class BertCSVDynamicMaskDataProcessor(torch.utils.data.IterableDataset):
                 features["masked_lm_mask"] = masked_lm_mask
 
             if not self.disable_nsp:
-                next_sentence_label = np.zeros((1,), dtype=np.int32)
+                features.update(self.get_nsp_features(data_row))
+            if self.pack_samples:
+                features.update(self.get_packing_features(data_row))
 
-                token_type_ids = (
-                    np.ones((self.max_sequence_length,), dtype=np.int32)
-                    * self.segment_pad_id
+            yield features
+
+    def pack_data_rows(self, data_rows):
+        """
+        Packs the tokens of several examples in every sequence.
+
+        :param data_rows: Iterator over the rows of the data files.
+        :returns: Yields rows with the `token_ids` of the packed examples,
+            the `packed_segment_ids` of the examples, numbered from 1, and
+            the `position_ids` of the tokens within their example.
+        """
+
+        def get_token_ids(data_row):
+            if "token_ids" in data_row:
+                token_ids = data_row["token_ids"]
+            else:
+                token_ids = self.tokenize(
+                    parse_text(data_row["tokens"], do_lower=self.do_lower)
                 )
+            token_ids = np.asarray(token_ids, dtype=np.int32)
+            return token_ids[: self.max_sequence_length]
+
+        packed_rows = pack_samples(
+            map(get_token_ids, data_rows),
+            [self.max_sequence_length],
+            lambda token_ids: [len(token_ids)],
+            num_rows=self.num_packing_rows,
+        )
+        for examples in packed_rows:
+            lengths = [len(token_ids) for token_ids in examples]
+            yield {
+                "token_ids": np.concatenate(examples),
+                "packed_segment_ids": np.repeat(
+                    np.arange(1, len(examples) + 1, dtype=np.int32), lengths
+                ),
+                "position_ids": np.concatenate(
+                    [np.arange(length, dtype=np.int32) for length in lengths]
+                ),
+            }
+
+    def get_packing_features(self, data_row):
+        """
+        Pads the features of the examples packed in a sequence.
 
-                segment_ids = data_row["segment_ids"].strip("[]").split(", ")
-                token_type_ids[: len(segment_ids)] = list(map(int, segment_ids))
-                next_sentence_label[0] = int(data_row["is_random_next"])
-                features["token_type_ids"] = token_type_ids
-                features["next_sentence_label"] = next_sentence_label
+        :param dict data_row: Row of `pack_data_rows`.
+        :return: dict with the `position_ids` and `packed_segment_ids`,
+            which are 0 for padding.
+        """
+        features = {}
+        for key in ["position_ids", "packed_segment_ids"]:
+            feature = np.zeros((self.max_sequence_length,), dtype=np.int32)
+            feature[: len(data_row[key])] = data_row[key]
+            features[key] = feature
+        return features
+
+    def get_unmasked_features(self, token_ids):
+        """
+        Pads the token ids of a sample, which is masked later as part of its
+        batch.
 
-            yield features
+        :param list token_ids: Token ids of the sample.
+        :return: dict with the `input_ids` and `attention_mask` of the sample.
+        """
+        num_tokens = len(token_ids)
+        input_ids = np.full(
+            (self.max_sequence_length,), self.input_pad_id, dtype=np.int32
+        )
+        input_ids[:num_tokens] = token_ids
+        attention_mask = np.full(
+            (self.max_sequence_length,), self.attn_mask_pad_id, dtype=np.int32
+        )
+        attention_mask[:num_tokens] = 1
+        return {"input_ids": input_ids, "attention_mask": attention_mask}
+
+    def get_nsp_features(self, data_row):
+        """
+        Creates the features for the NSP task.
+
+        :param dict data_row: Row of the data file.
+        :return: dict with the `token_type_ids` and `next_sentence_label`.
+        """
+        next_sentence_label = np.zeros((1,), dtype=np.int32)
+
+        token_type_ids = (
+            np.ones((self.max_sequence_length,), dtype=np.int32)
+            * self.segment_pad_id
+        )
+
+        segment_ids = data_row["segment_ids"]
+        if isinstance(segment_ids, str):
+            segment_ids = list(map(int, segment_ids.strip("[]").split(", ")))
+        token_type_ids[: len(segment_ids)] = segment_ids
+        next_sentence_label[0] = int(data_row["is_random_next"])
+        return {
+            "token_type_ids": token_type_ids,
+            "next_sentence_label": next_sentence_label,
+        }
+
+    def mask_batch(self, batch):
+        """
+        Adds the MLM features to a batch of unmasked samples.
+
+        :param dict batch: Batch with the tensors of `get_unmasked_features`.
+        :return: The batch with the masked `input_ids`, the `labels`, the
+            `masked_lm_mask` and, if gathered, the `masked_lm_positions`.
+        """
+        features = create_masked_lm_predictions_batch(
+            batch["input_ids"].numpy(),
+            batch["attention_mask"].numpy(),
+            self.special_tokens_indices["mask_token"],
+            self.max_predictions_per_seq,
+            self.labels_pad_id,
+            self.masked_lm_prob,
+            self.np_rng,
+            self.is_excluded_id,
+            self.replacement_pool_ids,
+            self.is_continuation_id if self.mask_whole_word else None,
+            self.gather_mlm_labels,
+        )
+        for key, value in features.items():
+            batch[key] = torch.from_numpy(value)
+        return batch
 
     def __iter__(self):
         batched_dataset = bucketed_batch(
@@ -352,6 +526,8 @@ class BertCSVDynamicMaskDataProcessor(torch.utils.data.IterableDataset):
             seed=self.shuffle_seed,
         )
         for batch in batched_dataset:
+            if self.mask_after_batching:
+                batch = self.mask_batch(batch)
             if self.dynamic_mlm_scale:
                 scale = self.batch_size / torch.sum(batch["masked_lm_mask"])
                 batch["mlm_loss_scale"] = scale.expand(self.batch_size, 1)
@@ -372,6 +548,7 @@ class BertCSVDynamicMaskDataProcessor(torch.utils.data.IterableDataset):
         if self.shuffle_seed is not None:
             self.shuffle_seed += worker_id + 1
         self.rng = random.Random(self.shuffle_seed)
+        self.np_rng = np.random.default_rng(self.shuffle_seed)
 
         # Shard the data across multiple processes.
         self.csv_files_per_task_per_worker = shard_list_interleaved(
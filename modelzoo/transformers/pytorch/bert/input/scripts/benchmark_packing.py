@@ -0,0 +1,214 @@
+# Copyright 2022 Cerebras Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures the throughput of training steps of a small BERT model, in real
+(non padding) tokens per second, on batches of `BertCSVDynamicMaskDataProcessor`
+with every example padded to the maximum sequence length and with several
+examples packed in every sequence. The examples are synthetic documents of
+random lengths, written to a temporary directory.
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../../../../.."))
+from modelzoo.transformers.pytorch.bert.bert_pretrain_models import (
+    BertPretrainModel,
+)
+from modelzoo.transformers.pytorch.bert.input.BertCSVDynamicMaskDataProcessor import (
+    BertCSVDynamicMaskDataProcessor,
+)
+
+SPECIAL_TOKENS = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--max_sequence_length",
+        type=int,
+        default=512,
+        help="length of the sequences of the batches",
+    )
+    parser.add_argument(
+        "--mean_document_lengths",
+        type=int,
+        nargs="+",
+        default=[32, 128, 256],
+        help="mean numbers of tokens of the synthetic documents",
+    )
+    parser.add_argument(
+        "--batch_size", type=int, default=8, help="number of rows per batch"
+    )
+    parser.add_argument(
+        "--num_batches",
+        type=int,
+        default=10,
+        help="number of training steps timed for every configuration",
+    )
+    parser.add_argument(
+        "--vocab_size",
+        type=int,
+        default=1000,
+        help="number of tokens of the synthetic vocabulary",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="seed of the synthetic data"
+    )
+    return parser.parse_args()
+
+
+def write_synthetic_data(
+    data_dir, vocab_size, num_documents, mean_length, max_length, rng
+):
+    """
+    Write a vocabulary file and a CSV file with random documents, in the
+    format of the output of `create_csv_mlm_only.py`.
+
+    :return: Path to the vocabulary file.
+    """
+    words = SPECIAL_TOKENS + [
+        f"tok{i}" for i in range(vocab_size - len(SPECIAL_TOKENS))
+    ]
+    vocab_file = os.path.join(data_dir, "vocab.txt")
+    with open(vocab_file, "w") as fout:
+        fout.write("\n".join(words) + "\n")
+
+    lengths = np.clip(rng.geometric(1 / mean_length, num_documents), 1, None)
+    with open(os.path.join(data_dir, "data.csv"), "w", newline="") as fout:
+        writer = csv.DictWriter(
+            fout, fieldnames=["tokens", "segment_ids", "is_random_next"]
+        )
+        writer.writeheader()
+        for length in np.minimum(lengths, max_length - 2):
+            ids = rng.integers(len(SPECIAL_TOKENS), vocab_size, length)
+            tokens = ["[CLS]"] + [words[i] for i in ids] + ["[SEP]"]
+            writer.writerow(
+                {
+                    "tokens": str(tokens),
+                    "segment_ids": str([0] * len(tokens)),
+                    "is_random_next": 0,
+                }
+            )
+    with open(os.path.join(data_dir, "meta.dat"), "w") as fout:
+        fout.write(f"data.csv {num_documents}\n")
+    return vocab_file
+
+
+def benchmark(data_dir, vocab_file, pack_samples, args):
+    """
+    Time `args.num_batches` training steps.
+
+    :return: Tuple with the fraction of real tokens in the batches and the
+        throughput in real tokens per second.
+    """
+    params = {
+        "data_dir": data_dir,
+        "vocab_file": vocab_file,
+        "batch_size": args.batch_size,
+        "shuffle": False,
+        "shuffle_seed": args.seed,
+        "max_sequence_length": args.max_sequence_length,
+        "max_predictions_per_seq": args.max_sequence_length * 15 // 100,
+        "disable_nsp": True,
+        "pack_samples": pack_samples,
+    }
+    data_processor = BertCSVDynamicMaskDataProcessor(params)
+    data_processor._worker_init_fn(0)
+    iterator = iter(data_processor)
+    batches = [next(iterator) for _ in range(args.num_batches + 1)]
+
+    torch.manual_seed(args.seed)
+    model = BertPretrainModel(
+        disable_nsp=True,
+        vocab_size=args.vocab_size,
+        max_position_embeddings=args.max_sequence_length,
+        hidden_size=256,
+        num_hidden_layers=4,
+        num_heads=4,
+        filter_size=1024,
+    )
+
+    def train_step(batch):
+        mlm_logits, _, _, _ = model(
+            input_ids=batch["input_ids"],
+            attention_mask=batch["attention_mask"],
+            labels=batch["labels"],
+            masked_lm_positions=batch["masked_lm_positions"],
+            position_ids=batch.get("position_ids"),
+            packed_segment_ids=batch.get("packed_segment_ids"),
+        )
+        loss = torch.nn.functional.cross_entropy(
+            mlm_logits.flatten(0, 1), batch["labels"].flatten().long(),
+        )
+        loss.backward()
+
+    # Exclude the first step from the measurement.
+    train_step(batches[0])
+    num_tokens = 0
+    start = time.time()
+    for batch in batches[1:]:
+        train_step(batch)
+        num_tokens += int(batch["attention_mask"].sum())
+    elapsed = time.time() - start
+    num_positions = sum(
+        batch["attention_mask"].numel() for batch in batches[1:]
+    )
+    return num_tokens / num_positions, num_tokens / elapsed
+
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    print(
+        f"{'doc_len':>8} {'fill':>6} {'padded tok/s':>13} "
+        f"{'fill':>6} {'packed tok/s':>13} {'speedup':>8}"
+    )
+    for mean_length in args.mean_document_lengths:
+        with tempfile.TemporaryDirectory() as data_dir:
+            # Enough documents for the batches of packed documents.
+            num_documents = (
+                (args.num_batches + 2)
+                * args.batch_size
+                * (args.max_sequence_length // mean_length + 1)
+            )
+            vocab_file = write_synthetic_data(
+                data_dir,
+                args.vocab_size,
+                num_documents,
+                mean_length,
+                args.max_sequence_length,
+                rng,
+            )
+            padded_fill, padded = benchmark(data_dir, vocab_file, False, args)
+            packed_fill, packed = benchmark(data_dir, vocab_file, True, args)
+        print(
+            f"{mean_length:>8} {padded_fill:>6.2f} {padded:>13.1f} "
+            f"{packed_fill:>6.2f} {packed:>13.1f} {packed / padded:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+# Copyright 2022 Cerebras Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Converts the CSV files generated for BERT pretraining into binary shards
+with already parsed features, which the BERT data processors read without
+evaluating any text.
+"""
+import argparse
+import ast
+import csv
+import json
+import os
+import sys
+from functools import lru_cache, partial
+from multiprocessing import Pool
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../../../../.."))
+from modelzoo.common.input.utils import check_and_create_output_dirs
+from modelzoo.transformers.pytorch.bert.input.utils import (
+    build_vocab,
+    get_meta_data,
+)
+
+# dtypes of the features written by the static masking scripts
+STATIC_FEATURE_DTYPES = {
+    "input_ids": np.int32,
+    "token_type_ids": np.int8,
+    "next_sentence_label": np.int8,
+    "masked_lm_weights": np.int8,
+    "masked_lm_positions": np.int32,
+    "attention_mask": np.int8,
+    "labels": np.int32,
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        "--input_dir",
+        type=str,
+        required=True,
+        help="directory with the CSV files and the `meta.dat` file written "
+        "by one of the `create_csv*.py` scripts",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        required=True,
+        help="directory where the binary shards and their `meta.dat` "
+        "file will be stored",
+    )
+    parser.add_argument(
+        "--vocab_file",
+        type=str,
+        default=None,
+        help="path to the vocabulary file used to resolve the tokens of "
+        "CSV files written for dynamic masking into ids; not needed "
+        "for CSV files written with static masking",
+    )
+    parser.add_argument(
+        "--do_lower_case",
+        action="store_true",
+        help="pass this flag to lower case the tokens before resolving "
+        "them into ids; needs to match `do_lower` of the data processor",
+    )
+    parser.add_argument(
+        "--oov_token",
+        type=str,
+        default="[UNK]",
+        help="out of vocabulary token",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=os.cpu_count(),
+        help="number of files converted in parallel",
+    )
+    return parser.parse_args()
+
+
+def _ids_dtype(vocab_size):
+    return np.uint16 if vocab_size <= np.iinfo(np.uint16).max + 1 else np.int32
+
+
+def convert_static_rows(rows):
+    """Convert rows with the fixed length features of static masking.
+
+    Every feature is stored as a `[num_rows, length]` array, or `[num_rows]`
+    for the scalar `next_sentence_label`.
+    """
+    columns = {name: [] for name in rows[0] if name in STATIC_FEATURE_DTYPES}
+    for row in rows:
+        for name, values in columns.items():
+            values.append(ast.literal_eval(row[name]))
+    return {
+        name: np.array(values, dtype=STATIC_FEATURE_DTYPES[name])
+        for name, values in columns.items()
+    }
+
+
+def convert_dynamic_rows(rows, vocab, vocab_size, do_lower):
+    """Convert rows with the variable length tokens of dynamic masking.
+
+    Tokens are resolved into ids and stored flat in `token_ids`, together
+    with the `segment_ids` of the same length, with row `i` spanning
+    `offsets[i] : offsets[i + 1]`.
+    """
+    token_ids = []
+    segment_ids = []
+    is_random_next = []
+    offsets = [0]
+    for row in rows:
+        tokens = ast.literal_eval(row["tokens"])
+        if do_lower:
+            tokens = [token.lower() for token in tokens]
+        token_ids.extend(vocab.forward(tokens))
+        offsets.append(len(token_ids))
+        if "segment_ids" in row:
+            segment_ids.extend(ast.literal_eval(row["segment_ids"]))
+            is_random_next.append(int(row["is_random_next"]))
+
+    columns = {
+        "token_ids": np.array(token_ids, dtype=_ids_dtype(vocab_size)),
+        "offsets": np.array(offsets, dtype=np.int64),
+    }
+    ragged_columns = ["token_ids"]
+    if segment_ids:
+        columns["segment_ids"] = np.array(segment_ids, dtype=np.int8)
+        columns["is_random_next"] = np.array(is_random_next, dtype=np.int8)
+        ragged_columns.append("segment_ids")
+    columns["ragged_columns"] = np.array(ragged_columns)
+    return columns
+
+
+@lru_cache()
+def _load_vocab(vocab_file, do_lower, oov_token):
+    # Built once per worker process instead of once per converted file
+    return build_vocab(vocab_file, do_lower, oov_token)
+
+
+def convert_file(csv_file, output_dir, vocab_file, do_lower, oov_token):
+    """Convert one CSV file into a `.npz` shard in `output_dir`.
+
+    Returns:
+        Tuple with the path of the shard and the number of rows in it, or
+        `None` and `0` if the CSV file has no rows.
+    """
+    with open(csv_file, "r", newline="") as fin:
+        rows = list(csv.DictReader(fin))
+    if not rows:
+        return None, 0
+
+    if "tokens" in rows[0]:
+        assert vocab_file is not None, (
+            f"{csv_file} was written for dynamic masking, `vocab_file` is "
+            f"needed to resolve its tokens into ids."
+        )
+        vocab, vocab_size = _load_vocab(vocab_file, do_lower, oov_token)
+        columns = convert_dynamic_rows(rows, vocab, vocab_size, do_lower)
+    else:
+        columns = convert_static_rows(rows)
+
+    shard_file = os.path.join(
+        output_dir, os.path.splitext(os.path.basename(csv_file))[0] + ".npz"
+    )
+    np.savez(shard_file, **columns)
+    return shard_file, len(rows)
+
+
+def main():
+    args = parse_args()
+
+    check_and_create_output_dirs(args.output_dir, filetype="npz")
+
+    meta_data = get_meta_data(args.input_dir)
+    csv_files = [
+        csv_file for csv_file, num_lines in meta_data.items() if num_lines > 0
+    ]
+    with Pool(processes=args.processes) as pool:
+        shards = pool.map(
+            partial(
+                convert_file,
+                output_dir=args.output_dir,
+                vocab_file=args.vocab_file,
+                do_lower=args.do_lower_case,
+                oov_token=args.oov_token,
+            ),
+            csv_files,
+        )
+
+    shards = [(shard, num_rows) for shard, num_rows in shards if num_rows > 0]
+
+    # Store meta file.
+    meta_file = os.path.join(args.output_dir, "meta.dat")
+    with open(meta_file, "w") as fout:
+        for shard_file, num_rows in shards:
+            fout.write(f"{os.path.basename(shard_file)} {num_rows}\n")
+
+    # Keep the parameters of the CSV generation next to the shards.
+    params_file = os.path.join(args.input_dir, "data_params.json")
+    if os.path.isfile(params_file):
+        with open(params_file, "r") as fin:
+            params = json.load(fin)
+        params["converted_from"] = args.input_dir
+        with open(
+            os.path.join(args.output_dir, "data_params.json"), "w"
+        ) as fout:
+            json.dump(params, fout)
+
+    print(
+        f"Converted {len(shards)} files with "
+        f"{sum(num_rows for _, num_rows in shards)} rows to {args.output_dir}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import csv
 import os
 import random
 
@@ -65,6 +66,57 @@ def get_meta_data(data_dir):
     return meta_data
 
 
+def read_binary_shard(file_path, num_examples, start_id):
+    """
+    Read rows from a binary shard written by `convert_csv_to_binary.py`.
+    Columns listed in `ragged_columns` hold variable length sequences,
+    stored flat and sliced with the shared `offsets` index, all other
+    columns hold one fixed length entry per row.
+    :param str file_path: Path to the `.npz` shard.
+    :param int num_examples: Number of rows to read.
+    :param int start_id: Index of the first row to read.
+
+    :returns: Yields dicts with the numpy arrays of each row.
+    """
+    with np.load(file_path) as shard:
+        columns = {name: shard[name] for name in shard.files}
+    ragged_columns = set(columns.pop("ragged_columns", []))
+    offsets = columns.pop("offsets", None)
+
+    for row_id in range(start_id, start_id + num_examples):
+        row = {}
+        for name, values in columns.items():
+            if name in ragged_columns:
+                row[name] = values[offsets[row_id] : offsets[row_id + 1]]
+            else:
+                row[name] = values[row_id]
+        yield row
+
+
+def read_rows(file_path, num_examples, start_id):
+    """
+    Read `num_examples` rows starting at row `start_id` from a CSV file or,
+    if `file_path` ends with `.npz`, from a binary shard.
+    :param str file_path: Path to the data file.
+    :param int num_examples: Number of rows to read.
+    :param int start_id: Index of the first row to read.
+
+    :returns: Yields the rows as dicts. Values of CSV rows are the raw
+        strings, values of binary rows are already parsed numpy arrays.
+    """
+    if file_path.endswith(".npz"):
+        yield from read_binary_shard(file_path, num_examples, start_id)
+        return
+
+    with open(file_path, "r", newline="") as fin:
+        data_reader = csv.DictReader(fin)
+        for row_id, row in enumerate(data_reader):
+            if row_id >= start_id + num_examples:
+                break
+            if row_id >= start_id:
+                yield row
+
+
 def parse_text(text, do_lower):
     """
     Postprocessing of the CSV file.
@@ -145,6 +197,7 @@ def create_masked_lm_predictions(
     exclude_from_masking,
     mask_whole_word,
     replacement_pool=None,
+    is_continuation=None,
 ):
     """
     Creates the predictions for the masked LM objective.
@@ -165,6 +218,10 @@ def create_masked_lm_predictions(
     :param list replacement_pool: List of ids which should be included
         when replacing tokens with random words from vocab. Default is None
         and means that we can take any token from the vocab.
+    :param callable is_continuation: Returns whether a token continues the
+        previous word, used for whole word masking. Default is None and
+        means that tokens are strings continuing a word if they start
+        with `##`.
 
     :returns: tuple which includes:
             * np.array[int.32] input_ids: Numpy array with input token indices.
@@ -220,7 +277,9 @@ def create_masked_lm_predictions(
 
         if mask_whole_word:
             # Get span of the word for whole word masking.
-            span = get_whole_word_span(tokens, current_token_index)
+            span = get_whole_word_span(
+                tokens, current_token_index, is_continuation
+            )
         else:
             span = [current_token_index, current_token_index + 1]
 
@@ -263,26 +322,189 @@ def create_masked_lm_predictions(
     return input_ids, labels, attention_mask, masked_lm_mask
 
 
-def get_whole_word_span(tokens, start_index):
+def create_masked_lm_predictions_batch(
+    input_ids,
+    attention_mask,
+    mask_token_id,
+    max_predictions_per_seq,
+    labels_pad_id,
+    masked_lm_prob,
+    rng,
+    exclude_from_masking,
+    replacement_pool,
+    is_continuation=None,
+    gather_mlm_labels=True,
+):
+    """
+    Creates the predictions for the masked LM objective for a whole batch
+    at once. Follows `create_masked_lm_predictions`: tokens are visited in
+    random order and masked together with the rest of their word if
+    `is_continuation` is given, until `masked_lm_prob` of the tokens are
+    predicted. The only difference is that the selection stops at the first
+    word that would exceed `max_predictions_per_seq`, instead of skipping it
+    and trying shorter words.
+
+    :param np.array input_ids: Token ids of the unmasked batch.
+        Shape: (`batch_size`, `max_sequence_length`).
+    :param np.array attention_mask: Mask with `1` for the tokens and `0` for
+        the padding. Shape: (`batch_size`, `max_sequence_length`).
+    :param int mask_token_id: Id of the masked token.
+    :param int max_predictions_per_seq: Maximum number of masked LM predictions per sequence
+    :param int labels_pad_id: Labels padding id.
+    :param float masked_lm_prob: Masked LM probability.
+    :param np.random.Generator rng: Generator for the random masking.
+    :param np.array exclude_from_masking: Boolean lookup over the vocab,
+        `True` for the ids that should never be masked.
+    :param np.array replacement_pool: Ids used to randomly replace tokens.
+    :param np.array is_continuation: Boolean lookup over the vocab, `True`
+        for the ids that continue the previous word. Enables whole word
+        masking if given. Default is None.
+    :param bool gather_mlm_labels: Whether to gather the labels and mask at
+        the masked positions.
+
+    :returns: dict with the features:
+            * np.array[int.32] input_ids: Numpy array with masked input token indices.
+                Shape: (`batch_size`, `max_sequence_length`).
+            * np.array[int.32] labels: Numpy array with labels.
+               Shape: (`batch_size`, `max_sequence_length`), or
+               (`batch_size`, `max_predictions_per_seq`) if gathered.
+            * np.array[int.32] masked_lm_mask: Numpy array with a mask of
+               predicted tokens.
+               Shape: same as `labels`.
+            * np.array[int.32] masked_lm_positions: Numpy array with the
+               positions of the predicted tokens, only if gathered.
+               Shape: (`batch_size`, `max_predictions_per_seq`).
+    """
+    batch_size, max_sequence_length = input_ids.shape
+    is_token = attention_mask == 1
+    num_tokens = is_token.sum(axis=1)
+    num_to_predict = np.clip(
+        np.round(num_tokens * masked_lm_prob).astype(np.int64),
+        1,
+        max_predictions_per_seq,
+    )
+
+    # Words are contiguous runs of tokens. Numbering them across the
+    # flattened batch lets every reduction below run on 1D arrays.
+    is_word_start = np.ones_like(is_token)
+    if is_continuation is not None:
+        is_word_start[:, 1:] = ~(
+            is_continuation[input_ids[:, 1:]] & is_token[:, 1:]
+        )
+    word_starts = np.flatnonzero(is_word_start)
+    word_ids = np.cumsum(is_word_start.ravel()) - 1
+    word_rows = word_starts // max_sequence_length
+    word_lengths = np.diff(np.append(word_starts, input_ids.size))
+
+    # A word is reached when the first of its tokens comes up in a random
+    # order of the tokens, which is the minimum of their random scores.
+    scores = rng.random(input_ids.shape)
+    scores[~is_token] = np.inf
+    word_scores = np.minimum.reduceat(scores.ravel(), word_starts)
+    word_scores[
+        exclude_from_masking[input_ids.ravel()[word_starts]]
+        | (word_lengths > max_predictions_per_seq)
+    ] = np.inf
+
+    # Take the words of each row in random order until `num_to_predict`
+    # tokens are covered.
+    order = np.lexsort((word_scores, word_rows))
+    sorted_rows = word_rows[order]
+    sorted_lengths = np.where(
+        np.isfinite(word_scores[order]), word_lengths[order], 0
+    )
+    # Every row starts with a word, so each row restarts the cumulative sum
+    # after the last word of the previous row.
+    cum_lengths = np.cumsum(sorted_lengths)
+    row_starts = np.searchsorted(sorted_rows, np.arange(batch_size))
+    row_offsets = np.zeros((batch_size,), dtype=cum_lengths.dtype)
+    row_offsets[1:] = cum_lengths[row_starts[1:] - 1]
+    cum_lengths -= row_offsets[sorted_rows]
+    is_word_masked = np.zeros(word_scores.shape, dtype=bool)
+    is_word_masked[order] = (
+        (sorted_lengths > 0)
+        & (cum_lengths - sorted_lengths < num_to_predict[sorted_rows])
+        & (cum_lengths <= max_predictions_per_seq)
+    )
+    is_masked = is_word_masked[word_ids].reshape(input_ids.shape)
+
+    labels = np.full(input_ids.shape, labels_pad_id, dtype=np.int32)
+    labels[is_masked] = input_ids[is_masked]
+
+    # Mask `80%` of the time, replace with a random token `10%` of the
+    # time and leave the input as is `10%` of the time.
+    masked_input_ids = input_ids.astype(np.int32)
+    rnd = rng.random(input_ids.shape)
+    masked_input_ids[is_masked & (rnd < 0.8)] = mask_token_id
+    is_replaced = is_masked & (rnd >= 0.8) & (rnd < 0.9)
+    masked_input_ids[is_replaced] = replacement_pool[
+        rng.integers(len(replacement_pool), size=int(is_replaced.sum()))
+    ]
+
+    features = {"input_ids": masked_input_ids}
+    if not gather_mlm_labels:
+        features["labels"] = labels
+        features["masked_lm_mask"] = is_masked.astype(np.int32)
+        return features
+
+    # Gather MLM positions, masked positions first in increasing order.
+    num_gathered = min(max_predictions_per_seq, max_sequence_length)
+    positions = np.argsort(~is_masked, axis=1, kind="stable")[
+        :, :num_gathered
+    ]
+    is_gathered = np.arange(num_gathered)[None, :] < is_masked.sum(
+        axis=1, keepdims=True
+    )
+    positions = np.where(is_gathered, positions, 0)
+    gathered_mlm_positions = np.zeros(
+        (batch_size, max_predictions_per_seq), dtype=np.int32
+    )
+    gathered_mlm_positions[:, :num_gathered] = positions
+    gathered_labels = np.zeros(
+        (batch_size, max_predictions_per_seq), dtype=np.int32
+    )
+    gathered_labels[:, :num_gathered] = np.where(
+        is_gathered, np.take_along_axis(labels, positions, axis=1), 0
+    )
+    gathered_mlm_mask = np.zeros(
+        (batch_size, max_predictions_per_seq), dtype=np.int32
+    )
+    gathered_mlm_mask[:, :num_gathered] = is_gathered
+    features["labels"] = gathered_labels
+    features["masked_lm_mask"] = gathered_mlm_mask
+    features["masked_lm_positions"] = gathered_mlm_positions
+    return features
+
+
+def _is_continuation_token(token):
+    return token.startswith("##")
+
+
+def get_whole_word_span(tokens, start_index, is_continuation=None):
     """
     Returns the whole word start and end
     indices.
 
     :param: list tokens: Tokens to process.
     :param: int start_index: Start index.
+    :param: callable is_continuation: Returns whether a token continues
+        the previous word. Defaults to checking for the `##` prefix.
 
     :returns: tuple with start and end index of the word
               from the token list.
     """
+    if is_continuation is None:
+        is_continuation = _is_continuation_token
+
     end_index = len(tokens)
     if start_index < len(tokens) - 1:
         end_index = min(start_index + 1, len(tokens) - 1)
-        while tokens[end_index].startswith("##"):
+        while is_continuation(tokens[end_index]):
             end_index += 1
             if end_index > len(tokens) - 1:
                 break
 
-    while tokens[start_index].startswith("##") and start_index > 0:
+    while is_continuation(tokens[start_index]) and start_index > 0:
         start_index -= 1
 
     return start_index, end_index
@@ -179,6 +179,10 @@ class BertForPreTrainingModel(torch.nn.Module):
             # if NSP is enabled, mask it with main mask
             if "token_type_ids" in data:
                 masks["attention_mask"].append("token_type_ids")
+            # if examples are packed, mask their positions and segments
+            for name in ["position_ids", "packed_segment_ids"]:
+                if name in data:
+                    masks["attention_mask"].append(name)
 
             # Check if we're "gathering" MLM predictions:
             if "masked_lm_positions" in data:
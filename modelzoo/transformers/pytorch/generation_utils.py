@@ -0,0 +1,185 @@
+# Copyright 2022 Cerebras Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Autoregressive generation with KV-cached incremental decoding."""
+
+from typing import List, Optional
+
+import torch
+
+
+def left_pad_prompts(
+    prompts: List[List[int]], pad_token_id: int = 0, device=None
+):
+    """Batch prompts of different lengths, padded on the left.
+
+    Args:
+        prompts (list): Token ids of every prompt.
+        pad_token_id (int): Token id of the padding.
+        device (torch.device): Device of the resulting tensors.
+
+    Returns:
+        Tuple of the input ids and of the attention mask, with 1 for tokens
+        and 0 for padding, of shape [batch_size, max_prompt_length].
+    """
+    max_length = max(len(prompt) for prompt in prompts)
+    input_ids = torch.full(
+        (len(prompts), max_length), pad_token_id, dtype=torch.long
+    )
+    attention_mask = torch.zeros((len(prompts), max_length), dtype=torch.long)
+    for i, prompt in enumerate(prompts):
+        if prompt:
+            input_ids[i, -len(prompt) :] = torch.tensor(prompt)
+            attention_mask[i, -len(prompt) :] = 1
+    return input_ids.to(device), attention_mask.to(device)
+
+
+def sample_next_tokens(
+    logits: torch.Tensor,
+    do_sample: bool = False,
+    temperature: float = 1.0,
+    top_k: int = 0,
+    top_p: float = 1.0,
+    generator: Optional[torch.Generator] = None,
+):
+    """Pick the next token of every sequence from its logits.
+
+    Args:
+        logits (torch.Tensor): Logits of shape [batch_size, vocab_size].
+        do_sample (bool): Sample from the distribution of the logits if True,
+            otherwise pick the most likely token.
+        temperature (float): Temperature the logits are divided by.
+        top_k (int): If positive, sample among the `top_k` most likely tokens.
+        top_p (float): If below 1, sample among the most likely tokens whose
+            cumulative probability reaches `top_p` (nucleus sampling).
+        generator (torch.Generator): Random number generator for sampling.
+
+    Returns:
+        Token ids of shape [batch_size].
+    """
+    if not do_sample:
+        return logits.argmax(dim=-1)
+
+    logits = logits.float() / temperature
+    if top_k > 0:
+        top_k = min(top_k, logits.shape[-1])
+        kth_logits = torch.topk(logits, top_k, dim=-1).values[:, -1:]
+        logits = logits.masked_fill(logits < kth_logits, float("-inf"))
+    if top_p < 1.0:
+        sorted_logits, sorted_indices = torch.sort(
+            logits, dim=-1, descending=True
+        )
+        sorted_probs = torch.softmax(sorted_logits, dim=-1)
+        # Drop the tokens after the cumulative probability reaches `top_p`,
+        # always keeping the most likely one.
+        sorted_to_remove = sorted_probs.cumsum(dim=-1) - sorted_probs >= top_p
+        to_remove = sorted_to_remove.scatter(
+            -1, sorted_indices, sorted_to_remove
+        )
+        logits = logits.masked_fill(to_remove, float("-inf"))
+
+    probs = torch.softmax(logits, dim=-1)
+    return torch.multinomial(probs, 1, generator=generator).squeeze(-1)
+
+
+@torch.no_grad()
+def generate(
+    model: torch.nn.Module,
+    input_ids: torch.Tensor,
+    attention_mask: Optional[torch.Tensor] = None,
+    max_new_tokens: int = 32,
+    do_sample: bool = False,
+    temperature: float = 1.0,
+    top_k: int = 0,
+    top_p: float = 1.0,
+    eos_token_id: Optional[int] = None,
+    pad_token_id: int = 0,
+    generator: Optional[torch.Generator] = None,
+):
+    """Generate tokens after prompts with a decoder-only language model.
+
+    The prompts are processed in one forward pass which fills preallocated
+    key/value caches of every layer, then every new token is computed from
+    its own query and the cached keys and values only.
+
+    Args:
+        model (torch.nn.Module): Model with a `transformer_decoder` and a
+            forward pass accepting `past_kv`, such as `GPT2LMHeadModel`
+            and `GPTJModel`.
+        input_ids (torch.Tensor): Prompts of shape [batch_size, prompt_len],
+            padded on the left, see `left_pad_prompts`.
+        attention_mask (torch.Tensor): Mask of the prompts with 1 for tokens
+            and 0 for padding. Defaults to prompts without padding.
+        max_new_tokens (int): Number of tokens to generate.
+        do_sample, temperature, top_k, top_p, generator: Sampling options,
+            see `sample_next_tokens`. Greedy decoding by default.
+        eos_token_id (int): If specified, sequences that generated this
+            token are padded with `pad_token_id` afterwards, and generation
+            stops once all sequences are finished.
+        pad_token_id (int): Token id of the padding after finished sequences.
+
+    Returns:
+        Tensor of the prompts followed by the generated tokens, of shape
+        [batch_size, prompt_len + number of generated tokens].
+    """
+    batch_size, prompt_length = input_ids.shape
+    max_length = prompt_length + max_new_tokens
+    assert max_length <= model.max_position_embeddings, (
+        f"Cannot generate {max_length} positions with a model of "
+        f"{model.max_position_embeddings} positions."
+    )
+    if attention_mask is None:
+        attention_mask = torch.ones_like(input_ids)
+    attention_mask = attention_mask.long()
+
+    was_training = model.training
+    model.eval()
+
+    past_kv = model.transformer_decoder.init_kv_cache(
+        batch_size,
+        max_length,
+        dtype=next(model.parameters()).dtype,
+        device=input_ids.device,
+    )
+    finished = torch.zeros(
+        batch_size, dtype=torch.bool, device=input_ids.device
+    )
+    tokens = [input_ids]
+    step_input_ids = input_ids
+    for _ in range(max_new_tokens):
+        logits = model(
+            step_input_ids, attention_mask=attention_mask, past_kv=past_kv,
+        )
+        next_tokens = sample_next_tokens(
+            logits[:, -1],
+            do_sample=do_sample,
+            temperature=temperature,
+            top_k=top_k,
+            top_p=top_p,
+            generator=generator,
+        )
+        if eos_token_id is not None:
+            next_tokens = next_tokens.masked_fill(finished, pad_token_id)
+            finished |= next_tokens == eos_token_id
+        tokens.append(next_tokens[:, None])
+        if eos_token_id is not None and finished.all():
+            break
+
+        step_input_ids = next_tokens[:, None]
+        attention_mask = torch.cat(
+            [attention_mask, torch.ones_like(step_input_ids)], dim=-1
+        )
+
+    model.train(was_training)
+    return torch.cat(tokens, dim=-1)
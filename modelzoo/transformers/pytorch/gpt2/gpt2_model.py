@@ -21,12 +21,16 @@ from modelzoo.common.pytorch.layers import (
     TransformerDecoder,
     TransformerDecoderLayer,
 )
+from modelzoo.transformers.pytorch.generation_utils import generate
 from modelzoo.transformers.pytorch.gpt2.sparse_mask import (
+    FixedSparseAttentionLayout,
     create_fixed_sparse_attention_mask,
 )
 from modelzoo.transformers.pytorch.transformer_utils import (
     build_broadcastable_attention_mask,
+    build_incremental_decoding_mask,
     make_sparse_mask_broadcastable,
+    position_ids_from_attention_mask,
 )
 
 
@@ -57,6 +61,8 @@ class GPT2LMHeadModel(nn.Module):
         attention_dropout_rate=0.1,
         attention_softmax_fp32=True,
         attention_kernel=None,
+        attention_module="aiayn_attention",
+        attention_block_size=128,
         # Encoder - ffn
         filter_size=3072,
         nonlinearity="gelu",
@@ -125,6 +131,14 @@ class GPT2LMHeadModel(nn.Module):
 
         self.drop_embd = nn.Dropout(embd_pdrop)
 
+        # Blockwise attention applies the causal mask implicitly
+        self.blockwise_attention = attention_module == "blockwise_attention"
+        extra_attention_params = {"attention_kernel": attention_kernel}
+        if self.blockwise_attention:
+            extra_attention_params.update(
+                block_size=attention_block_size, causal=True
+            )
+
         decoder_layer = TransformerDecoderLayer(
             d_model=hidden_size,
             nhead=num_heads,
@@ -133,7 +147,8 @@ class GPT2LMHeadModel(nn.Module):
             activation=nonlinearity,
             layer_norm_eps=layer_norm_epsilon,
             norm_first=True,
-            extra_attention_params={"attention_kernel": attention_kernel},
+            attention_module_str=attention_module,
+            extra_attention_params=extra_attention_params,
             add_cross_attention=False,
             attention_type=attention_type,
             attention_dropout_rate=attention_dropout_rate,
@@ -155,7 +170,15 @@ class GPT2LMHeadModel(nn.Module):
             decoder_layer, num_layers=num_hidden_layers, norm=self.ln_f,
         )
 
-        if fixed_sparse_attention is not None:
+        if fixed_sparse_attention is not None and self.blockwise_attention:
+            # Skip the masked blocks instead of adding a dense mask
+            self.fixed_sparsity_mask = FixedSparseAttentionLayout(
+                max_sequence_length=max_position_embeddings,
+                n_heads=num_heads,
+                block_size=attention_block_size,
+                **fixed_sparse_attention,
+            )
+        elif fixed_sparse_attention is not None:
             self.fixed_sparsity_mask = create_fixed_sparse_attention_mask(
                 max_sequence_length=max_position_embeddings,
                 n_heads=num_heads,
@@ -218,23 +241,66 @@ class GPT2LMHeadModel(nn.Module):
         return self.embedding_layer.get_input_embeddings()
 
     def forward(
-        self, input_ids=None, attention_mask=None, labels=None,
+        self,
+        input_ids=None,
+        attention_mask=None,
+        labels=None,
+        past_kv=None,
+        return_hidden_states=False,
     ):
-        hidden_states = self.embedding_layer(input_ids)
+        """
+        If `past_kv` holds the key/value caches of every layer, e.g. from
+        `self.transformer_decoder.init_kv_cache`, only the new tokens are
+        passed in `input_ids`, their keys and values are appended to the
+        caches, and `attention_mask` covers the cached and new tokens of left
+        padded sequences. See `generate`.
+
+        If `return_hidden_states` is True, the final hidden states are
+        returned instead of the logits, e.g. to apply `lm_head` fused with
+        the loss, see `ChunkedGPTLMHeadModelLoss`.
+        """
+        position_ids = None
+        if past_kv is not None:
+            position_ids = position_ids_from_attention_mask(attention_mask)[
+                :, -input_ids.shape[1] :
+            ]
+        hidden_states = self.embedding_layer(
+            input_ids, position_ids=position_ids
+        )
         if self.embedding_layer_norm:
             hidden_states = self.embedding_ln_f(hidden_states)
         hidden_states = self.drop_embd(hidden_states)
 
-        causal_attention_mask = build_broadcastable_attention_mask(
-            attention_mask,
-            build_causal=True,
-            device=input_ids.device,
-            dtype=hidden_states.dtype,
-        )
+        key_padding_mask = None
+        if past_kv is not None:
+            causal_attention_mask = build_incremental_decoding_mask(
+                attention_mask, input_ids.shape[1], dtype=hidden_states.dtype,
+            )
+        elif self.blockwise_attention:
+            # The causal mask is implicit, only padding is masked
+            causal_attention_mask = None
+            if attention_mask is not None:
+                key_padding_mask = attention_mask == 0
+        else:
+            causal_attention_mask = build_broadcastable_attention_mask(
+                attention_mask,
+                build_causal=True,
+                device=input_ids.device,
+                dtype=hidden_states.dtype,
+            )
 
         # Fixed sparse attention, used in GPT-3 model
         sparse_attention_mask = None
-        if self.fixed_sparsity_mask is not None:
+        if self.fixed_sparsity_mask is not None and past_kv is not None:
+            sparse_attention_mask = build_incremental_decoding_mask(
+                attention_mask,
+                input_ids.shape[1],
+                dtype=hidden_states.dtype,
+                sparse_mask=self.fixed_sparsity_mask,
+            )
+        elif self.fixed_sparsity_mask is not None and self.blockwise_attention:
+            sparse_attention_mask = self.fixed_sparsity_mask
+        elif self.fixed_sparsity_mask is not None:
             sparse_attention_mask = make_sparse_mask_broadcastable(
                 self.fixed_sparsity_mask,
                 attention_mask,
@@ -247,8 +313,20 @@ class GPT2LMHeadModel(nn.Module):
             hidden_states,
             tgt_mask=causal_attention_mask,
             sparse_mask=sparse_attention_mask,
+            tgt_key_padding_mask=key_padding_mask,
+            past_kv=past_kv,
         )
 
+        if return_hidden_states:
+            return hidden_states
+
         lm_logits = self.lm_head(hidden_states)
 
         return lm_logits
+
+    def generate(self, input_ids, attention_mask=None, **kwargs):
+        """Generate tokens after the prompts in `input_ids` with KV-cached
+        incremental decoding. See `generation_utils.generate` for the
+        decoding options.
+        """
+        return generate(self, input_ids, attention_mask, **kwargs)
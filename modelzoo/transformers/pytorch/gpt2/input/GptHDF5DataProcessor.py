@@ -14,6 +14,7 @@
 
 """Pytorch GPT2/3 Dataloader"""
 
+import copy
 import logging
 import math
 import os
@@ -24,7 +25,14 @@ import h5py
 import numpy as np
 import torch
 
+from modelzoo.common.pytorch.input_utils import SampleCursor
 from modelzoo.common.pytorch.utils import BufferedShuffleDataset
+from modelzoo.transformers.data_processing.h5_index import (
+    INDEX_FILENAME,
+    is_entry_stale,
+    load_h5_index,
+    read_n_examples_parallel,
+)
 from modelzoo.transformers.pytorch.input_utils import (
     num_tasks,
     shard_list_of_chunks_contiguous,
@@ -32,6 +40,21 @@ from modelzoo.transformers.pytorch.input_utils import (
 )
 
 
+class _ResumableDataLoader(torch.utils.data.DataLoader):
+    """
+    Data loader of a resumable `GptHDF5DataProcessor`, which counts the
+    epochs started in the main process. Workers iterate over copies of the
+    dataset made when they start, so the main process does not see their
+    iterations. Single-process loading counts the epochs in the dataset.
+    """
+
+    def __iter__(self):
+        iterator = super().__iter__()
+        if self.num_workers > 0:
+            self.dataset._num_epochs_started += 1
+        return iterator
+
+
 class GptHDF5DataProcessor(torch.utils.data.IterableDataset):
     """
     A HDF5 dataset processor for GPT pre-training.
@@ -55,6 +78,12 @@ class GptHDF5DataProcessor(torch.utils.data.IterableDataset):
     - "prefetch_factor" (int): Number of batches loaded in advance by each worker.
     - "persistent_workers" (bool): If True, the data loader will not shutdown
        the worker processes after a dataset has been consumed once.
+    - "num_index_threads" (int): Number of threads opening the HDF5 files
+       that are not listed in the `h5_index.json` index of their directory.
+    - "resumable" (bool): If True, samples are read in a deterministic order
+       given by `shuffle_seed`, whose position is saved with the checkpoints,
+       so training resumes after the last consumed sample with any number of
+       workers and tasks. The shuffle buffer is not used in this mode.
     """
 
     def __init__(self, params):
@@ -73,6 +102,7 @@ class GptHDF5DataProcessor(torch.utils.data.IterableDataset):
         self.prefetch_factor = params.get("prefetch_factor", 10)
         self.persistent_workers = params.get("persistent_workers", True)
         self.dataloader_state = params.get('cerebras', {})
+        self.resumable = params.get("resumable", False)
 
         # Features in HDF5 files
         self.features_list = ["input_ids", "attention_mask", "labels"]
@@ -83,12 +113,16 @@ class GptHDF5DataProcessor(torch.utils.data.IterableDataset):
             self.data_dir = [self.data_dir]
 
         files = []
+        # Indexed number of examples of the files, validated lazily when
+        # the files are opened for reading.
+        self.file_index = {}
         for directory in self.data_dir:
             p = Path(directory)
             assert (
                 p.is_dir()
             ), f"The path {directory} does not exist or is not a directory."
             files.extend(p.glob('*.h5'))
+            self.file_index.update(load_h5_index(str(p.resolve())) or {})
 
         files = sorted(files)
         if not files:
@@ -97,23 +131,66 @@ class GptHDF5DataProcessor(torch.utils.data.IterableDataset):
         self.num_tasks = num_tasks()
         self.task_id = task_id()
 
-        # Shard H5 files between the tasks and resolve the paths
-        files_in_this_task = [
-            str(file.resolve())
-            for file in files[self.task_id :: self.num_tasks]
+        # Shard H5 files between the tasks and resolve the paths. Resumable
+        # iteration shards batches instead, so every task needs all files.
+        if self.resumable:
+            files_in_this_task = [str(file.resolve()) for file in files]
+        else:
+            files_in_this_task = [
+                str(file.resolve())
+                for file in files[self.task_id :: self.num_tasks]
+            ]
+
+        # Only files missing from the index are opened here.
+        unindexed_files = [
+            file_path
+            for file_path in files_in_this_task
+            if file_path not in self.file_index
         ]
+        if unindexed_files:
+            logging.info(
+                f"Reading the number of examples of {len(unindexed_files)} "
+                f"files without an entry in {INDEX_FILENAME}."
+            )
+        num_examples_in_unindexed_files = dict(
+            zip(
+                unindexed_files,
+                read_n_examples_parallel(
+                    unindexed_files, params.get("num_index_threads", None)
+                ),
+            )
+        )
 
         self.files_in_this_task = []
         self.num_examples_in_this_task = 0
         for file_path in files_in_this_task:
-            with h5py.File(file_path, mode='r') as h5_file:
-                num_examples_in_file = h5_file.attrs["n_examples"]
-                self.files_in_this_task.append(
-                    (file_path, num_examples_in_file)
-                )
-                self.num_examples_in_this_task += num_examples_in_file
-
-        if self.shuffle:
+            if file_path in self.file_index:
+                num_examples_in_file = self.file_index[file_path]["n_examples"]
+            else:
+                num_examples_in_file = num_examples_in_unindexed_files[
+                    file_path
+                ]
+            self.files_in_this_task.append((file_path, num_examples_in_file))
+            self.num_examples_in_this_task += num_examples_in_file
+
+        if self.resumable:
+            self.sample_cursor = SampleCursor(
+                [num_examples for _, num_examples in self.files_in_this_task],
+                self.batch_size,
+                seed=self.shuffle_seed,
+                shuffle=self.shuffle,
+            )
+            # Every iteration over the dataset starts the next epoch, even if
+            # the previous one was not read to the end, while
+            # `sample_cursor` stays at the position training started from.
+            self._num_epochs_started = 0
+            self.num_examples_in_this_task = (
+                self.num_examples_in_this_task
+                // self.batch_size
+                // self.num_tasks
+                * self.batch_size
+            )
+        elif self.shuffle:
             random.seed(self.shuffle_seed)
             random.shuffle(self.files_in_this_task)
 
@@ -173,6 +250,21 @@ class GptHDF5DataProcessor(torch.utils.data.IterableDataset):
                                     + 1
                                 )
 
+    def _validate_file(self, file_path, h5_file):
+        """
+        Check the indexed number of examples of a file against the file.
+        Only files that changed since they were indexed are checked.
+        """
+        entry = self.file_index.get(file_path)
+        if entry is None or not is_entry_stale(file_path, entry):
+            return
+        if h5_file.attrs["n_examples"] != entry["n_examples"]:
+            raise RuntimeError(
+                f"{file_path} has {h5_file.attrs['n_examples']} examples, "
+                f"but {entry['n_examples']} in the {INDEX_FILENAME} index of "
+                f"its directory. Rebuild the index with `build_h5_index.py`."
+            )
+
     def _load_buffer(self, data_partitions):
         # partition id should default to 0 if not reading iter from file
         restart_iter_partition_id = 0
@@ -253,6 +345,7 @@ class GptHDF5DataProcessor(torch.utils.data.IterableDataset):
             else:
                 start_idx = start_idx_org
             with h5py.File(file_path, mode='r') as h5_file:
+                self._validate_file(file_path, h5_file)
                 for idx in range(
                     start_idx, start_idx_org + num_examples, self.batch_size
                 ):
@@ -263,11 +356,72 @@ class GptHDF5DataProcessor(torch.utils.data.IterableDataset):
                     for i in range(load_len):
                         yield load_data[i]
 
+    def get_dataloader_state(self, num_batches_read):
+        """
+        Returns the state to save with a checkpoint, after `num_batches_read`
+        batches were read from the current epoch of the data loader of every
+        task. Only available if `resumable` is set.
+        """
+        if not self.resumable:
+            return None
+        cursor = self._epoch_cursor(max(0, self._num_epochs_started - 1))
+        return cursor.state_dict(num_batches_read, self.num_tasks)
+
+    def load_dataloader_state(self, state):
+        """
+        Resumes from a state returned by `get_dataloader_state`. Needs to be
+        called before iterating over the data loader.
+        """
+        if self.resumable:
+            self.sample_cursor.load_state_dict(state)
+            self._num_epochs_started = 0
+
+    def _epoch_cursor(self, epoch_index):
+        """
+        Returns the cursor at the start of the `epoch_index`-th iteration
+        over the dataset, counted from `sample_cursor`.
+        """
+        cursor = copy.copy(self.sample_cursor)
+        if epoch_index > 0:
+            cursor.next_epoch(epoch_index)
+        return cursor
+
+    def _load_resumable(self):
+        worker_info = torch.utils.data.get_worker_info()
+        if worker_info is not None:
+            worker_id, num_workers = worker_info.id, worker_info.num_workers
+        else:
+            worker_id, num_workers = 0, 1
+
+        cursor = self._epoch_cursor(self._num_epochs_started)
+        self._num_epochs_started += 1
+
+        h5_file, h5_file_index = None, None
+        try:
+            for file_index, start, stop in cursor.iter_spans(
+                self.task_id, self.num_tasks, worker_id, num_workers
+            ):
+                if file_index != h5_file_index:
+                    if h5_file is not None:
+                        h5_file.close()
+                    file_path = self.files_in_this_task[file_index][0]
+                    h5_file = h5py.File(file_path, mode='r')
+                    h5_file_index = file_index
+                    self._validate_file(file_path, h5_file)
+                yield from h5_file["data"][start:stop]
+        finally:
+            if h5_file is not None:
+                h5_file.close()
+
     def __iter__(self):
         """
         Iterating over the data to construct input features.
         """
-        for example in self._load_buffer(self.data_partitions):
+        if self.resumable:
+            examples = self._load_resumable()
+        else:
+            examples = self._load_buffer(self.data_partitions)
+        for example in examples:
             yield {
                 feature: np.array(example[i], np.int32)
                 for i, feature in enumerate(self.features_list)
@@ -302,11 +456,18 @@ class GptHDF5DataProcessor(torch.utils.data.IterableDataset):
         """
         Classmethod to create the dataloader object.
         """
-        data_loader = torch.utils.data.DataLoader(
+        data_loader_class = (
+            _ResumableDataLoader
+            if self.resumable
+            else torch.utils.data.DataLoader
+        )
+        data_loader = data_loader_class(
             BufferedShuffleDataset(
                 dataset=self, buffer_size=self.shuffle_buffer
             )
-            if self.shuffle and not bool(self.dataloader_state)
+            if self.shuffle
+            and not bool(self.dataloader_state)
+            and not self.resumable
             else self,
             batch_size=self.batch_size,
             drop_last=self.drop_last,
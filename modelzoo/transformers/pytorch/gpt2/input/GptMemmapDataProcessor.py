@@ -0,0 +1,214 @@
+# Copyright 2022 Cerebras Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pytorch GPT2/3 Dataloader for memory-mapped flat token streams"""
+
+import random
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from modelzoo.transformers.pytorch.input_utils import (
+    num_tasks,
+    shard_list_of_chunks_contiguous,
+    task_id,
+)
+
+
+class GptMemmapDataProcessor(torch.utils.data.IterableDataset):
+    """
+    A memory-mapped token stream dataset processor for GPT pre-training.
+    Reads the `.bin`/`.idx.npz` file pairs written by the `memmap_text`
+    subcommand of `create_hdf5_dataset.py`.
+    Functionality includes:
+        Reading token sequences from the memory-mapped token stream
+        without decompression, and
+        Deriving input sequences, masks and autoregressive LM labels
+        from each sequence on the fly
+    :param dict params: dict containing training
+        input parameters for creating dataset.
+    Expects the following fields:
+    - "data_dir" (str or list of str): Path to dataset `.bin` files
+    - "max_sequence_length (int): Maximum length of the sequence to generate
+    - "batch_size" (int): Batch size.
+    - "shuffle" (bool): Flag to enable data shuffling.
+    - "shuffle_seed" (int): Shuffle seed.
+    - "num_workers" (int):  How many subprocesses to use for data loading.
+    - "drop_last" (bool): If True and the dataset size is not divisible
+       by the batch size, the last incomplete batch will be dropped.
+    - "prefetch_factor" (int): Number of batches loaded in advance by each worker.
+    - "persistent_workers" (bool): If True, the data loader will not shutdown
+       the worker processes after a dataset has been consumed once.
+    """
+
+    def __init__(self, params):
+        super(GptMemmapDataProcessor, self).__init__()
+
+        self.data_dir = params["data_dir"]
+        self.batch_size = params["batch_size"]
+        self.max_sequence_length = params["max_sequence_length"]
+
+        self.shuffle = params["shuffle"]
+        self.shuffle_seed = params.get("shuffle_seed", None)
+
+        self.num_workers = params.get("num_workers", 0)
+        self.drop_last = params.get("drop_last", True)
+        self.prefetch_factor = params.get("prefetch_factor", 10)
+        self.persistent_workers = params.get("persistent_workers", True)
+
+        assert self.batch_size > 0, "Batch size should be a positive number."
+
+        if not isinstance(self.data_dir, list):
+            self.data_dir = [self.data_dir]
+
+        files = []
+        for directory in self.data_dir:
+            p = Path(directory)
+            assert (
+                p.is_dir()
+            ), f"The path {directory} does not exist or is not a directory."
+            files.extend(p.glob('*.bin'))
+
+        files = sorted(files)
+        if not files:
+            raise RuntimeError("No .bin dataset files found.")
+
+        self.num_tasks = num_tasks()
+        self.task_id = task_id()
+
+        # Shard token files between the tasks and resolve the paths. Only
+        # the offsets index of each file is read here, the token streams are
+        # memory-mapped lazily by the workers.
+        self.files_in_this_task = []
+        self.num_examples_in_this_task = 0
+        for file in files[self.task_id :: self.num_tasks]:
+            file_path = str(file.resolve())
+            index = np.load(file_path[: -len(".bin")] + ".idx.npz")
+            offsets = index["offsets"]
+            file_spec = (
+                file_path,
+                offsets,
+                str(index["dtype"]),
+                int(index["pad_id"]),
+            )
+            self.files_in_this_task.append((file_spec, len(offsets) - 1))
+            self.num_examples_in_this_task += len(offsets) - 1
+
+        if self.shuffle:
+            random.seed(self.shuffle_seed)
+            random.shuffle(self.files_in_this_task)
+
+    def _get_example(self, tokens, start, end, pad_id):
+        """
+        Derive the features of a single example from its token sequence.
+        `input_ids` and `labels` are the sequence shifted by one position,
+        so both are read as views into the same memory-mapped slice.
+        """
+        num_tokens = min(end - start, self.max_sequence_length + 1) - 1
+        input_ids = tokens[start : start + num_tokens]
+        labels = tokens[start + 1 : start + num_tokens + 1]
+
+        if num_tokens == self.max_sequence_length:
+            return {
+                "input_ids": input_ids.astype(np.int32),
+                "attention_mask": np.ones(
+                    self.max_sequence_length, dtype=np.int32
+                ),
+                "labels": labels.astype(np.int32),
+            }
+
+        example = {
+            "input_ids": np.full(
+                self.max_sequence_length, pad_id, dtype=np.int32
+            ),
+            "attention_mask": np.zeros(
+                self.max_sequence_length, dtype=np.int32
+            ),
+            "labels": np.full(self.max_sequence_length, pad_id, dtype=np.int32),
+        }
+        example["input_ids"][:num_tokens] = input_ids
+        example["attention_mask"][:num_tokens] = 1
+        example["labels"][:num_tokens] = labels
+        return example
+
+    def __iter__(self):
+        """
+        Iterating over the data to construct input features.
+        """
+        for (
+            (file_path, offsets, dtype, pad_id),
+            start_idx,
+            num_examples,
+        ) in self.data_partitions:
+            tokens = np.memmap(file_path, dtype=dtype, mode="r")
+            indices = np.arange(start_idx, start_idx + num_examples)
+            if self.shuffle:
+                # Random access is O(1), so shuffle within the partition
+                # instead of going through a shuffle buffer.
+                self.rng.shuffle(indices)
+            for idx in indices:
+                yield self._get_example(
+                    tokens, offsets[idx], offsets[idx + 1], pad_id
+                )
+            del tokens
+
+    def __len__(self):
+        """
+        Returns the len of dataset on the task process
+        """
+        return self.num_examples_in_this_task
+
+    def _worker_init_fn(self, worker_id):
+        worker_info = torch.utils.data.get_worker_info()
+
+        if worker_info is not None:
+            worker_id = worker_info.id
+            num_workers = worker_info.num_workers
+        else:
+            # Single-process
+            worker_id = 0
+            num_workers = 1
+
+        # Use a unique seed for each worker.
+        seed = (
+            self.shuffle_seed + worker_id
+            if self.shuffle_seed is not None
+            else None
+        )
+        self.rng = np.random.default_rng(seed)
+
+        self.data_partitions = shard_list_of_chunks_contiguous(
+            self.files_in_this_task, worker_id, num_workers
+        )
+
+    def create_dataloader(self, is_training=True):
+        """
+        Classmethod to create the dataloader object.
+        """
+        data_loader = torch.utils.data.DataLoader(
+            self,
+            batch_size=self.batch_size,
+            drop_last=self.drop_last,
+            num_workers=self.num_workers,
+            prefetch_factor=self.prefetch_factor if self.num_workers > 0 else 2,
+            persistent_workers=self.persistent_workers
+            if self.num_workers > 0
+            else False,
+            worker_init_fn=self._worker_init_fn,
+        )
+        if self.num_workers == 0:
+            self._worker_init_fn(0)
+
+        return data_loader
@@ -29,6 +29,7 @@ from tqdm import tqdm
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "../../../../../.."))
 from modelzoo.common.input.utils import check_and_create_output_dirs
+from modelzoo.transformers.data_processing.h5_index import write_h5_index
 from modelzoo.transformers.data_processing.utils import count_total_documents
 from modelzoo.transformers.pytorch.gpt2.input.data_processor_utils import (
     training_data_generator,
@@ -278,6 +279,7 @@ def main():
     with open(json_params_file, 'w') as _fout:
         json.dump(params, _fout)
 
+    write_h5_index(output_dir)
     print(f"Done! Wrote total of {total_written} examples.")
 
 
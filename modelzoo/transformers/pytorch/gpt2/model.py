@@ -17,6 +17,9 @@ import logging
 import torch
 
 from modelzoo.common.pytorch.metrics import AccuracyMetric, PerplexityMetric
+from modelzoo.common.pytorch.model_utils.ChunkedGPTLMHeadModelLoss import (
+    ChunkedGPTLMHeadModelLoss,
+)
 from modelzoo.common.pytorch.model_utils.GPTLMHeadModelLoss import (
     GPTLMHeadModelLoss,
 )
@@ -35,9 +38,20 @@ class Gpt2Model(torch.nn.Module):
         model_params = params["model"].copy()
         self.model = self.build_model(model_params)
 
-        self.loss_fn = GPTLMHeadModelLoss(
-            params["model"]["vocab_size"], self.loss_scaling, self.loss_weight,
-        )
+        if self.lm_loss_chunk_size:
+            # Fused LM head and loss, without the logits of all tokens
+            self.loss_fn = ChunkedGPTLMHeadModelLoss(
+                params["model"]["vocab_size"],
+                self.loss_scaling,
+                self.loss_weight,
+                chunk_size=self.lm_loss_chunk_size,
+            )
+        else:
+            self.loss_fn = GPTLMHeadModelLoss(
+                params["model"]["vocab_size"],
+                self.loss_scaling,
+                self.loss_weight,
+            )
         self.compute_eval_metrics = model_params.pop(
             "compute_eval_metrics", True
         )
@@ -58,6 +72,7 @@ class Gpt2Model(torch.nn.Module):
             )
 
         self.loss_weight = model_params.pop("loss_weight", 1.0)
+        self.lm_loss_chunk_size = model_params.pop("lm_loss_chunk_size", None)
         self.loss_scaling = model_params.pop(
             "loss_scaling", "num_tokens"
         ).lower()
@@ -115,6 +130,10 @@ class Gpt2Model(torch.nn.Module):
                 "attention_softmax_fp32", True
             ),
             attention_kernel=model_params.pop("attention_kernel", None),
+            attention_module=model_params.pop(
+                "attention_module", "aiayn_attention"
+            ),
+            attention_block_size=model_params.pop("attention_block_size", 128),
             # Encoder - ffn
             filter_size=model_params.pop("filter_size"),
             nonlinearity=model_params.pop("nonlinearity", "gelu"),
@@ -152,6 +171,9 @@ class Gpt2Model(torch.nn.Module):
         return model
 
     def __call__(self, data):
+        if self.lm_loss_chunk_size:
+            return self._chunked_lm_loss(data)
+
         lm_logits = self.model(
             input_ids=data["input_ids"],
             attention_mask=data["attention_mask"],
@@ -192,3 +214,35 @@ class Gpt2Model(torch.nn.Module):
             )
 
         return loss
+
+    def _chunked_lm_loss(self, data):
+        hidden_states = self.model(
+            input_ids=data["input_ids"],
+            attention_mask=data["attention_mask"],
+            labels=data["labels"],
+            return_hidden_states=True,
+        )
+        outputs = self.loss_fn(
+            hidden_states,
+            self.model.lm_head,
+            labels=data["labels"],
+            attention_mask=data["attention_mask"],
+        )
+
+        # Calculate eval metrics if not training
+        if not self.model.training and self.compute_eval_metrics:
+            lm_labels = data["labels"].clone()
+            lm_weights = data["attention_mask"].to(hidden_states.dtype).clone()
+
+            self.accuracy_metric(
+                labels=lm_labels,
+                predictions=outputs.predictions.int(),
+                weights=lm_weights,
+            )
+            self.perplexity_metric(
+                labels=lm_labels,
+                loss=-outputs.token_log_probs,
+                weights=lm_weights,
+            )
+
+        return outputs.loss
@@ -12,9 +12,228 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import logging
+import os
+
 import numpy as np
 import torch
 
+from modelzoo.common.pytorch.layers.BlockwiseAttentionLayer import (
+    BlockSparseMask,
+)
+
+_CACHE_VERSION = 1
+
+
+class FixedSparseAttentionLayout(BlockSparseMask):
+    """
+    GPT-3 Fixed Sparse layout, computed from its parameters instead of
+    stored as a dense mask.
+    Adapted from https://github.com/openai/sparse_attention/blob/master/attention.py#L135
+
+    A query attends to the keys up to its position which are either in its
+    local block of `local_attn_ctx` positions, or in the `vert_size`
+    "vertical" columns at the end of every local block, selected by the head
+    when `num_verts > 1`. Heads with the same `head % num_verts` share their
+    layout, so only `num_verts` distinct layouts are computed.
+
+    The layout is also a `BlockSparseMask` of blocks of `block_size`
+    positions. The block map can be cached in `cache_dir`, keyed by the
+    parameters of the layout, as it takes quadratic time to compute.
+
+    :param int max_sequence_length: Max sequence length.
+    :param int n_heads: Number of attention heads.
+    :param int local_attn_ctx: Number of positions of the local blocks.
+    :param int num_verts: Number of distinct vertical column patterns.
+    :param int vert_size: Number of vertical columns per local block.
+    :param bool different_layout_per_head: Whether the heads use the
+        distinct patterns, otherwise all heads use the first one.
+    :param int block_size: Number of positions of the blocks.
+    :param str cache_dir: Directory of the cached block maps. The block
+        maps are not cached if None. Errors reading or writing the cache are
+        logged and ignored.
+    """
+
+    def __init__(
+        self,
+        max_sequence_length,
+        n_heads,
+        local_attn_ctx=16,
+        num_verts=64,
+        vert_size=16,
+        different_layout_per_head=False,
+        block_size=128,
+        cache_dir=None,
+    ):
+        stride = local_attn_ctx
+        assert n_heads % num_verts == 0
+        assert vert_size <= stride
+        assert stride % vert_size == 0
+        assert (
+            num_verts <= stride // vert_size
+        ), f"At most {stride // vert_size} vertical patterns are supported."
+
+        self.max_sequence_length = max_sequence_length
+        self.n_heads = n_heads
+        self.local_attn_ctx = local_attn_ctx
+        self.num_verts = num_verts
+        self.vert_size = vert_size
+        self.different_layout_per_head = different_layout_per_head
+        self.block_size = block_size
+        self.cache_dir = cache_dir
+
+        # Column `c` of a local block is a vertical column of pattern `v` if
+        # it is one of `stride - 1 - v * vert_size - [0, vert_size)`.
+        num_layouts = num_verts if different_layout_per_head else 1
+        columns = np.arange(stride)
+        self._vertical_columns = torch.from_numpy(
+            columns[None, :] // vert_size
+            == stride // vert_size - 1 - np.arange(num_layouts)[:, None]
+        )
+        # Distinct layout of every head
+        if different_layout_per_head:
+            self._head_layouts = torch.arange(n_heads) % num_verts
+        else:
+            self._head_layouts = torch.zeros(1, dtype=torch.long)
+        self._block_map = None
+
+    @property
+    def num_heads(self):
+        """Number of heads of the masks, 1 if shared by all heads."""
+        return len(self._head_layouts)
+
+    def _attended(self, query_positions, key_positions, device=None):
+        """Whether the queries attend to the keys, for every distinct layout.
+
+        Args:
+            query_positions (torch.Tensor): Positions of the queries.
+            key_positions (torch.Tensor): Positions of the keys, broadcastable
+                with `query_positions`.
+
+        Returns:
+            Boolean tensor of shape `[num_layouts, *broadcast_shape]`.
+        """
+        stride = self.local_attn_ctx
+        local = query_positions // stride == key_positions // stride
+        vertical = self._vertical_columns.to(device)[:, key_positions % stride]
+        causal = key_positions <= query_positions
+        return (local | vertical) & causal
+
+    def mask_at(self, query_positions, key_positions):
+        """Mask of the given positions.
+
+        Args:
+            query_positions (torch.Tensor): Positions of the queries.
+            key_positions (torch.Tensor): Positions of the keys, broadcastable
+                with `query_positions`.
+
+        Returns:
+            Boolean tensor of shape `[num_heads, *broadcast_shape]`, with
+            True for masked positions.
+        """
+        device = query_positions.device
+        masked = ~self._attended(query_positions, key_positions, device)
+        return masked[self._head_layouts.to(device)]
+
+    def block_mask(self, q_start, q_end, k_start, k_end, device=None):
+        return self.mask_at(
+            torch.arange(q_start, q_end, device=device)[:, None],
+            torch.arange(k_start, k_end, device=device)[None, :],
+        )
+
+    def to_dense(self, dtype=None):
+        """
+        Returns:
+            Mask of shape [n_heads, max_sequence_length, max_sequence_length],
+            or [max_sequence_length, max_sequence_length] if all heads share
+            the layout, with 1 for masked positions.
+        """
+        positions = torch.arange(self.max_sequence_length)
+        mask = self.mask_at(positions[:, None], positions[None, :])
+        if not self.different_layout_per_head:
+            mask = mask[0]
+        return mask.to(torch.float32 if dtype is None else dtype)
+
+    def _cache_path(self):
+        name = (
+            f"v{_CACHE_VERSION}_len{self.max_sequence_length}"
+            f"_local{self.local_attn_ctx}_verts{self.num_verts}"
+            f"_vsize{self.vert_size}"
+            f"_perhead{int(self.different_layout_per_head)}"
+            f"_block{self.block_size}.npz"
+        )
+        return os.path.join(self.cache_dir, name)
+
+    def _compute_block_map(self):
+        """Reduce the layouts over blocks, one row of blocks at a time."""
+        block = self.block_size
+        length = self.max_sequence_length
+        num_blocks = -(-length // block)
+        num_layouts = len(self._vertical_columns)
+        attended = np.zeros((num_layouts, num_blocks, num_blocks), bool)
+        full = np.zeros((num_layouts, num_blocks, num_blocks), bool)
+        # Positions past the end are never attended to
+        key_positions = torch.arange(num_blocks * block)
+        for q_block in range(num_blocks):
+            query_positions = torch.arange(
+                q_block * block, min((q_block + 1) * block, length)
+            )
+            row = self._attended(
+                query_positions[:, None], key_positions[None, :]
+            )
+            row[..., length:] = False
+            row = row.reshape(
+                num_layouts, len(query_positions), num_blocks, block
+            )
+            attended[:, q_block] = row.any(dim=3).any(dim=1).numpy()
+            full[:, q_block] = row.all(dim=3).all(dim=1).numpy()
+        return attended, full
+
+    def _write_cache(self, cache_path, attended, full):
+        # Readers never see a partially written cache.
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                np.savez(f, attended=attended, full=full)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logging.warning(f"Could not write the cache {cache_path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def block_map(self):
+        if self._block_map is None:
+            cache_path = self._cache_path() if self.cache_dir else None
+            attended = full = None
+            if cache_path and os.path.isfile(cache_path):
+                try:
+                    with np.load(cache_path) as cached:
+                        attended, full = cached["attended"], cached["full"]
+                except (OSError, ValueError, KeyError):
+                    logging.warning(f"Ignoring unreadable cache {cache_path}")
+            if attended is None:
+                attended, full = self._compute_block_map()
+                if cache_path:
+                    self._write_cache(cache_path, attended, full)
+            self._block_map = (
+                torch.from_numpy(attended)[self._head_layouts],
+                torch.from_numpy(full)[self._head_layouts],
+            )
+        return self._block_map
+
+    def block_indices(self):
+        """
+        Returns:
+            For every head of the masks, the list of the indices of the
+            attended key blocks of every query block.
+        """
+        attended, _ = self.block_map()
+        return [
+            [row.nonzero().flatten().tolist() for row in head]
+            for head in attended
+        ]
+
 
 def create_fixed_sparse_attention_mask(
     max_sequence_length,
@@ -36,47 +255,11 @@ def create_fixed_sparse_attention_mask(
         The autoregressive fixed sparse mask of shape
         [n_heads, max_sequence_length, max_sequence_length].
     """
-
-    n_ctx = max_sequence_length
-    assert n_heads % num_verts == 0
-    stride = local_attn_ctx
-    assert vert_size <= stride
-    assert stride % vert_size == 0
-    indices = [i for i in range(stride - 1, -1, -1)]
-    indices = np.array(indices).reshape([-1, vert_size])
-    if num_verts == 1:
-        layout = np.zeros([n_ctx, n_ctx])
-        for idx in indices[0]:
-            layout[:, idx::stride] = 1
-        for q_idx in range(n_ctx):
-            # Each thing can attend to its local block
-            row = q_idx // stride
-            layout[q_idx, row * stride : (row + 1) * stride] = 1
-            # Any query cannot attend to keys above it
-            layout[q_idx, q_idx + 1 :] = 0
-    else:
-        layouts = []
-        indices = indices[:num_verts]
-        for h in range(n_heads):
-            layout = np.zeros([n_ctx, n_ctx])
-            subindices = indices[h % num_verts]
-            for idx in subindices:
-                layout[:, idx::stride] = 1
-            for q_idx in range(n_ctx):
-                # Each position can attend to its local block
-                row = q_idx // stride
-                layout[q_idx, row * stride : (row + 1) * stride] = 1
-                # Any query cannot attend to keys above it
-                layout[q_idx, q_idx + 1 :] = 0
-            layouts.append(layout)
-        layout = np.array(layouts)
-
-    if not different_layout_per_head:
-        layout = layout[0, :, :]
-
-    # Swap 0s and 1s since we use 1 to indicate masked positions
-    mask = 1 - layout
-
-    fixed_sparse_attn_mask = torch.Tensor(mask).to(dtype)
-
-    return fixed_sparse_attn_mask
+    return FixedSparseAttentionLayout(
+        max_sequence_length,
+        n_heads,
+        local_attn_ctx=local_attn_ctx,
+        num_verts=num_verts,
+        vert_size=vert_size,
+        different_layout_per_head=different_layout_per_head,
+    ).to_dense(dtype)
@@ -17,6 +17,9 @@ import sys
 from modelzoo.transformers.pytorch.gpt2.input.GptHDF5DataProcessor import (  # noqa
     GptHDF5DataProcessor,
 )
+from modelzoo.transformers.pytorch.gpt2.input.GptMemmapDataProcessor import (  # noqa
+    GptMemmapDataProcessor,
+)
 from modelzoo.transformers.pytorch.gpt2.input.GptTextDataProcessor import (  # noqa
     GptTextDataProcessor,
 )
@@ -24,8 +24,11 @@ from modelzoo.common.pytorch.layers.utils import apply_position_bias
 from modelzoo.common.pytorch.model_utils.RotaryPositionEmbeddingHelper import (
     RotaryPositionEmbeddingHelper,
 )
+from modelzoo.transformers.pytorch.generation_utils import generate
 from modelzoo.transformers.pytorch.transformer_utils import (
     build_broadcastable_attention_mask,
+    build_incremental_decoding_mask,
+    position_ids_from_attention_mask,
 )
 
 
@@ -56,6 +59,8 @@ class GPTJModel(nn.Module):
         attention_softmax_fp32=True,
         use_projection_bias_in_attention=False,
         use_ffn_bias_in_attention=False,
+        attention_module="aiayn_attention",
+        attention_block_size=128,
         # Task-specific
         initializer_range=0.02,
         use_bias_in_output=False,
@@ -98,6 +103,14 @@ class GPTJModel(nn.Module):
 
         self.drop_embd = nn.Dropout(embd_pdrop)
 
+        # Blockwise attention applies the causal mask implicitly
+        self.blockwise_attention = attention_module == "blockwise_attention"
+        extra_attention_params = {}
+        if self.blockwise_attention:
+            extra_attention_params.update(
+                block_size=attention_block_size, causal=True
+            )
+
         decoder_layer = GPTJDecoderLayer(
             d_model=hidden_size,
             nhead=num_heads,
@@ -106,7 +119,8 @@ class GPTJModel(nn.Module):
             dropout=dropout_rate,
             activation=nonlinearity,
             layer_norm_eps=layer_norm_epsilon,
-            extra_attention_params={},
+            attention_module_str=attention_module,
+            extra_attention_params=extra_attention_params,
             add_cross_attention=False,
             attention_type=attention_type,
             attention_dropout_rate=attention_dropout_rate,
@@ -193,17 +207,54 @@ class GPTJModel(nn.Module):
             output_embedding.out_features = input_embedding.num_embeddings
 
     def forward(
-        self, input_ids=None, attention_mask=None, labels=None,
+        self,
+        input_ids=None,
+        attention_mask=None,
+        labels=None,
+        past_kv=None,
+        return_hidden_states=False,
     ):
-        hidden_states = self.embedding_layer(input_ids)
-        hidden_states = self.drop_embd(hidden_states)
+        """
+        If `past_kv` holds the key/value caches of every layer, e.g. from
+        `self.transformer_decoder.init_kv_cache`, only the new tokens are
+        passed in `input_ids`, their keys and values are appended to the
+        caches, and `attention_mask` covers the cached and new tokens of left
+        padded sequences. See `generate`.
 
-        causal_attention_mask = build_broadcastable_attention_mask(
-            attention_mask,
-            build_causal=True,
-            device=input_ids.device,
-            dtype=hidden_states.dtype,
+        If `return_hidden_states` is True, the final hidden states are
+        returned instead of the logits, e.g. to apply `lm_head` fused with
+        the loss, see `ChunkedGPTLMHeadModelLoss`.
+        """
+        position_ids = None
+        if past_kv is not None:
+            assert (
+                self.relative_pe_helper is None
+            ), "Incremental decoding does not support relative position embeddings."
+            position_ids = position_ids_from_attention_mask(attention_mask)[
+                :, -input_ids.shape[1] :
+            ]
+        hidden_states = self.embedding_layer(
+            input_ids, position_ids=position_ids
         )
+        hidden_states = self.drop_embd(hidden_states)
+
+        key_padding_mask = None
+        if past_kv is not None:
+            causal_attention_mask = build_incremental_decoding_mask(
+                attention_mask, input_ids.shape[1], dtype=hidden_states.dtype,
+            )
+        elif self.blockwise_attention:
+            # The causal mask is implicit, only padding is masked
+            causal_attention_mask = None
+            if attention_mask is not None:
+                key_padding_mask = attention_mask == 0
+        else:
+            causal_attention_mask = build_broadcastable_attention_mask(
+                attention_mask,
+                build_causal=True,
+                device=input_ids.device,
+                dtype=hidden_states.dtype,
+            )
 
         # Helpers on alibi/relative position embeddings
         length = input_ids.shape[1]
@@ -214,10 +265,23 @@ class GPTJModel(nn.Module):
         hidden_states = self.transformer_decoder(
             hidden_states,
             tgt_mask=causal_attention_mask,
+            tgt_key_padding_mask=key_padding_mask,
             rotary_position_embedding_helper=self.rotary_pe_helper,
             self_attn_position_bias=self_attn_position_bias,
+            past_kv=past_kv,
+            position_ids=position_ids,
         )
 
+        if return_hidden_states:
+            return hidden_states
+
         lm_logits = self.lm_head(hidden_states)
 
         return lm_logits
+
+    def generate(self, input_ids, attention_mask=None, **kwargs):
+        """Generate tokens after the prompts in `input_ids` with KV-cached
+        incremental decoding. See `generation_utils.generate` for the
+        decoding options.
+        """
+        return generate(self, input_ids, attention_mask, **kwargs)
@@ -17,6 +17,9 @@ import logging
 import torch
 
 from modelzoo.common.pytorch.metrics import AccuracyMetric, PerplexityMetric
+from modelzoo.common.pytorch.model_utils.ChunkedGPTLMHeadModelLoss import (
+    ChunkedGPTLMHeadModelLoss,
+)
 from modelzoo.common.pytorch.model_utils.GPTLMHeadModelLoss import (
     GPTLMHeadModelLoss,
 )
@@ -33,9 +36,20 @@ class GptjModel(torch.nn.Module):
 
         model_params = params["model"].copy()
         self.model = self.build_model(model_params)
-        self.loss_fn = GPTLMHeadModelLoss(
-            params["model"]["vocab_size"], self.loss_scaling, self.loss_weight,
-        )
+        if self.lm_loss_chunk_size:
+            # Fused LM head and loss, without the logits of all tokens
+            self.loss_fn = ChunkedGPTLMHeadModelLoss(
+                params["model"]["vocab_size"],
+                self.loss_scaling,
+                self.loss_weight,
+                chunk_size=self.lm_loss_chunk_size,
+            )
+        else:
+            self.loss_fn = GPTLMHeadModelLoss(
+                params["model"]["vocab_size"],
+                self.loss_scaling,
+                self.loss_weight,
+            )
 
         self.compute_eval_metrics = model_params.pop(
             "compute_eval_metrics", True
@@ -89,6 +103,7 @@ class GptjModel(torch.nn.Module):
             )
 
         self.loss_weight = model_params.pop("loss_weight", 1.0)
+        self.lm_loss_chunk_size = model_params.pop("lm_loss_chunk_size", None)
         self.loss_scaling = model_params.pop(
             "loss_scaling", "num_tokens"
         ).lower()
@@ -139,6 +154,10 @@ class GptjModel(torch.nn.Module):
             use_ffn_bias_in_attention=model_params.pop(
                 "use_ffn_bias_in_attention", True
             ),
+            attention_module=model_params.pop(
+                "attention_module", "aiayn_attention"
+            ),
+            attention_block_size=model_params.pop("attention_block_size", 128),
             # Task-specific
             initializer_range=model_params.pop("initializer_range", 0.02),
             use_bias_in_output=model_params.pop("use_bias_in_output", False),
@@ -170,6 +189,9 @@ class GptjModel(torch.nn.Module):
         return model
 
     def __call__(self, data):
+        if self.lm_loss_chunk_size:
+            return self._chunked_lm_loss(data)
+
         lm_logits = self.model(**data)
         loss = self.loss_fn(lm_logits, data["labels"], data["attention_mask"],)
 
@@ -202,3 +224,30 @@ class GptjModel(torch.nn.Module):
             )
 
         return loss
+
+    def _chunked_lm_loss(self, data):
+        hidden_states = self.model(**data, return_hidden_states=True)
+        outputs = self.loss_fn(
+            hidden_states,
+            self.model.lm_head,
+            data["labels"],
+            data["attention_mask"],
+        )
+
+        # Calculate eval metrics if not training
+        if not self.model.training and self.compute_eval_metrics:
+            lm_labels = data["labels"].clone()
+            lm_weights = data["attention_mask"].clone()
+
+            self.accuracy_metric(
+                labels=lm_labels,
+                predictions=outputs.predictions.int(),
+                weights=lm_weights,
+            )
+            self.perplexity_metric(
+                labels=lm_labels,
+                loss=-outputs.token_log_probs,
+                weights=lm_weights,
+            )
+
+        return outputs.loss
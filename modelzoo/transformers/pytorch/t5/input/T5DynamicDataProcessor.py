@@ -24,7 +24,7 @@ from functools import partial
 import numpy as np
 import torch
 
-from modelzoo.common.pytorch.input_utils import bucketed_batch
+from modelzoo.common.pytorch.input_utils import bucketed_batch, pack_samples
 from modelzoo.transformers.pytorch.bert.input.utils import build_vocab
 from modelzoo.transformers.pytorch.input_utils import (
     get_data_for_task,
@@ -35,7 +35,9 @@ from modelzoo.transformers.pytorch.input_utils import (
 from modelzoo.transformers.pytorch.t5.input.utils import (
     concatenate_documents,
     construct_denoising_objective,
+    construct_denoising_objective_batch,
     flat_map,
+    get_denoised_input_length,
     get_raw_sequence_lengths,
     pad_t5_input_features,
     parse_text,
@@ -89,6 +91,18 @@ class T5DynamicDataProcessor(torch.utils.data.IterableDataset):
     so that computation is performed on real data rather than padding
     :param int num_documents_to_concatenate, optional: Specifies how many
     documents to pack together
+    :param bool batched_denoising, optional: If set, the span corruption is
+    applied to whole batches of sequences at once instead of to each sequence
+    separately. It draws different noise masks than the default per-sequence
+    corruption for the same seed. Ignored when packing samples.
+    :param bool pack_samples, optional: If set, several examples are packed
+    in every encoder and decoder sequence after the span corruption, instead
+    of padding every example. Adds the `packed_segment_ids` and
+    `decoder_packed_segment_ids` of the examples, from which the model
+    builds block diagonal attention masks, and the `position_ids` and
+    `decoder_position_ids` of the tokens within their example.
+    :param int num_packing_rows, optional: Number of sequences which are kept
+    open for examples to be packed in.
     :param str oov_token, optional: Token for out-of-vocabulary words/sub-words
     :param str sos_token, optional: Token for start-of-sequence
     :param str eos_token, optional: Token for end-of-sequence
@@ -154,6 +168,12 @@ class T5DynamicDataProcessor(torch.utils.data.IterableDataset):
         self.num_documents_to_concatenate = params.get(
             "num_documents_to_concatenate", 128
         )
+        self.pack_samples = params.get("pack_samples", False)
+        self.num_packing_rows = params.get("num_packing_rows", 8)
+        # Examples are packed after they are corrupted one by one.
+        self.batched_denoising = (
+            params.get("batched_denoising", False) and not self.pack_samples
+        )
 
         # Multi-processing params.
         self.num_workers = params.get("num_workers", 0)
@@ -292,6 +312,8 @@ class T5DynamicDataProcessor(torch.utils.data.IterableDataset):
                Shape: (`tgt_max_sequence_length`).
             * np.array[int.32] labels: Numpy array with labels for teacher forcing mode.
                Shape: (`tgt_max_sequence_length`).
+            If `batched_denoising` is set, the uncorrupted token sequences
+            are returned instead and turned into features by `denoise_batch`.
         """
         # Shard the data across multiple processes.
 
@@ -338,6 +360,9 @@ class T5DynamicDataProcessor(torch.utils.data.IterableDataset):
             # shuffle after `split_sequences` so that sequences from the same
             # document aren't always consecutive
             dataset = shuffle(dataset, self.shuffle_buffer, self.rng)
+        if self.batched_denoising:
+            return dataset
+
         dataset = map(
             partial(
                 construct_denoising_objective,
@@ -348,6 +373,17 @@ class T5DynamicDataProcessor(torch.utils.data.IterableDataset):
             ),
             dataset,
         )
+        if self.pack_samples:
+            dataset = pack_samples(
+                dataset,
+                [self.src_max_sequence_length, self.tgt_max_sequence_length],
+                lambda features: [
+                    len(features["input_ids"]),
+                    len(features["decoder_input_ids"]),
+                ],
+                num_rows=self.num_packing_rows,
+            )
+            dataset = map(self.concatenate_packed_features, dataset)
         dataset = map(
             lambda features: pad_t5_input_features(
                 src_max_sequence_length=self.src_max_sequence_length,
@@ -362,6 +398,33 @@ class T5DynamicDataProcessor(torch.utils.data.IterableDataset):
 
         return dataset
 
+    def concatenate_packed_features(self, examples):
+        """
+        Concatenates the features of the examples packed in a sequence.
+
+        :param list examples: Features of the examples, which are not padded.
+        :return: dict with the concatenated features, the `packed_segment_ids`
+            and `decoder_packed_segment_ids` of the examples, numbered from 1,
+            and the `position_ids` and `decoder_position_ids` of the tokens
+            within their example.
+        """
+        features = {
+            key: np.concatenate([example[key] for example in examples])
+            for key in ["input_ids", "decoder_input_ids", "labels"]
+        }
+        segment_ids = np.arange(1, len(examples) + 1, dtype=np.int32)
+        for prefix in ["", "decoder_"]:
+            lengths = [
+                len(example[f"{prefix}input_ids"]) for example in examples
+            ]
+            features[f"{prefix}packed_segment_ids"] = np.repeat(
+                segment_ids, lengths
+            )
+            features[f"{prefix}position_ids"] = np.concatenate(
+                [np.arange(length, dtype=np.int32) for length in lengths]
+            )
+        return features
+
     def element_length_fn(self, features):
         """
         Takes a single sample and returns the sequence length of that sample
@@ -369,15 +432,55 @@ class T5DynamicDataProcessor(torch.utils.data.IterableDataset):
         """
         return np.sum(features["attention_mask"])
 
-    def __iter__(self):
-        batched_dataset = bucketed_batch(
-            self.get_single_item(),
-            self.batch_size,
-            buckets=self.buckets,
-            element_length_fn=self.element_length_fn,
-            drop_last=self.drop_last,
-            seed=self.shuffle_seed,
+    def sequence_length_fn(self, sequence):
+        """
+        Takes a single uncorrupted sequence and returns the sequence length
+        of the sample created from it, to be used for VTS bucketing.
+        """
+        return get_denoised_input_length(len(sequence))
+
+    def denoise_batch(self, sequences):
+        """
+        Creates the features of a batch of uncorrupted sequences.
+
+        :param list sequences: Token sequences of the batch.
+        :return: dict with tensors of the features of `get_single_item`,
+            stacked along the batch dimension.
+        """
+        features = construct_denoising_objective_batch(
+            sequences,
+            vocab_size=self.src_vocab_size,
+            sos_token=self.special_tokens_indices["sos_token"],
+            eos_token=self.special_tokens_indices["eos_token"],
+            src_max_sequence_length=self.src_max_sequence_length,
+            tgt_max_sequence_length=self.tgt_max_sequence_length,
+            input_pad_id=self.input_pad_id,
+            attn_mask_pad_id=self.attn_mask_pad_id,
+            labels_pad_id=self.labels_pad_id,
+            rng=self.np_rng,
         )
+        return {key: torch.from_numpy(value) for key, value in features.items()}
+
+    def __iter__(self):
+        if self.batched_denoising:
+            batched_dataset = bucketed_batch(
+                self.get_single_item(),
+                self.batch_size,
+                buckets=self.buckets,
+                element_length_fn=self.sequence_length_fn,
+                collate_fn=self.denoise_batch,
+                drop_last=self.drop_last,
+                seed=self.shuffle_seed,
+            )
+        else:
+            batched_dataset = bucketed_batch(
+                self.get_single_item(),
+                self.batch_size,
+                buckets=self.buckets,
+                element_length_fn=self.element_length_fn,
+                drop_last=self.drop_last,
+                seed=self.shuffle_seed,
+            )
         for batch in batched_dataset:
             if self.dynamic_loss_weight:
                 scale = self.batch_size / torch.sum(
@@ -0,0 +1,157 @@
+# Copyright 2022 Cerebras Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures the throughput of `T5DynamicDataProcessor` in samples per second,
+with the span corruption applied to each sequence separately and to whole
+batches, on synthetic data written to a temporary directory.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../../../../.."))
+from modelzoo.transformers.pytorch.t5.input.T5DynamicDataProcessor import (
+    T5DynamicDataProcessor,
+)
+from modelzoo.transformers.pytorch.t5.input.utils import (
+    get_raw_sequence_lengths,
+)
+
+SPECIAL_TOKENS = ["<pad>", "</s>", "<unk>", "<s>"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        "--src_max_sequence_lengths",
+        type=int,
+        nargs="+",
+        default=[512, 1024, 2048],
+        help="encoder sequence lengths to benchmark",
+    )
+    parser.add_argument(
+        "--batch_size", type=int, default=64, help="number of samples per batch"
+    )
+    parser.add_argument(
+        "--num_batches",
+        type=int,
+        default=20,
+        help="number of batches timed for every configuration",
+    )
+    parser.add_argument(
+        "--vocab_size",
+        type=int,
+        default=32000,
+        help="number of tokens of the synthetic vocabulary",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="seed of the synthetic data"
+    )
+    return parser.parse_args()
+
+
+def write_synthetic_data(
+    data_dir, vocab_size, num_documents, document_length, rng
+):
+    """
+    Write a vocabulary file and a text file with random documents, in the
+    format of the output of `preprocess_c4.sh`.
+
+    :return: Path to the vocabulary file.
+    """
+    words = SPECIAL_TOKENS + [
+        f"tok{i}" for i in range(vocab_size - len(SPECIAL_TOKENS))
+    ]
+    vocab_file = os.path.join(data_dir, "vocab.txt")
+    with open(vocab_file, "w") as fout:
+        fout.write("\n".join(words) + "\n")
+
+    with open(os.path.join(data_dir, "data.txt"), "w") as fout:
+        for _ in range(num_documents):
+            ids = rng.integers(len(SPECIAL_TOKENS), vocab_size, document_length)
+            fout.write(" ".join(words[i] for i in ids) + "\n")
+    with open(os.path.join(data_dir, "meta.dat"), "w") as fout:
+        fout.write(f"data.txt {num_documents}\n")
+    return vocab_file
+
+
+def benchmark(data_dir, vocab_file, src_max_sequence_length, batched, args):
+    """
+    Time `args.num_batches` batches of the data processor.
+
+    :return: Throughput in samples per second.
+    """
+    _, tgt_max_sequence_length = get_raw_sequence_lengths(
+        src_max_sequence_length
+    )
+    params = {
+        "src_data_dir": data_dir,
+        "src_vocab_file": vocab_file,
+        "batch_size": args.batch_size,
+        "shuffle": False,
+        "shuffle_seed": args.seed,
+        "extra_ids": 100,
+        "src_max_sequence_length": src_max_sequence_length,
+        "tgt_max_sequence_length": tgt_max_sequence_length,
+        "batched_denoising": batched,
+    }
+    # Iterate over the processor in this process, as a single data loader
+    # worker would, so only the cost of creating the batches is measured.
+    data_processor = T5DynamicDataProcessor(params)
+    data_processor._worker_init_fn(0)
+    iterator = iter(data_processor)
+    # Exclude the start up of the pipeline from the measurement.
+    next(iterator)
+    start = time.time()
+    for _ in range(args.num_batches):
+        next(iterator)
+    return args.num_batches * args.batch_size / (time.time() - start)
+
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    print(f"{'src_len':>8} {'per sample':>12} {'batched':>12} {'speedup':>8}")
+    for src_max_sequence_length in args.src_max_sequence_lengths:
+        raw_length, _ = get_raw_sequence_lengths(src_max_sequence_length)
+        with tempfile.TemporaryDirectory() as data_dir:
+            # Every document is split into 4 sequences of the raw length.
+            num_documents = args.batch_size * (
+                (args.num_batches + 1 + 3) // 4 + 1
+            )
+            vocab_file = write_synthetic_data(
+                data_dir, args.vocab_size, num_documents, 4 * raw_length, rng
+            )
+            per_sample = benchmark(
+                data_dir, vocab_file, src_max_sequence_length, False, args
+            )
+            batched = benchmark(
+                data_dir, vocab_file, src_max_sequence_length, True, args
+            )
+        print(
+            f"{src_max_sequence_length:>8} {per_sample:>12.1f} "
+            f"{batched:>12.1f} {batched / per_sample:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
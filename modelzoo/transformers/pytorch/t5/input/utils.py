@@ -114,14 +114,27 @@ def _random_segmentation(num_items, num_segments, rng):
     rng.shuffle(first_in_segment)
     first_in_segment_padded = np.pad(first_in_segment, [[1, 0]])
     segment_id = np.cumsum(first_in_segment_padded)
+    return np.bincount(segment_id, minlength=num_segments).astype(np.int32)
 
-    segment_length = np.zeros(num_segments, dtype=np.int32)
-    data = np.ones_like(segment_id)
-    for i in range(len(segment_length)):
-        segment_length[i] = sum(
-            data[j] for j in range(len(segment_id)) if segment_id[j] == i
-        )
-    return segment_length
+
+def _num_noise_tokens_and_spans(
+    length, noise_density=0.15, mean_noise_span_length=3.0
+):
+    """
+    Number of noise tokens and noise spans of a sequence, as used by
+    `random_spans_noise_mask`.
+    :param int length: Length of the incoming token sequence, at least 2.
+    :param float noise_density: A float - approximate density of output mask.
+    :param float mean_noise_span_length: A number used in the noise mask calculation.
+    :return: A tuple with the number of noise tokens and noise spans.
+    """
+    num_noise_tokens = round(length * noise_density)
+    # Avoid degeneracy by ensuring positive numbers of noise and non-noise tokens.
+    num_noise_tokens = min(max(num_noise_tokens, 1), length - 1)
+    num_noise_spans = round(num_noise_tokens / mean_noise_span_length)
+    # Avoid degeneracy by ensuring positive number of noise spans.
+    num_noise_spans = max(num_noise_spans, 1)
+    return num_noise_tokens, num_noise_spans
 
 
 def random_spans_noise_mask(
@@ -152,16 +165,10 @@ def random_spans_noise_mask(
     original_length = length
     length = max(length, 2)
 
-    # Calculate number of noised tokens.
-    num_noise_tokens = round(length * noise_density)
-
-    # Avoid degeneracy by ensuring positive numbers of noise and non-noise tokens.
-    num_noise_tokens = min(max(num_noise_tokens, 1), length - 1)
-
-    num_noise_spans = round(num_noise_tokens / mean_noise_span_length)
-
-    # Avoid degeneracy by ensuring positive number of noise spans.
-    num_noise_spans = max(num_noise_spans, 1)
+    # Calculate number of noised tokens and noise spans.
+    num_noise_tokens, num_noise_spans = _num_noise_tokens_and_spans(
+        length, noise_density, mean_noise_span_length
+    )
     num_nonnoise_tokens = length - num_noise_tokens
 
     # Pick the lengths of the noise spans and the non-noise spans.
@@ -180,12 +187,9 @@ def random_spans_noise_mask(
 
     span_starts = np.cumsum(interleaved_span_lengths)[:-1]
 
+    # Spans are non-empty, so every start is a distinct position.
     span_start_indicator = np.zeros(length, dtype=np.int32)
-    data = np.ones_like(span_starts)
-    for i in range(len(span_start_indicator)):
-        span_start_indicator[i] = sum(
-            data[j] for j in range(len(span_starts)) if span_starts[j] == i
-        )
+    span_start_indicator[span_starts] = 1
 
     span_num = np.cumsum(span_start_indicator)
     is_noise = np.equal(span_num % 2, 1)
@@ -275,6 +279,272 @@ def construct_denoising_objective(
     }
 
 
+def _random_segmentation_batch(num_items, num_segments, rng):
+    """
+    Partition sequences of items randomly into non-empty segments, with
+    one sequence per row. Same as `_random_segmentation` for every row.
+    :param np.array num_items: Integers > 0, with shape `[batch_size]`.
+    :param np.array num_segments: Integers in `[1, num_items]`, with shape
+        `[batch_size]`.
+    :param np.random.Generator rng: The numpy random generator to be used as
+        the source of randomness for this function.
+    :return: A numpy array with shape `[batch_size, max(num_segments)]`
+        containing the segment lengths of each row, which add up to its
+        `num_items` and are zero after its `num_segments` segments.
+    """
+    batch_size = len(num_items)
+    max_gaps = int(num_items.max()) - 1
+    max_segments = int(num_segments.max())
+
+    # Segments start after a uniformly random subset of `num_segments - 1`
+    # of the `num_items - 1` gaps between items, given by the gaps with the
+    # lowest random keys.
+    keys = rng.random((batch_size, max_gaps))
+    keys[np.arange(max_gaps)[None, :] >= (num_items - 1)[:, None]] = np.inf
+    sorted_keys = np.pad(
+        np.sort(keys, axis=1), [[0, 0], [1, 0]], constant_values=-np.inf
+    )
+    thresholds = sorted_keys[np.arange(batch_size), num_segments - 1]
+    first_in_segment = keys <= thresholds[:, None]
+    segment_id = np.pad(
+        np.cumsum(first_in_segment, axis=1, dtype=np.int32), [[0, 0], [1, 0]]
+    )
+
+    # Count the items of every segment with one bincount over the batch.
+    is_item = np.arange(max_gaps + 1)[None, :] < num_items[:, None]
+    segment_id += np.arange(batch_size)[:, None] * max_segments
+    segment_length = np.bincount(
+        segment_id[is_item], minlength=batch_size * max_segments
+    )
+    return segment_length.reshape(batch_size, max_segments).astype(np.int32)
+
+
+def random_spans_noise_mask_batch(
+    lengths, noise_density=0.15, mean_noise_span_length=3.0, rng=None
+):
+    """
+    Noise masks of a batch of sequences, with the same distribution as
+    `random_spans_noise_mask` for every sequence.
+    :param np.array lengths: Lengths of the token sequences, with shape
+        `[batch_size]`.
+    :param float noise_density: A float - approximate density of output mask.
+    :param float mean_noise_span_length: A number used in the noise mask calculation.
+    :param np.random.Generator rng: The numpy random generator to be used as
+        the source of randomness for this function.
+    :return: A boolean np.array with shape `[batch_size, max(lengths)]`,
+        `False` after the end of each sequence.
+    """
+    assert rng is not None, "You must specify a random number generator"
+    assert isinstance(
+        rng, np.random.Generator
+    ), f"rng must be a `np.random.Generator` object, got {type(rng)}"
+
+    # Increase the lengths to avoid degeneracy.
+    original_lengths = np.asarray(lengths)
+    lengths = np.maximum(original_lengths, 2)
+    batch_size = len(lengths)
+
+    # Calculate number of noised tokens and noise spans, rounding half to
+    # even like `round` does.
+    num_noise_tokens = np.clip(
+        np.round(lengths * noise_density).astype(np.int64), 1, lengths - 1
+    )
+    num_noise_spans = np.maximum(
+        np.round(num_noise_tokens / mean_noise_span_length).astype(np.int64),
+        1,
+    )
+    num_nonnoise_tokens = lengths - num_noise_tokens
+
+    # Pick the lengths of the noise spans and the non-noise spans.
+    noise_span_lengths = _random_segmentation_batch(
+        num_noise_tokens, num_noise_spans, rng=rng
+    )
+    nonnoise_span_lengths = _random_segmentation_batch(
+        num_nonnoise_tokens, num_noise_spans, rng=rng
+    )
+
+    # Interleave both lengths, with the empty spans past the end of each
+    # sequence starting at its length.
+    interleaved_span_lengths = np.reshape(
+        np.stack([nonnoise_span_lengths, noise_span_lengths], axis=2),
+        [batch_size, -1],
+    )
+    span_starts = np.cumsum(interleaved_span_lengths, axis=1)[:, :-1]
+
+    # Spans are non-empty up to the end of each sequence, so only the
+    # starts past the end can coincide.
+    max_length = int(lengths.max())
+    span_start_indicator = np.zeros((batch_size, max_length + 1), dtype=bool)
+    span_start_indicator[np.arange(batch_size)[:, None], span_starts] = True
+
+    span_num = np.cumsum(
+        span_start_indicator[:, :max_length], axis=1, dtype=np.int32
+    )
+    is_noise = np.equal(span_num % 2, 1)
+    is_noise &= np.arange(max_length)[None, :] < original_lengths[:, None]
+    return is_noise[:, : int(original_lengths.max())]
+
+
+def noise_token_span_to_unique_sentinel_batch(
+    tokens, noise_mask, lengths, vocab_size, pad_id=0
+):
+    """
+    Replace each run of consecutive noise tokens with a different sentinel,
+    for every row of a batch. Same as `noise_token_span_to_unique_sentinel`
+    for every row.
+    :param np.array tokens: Uncorrupted token indices, with shape
+        `[batch_size, max_length]`.
+    :param np.array noise_mask: A 2d boolean tensor with mask to apply noise,
+        `False` after the end of each sequence.
+    :param np.array lengths: Lengths of the token sequences, with shape
+        `[batch_size]`.
+    :param int vocab_size: Size of the vocabulary with tokens.
+    :param int pad_id: Id used to pad the rows of the output.
+    :return: A tuple with the np.array with sentinels and shape
+        `[batch_size, max(output_lengths)]`, and the np.array with the
+        `output_lengths` of each row.
+    """
+    previous_token_is_noise = np.pad(noise_mask[:, :-1], [[0, 0], [1, 0]])
+
+    first_noise_tokens = np.logical_and(
+        noise_mask, np.logical_not(previous_token_is_noise)
+    )
+    subsequent_noise_tokens = np.logical_and(
+        noise_mask, previous_token_is_noise
+    )
+
+    sentinel = (
+        _sentinel_id(vocab_size)
+        + 1
+        - np.cumsum(first_noise_tokens, axis=1, dtype=np.int32)
+    )
+    tokens = np.where(first_noise_tokens, sentinel, tokens)
+
+    # Compact the kept tokens of every row to its beginning. Boolean
+    # indexing keeps them in row-major order, so the column of each kept
+    # token is its offset from the first kept token of its row.
+    keep = np.logical_not(subsequent_noise_tokens)
+    keep &= np.arange(tokens.shape[1])[None, :] < lengths[:, None]
+    output_lengths = keep.sum(axis=1)
+    kept_tokens = tokens[keep]
+    rows = np.repeat(np.arange(tokens.shape[0]), output_lengths)
+    row_starts = np.cumsum(output_lengths) - output_lengths
+    columns = np.arange(len(kept_tokens)) - row_starts[rows]
+    output = np.full(
+        (tokens.shape[0], int(output_lengths.max())), pad_id, dtype=tokens.dtype
+    )
+    output[rows, columns] = kept_tokens
+    return output, output_lengths
+
+
+def construct_denoising_objective_batch(
+    sequences,
+    vocab_size,
+    sos_token,
+    eos_token,
+    src_max_sequence_length,
+    tgt_max_sequence_length,
+    input_pad_id,
+    attn_mask_pad_id,
+    labels_pad_id,
+    rng,
+):
+    """
+    Formats a batch of raw sequences into corrupted sequences and
+    corresponding denoising targets, padded to the maximum sequence lengths.
+    Produces the same features as `construct_denoising_objective` followed
+    by `pad_t5_input_features` for every sequence, with all of the work done
+    on 2d arrays.
+    :param list sequences: A list of uncorrupted token index sequences.
+    :param int vocab_size: The size of the vocabulary.
+    :param int sos_token: The index of the `SOS` token in the vocabulary.
+    :param int eos_token: The index of the `EOS` token in the vocabulary.
+    :param int src_max_sequence_length: Maximum sequence length of the encoder input.
+    :param int tgt_max_sequence_length: Maximum sequence length of the decoder input.
+    :param int input_pad_id: Input sequence padding id.
+    :param int attn_mask_pad_id: Attention mask padding id.
+    :param int labels_pad_id: Labels padding id.
+    :param np.random.Generator rng: The numpy random generator to be used as
+        the source of randomness for this function.
+    :returns: dict with the padded features of `pad_t5_input_features`,
+        stacked along a new first dimension of size `len(sequences)`.
+    """
+    batch_size = len(sequences)
+    lengths = np.array([len(sequence) for sequence in sequences])
+    is_token = np.arange(lengths.max())[None, :] < lengths[:, None]
+    tokens = np.zeros(is_token.shape, dtype=np.int32)
+    tokens[is_token] = np.concatenate(sequences)
+
+    noise_mask = random_spans_noise_mask_batch(lengths, rng=rng)
+    encoder_ids, encoder_lengths = noise_token_span_to_unique_sentinel_batch(
+        tokens, noise_mask, lengths, vocab_size, pad_id=input_pad_id
+    )
+    decoder_ids, decoder_lengths = noise_token_span_to_unique_sentinel_batch(
+        tokens,
+        np.logical_and(np.logical_not(noise_mask), is_token),
+        lengths,
+        vocab_size,
+        pad_id=input_pad_id,
+    )
+
+    # Add special tokens and pad input sequences.
+    rows = np.arange(batch_size)
+    input_ids = np.full(
+        (batch_size, src_max_sequence_length), input_pad_id, dtype=np.int32
+    )
+    input_ids[:, : encoder_ids.shape[1]] = encoder_ids
+    attention_mask = np.where(
+        np.arange(src_max_sequence_length)[None, :]
+        < encoder_lengths[:, None],
+        1,
+        attn_mask_pad_id,
+    ).astype(np.int32)
+
+    decoder_input_ids = np.full(
+        (batch_size, tgt_max_sequence_length), input_pad_id, dtype=np.int32
+    )
+    decoder_input_ids[:, 0] = sos_token
+    decoder_input_ids[:, 1 : decoder_ids.shape[1] + 1] = decoder_ids
+    decoder_attention_mask = np.where(
+        np.arange(tgt_max_sequence_length)[None, :]
+        < decoder_lengths[:, None] + 1,
+        1,
+        attn_mask_pad_id,
+    ).astype(np.int32)
+
+    labels = np.full(
+        (batch_size, tgt_max_sequence_length), labels_pad_id, dtype=np.int32
+    )
+    labels[:, : decoder_ids.shape[1]] = np.where(
+        np.arange(decoder_ids.shape[1])[None, :] < decoder_lengths[:, None],
+        decoder_ids,
+        labels_pad_id,
+    )
+    labels[rows, decoder_lengths] = eos_token
+
+    return {
+        "input_ids": input_ids,
+        "decoder_input_ids": decoder_input_ids,
+        "attention_mask": attention_mask,
+        "decoder_attention_mask": decoder_attention_mask,
+        "labels": labels,
+        "decoder_input_length": (decoder_lengths + 1).astype(np.int64),
+    }
+
+
+def get_denoised_input_length(length):
+    """
+    Length of the encoder input that `construct_denoising_objective` creates
+    from a sequence, which only depends on the length of the sequence.
+    :param int length: Length of the uncorrupted token sequence.
+    :return: int length of the corrupted encoder input.
+    """
+    if length < 2:
+        return length
+    num_noise_tokens, num_noise_spans = _num_noise_tokens_and_spans(length)
+    return length - num_noise_tokens + num_noise_spans
+
+
 def get_raw_sequence_lengths(
     max_sequence_length, corruption_prob=0.15, mean_span_len=3
 ):
@@ -445,7 +715,7 @@ def pad_t5_input_features(
     attention_mask[: len(features["input_ids"])] = 1
     decoder_attention_mask[: len(features["decoder_input_ids"])] = 1
 
-    return {
+    padded_features = {
         "input_ids": input_ids,
         "decoder_input_ids": decoder_input_ids,
         "attention_mask": attention_mask,
@@ -453,6 +723,19 @@ def pad_t5_input_features(
         "labels": labels,
         "decoder_input_length": len(features["decoder_input_ids"]),
     }
+    # Segment and position ids of packed examples are padded with 0.
+    for key, max_sequence_length in [
+        ("packed_segment_ids", src_max_sequence_length),
+        ("position_ids", src_max_sequence_length),
+        ("decoder_packed_segment_ids", tgt_max_sequence_length),
+        ("decoder_position_ids", tgt_max_sequence_length),
+    ]:
+        if key in features:
+            feature = np.zeros((max_sequence_length,), dtype=np.int32)
+            feature[: len(features[key])] = features[key]
+            padded_features[key] = feature
+
+    return padded_features
 
 
 def parse_text(text, do_lower):
@@ -212,6 +212,13 @@ class T5ForConditionalGenerationModel(nn.Module):
             data["labels"] = self.vts(
                 data["labels"], data["decoder_attention_mask"]
             )
+            # if examples are packed, mask their segments and positions
+            for name in ["packed_segment_ids", "position_ids"]:
+                if name in data:
+                    data[name] = self.vts(data[name], data["attention_mask"])
+                    data[f"decoder_{name}"] = self.vts(
+                        data[f"decoder_{name}"], data["decoder_attention_mask"]
+                    )
         kwargs = {
             "input_ids": data["input_ids"],
             "attention_mask": data["attention_mask"],
@@ -219,6 +226,12 @@ class T5ForConditionalGenerationModel(nn.Module):
             "decoder_attention_mask": data["decoder_attention_mask"],
             "labels": data["labels"],
             "loss_weight": data.get("loss_weight", None),
+            "packed_segment_ids": data.get("packed_segment_ids", None),
+            "decoder_packed_segment_ids": data.get(
+                "decoder_packed_segment_ids", None
+            ),
+            "position_ids": data.get("position_ids", None),
+            "decoder_position_ids": data.get("decoder_position_ids", None),
         }
         logits = self.model(**kwargs)
         loss = None
@@ -46,6 +46,7 @@ from modelzoo.common.pytorch.layers import (
 )
 from modelzoo.transformers.pytorch.transformer_utils import (
     build_broadcastable_attention_mask,
+    build_segment_attention_mask,
     create_2D_autoregressive_mask,
     make_key_padding_mask_broadcastable,
 )
@@ -507,12 +508,26 @@ class T5ForConditionalGeneration(nn.Module):
         labels=None,
         use_cache=None,
         loss_weight=None,
+        packed_segment_ids=None,
+        decoder_packed_segment_ids=None,
+        position_ids=None,
+        decoder_position_ids=None,
     ):
         r"""
         labels (:obj:`torch.LongTensor` of shape :obj:`(batch_size,)`, `optional`):
             Labels for computing the sequence classification/regression loss. Indices should be in :obj:`[-100, 0, ...,
             config.vocab_size - 1]`. All labels set to ``-100`` are ignored (masked), the loss is only computed for
             labels in ``[0, ..., config.vocab_size]``
+        packed_segment_ids (:obj:`torch.LongTensor` of shape :obj:`(batch_size, src_seq_length)`, `optional`):
+            Example of the encoder tokens when several examples are packed in a row, numbered from 1, with 0 for
+            padding. Tokens only attend to the tokens of their example, instead of using the `attention_mask`.
+        decoder_packed_segment_ids (:obj:`torch.LongTensor` of shape :obj:`(batch_size, tgt_seq_length)`, `optional`):
+            Example of the decoder tokens, numbered like the examples of the encoder. Must be set along with
+            `packed_segment_ids`.
+        position_ids (:obj:`torch.LongTensor` of shape :obj:`(batch_size, src_seq_length)`, `optional`):
+            Position of the encoder tokens within their packed example, used by absolute position embeddings.
+        decoder_position_ids (:obj:`torch.LongTensor` of shape :obj:`(batch_size, tgt_seq_length)`, `optional`):
+            Position of the decoder tokens within their packed example, used by absolute position embeddings.
 
         Returns:
 
@@ -549,7 +564,7 @@ class T5ForConditionalGeneration(nn.Module):
 
         # Encode if needed (training, first prediction pass)
         if encoder_outputs is None:
-            src = self.encoder_embeddings(input_ids)
+            src = self.encoder_embeddings(input_ids, position_ids=position_ids)
             # Transformer uses pre-encoder dropout
             if self.pre_encoder_dropout:
                 src = self.pre_encoder_dropout(src)
@@ -561,7 +576,11 @@ class T5ForConditionalGeneration(nn.Module):
                     src.shape[1], src.shape[1]
                 )
             src = self.dropout_before_encoder(src)
-            if attention_mask is not None:
+            if packed_segment_ids is not None:
+                attention_mask = build_segment_attention_mask(
+                    packed_segment_ids, dtype=src.dtype
+                )
+            elif attention_mask is not None:
                 attention_mask = make_key_padding_mask_broadcastable(
                     attention_mask, dtype=src.dtype
                 )
@@ -587,7 +606,9 @@ class T5ForConditionalGeneration(nn.Module):
             # get decoder inputs from shifting lm labels to the right
             decoder_input_ids = self._shift_right(labels)
 
-        decoder_inputs_embeds = self.decoder_embeddings(decoder_input_ids)
+        decoder_inputs_embeds = self.decoder_embeddings(
+            decoder_input_ids, position_ids=decoder_position_ids
+        )
 
         # Transformer uses dropout before feeding to decoder module while
         # T5 does not use this layer
@@ -604,7 +625,19 @@ class T5ForConditionalGeneration(nn.Module):
                 decoder_seq_length, decoder_seq_length
             )
 
-        if decoder_attention_mask is None:
+        if decoder_packed_segment_ids is not None:
+            extended_decoder_attention_mask = build_segment_attention_mask(
+                decoder_packed_segment_ids,
+                build_causal=True,
+                dtype=hidden_states.dtype,
+            )
+            # Decoder tokens attend to the encoder tokens of their example
+            attention_mask = build_segment_attention_mask(
+                decoder_packed_segment_ids,
+                packed_segment_ids,
+                dtype=hidden_states.dtype,
+            )
+        elif decoder_attention_mask is None:
             extended_decoder_attention_mask = (
                 create_2D_autoregressive_mask(
                     decoder_seq_length,
@@ -174,6 +174,130 @@ def create_2D_autoregressive_mask(
     return causal_mask
 
 
+def build_segment_attention_mask(
+    query_segment_ids: torch.Tensor,
+    key_segment_ids: Optional[torch.Tensor] = None,
+    build_causal: bool = False,
+    dtype=None,
+):
+    """Create the block diagonal attention mask of packed sequences, so that
+    the tokens of every sequence only attend to the tokens of the same
+    sequence.
+
+    Args:
+        query_segment_ids (torch.Tensor): Segment ids of the queries of
+            shape [batch_size, src_seq_len], numbering the sequences packed
+            in every row from 1, with 0 for padding.
+        key_segment_ids (torch.Tensor): Segment ids of the keys of shape
+            [batch_size, target_seq_len], e.g. of the encoder sequences for
+            the cross-attention of a decoder. Defaults to the segment ids of
+            the queries.
+        build_causal (bool): If enabled, queries also don't attend to the
+            keys after them.
+        dtype (torch.dtype): Dtype of the resulting mask.
+
+    Returns:
+        The attention mask of shape [batch_size, num_heads, src_seq_len, target_seq_len],
+        with 0 for attended positions and a negative infinity constant for
+        masked ones, and broadcast dimensions set to 1. Padding queries are
+        not masked so that none of their rows is fully masked.
+    """
+    if dtype is None:
+        dtype = torch.float16
+    if key_segment_ids is None:
+        key_segment_ids = query_segment_ids
+
+    masked = query_segment_ids[:, :, None] != key_segment_ids[:, None, :]
+    masked = masked & (query_segment_ids != 0)[:, :, None]
+    if build_causal:
+        causal_mask = create_2D_autoregressive_mask(
+            query_segment_ids.shape[-1],
+            key_segment_ids.shape[-1],
+            dtype=torch.bool,
+            device=query_segment_ids.device,
+        )
+        masked = masked | causal_mask[None, :, :]
+
+    return torch.zeros(
+        masked[:, None, :, :].shape, dtype=dtype, device=masked.device
+    ).masked_fill(masked[:, None, :, :], torch.finfo(dtype).min)
+
+
+def position_ids_from_attention_mask(attention_mask: torch.Tensor):
+    """Positions of the tokens of left padded sequences.
+
+    Args:
+        attention_mask (torch.Tensor): Mask of shape [batch_size, seq_len],
+            with 1 for tokens and 0 for the padding before them.
+
+    Returns:
+        The position of every token of shape [batch_size, seq_len], counted
+        from the first token of its sequence. Padding gets position 0.
+    """
+    return (attention_mask.long().cumsum(-1) - 1).clamp(min=0)
+
+
+def build_incremental_decoding_mask(
+    attention_mask: torch.Tensor,
+    query_length: int,
+    dtype=None,
+    sparse_mask: Optional[torch.Tensor] = None,
+):
+    """Create the attention mask of a step of incremental decoding, where
+    the queries of the last `query_length` positions attend to the keys of
+    all positions stored so far.
+
+    Args:
+        attention_mask (torch.Tensor): Mask of shape [batch_size, key_len] of
+            the past and present positions, with 1 for tokens and 0 for the
+            padding of left padded sequences.
+        query_length (int): Number of present positions.
+        dtype (torch.dtype): Dtype of the resulting mask.
+        sparse_mask (torch.Tensor): Optional fixed sparse mask of shape
+            [max_seq_len, max_seq_len] or [num_heads, max_seq_len, max_seq_len]
+            with 1 for masked positions, indexed by the token positions. Can
+            also be a layout with a `mask_at(query_positions, key_positions)`
+            method, such as `FixedSparseAttentionLayout`.
+
+    Returns:
+        The attention mask of shape [batch_size, num_heads, query_len, key_len],
+        with 0 for attended positions and a negative infinity constant for
+        masked ones, and broadcast dimensions set to 1.
+    """
+    if dtype is None:
+        dtype = torch.float16
+    device = attention_mask.device
+    key_length = attention_mask.shape[-1]
+
+    query_index = torch.arange(
+        key_length - query_length, key_length, device=device
+    )
+    key_index = torch.arange(key_length, device=device)
+    masked = (query_index[:, None] < key_index[None, :])[None, None, :, :]
+    masked = masked | (attention_mask == 0)[:, None, None, :]
+
+    if sparse_mask is not None:
+        key_positions = position_ids_from_attention_mask(attention_mask)
+        query_positions = key_positions[:, -query_length:]
+        if isinstance(sparse_mask, torch.Tensor):
+            sparse = sparse_mask.to(device=device, dtype=torch.bool)[
+                ..., query_positions[:, :, None], key_positions[:, None, :]
+            ]
+        else:
+            sparse = sparse_mask.mask_at(
+                query_positions[:, :, None], key_positions[:, None, :]
+            )
+        if sparse.dim() == 3:
+            sparse = sparse[:, None, :, :]
+        else:
+            sparse = sparse.transpose(0, 1)
+        masked = masked | sparse
+
+    return torch.zeros(masked.shape, dtype=dtype, device=device).masked_fill(
+        masked, torch.finfo(dtype).min
+    )
+
+
 def make_sparse_mask_broadcastable(
     sparse_mask: torch.Tensor,
     key_padding_mask: torch.Tensor,